@@ -114,8 +114,12 @@ class SOAPAddress:
 
 
 class HTTPTransport:
-    def __init__(self, additional_headers = None):
+    def __init__(self, additional_headers = None, connection_pool = None):
         self.additional_headers = additional_headers or {}
+        # Optional pool of keep-alive connections. Any object providing
+        # GetConnection(proto, address) -> (connection, reused) and
+        # ReleaseConnection(proto, address, connection) will do.
+        self.connection_pool = connection_pool
 
     def getNS(self, original_namespace, data):
         """Extract the (possibly extended) namespace from the returned
@@ -132,8 +136,14 @@ class HTTPTransport:
             return original_namespace
     
     # Need a Timeout someday?
+    #
+    # If a recorder is given, the request and response of this call are
+    # handed to it, independently of the dump* config settings, via
+    #   recorder.recordRequest(request_line, headers, data)
+    #   recorder.recordResponse(code, msg, header_lines, data)
+    # where data is always the uncompressed SOAP message.
     def call(self, addr, data, namespace, soapaction = None, encoding = None,
-        http_proxy = None, config = Config):
+        http_proxy = None, config = Config, recorder = None):
 
         import httplib
 
@@ -166,7 +176,12 @@ class HTTPTransport:
             real_addr = addr.host
             real_path = addr.path
 
-        if addr.proto == 'httpg':
+        pooled = self.connection_pool is not None and \
+                 addr.proto in ('http', 'https')
+
+        if pooled:
+            r = None
+        elif addr.proto == 'httpg':
             from pyGlobus.io import GSIHTTP
             r = GSIHTTP(real_addr, tcpAttr = config.tcpAttr)
         elif addr.proto == 'https':
@@ -174,8 +189,6 @@ class HTTPTransport:
         else:
             r = httplib.HTTP(real_addr)
 
-        r.putrequest("POST", real_path)
-
         headers = []
 
         headers.append(("Host", addr.host))
@@ -200,18 +213,22 @@ class HTTPTransport:
         else:
             headers.append(("SOAPAction", '"%s"' % soapaction))
 
+        if pooled:
+            request_line = "POST %s HTTP/1.1" % real_path
+        else:
+            request_line = "POST %s %s" % (real_path, r._http_vsn_str)
+
+        if recorder is not None:
+            recorder.recordRequest(request_line, headers, data)
+
         if config.dumpHeadersOut:
             s = 'Outgoing HTTP headers'
             debugHeader(s)
-            print "POST %s %s" % (real_path, r._http_vsn_str)
+            print request_line
             for header in headers:
                 print '%s:%s' % header
             debugFooter(s)
 
-        for header in headers:
-            r.putheader(header[0], header[1])
-        r.endheaders()
-
         if config.dumpSOAPOut:
             s = 'Outgoing SOAP'
             debugHeader(s)
@@ -220,43 +237,58 @@ class HTTPTransport:
                 print
             debugFooter(s)
 
-        # send the payload
-        r.send(transport_data)
-
-        # read response line
-        code, msg, headers = r.getreply()
-
-        if headers:
+        if pooled:
+            code, msg, headers, data = self.__pooledCall(
+                addr.proto, real_addr, real_path, headers, transport_data)
             content_type = headers.get("content-type","text/xml")
-            content_length = headers.get("Content-length")
+            message_len = len(data)
         else:
-            content_type=None
-            content_length=None
+            r.putrequest("POST", real_path)
+            for header in headers:
+                r.putheader(header[0], header[1])
+            r.endheaders()
 
-        # work around OC4J bug which does '<len>, <len>' for some reaason
-        if content_length:
-            comma=content_length.find(',')
-            if comma>0:
-                content_length = content_length[:comma]
+            # send the payload
+            r.send(transport_data)
 
-        # attempt to extract integer message size
-        try:
-            message_len = int(content_length)
-        except:
-            message_len = -1
-            
-        if message_len < 0:
-            # Content-Length missing or invalid; just read the whole socket
-            # This won't work with HTTP/1.1 chunked encoding
-            data = r.getfile().read()
-            message_len = len(data)
-        else:
-            data = r.getfile().read(message_len)
+            # read response line
+            code, msg, headers = r.getreply()
+
+            if headers:
+                content_type = headers.get("content-type","text/xml")
+                content_length = headers.get("Content-length")
+            else:
+                content_type=None
+                content_length=None
+
+            # work around OC4J bug which does '<len>, <len>' for some reaason
+            if content_length:
+                comma=content_length.find(',')
+                if comma>0:
+                    content_length = content_length[:comma]
+
+            # attempt to extract integer message size
+            try:
+                message_len = int(content_length)
+            except:
+                message_len = -1
+
+            if message_len < 0:
+                # Content-Length missing or invalid; just read the whole socket
+                # This won't work with HTTP/1.1 chunked encoding
+                data = r.getfile().read()
+                message_len = len(data)
+            else:
+                data = r.getfile().read(message_len)
 
         if headers.get('content-encoding', None) == 'gzip':
             data = gzip.GzipFile(fileobj=StringIO.StringIO(data),
                                  mode='rb').read()
 
+        if recorder is not None:
+            recorder.recordResponse(code, msg, getattr(headers, 'headers', []),
+                                    data)
+
         if(config.debug):
             print "code=",code
             print "msg=", msg
@@ -302,6 +334,72 @@ class HTTPTransport:
         # return response payload
         return data, new_ns
 
+    def __pooledCall(self, proto, address, path, headers, body):
+        """POST the request over a pooled HTTP/1.1 keep-alive connection.
+
+        A connection taken from the pool may have been dropped by the server
+        since it was last used. The request is resent once, on another
+        connection, if sending it on a reused connection fails, or if the
+        server closes or resets a reused connection without answering. It is
+        never resent after a timeout, nor after any other failure once it was
+        sent, as the server may already have carried it out."""
+
+        import sys
+
+        resent = 0
+        while 1:
+            conn, reused = self.connection_pool.GetConnection(proto, address)
+            sent = 0
+            try:
+                conn.putrequest("POST", path, skip_host = 1,
+                                skip_accept_encoding = 1)
+                for header in headers:
+                    conn.putheader(header[0], header[1])
+                # Headers and body go out in a single segment; sent apart,
+                # Nagle's algorithm stalls every call on a delayed ACK.
+                conn.endheaders(body)
+                sent = 1
+                response = conn.getresponse()
+            except:
+                exc_info = sys.exc_info()
+                conn.close()
+                if reused and not resent and \
+                       _canResend(exc_info[1], sent):
+                    resent = 1
+                    continue
+                raise exc_info[0], exc_info[1], exc_info[2]
+            break
+
+        try:
+            data = response.read()
+        except:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.connection_pool.ReleaseConnection(proto, address, conn)
+        return response.status, response.reason, response.msg, data
+
+
+def _canResend(error, sent):
+    """Tells whether a request which failed on a reused connection is safe
+    to send again, i.e. whether the server can not have carried it out."""
+
+    import errno
+    import httplib
+    import socket
+
+    if isinstance(error, socket.timeout):
+        return 0
+    if not sent:
+        return isinstance(error, (socket.error, httplib.CannotSendRequest))
+    if isinstance(error, httplib.BadStatusLine):
+        return 1
+    return isinstance(error, socket.error) and \
+           error.args[:1] in ((errno.ECONNRESET,), (errno.EPIPE,))
+
 ################################################################################
 # SOAP Proxy
 ################################################################################
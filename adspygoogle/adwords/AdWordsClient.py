@@ -20,12 +20,13 @@ __author__ = 'api.sgrinberg@gmail.com (Stan Grinberg)'
 
 import os
 import re
-import thread
+import threading
 import time
 
 from adspygoogle.adwords import AdWordsSanityCheck
 from adspygoogle.adwords import AUTH_TOKEN_SERVICE
 from adspygoogle.adwords import DEFAULT_API_VERSION
+from adspygoogle.adwords import DEFAULT_MAX_IN_FLIGHT
 from adspygoogle.adwords import LIB_SHORT_NAME
 from adspygoogle.adwords import LIB_SIG
 from adspygoogle.adwords import REQUIRED_SOAP_HEADERS
@@ -33,11 +34,16 @@ from adspygoogle.adwords.AdWordsErrors import AdWordsError
 from adspygoogle.adwords.GenericAdWordsService import GenericAdWordsService
 from adspygoogle.adwords.ReportDownloader import ReportDownloader
 from adspygoogle.common import SanityCheck
+from adspygoogle.common import ServiceRegistry
 from adspygoogle.common import Utils
 from adspygoogle.common.Client import Client
+from adspygoogle.common.ConnectionPool import ConnectionPool
+from adspygoogle.common.ConnectionPool import DEFAULT_IDLE_TIMEOUT
+from adspygoogle.common.ConnectionPool import DEFAULT_MAX_SIZE
 from adspygoogle.common.Errors import AuthTokenError
 from adspygoogle.common.Errors import ValidationError
 from adspygoogle.common.Logger import Logger
+from adspygoogle.common.WsdlCache import WsdlCache
 
 
 class AdWordsClient(Client):
@@ -95,13 +101,16 @@ class AdWordsClient(Client):
         'strict': 'y',
         'pretty_xml': 'y',
         'compress': 'y',
-        'access': ''
+        'access': '',
+        'connection_pool_size': 10, # 0 = open a new connection per request
+        'connection_idle_timeout': 60,
+        'max_in_flight': 10,
+        'wsdl_cache_dir': '/path/to/cache' # '' = parse WSDLs on every use
       }
       path = '/path/to/home'
     """
     super(AdWordsClient, self).__init__(headers, config, path)
 
-    self.__lock = thread.allocate_lock()
     self.__loc = None
 
     if path is not None:
@@ -214,6 +223,28 @@ class AdWordsClient(Client):
     # Initialize logger.
     self.__logger = Logger(LIB_SIG, self._config['log_home'])
 
+    # Initialize the keep-alive connection pool shared by all services created
+    # from this instance of AdWordsClient.
+    self.__connection_pool = None
+    if int(self._config['connection_pool_size']) > 0:
+      self.__connection_pool = ConnectionPool(
+          self._config['connection_pool_size'],
+          self._config['connection_idle_timeout'])
+
+    # Bound the number of requests that services created from this instance of
+    # AdWordsClient may have in flight at the same time.
+    self.__lock = threading.BoundedSemaphore(int(self._config['max_in_flight']))
+    # Guards the headers and config values which are shared by the services
+    # created from this instance of AdWordsClient and updated as a side effect
+    # of calls: the auth token and its epoch, and the units and operations
+    # counters.
+    self.__state_lock = threading.Lock()
+
+    # Initialize the on-disk cache of compiled WSDLs, if one is configured.
+    self.__wsdl_cache = None
+    if self._config['wsdl_cache_dir']:
+      self.__wsdl_cache = WsdlCache(self._config['wsdl_cache_dir'])
+
   def __LoadAuthCredentials(self):
     """Load existing authentication credentials from adwords_api_auth.pkl.
 
@@ -252,7 +283,11 @@ class AdWordsClient(Client):
     config = super(AdWordsClient, self)._SetMissingDefaultConfigValues(config)
     default_config = {
         'home': AdWordsClient.home,
-        'log_home': os.path.join(AdWordsClient.home, 'logs')
+        'log_home': os.path.join(AdWordsClient.home, 'logs'),
+        'connection_pool_size': DEFAULT_MAX_SIZE,
+        'connection_idle_timeout': DEFAULT_IDLE_TIMEOUT,
+        'max_in_flight': DEFAULT_MAX_IN_FLIGHT,
+        'wsdl_cache_dir': ''
     }
     for key in default_config:
       if key not in config:
@@ -331,6 +366,27 @@ class AdWordsClient(Client):
         self._headers['clientCustomerId'] != client_customer_id):
       self._headers['clientCustomerId'] = client_customer_id
 
+  def ClearWsdlCache(self, service_url=None):
+    """Remove compiled WSDLs from the on-disk cache set by 'wsdl_cache_dir'.
+
+    Also forgets the definitions shared by all services in this process, so
+    that services created afterwards parse their WSDL again. Services which
+    already exist are not affected.
+
+    Args:
+      [optional]
+      service_url: str URL of the service whose compiled WSDLs to remove, i.e.
+                   'https://adwords.google.com/api/adwords/cm/v201206/
+                   CampaignService'. If None, the whole cache is cleared.
+    """
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+    if self.__wsdl_cache is None:
+      return
+    if service_url is None:
+      self.__wsdl_cache.Invalidate()
+    else:
+      self.__wsdl_cache.Invalidate(service_url + '?wsdl')
+
   def __GetValidateOnly(self):
     """Return current state of the validation mode.
 
@@ -440,7 +496,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'AdExtensionOverrideService')
+                                 self.__logger, 'AdExtensionOverrideService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetAdGroupAdService(self, server='https://adwords.google.com',
                           version=None, http_proxy=None):
@@ -474,7 +532,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'AdGroupAdService')
+                                 self.__logger, 'AdGroupAdService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetAdGroupCriterionService(self, server='https://adwords.google.com',
                                  version=None, http_proxy=None):
@@ -508,7 +568,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'AdGroupCriterionService')
+                                 self.__logger, 'AdGroupCriterionService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetAdGroupService(self, server='https://adwords.google.com',
                         version=None, http_proxy=None):
@@ -543,7 +605,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'AdGroupService')
+                                 self.__logger, 'AdGroupService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetAdParamService(self, server='https://adwords.google.com',
                         version=None, http_proxy=None):
@@ -577,7 +641,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'AdParamService')
+                                 self.__logger, 'AdParamService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetAlertService(self, server='https://adwords.google.com', version=None,
                       http_proxy=None):
@@ -611,7 +677,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'AlertService')
+                                 self.__logger, 'AlertService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetBidLandscapeService(self, server='https://adwords.google.com',
                              version=None, http_proxy=None):
@@ -645,7 +713,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'BidLandscapeService')
+                                 self.__logger, 'BidLandscapeService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetBudgetOrderService(self, server='https://adwords.google.com',
                             version=None, http_proxy=None):
@@ -679,7 +749,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'BudgetOrderService')
+                                 self.__logger, 'BudgetOrderService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetBulkMutateJobService(self, server='https://adwords.google.com',
                               version=None, http_proxy=None):
@@ -713,7 +785,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'BulkMutateJobService')
+                                 self.__logger, 'BulkMutateJobService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetMutateJobService(self, server='https://adwords.google.com',
                               version=None, http_proxy=None):
@@ -747,7 +821,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'MutateJobService')
+                                 self.__logger, 'MutateJobService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetCampaignAdExtensionService(self, server='https://adwords.google.com',
                                     version=None, http_proxy=None):
@@ -781,7 +857,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'CampaignAdExtensionService')
+                                 self.__logger, 'CampaignAdExtensionService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetCampaignCriterionService(self, server='https://adwords.google.com',
                                   version=None, http_proxy=None):
@@ -815,7 +893,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'CampaignCriterionService')
+                                 self.__logger, 'CampaignCriterionService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetCampaignService(self, server='https://adwords.google.com',
                          version=None, http_proxy=None):
@@ -850,7 +930,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'CampaignService')
+                                 self.__logger, 'CampaignService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetCampaignTargetService(self, server='https://adwords.google.com',
                                version=None, http_proxy=None):
@@ -885,7 +967,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'CampaignTargetService')
+                                 self.__logger, 'CampaignTargetService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetCreateAccountService(self, server='https://adwords.google.com',
                               version=None, http_proxy=None):
@@ -920,7 +1004,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'CreateAccountService')
+                                 self.__logger, 'CreateAccountService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetConstantDataService(self, server='https://adwords.google.com',
                              version=None, http_proxy=None):
@@ -954,7 +1040,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'ConstantDataService')
+                                 self.__logger, 'ConstantDataService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetCustomerService(self, server='https://adwords.google.com',
                          version=None, http_proxy=None):
@@ -988,7 +1076,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'CustomerService')
+                                 self.__logger, 'CustomerService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetCustomerSyncService(self, server='https://adwords.google.com',
                              version=None, http_proxy=None):
@@ -1022,7 +1112,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'CustomerSyncService')
+                                 self.__logger, 'CustomerSyncService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetExperimentService(self, server='https://adwords.google.com',
                            version=None, http_proxy=None):
@@ -1056,7 +1148,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'ExperimentService')
+                                 self.__logger, 'ExperimentService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetGeoLocationService(self, server='https://adwords.google.com',
                             version=None, http_proxy=None):
@@ -1090,7 +1184,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'GeoLocationService')
+                                 self.__logger, 'GeoLocationService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetInfoService(self, server='https://adwords.google.com', version=None,
                      http_proxy=None):
@@ -1125,7 +1221,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'InfoService')
+                                 self.__logger, 'InfoService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetLocationCriterionService(self, server='https://adwords.google.com',
                                   version=None, http_proxy=None):
@@ -1160,7 +1258,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'LocationCriterionService')
+                                 self.__logger, 'LocationCriterionService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetManagedCustomerService(self, server='https://adwords.google.com',
                                 version=None, http_proxy=None):
@@ -1194,7 +1294,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'ManagedCustomerService')
+                                 self.__logger, 'ManagedCustomerService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetMediaService(self, server='https://adwords.google.com', version=None,
                       http_proxy=None):
@@ -1229,7 +1331,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'MediaService')
+                                 self.__logger, 'MediaService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetReportDefinitionService(self, server='https://adwords.google.com',
                                  version=None, http_proxy=None):
@@ -1264,7 +1368,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'ReportDefinitionService')
+                                 self.__logger, 'ReportDefinitionService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetReportDownloader(self, server='https://adwords.google.com',
                           version=None, http_proxy=None):
@@ -1332,7 +1438,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'ServicedAccountService')
+                                 self.__logger, 'ServicedAccountService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetTargetingIdeaService(self, server='https://adwords.google.com',
                               version=None, http_proxy=None):
@@ -1366,7 +1474,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'TargetingIdeaService')
+                                 self.__logger, 'TargetingIdeaService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetTrafficEstimatorService(self, server='https://adwords.google.com',
                                  version=None, http_proxy=None):
@@ -1400,7 +1510,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'TrafficEstimatorService')
+                                 self.__logger, 'TrafficEstimatorService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetUserListService(self, server='https://adwords.google.com',
                          version=None, http_proxy=None):
@@ -1434,7 +1546,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'UserListService')
+                                 self.__logger, 'UserListService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetConversionTrackerService(self, server='https://adwords.google.com',
                                   version=None, http_proxy=None):
@@ -1468,7 +1582,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'ConversionTrackerService')
+                                 self.__logger, 'ConversionTrackerService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def GetDataService(self, server='https://adwords.google.com',
                      version=None, http_proxy=None):
@@ -1502,7 +1618,9 @@ class AdWordsClient(Client):
         'http_proxy': http_proxy
     }
     return GenericAdWordsService(headers, self._config, op_config, self.__lock,
-                                 self.__logger, 'DataService')
+                                 self.__logger, 'DataService',
+                                 self.__connection_pool, self.__wsdl_cache,
+                                 self.__state_lock)
 
   def _GetOAuthScope(self, server='https://adwords.google.com'):
     """Retrieves the OAuth Scope to use.
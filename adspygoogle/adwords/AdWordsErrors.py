@@ -149,6 +149,51 @@ class AdWordsBillingError(AdWordsApiError):
   pass
 
 
+class AdWordsPartialFailureError(AdWordsError):
+
+  """Implements AdWordsPartialFailureError.
+
+  Responsible for handling the partial failure errors of one operation of a
+  mutate() call which was sent with partialFailure on.
+  """
+
+  def __init__(self, errors):
+    """Inits AdWordsPartialFailureError.
+
+    Args:
+      errors: list Partial failure errors of the operation, as dicts.
+    """
+    self.errors = errors
+    AdWordsError.__init__(self, ', '.join(
+        [str(error.get('errorString') or error.get('ApiError_Type'))
+         for error in errors]))
+
+
+class BatchMutateError(AdWordsError):
+
+  """Implements BatchMutateError.
+
+  Responsible for handling the failure of some of the chunks a list of mutate
+  operations was split into. The chunks which did not fail were applied.
+  """
+
+  def __init__(self, result, failures, chunks):
+    """Inits BatchMutateError.
+
+    Args:
+      result: dict Merged result of the chunks which succeeded, with None as
+              the value of each operation of the failed chunks, or None.
+      failures: list Tuples of the index of the first operation of a failed
+                chunk, its number of operations and the error it raised.
+      chunks: int Number of chunks the operations were split into.
+    """
+    self.result = result
+    self.failures = failures
+    first_error = failures[0][2]
+    AdWordsError.__init__(self, '%d of %d chunks failed, the first one with: %s'
+                          % (len(failures), chunks, first_error))
+
+
 # Map error codes and types to their corresponding classes.
 ERRORS = {}
 ERROR_CODES = [x for x in xrange(0, 208)]
@@ -18,6 +18,7 @@
 
 __author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
 
+import threading
 import time
 
 from adspygoogle import SOAPpy
@@ -30,11 +31,17 @@ from adspygoogle.adwords.AdWordsErrors import AdWordsApiError
 from adspygoogle.adwords.AdWordsErrors import AdWordsError
 from adspygoogle.adwords.AdWordsErrors import ERRORS
 from adspygoogle.adwords.AdWordsSoapBuffer import AdWordsSoapBuffer
+from adspygoogle.adwords.util import Batching
+from adspygoogle.adwords.util import MutateQueue
+from adspygoogle.adwords.util import Paging
+from adspygoogle.adwords.util import PrecompiledSchemas
+from adspygoogle.common import MessageHandler
 from adspygoogle.common import Utils
 from adspygoogle.common.Errors import Error
 from adspygoogle.common.Errors import ValidationError
 from adspygoogle.common.GenericApiService import GenericApiService
 from adspygoogle.common.GenericApiService import MethodInfoKeys
+from adspygoogle.common.soappy import RequestSerializer
 
 
 class GenericAdWordsService(GenericApiService):
@@ -59,7 +66,8 @@ class GenericAdWordsService(GenericApiService):
   # List of fields we should convert to string.
   _STR_CONVERT = ['clientCustomerId']
 
-  def __init__(self, headers, config, op_config, lock, logger, service_name):
+  def __init__(self, headers, config, op_config, lock, logger, service_name,
+               connection_pool=None, wsdl_cache=None, state_lock=None):
     """Inits GenericAdWordsService.
 
     Args:
@@ -68,10 +76,21 @@ class GenericAdWordsService(GenericApiService):
       config: dict Dictionary object with populated configuration values.
       op_config: dict Dictionary object with additional configuration values for
                  this operation.
-      lock: thread.lock Thread lock to use to synchronize requests.
+      lock: threading.BoundedSemaphore Semaphore which bounds the number of
+            requests in flight.
       logger: Logger Instance of Logger to use for logging.
       service_name: string The name of this service.
+      [optional]
+      connection_pool: ConnectionPool Pool of keep-alive connections shared by
+                       all services of one client.
+      wsdl_cache: WsdlCache On-disk cache of compiled service definitions.
+      state_lock: threading.Lock Lock shared by all services of one client,
+                  which guards the auth token and the units and operations
+                  counters.
     """
+    if state_lock is None:
+      state_lock = threading.Lock()
+    self.__state_lock = state_lock
     group = op_config['group']
     if service_name == 'BulkMutateJobService': group = 'job'
     service_url = [op_config['server'], 'api/adwords', group,
@@ -82,11 +101,15 @@ class GenericAdWordsService(GenericApiService):
     namespace = '/'.join(['https://adwords.google.com/api/adwords',
                           op_config['group'], op_config['version']])
     namespace_extractor = _DetermineNamespacePrefix
+    # Every service object for the same URL shares one compiled definition.
+    registry_key = (op_config['server'], group, op_config['version'],
+                    service_name, config['access'])
 
     super(GenericAdWordsService, self).__init__(
         headers, config, op_config, lock, logger, service_name, service_url,
         GenericAdWordsService._WRAP_LISTS, GenericAdWordsService._BUFFER_CLASS,
-        namespace, namespace_extractor)
+        namespace, namespace_extractor, connection_pool, wsdl_cache,
+        registry_key)
 
     # AdWords-specific changes to the SOAPpy.WSDL.Proxy
     methodattrs = {}
@@ -96,25 +119,48 @@ class GenericAdWordsService(GenericApiService):
     methodattrs['xmlns'] = self._namespace
     self._soappyservice.soapproxy.methodattrs = methodattrs
 
-  def _SetHeaders(self):
-    """Sets the SOAP headers for this service's requests."""
-    now = time.time()
-    if ((('authToken' not in self._headers and
-          'auth_token_epoch' not in self._config) or
-         int(now - self._config['auth_token_epoch']) >= AUTH_TOKEN_EXPIRE) and
-        not (self._headers.get('oauth_credentials') or
-             self._headers.get('oauth2credentials'))):
+  def _GetPrecompiledDefinition(self):
+    """Returns the definition of this service shipped with the library.
+
+    Returns:
+      ServiceDefinition The shipped definition, or None if there is none for
+      this service, version and server.
+    """
+    group = PrecompiledSchemas.SERVICES.get(self._service_name)
+    if group is None:
+      return None
+    return PrecompiledSchemas.Load(self._op_config['server'],
+                                   self._op_config['version'], group,
+                                   self._service_name)
+
+  def _GetSoapHeaders(self):
+    """Builds the SOAP headers for a request made by this service.
+
+    Regenerates the auth token first, if it has expired. The token is fetched
+    without holding the client's lock, so that calls which need no new token
+    are not held up by the request for one.
+
+    Returns:
+      headerType The SOAP headers to send with the request.
+    """
+    if self.__IsAuthTokenExpired():
       if ('email' not in self._headers or not self._headers['email'] or
           'password' not in self._headers or not self._headers['password']):
-        raise ValidationError('Required authentication headers, \'email\' and '
-                              '\'password\', are missing. Unable to regenerate '
-                              'authentication token.')
-      self._headers['authToken'] = Utils.GetAuthToken(
-          self._headers['email'], self._headers['password'], AUTH_TOKEN_SERVICE,
-          LIB_SIG, self._config['proxy'])
-      self._config['auth_token_epoch'] = time.time()
-
-    # Apply headers to the SOAPpy service.
+        raise ValidationError('Required authentication headers, \'email\' '
+                              'and \'password\', are missing. Unable to '
+                              'regenerate authentication token.')
+      auth_token = Utils.GetAuthToken(
+          self._headers['email'], self._headers['password'],
+          AUTH_TOKEN_SERVICE, LIB_SIG, self._config['proxy'])
+      self.__state_lock.acquire()
+      try:
+        # Another thread may have stored a fresh token in the meantime.
+        if self.__IsAuthTokenExpired():
+          self._headers['authToken'] = auth_token
+          self._config['auth_token_epoch'] = time.time()
+      finally:
+        self.__state_lock.release()
+
     header_attrs = {
         'xmlns': self._namespace,
         'xmlns:cm': ('https://adwords.google.com/api/adwords/cm/' +
@@ -136,7 +182,23 @@ class GenericAdWordsService(GenericApiService):
     request_header = SOAPpy.Types.structType(
         data=request_header_data, name='RequestHeader', typed=0)
     soap_headers.RequestHeader = request_header
-    self._soappyservice.soapproxy.header = soap_headers
+    return soap_headers
+
+  def __IsAuthTokenExpired(self):
+    """Checks whether a new ClientLogin auth token is needed.
+
+    Returns:
+      bool True if the auth token is missing or has expired and OAuth is not
+      used, False otherwise.
+    """
+    if (self._headers.get('oauth_credentials') or
+        self._headers.get('oauth2credentials')):
+      return False
+    if ('authToken' not in self._headers and
+        'auth_token_epoch' not in self._config):
+      return True
+    return (int(time.time() - self._config['auth_token_epoch']) >=
+            AUTH_TOKEN_EXPIRE)
 
   def _GetMethodInfo(self, method_name):
     """Pulls all of the relevant data about a method from a SOAPpy service.
@@ -205,7 +267,8 @@ class GenericAdWordsService(GenericApiService):
             AdWordsUtils.TransformUserListRuleOperands(operation['operand'])
     return args
 
-  def _HandleLogsAndErrors(self, buf, start_time, stop_time, error=None):
+  def _HandleLogsAndErrors(self, buf, start_time, stop_time, error=None,
+                           call_result=None):
     """Manage SOAP XML message.
 
     Args:
@@ -214,18 +277,30 @@ class GenericAdWordsService(GenericApiService):
       stop_time: str Time after service call was invoked.
       [optional]
       error: dict Error, if any.
+      call_result: CallResult Request metadata and response headers of the
+                   call. Without it, they are read from the buffer.
     """
     if error is None:
       error = {}
     try:
       # Update the number of units and operations consumed by API call.
-      if buf.GetCallUnits() and buf.GetCallOperations():
-        self._config['units'][0] += int(buf.GetCallUnits())
-        self._config['operations'][0] += int(buf.GetCallOperations())
-        self._config['last_units'][0] = int(buf.GetCallUnits())
-        self._config['last_operations'][0] = int(buf.GetCallOperations())
-
-      handlers = self.__GetLogHandlers(buf)
+      if call_result is not None and call_result.HasHeaders():
+        units = call_result.GetHeaderValue('units')
+        operations = call_result.GetHeaderValue('operations')
+      else:
+        units = buf.GetCallUnits()
+        operations = buf.GetCallOperations()
+      if units and operations:
+        self.__state_lock.acquire()
+        try:
+          self._config['units'][0] += int(units)
+          self._config['operations'][0] += int(operations)
+          self._config['last_units'][0] = int(units)
+          self._config['last_operations'][0] = int(operations)
+        finally:
+          self.__state_lock.release()
+
+      handlers = self.__GetLogHandlers(buf, call_result, units, operations)
       fault = super(GenericAdWordsService, self)._ManageSoap(
           buf, handlers, LIB_URL, start_time, stop_time, error)
       if fault:
@@ -250,15 +325,236 @@ class GenericAdWordsService(GenericApiService):
       if error: e = error
       raise Error(e)
 
-  def __GetLogHandlers(self, buf):
+  def IterGet(self, selector, page_size=None, workers=1, ordered=True):
+    """Iterates over the entries matched by a selector, one page at a time.
+
+    By default, the next page is fetched in the background while the caller
+    works through the entries of the current one, so at most two pages are held
+    at a time.
+
+    With more than one worker, the remaining pages are fetched concurrently
+    once the first page told how many entries there are. Workers beyond the
+    client's config['max_in_flight'] would only wait for a free slot, so no
+    more than that many are started.
+
+    Args:
+      selector: dict Selector for this service's get() call. Its paging
+                startIndex, if any, is where iteration starts.
+      [optional]
+      page_size: int Number of entries per page. Defaults to the selector's
+                 numberResults, or 500 if it has none.
+      workers: int Number of pages fetched at the same time.
+      ordered: bool Whether entries fetched by several workers are yielded in
+               the order the server returns them, as opposed to page by page
+               in the order the pages arrive.
+
+    Returns:
+      generator Entries of all pages.
+    """
+    workers = min(workers, int(self._config['max_in_flight']))
+    return Paging.IterEntries(self._GetPage, selector, page_size, workers,
+                              ordered)
+
+  def _GetPage(self, selector):
+    """Calls get() and returns the page it returned.
+
+    Args:
+      selector: dict Selector for the page.
+
+    Returns:
+      dict The page.
+    """
+    page = self.Get(selector)
+    if Utils.BoolTypeConvert(self._config['wrap_in_tuple']):
+      page = page[0]
+    return page
+
+  def BatchMutate(self, operations,
+                  max_operations=Batching.DEFAULT_MAX_OPERATIONS,
+                  max_bytes=Batching.DEFAULT_MAX_BYTES, workers=1):
+    """Sends a list of operations of any length through mutate() in chunks.
+
+    The operations are split into chunks of at most max_operations operations
+    and about max_bytes of request XML, which are sent by up to workers
+    concurrent mutate() calls, no more than the client's
+    config['max_in_flight']. The value lists of the chunks are joined in order,
+    and the fieldPath of partial failure errors, i.e. 'operations[3].operand',
+    is rewritten to index the whole list of operations.
+
+    Args:
+      operations: list Operations for this service's mutate() call.
+      [optional]
+      max_operations: int Number of operations per chunk.
+      max_bytes: int Estimated size of the operations of a chunk, in bytes, or
+                 None to split by number of operations only.
+      workers: int Number of chunks sent at the same time.
+
+    Returns:
+      dict Merged result of all chunks, with the same fields as the result of
+      mutate(). Wrapped in a tuple if config['wrap_in_tuple'] is on.
+
+    Raises:
+      ValidationError: if this service has no mutate() call taking a list of
+                       operations.
+      BatchMutateError: if any chunk failed. The chunks which did not were
+                        applied, and their merged result is on the error.
+    """
+    method_info = self.__GetMutateInfo()
+    get_size = None
+    if max_bytes is not None:
+      get_size = self.__GetOperationSizer(method_info)
+    chunks = Batching.SplitOperations(operations, max_operations, max_bytes,
+                                      get_size)
+    workers = min(workers, int(self._config['max_in_flight']))
+    result = Batching.MutateInChunks(self._Mutate, chunks, workers)
+    if Utils.BoolTypeConvert(self._config['wrap_in_tuple']):
+      result = MessageHandler.WrapInTuple(result)
+    return result
+
+  def GetMutateQueue(self, max_operations=MutateQueue.DEFAULT_MAX_OPERATIONS,
+                     max_delay=MutateQueue.DEFAULT_MAX_DELAY):
+    """Returns a queue which coalesces operations into fewer mutate() calls.
+
+    All services for the same URL, credentials and request headers, i.e. the
+    same client customer id, developer token and validateOnly, share one queue,
+    so operations added by any thread are sent together. Operations are sent
+    once max_operations of them are waiting, or max_delay milliseconds after
+    the first of them was added. The queue's settings are those of the call
+    which created it.
+
+    Args:
+      [optional]
+      max_operations: int Number of operations sent in one call.
+      max_delay: int Number of milliseconds an operation waits for others.
+
+    Returns:
+      MutateQueue The queue. Its Add() returns a future for each operation.
+
+    Raises:
+      ValidationError: if this service has no mutate() call taking a list of
+                       operations, or partialFailure is not on.
+    """
+    self.__GetMutateInfo()
+    if not Utils.BoolTypeConvert(self._headers.get('partialFailure')):
+      raise ValidationError('Coalesced operations are sent with partialFailure '
+                            'on, so that one bad operation does not fail the '
+                            'others. Set partial_failure on the client before '
+                            'creating the service.')
+    return MutateQueue.GetSharedQueue(self.__GetMutateQueueKey(),
+                                      self._Mutate, max_operations, max_delay)
+
+  def __GetMutateQueueKey(self):
+    """Returns what identifies the services which may share a mutate queue.
+
+    Operations of a shared queue are sent by the service which created it, so
+    services only share a queue if their calls would be sent by the same user
+    with the same headers.
+
+    Returns:
+      tuple The service URL, the user the calls are authorized as, and the
+      value of each request header other than the auth token.
+    """
+    if self._headers.get('oauth2credentials'):
+      identity = ('oauth2', self._headers['oauth2credentials'])
+    elif self._headers.get('oauth_credentials'):
+      identity = ('oauth', _MakeHashable(self._headers['oauth_credentials']))
+    elif self._headers.get('email'):
+      identity = ('email', self._headers['email'])
+    else:
+      identity = ('authToken', self._headers.get('authToken'))
+    key = [self._service_url, identity]
+    for header in GenericAdWordsService._POSSIBLE_ADWORDS_REQUEST_HEADERS:
+      if header != 'authToken':
+        value = self._headers.get(header)
+        if value is not None:
+          value = str(value)
+        key.append(value)
+    return tuple(key)
+
+  def _Mutate(self, operations):
+    """Calls mutate() and returns the result it returned.
+
+    Args:
+      operations: list Operations to send.
+
+    Returns:
+      dict The result.
+    """
+    result = self.Mutate(operations)
+    if Utils.BoolTypeConvert(self._config['wrap_in_tuple']):
+      result = result[0]
+    return result
+
+  def __GetMutateInfo(self):
+    """Returns the input of this service's mutate() call.
+
+    Returns:
+      dict Information about the operations parameter of mutate().
+
+    Raises:
+      ValidationError: if this service has no mutate() call taking a list of
+                       operations.
+    """
+    if 'mutate' in self._soappyservice.methods:
+      inputs = self._GetMethodInfo('mutate')[MethodInfoKeys.INPUTS]
+      if (len(inputs) == 1 and
+          inputs[0][MethodInfoKeys.MAX_OCCURS] == 'unbounded'):
+        return inputs[0]
+    raise ValidationError('%s has no mutate() call taking a list of '
+                          'operations.' % self._service_name)
+
+  def __GetOperationSizer(self, method_info):
+    """Returns a function which estimates the request XML of an operation.
+
+    Operations are serialized the way mutate() would send them where possible.
+    The size of the others is estimated from their repr().
+
+    Args:
+      method_info: dict Information about the operations parameter of
+                   mutate().
+
+    Returns:
+      function Takes an operation and returns its estimated size in bytes.
+    """
+    soap_config = self._GetSoapConfig()
+    serializable = (RequestSerializer.CanSerialize(soap_config) and
+                    self._PackArg.im_func is GenericApiService._PackArg.im_func)
+
+    def GetSize(operation):
+      if serializable:
+        serialized = RequestSerializer.SerializeArg(
+            operation, str(method_info[MethodInfoKeys.ELEMENT_NAME]),
+            method_info[MethodInfoKeys.NS], method_info[MethodInfoKeys.TYPE],
+            self._soappyservice, self._namespace_extractor, soap_config)
+        if serialized is not None:
+          return sum([len(piece) for piece in serialized.pieces])
+      return len(repr(operation))
+
+    return GetSize
+
+  def __GetLogHandlers(self, buf, call_result, units, operations):
     """Gets a list of log handlers for the AdWords library.
 
     Args:
       buf: SoapBuffer SOAP buffer from which calls are retrieved for logging.
+      call_result: CallResult Request metadata and response headers of the
+                   call, or None to read them from the buffer.
+      units: str Value of the units header.
+      operations: str Value of the operations header.
 
     Returns:
       list Log handlers for the AdWords library.
     """
+    if call_result is not None and call_result.HasHeaders():
+      call_name = call_result.method_name
+      operators = call_result.GetOperators()
+      response_time = call_result.GetHeaderValue('responseTime')
+      request_id = call_result.GetHeaderValue('requestId')
+    else:
+      call_name = buf.GetCallName()
+      operators = buf.GetOperatorName()
+      response_time = buf.GetCallResponseTime()
+      request_id = buf.GetCallRequestId()
     return [
         {
             'tag': 'xml_log',
@@ -271,10 +567,8 @@ class GenericAdWordsService(GenericApiService):
             'data': str('host=%s service=%s method=%s operator=%s '
                         'responseTime=%s operations=%s units=%s requestId=%s'
                         % (Utils.GetNetLocFromUrl(self._service_url),
-                           self._service_name, buf.GetCallName(),
-                           buf.GetOperatorName(), buf.GetCallResponseTime(),
-                           buf.GetCallOperations(), buf.GetCallUnits(),
-                           buf.GetCallRequestId()))
+                           self._service_name, call_name, operators,
+                           response_time, operations, units, request_id))
         },
         {
             'tag': '',
@@ -284,6 +578,24 @@ class GenericAdWordsService(GenericApiService):
     ]
 
 
+def _MakeHashable(value):
+  """Returns a value which can be used in a dictionary key.
+
+  Args:
+    value: object Value made of dicts, lists and hashable values.
+
+  Returns:
+    object The value, with dicts turned into sorted tuples of their items and
+    lists into tuples.
+  """
+  if isinstance(value, dict):
+    return tuple([(key, _MakeHashable(value[key]))
+                  for key in sorted(value.keys())])
+  if isinstance(value, (list, tuple)):
+    return tuple([_MakeHashable(item) for item in value])
+  return value
+
+
 def _DetermineNamespacePrefix(url):
   """Returns the SOAP prefix to use for definitions within the given namespace.
 
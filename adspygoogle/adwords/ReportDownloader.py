@@ -18,24 +18,41 @@
 
 __author__ = 'api.kwinter@gmail.com (Kevin Winter)'
 
+import copy
+import csv
+import decimal
 import gzip
 import re
 import StringIO
+import struct
 import time
 import urllib
 import urllib2
+import zlib
 
 from adspygoogle import SOAPpy
 from adspygoogle.adwords import AUTH_TOKEN_EXPIRE
 from adspygoogle.adwords import AUTH_TOKEN_SERVICE
 from adspygoogle.adwords import LIB_SIG
 from adspygoogle.adwords.AdWordsErrors import AdWordsError
+from adspygoogle.adwords.util import PrecompiledSchemas
+from adspygoogle.adwords.util import ReportAggregator
+from adspygoogle.adwords.util import ReportColumns
+from adspygoogle.adwords.util import ReportScheduler
 from adspygoogle.adwords.util import XsdToWsdl
+from adspygoogle.common import LruCache
 from adspygoogle.common import MessageHandler
 from adspygoogle.common import SanityCheck
+from adspygoogle.common import ServiceRegistry
 from adspygoogle.common import Utils
 from adspygoogle.common.Errors import ValidationError
 from adspygoogle.common.Logger import Logger
+from adspygoogle.common.soappy import ServiceDefinition
+
+try:
+  from hashlib import sha1
+except ImportError:
+  from sha import new as sha1
 
 
 SERVICE_NAME = 'ReportDefinitionService'
@@ -45,6 +62,28 @@ VERSIONED='/%s'
 OLD_ERROR_REGEX = r'^!!!([-\d]+)\|\|\|([-\d]+)\|\|\|(.*)\?\?\?'
 ATTRIBUTES_REGEX = r'( )?[\w:-]+="[\w:\[\]-]+"'
 BUF_SIZE = 4096
+# Makes zlib expect, and check, a gzip header and trailer.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# First bytes of every gzip stream.
+GZIP_MAGIC = '\x1f\x8b'
+# Field separators of the download formats which can be read row by row.
+ROW_DELIMITERS = {
+    'CSV': ',',
+    'TSV': '\t',
+    'GZIPPED_CSV': ',',
+    'GZIPPED_TSV': '\t'
+}
+# Value of the first column of the totals row which ends a report.
+TOTALS_LABEL = 'Total'
+# Values which stand for a missing number.
+NULL_VALUES = ('', '--', ' --')
+# Finds the list of fields of an AWQL query.
+AWQL_FIELDS_REGEX = r'^\s*SELECT\s+(.+?)\s+FROM\s'
+# Number of report definitions whose request payload is kept for reuse.
+PAYLOAD_CACHE_SIZE = 100
+# Request payloads of recently downloaded report definitions, shared by all
+# downloaders in this process and keyed by server, version and definition hash.
+PAYLOAD_CACHE = LruCache.LruCache(PAYLOAD_CACHE_SIZE)
 
 
 class ReportDownloader(object):
@@ -71,38 +110,98 @@ class ReportDownloader(object):
     xsd_url = '%s%s%s/reportDefinition.xsd' % (op_config['server'],
                                                '/api/adwords/reportdownload/',
                                                self._op_config['version'])
-    self._soappyservice = XsdToWsdl.CreateWsdlFromXsdUrl(xsd_url)
+    self._soappyservice = ServiceRegistry.SHARED_REGISTRY.GetDefinition(
+        (op_config['server'], PrecompiledSchemas.REPORT_GROUP,
+         self._op_config['version'], PrecompiledSchemas.REPORT_DEFINITION),
+        lambda: self.__LoadReportDefinitionSchema(xsd_url))
     self._logger = logger
 
+  def __LoadReportDefinitionSchema(self, xsd_url):
+    """Returns the compiled schema of report definitions.
+
+    Uses the schema shipped with the library if there is one, and downloads and
+    compiles reportDefinition.xsd otherwise.
+
+    Args:
+      xsd_url: str URL of reportDefinition.xsd.
+
+    Returns:
+      ServiceDefinition The compiled schema.
+    """
+    definition = PrecompiledSchemas.Load(
+        self._op_config['server'], self._op_config['version'],
+        PrecompiledSchemas.REPORT_GROUP, PrecompiledSchemas.REPORT_DEFINITION)
+    if definition is None:
+      definition = ServiceDefinition.CompileWsdlProxy(
+          XsdToWsdl.CreateWsdlFromXsdUrl(xsd_url))
+    return definition
+
   def DownloadReport(self, report_definition_or_id, return_micros=False,
-                     file_path=None, fileobj=None):
+                     file_path=None, fileobj=None, progress_callback=None,
+                     keep_compressed=False, count_rows=False):
     """Downloads a report by object or id.
 
+    With keep_compressed, the report is saved gzipped, as the server sent it,
+    instead of being decompressed; see DownloadReportWithAwql.
+
     Args:
       report_definition_or_id: dict or str Report or reportDefinitionId.
       return_micros: bool Whether to return currency in micros (optional).
       file_path: str File path to download to (optional).
       fileobj: file An already-open file-like object that supports write()
                (optional).
+      progress_callback: function Called with the number of bytes received
+                         and the number of bytes of report data they held,
+                         after each chunk of the response (optional).
+      keep_compressed: bool Whether to save the report gzipped (optional).
+      count_rows: bool Whether to count the rows of a report saved with
+                  keep_compressed. Reports downloaded by id can not be counted,
+                  as their format is not known (optional).
 
     Returns:
       str Report data if file_path and fileobj are None, None if fileobj is
-          not None and file_path otherwise.
+          not None and file_path otherwise. With count_rows, a tuple of the
+          above and the number of rows of the report.
+
+    Raises:
+      ValidationError: if count_rows is set for a report which can not be
+                       counted.
+      zlib.error: if the gzipped report is corrupt or incomplete.
     """
+    if keep_compressed or count_rows:
+      if isinstance(report_definition_or_id, dict):
+        return self.__DownloadCompressedReport(
+            self.__GenerateUrl(),
+            self.__GetReportPayload(report_definition_or_id),
+            report_definition_or_id.get('downloadFormat'), return_micros,
+            file_path, fileobj, progress_callback, count_rows)
+      return self.__DownloadCompressedReport(
+          self.__GenerateUrl(report_definition_or_id), None, None,
+          return_micros, file_path, fileobj, progress_callback, count_rows)
+
     if not fileobj and file_path:
       fileobj = open(file_path, 'w+')
 
     if isinstance(report_definition_or_id, dict):
       return self.__DownloadAdHocReport(report_definition_or_id, return_micros,
-                                        fileobj) or file_path
+                                        fileobj, progress_callback) or file_path
     else:
       return self.__DownloadReportById(report_definition_or_id, return_micros,
-                                       fileobj) or file_path
+                                       fileobj, progress_callback) or file_path
 
   def DownloadReportWithAwql(self, report_query, download_format,
-                             return_micros=False, file_path=None, fileobj=None):
+                             return_micros=False, file_path=None, fileobj=None,
+                             progress_callback=None, keep_compressed=False,
+                             count_rows=False):
     """Downloads a report with AWQL.
 
+    With keep_compressed, the report is saved gzipped, exactly as the server
+    sent it, instead of being decompressed and compressed again. Reports in
+    GZIPPED_* formats are downloaded as they are; for other formats, the
+    server is asked to gzip the response. The gzip stream is still
+    decompressed alongside, only to check it against the CRC and length in its
+    trailer and, with count_rows, to count the rows of a CSV or TSV report.
+
     Args:
       report_query: str AWQL for the report.
       download_format: str Download format. E.g. CSV, TSV, XML.
@@ -110,42 +209,322 @@ class ReportDownloader(object):
       file_path: str File path to download to (optional).
       fileobj: file An already-open file-like object that supports write()
                (optional).
+      progress_callback: function Called with the number of bytes received
+                         and the number of bytes of report data they held,
+                         after each chunk of the response (optional).
+
+      keep_compressed: bool Whether to save the report gzipped (optional).
+      count_rows: bool Whether to count the rows of a CSV or TSV report saved
+                  with keep_compressed (optional).
 
     Returns:
       str Report data if file_path and fileobj are None, None if fileobj is
-          not None and file_path otherwise.
+          not None and file_path otherwise. With count_rows, a tuple of the
+          above and the number of rows of the report.
+
+    Raises:
+      ValidationError: if count_rows is set for a report which can not be
+                       counted.
+      zlib.error: if the gzipped report is corrupt or incomplete.
     """
+    if keep_compressed or count_rows:
+      payload = urllib.urlencode({
+          '__fmt': download_format,
+          '__rdquery': report_query
+      })
+      return self.__DownloadCompressedReport(
+          self.__GenerateUrl(), payload, download_format, return_micros,
+          file_path, fileobj, progress_callback, count_rows)
+
     if not fileobj and file_path:
       fileobj = open(file_path, 'w+')
 
     return self.__DownloadAdHocReportWithAwql(report_query,
                                               download_format,
                                               return_micros,
-                                              fileobj) or file_path
+                                              fileobj,
+                                              progress_callback) or file_path
+
+  def GetAccountDownloader(self, client_customer_id):
+    """Returns a copy of this downloader for another client account.
+
+    Args:
+      client_customer_id: str Id of the account to download reports for.
+
+    Returns:
+      ReportDownloader Downloader which shares everything but its headers with
+      this one.
+    """
+    downloader = copy.copy(self)
+    downloader._headers = dict(self._headers,
+                               clientCustomerId=client_customer_id)
+    return downloader
+
+  def DownloadReportForAccounts(
+      self, report_definition_or_query, client_customer_ids,
+      download_format=None, output_dir=None, fileobj=None, return_micros=False,
+      workers=ReportScheduler.DEFAULT_WORKERS,
+      retries=ReportScheduler.DEFAULT_RETRIES,
+      retry_delay=ReportScheduler.DEFAULT_RETRY_DELAY):
+    """Downloads a report for many client accounts at once.
+
+    Either saves each account's report to its own file in output_dir, named
+    after the account, or merges the rows of all of them, prefixed with the
+    account's id, into fileobj. Failed downloads are retried, and do not stop
+    the downloads of other accounts.
+
+    Args:
+      report_definition_or_query: dict or str Report or AWQL for the report.
+      client_customer_ids: list Ids of the accounts to download the report for.
+      download_format: str Download format. Only needed with AWQL (optional).
+      output_dir: str Directory to save one file per account to (optional).
+      fileobj: file File-like object to merge CSV or TSV reports into
+               (optional).
+      return_micros: bool Whether to return currency in micros (optional).
+      workers: int Number of reports downloaded at the same time (optional).
+      retries: int Number of times a failed download is retried (optional).
+      retry_delay: float Seconds to wait before the first retry of a download,
+                   doubled for each further retry (optional).
+
+    Returns:
+      list Manifest with the outcome for each account, see
+      ReportScheduler.DownloadReports.
+    """
+    return ReportScheduler.DownloadReports(
+        self, report_definition_or_query, client_customer_ids,
+        download_format, output_dir, fileobj, return_micros, workers, retries,
+        retry_delay)
+
+  def DownloadShardedReport(self, report_definition, shard='WEEK',
+                            return_micros=False, file_path=None, fileobj=None,
+                            workers=ReportScheduler.DEFAULT_WORKERS,
+                            retries=ReportScheduler.DEFAULT_RETRIES,
+                            retry_delay=ReportScheduler.DEFAULT_RETRY_DELAY):
+    """Downloads a CUSTOM_DATE report in shards of its date range at once.
+
+    The report's date range is split into shards of a day, a week or a number
+    of days, whose reports are downloaded at the same time and retried on
+    their own if they fail. They are merged into one report in date order, as
+    soon as each shard and those before it are complete. The merged report
+    starts with the column header row, followed by the rows of every shard;
+    the report title and totals rows of the shards are left out, as each only
+    covers its own shard.
+
+    Args:
+      report_definition: dict Report to download, with a dateRangeType of
+                         CUSTOM_DATE and a downloadFormat of CSV or TSV.
+      shard: str or int Size of a shard, either DAY, WEEK or a number of days
+             (optional).
+      return_micros: bool Whether to return currency in micros (optional).
+      file_path: str File path to download to (optional).
+      fileobj: file An already-open file-like object that supports write()
+               (optional).
+      workers: int Number of shards downloaded at the same time (optional).
+      retries: int Number of times a failed shard is retried (optional).
+      retry_delay: float Seconds to wait before the first retry of a shard,
+                   doubled for each further retry (optional).
+
+    Returns:
+      str Report data if file_path and fileobj are None, None if fileobj is
+          not None and file_path otherwise.
+
+    Raises:
+      ValidationError: if the report is not a CUSTOM_DATE report in CSV or TSV
+                       format.
+    """
+    if report_definition.get('dateRangeType') != 'CUSTOM_DATE':
+      raise ValidationError('Only CUSTOM_DATE reports can be sharded.')
+    download_format = str(report_definition.get('downloadFormat')).upper()
+    if download_format not in ReportScheduler.MERGE_DELIMITERS:
+      raise ValidationError('Reports in %s format can not be sharded.'
+                            % download_format)
+    date_range = (report_definition.get('selector') or {}).get('dateRange')
+    if not date_range:
+      raise ValidationError('Report has no selector dateRange to shard.')
+    shards = ReportScheduler.SplitDateRange(date_range.get('min'),
+                                            date_range.get('max'), shard)
+    delimiter = ReportScheduler.MERGE_DELIMITERS[download_format]
+
+    if not fileobj and file_path:
+      fileobj = open(file_path, 'w+')
+    output = fileobj or StringIO.StringIO()
+
+    def DownloadShard(shard_range, spool):
+      shard_definition = copy.deepcopy(report_definition)
+      shard_definition['selector']['dateRange'] = {
+          'min': shard_range[0],
+          'max': shard_range[1]
+      }
+      self.__DownloadAdHocReport(shard_definition, return_micros, spool)
+
+    def WriteShard(index, spool):
+      _MergeShard(spool, output, delimiter, index == 0)
+
+    ReportScheduler.DownloadShards(DownloadShard, shards, WriteShard, workers,
+                                   retries, retry_delay)
+    if fileobj:
+      return file_path
+    return output.getvalue()
+
+  def IterReportRows(self, report_definition_or_query, download_format=None,
+                     return_micros=False, as_dict=False, column_types=None,
+                     include_header=False):
+    """Downloads a report and yields its rows as they arrive.
+
+    The report is parsed straight off the response, so memory use does not grow
+    with the size of the report. The report title and the totals row are
+    skipped, and the column header row is used to name the fields of each row.
+
+    Args:
+      report_definition_or_query: dict or str Report to download, or AWQL for
+                                  the report.
+      download_format: str Download format, one of CSV, TSV, GZIPPED_CSV or
+                       GZIPPED_TSV. Only needed with AWQL, as a report
+                       definition has its own downloadFormat (optional).
+      return_micros: bool Whether to return currency in micros (optional).
+      as_dict: bool Whether to yield each row as a dict keyed by column header,
+               as opposed to a tuple (optional).
+      column_types: dict Column headers mapped to the field type of their
+                    column, i.e. {'Cost': 'Money', 'Clicks': 'Long'}, or to a
+                    function which converts a value. Values of other columns
+                    are left as str. Supported field types are Money, Bid,
+                    Integer, Long and Double (optional).
+      include_header: bool Whether to yield the column headers, as a tuple,
+                      before the first row (optional).
+
+    Returns:
+      generator Rows of the report.
+
+    Raises:
+      ValidationError: if the download format can not be read row by row.
+    """
+    if isinstance(report_definition_or_query, dict):
+      download_format = report_definition_or_query.get('downloadFormat')
+      payload = self.__GetReportPayload(report_definition_or_query)
+    else:
+      payload = urllib.urlencode({
+          '__fmt': download_format,
+          '__rdquery': report_definition_or_query
+      })
+    download_format = str(download_format).upper()
+    if download_format not in ROW_DELIMITERS:
+      raise ValidationError('Reports in %s format can not be read row by row.'
+                            % download_format)
+    converters = _GetConverters(column_types or {}, return_micros)
+
+    response = self.__DownloadReport(payload, return_micros, stream=True)
+    if download_format.startswith('GZIPPED_'):
+      response = _ResponseReader(response, True)
+    return _IterRows(response.IterLines(), ROW_DELIMITERS[download_format],
+                     as_dict, converters, include_header)
+
+  def DownloadReportColumns(self, report_definition_or_query,
+                            download_format=None, column_types=None,
+                            output_dir=None):
+    """Downloads a report into one typed buffer per column.
+
+    The columns are named after the fields of the report's selector, or of the
+    SELECT clause of its AWQL, and filled as the report downloads. Fields
+    named in column_types are stored as 64-bit integers or doubles, with
+    currency in micros; other fields are stored as strings, dictionary-encoded.
+
+    Args:
+      report_definition_or_query: dict or str Report to download, or AWQL for
+                                  the report.
+      download_format: str Download format, one of CSV, TSV, GZIPPED_CSV or
+                       GZIPPED_TSV. Only needed with AWQL, as a report
+                       definition has its own downloadFormat (optional).
+      column_types: dict Fields mapped to their field type, i.e.
+                    {'Id': 'Long', 'Impressions': 'Long', 'Cost': 'Money'}.
+                    Supported field types are Money, Bid, Integer, Long and
+                    Double (optional).
+      output_dir: str Directory to save the columns to as .npy files, which
+                  ReportColumns.LoadColumns() memory-maps (optional).
+
+    Returns:
+      ReportColumns The columns of the report.
+
+    Raises:
+      ValidationError: if the report's fields can not be found, or a field
+                       type is not supported.
+    """
+    columns = ReportColumns.ReportColumns(
+        _GetFields(report_definition_or_query), column_types)
+    columns.ReadRows(self.IterReportRows(report_definition_or_query,
+                                         download_format, return_micros=True))
+    if output_dir is not None:
+      columns.Save(output_dir)
+    return columns
+
+  def AggregateReport(self, report_definition_or_query, group_by, aggregates,
+                      download_format=None, column_types=None, as_dict=False,
+                      max_groups=ReportAggregator.DEFAULT_MAX_GROUPS):
+    """Downloads a report and aggregates its rows per group as they arrive.
+
+    Rows are grouped by the values of the group_by fields, and only the running
+    aggregates of each group are kept, so the report is never held whole. Once
+    there are more than max_groups groups, they are spilled to disk. Currency
+    is aggregated in micros.
+
+    Args:
+      report_definition_or_query: dict or str Report to download, or AWQL for
+                                  the report.
+      group_by: list Fields to group the rows by, i.e. ['CampaignId'].
+      aggregates: list Aggregates to compute for each group, one of SUM, COUNT,
+                  MIN or MAX of a field, i.e. ['SUM(Cost)', 'COUNT(*)'].
+      download_format: str Download format, one of CSV, TSV, GZIPPED_CSV or
+                       GZIPPED_TSV. Only needed with AWQL, as a report
+                       definition has its own downloadFormat (optional).
+      column_types: dict Fields mapped to 'String', to compare their values by
+                    MIN and MAX as strings instead of numbers (optional).
+      as_dict: bool Whether to yield each group as a dict keyed by field and
+               aggregate, as opposed to a tuple (optional).
+      max_groups: int Number of groups held in memory before spilling them to
+                  disk (optional).
+
+    Returns:
+      generator Values of the group_by fields followed by the aggregates, for
+      each group in the order of its values.
+
+    Raises:
+      ValidationError: if a field is not in the report, or an aggregate is not
+                       supported.
+    """
+    aggregator = ReportAggregator.ReportAggregator(
+        _GetFields(report_definition_or_query), group_by, aggregates,
+        column_types, max_groups)
+    try:
+      aggregator.ReadRows(self.IterReportRows(
+          report_definition_or_query, download_format, return_micros=True))
+    except Exception:
+      aggregator.Close()
+      raise
+    return _IterAggregates(aggregator, as_dict)
 
   def __DownloadAdHocReport(self, report_definition, return_micros=False,
-                            fileobj=None):
+                            fileobj=None, progress_callback=None):
     """Downloads an AdHoc report.
 
     Args:
       report_definition: dict Report to download.
       return_micros: bool Whether to return currency in micros (optional).
       fileobj: file File to write to (optional).
+      progress_callback: function Called with the bytes received and the bytes
+                         of report data so far (optional).
 
     Returns:
       str Report data if no fileobj, otherwise None.
     """
-    report_xml = self.__GetReportXml(report_definition)
-    query_params = {'__rdxml': report_xml}
-
-    payload = urllib.urlencode(query_params)
-    return self.__DownloadReport(payload, return_micros, fileobj)
+    payload = self.__GetReportPayload(report_definition)
+    return self.__DownloadReport(payload, return_micros, fileobj,
+                                 progress_callback)
 
   def __DownloadAdHocReportWithAwql(self,
                                     report_query,
                                     download_format,
                                     return_micros=False,
-                                    fileobj=None):
+                                    fileobj=None,
+                                    progress_callback=None):
     """Downloads an AdHoc report with AWQL.
 
     Args:
@@ -153,6 +532,8 @@ class ReportDownloader(object):
       download_format: str Format of the report download.
       return_micros: bool Whether to return currency in micros (optional).
       fileobj: file File to write to (optional).
+      progress_callback: function Called with the bytes received and the bytes
+                         of report data so far (optional).
 
     Returns:
       str Report data if no fileobj, otherwise None.
@@ -163,25 +544,117 @@ class ReportDownloader(object):
     }
 
     payload = urllib.urlencode(query_params)
-    return self.__DownloadReport(payload, return_micros, fileobj)
+    return self.__DownloadReport(payload, return_micros, fileobj,
+                                 progress_callback)
 
-  def __DownloadReport(self, report_payload, return_micros=False, fileobj=None):
+  def __DownloadReport(self, report_payload, return_micros=False, fileobj=None,
+                       progress_callback=None, stream=False):
     """Downloads an AdHoc report for the specified payload.
 
     Args:
       report_payload: str Report payload to POST to the server.
       return_micros: bool Whether to return currency in micros (optional).
       fileobj: file File to write to (optional).
+      progress_callback: function Called with the bytes received and the bytes
+                         of report data so far (optional).
+      stream: bool Whether to return the response to read the report from
+              (optional).
 
     Returns:
-      str Report data if no fileobj, otherwise None.
+      str Report data if no fileobj, otherwise None. If stream is set, the
+      response to read the report from.
     """
     url = self.__GenerateUrl()
     self.__ReloadAuthToken()
     headers = self.__GenerateHeaders(return_micros, url)
     headers['Content-Type'] = 'application/x-www-form-urlencoded'
     headers['Content-Length'] = str(len(report_payload))
-    return self.__MakeRequest(url, headers, fileobj, payload=report_payload)
+    return self.__MakeRequest(url, headers, fileobj, payload=report_payload,
+                              progress_callback=progress_callback,
+                              stream=stream)
+
+  def __DownloadCompressedReport(self, url, payload, download_format,
+                                 return_micros, file_path, fileobj,
+                                 progress_callback, count_rows):
+    """Downloads a report and saves it gzipped, as the server sent it.
+
+    Args:
+      url: str Resource to download the report from.
+      payload: str Report payload to POST to the server, or None.
+      download_format: str Download format, or None if not known.
+      return_micros: bool Whether to return currency in micros.
+      file_path: str File path to download to, or None.
+      fileobj: file File-like object to download to, or None.
+      progress_callback: function Called with the bytes received and the bytes
+                         of report data so far, or None.
+      count_rows: bool Whether to count the rows of the report.
+
+    Returns:
+      str Gzipped report if file_path and fileobj are None, None if fileobj is
+      not None and file_path otherwise. With count_rows, a tuple of the above
+      and the number of rows of the report.
+    """
+    download_format = download_format and str(download_format).upper()
+    row_delimiter = None
+    if count_rows:
+      if download_format not in ROW_DELIMITERS:
+        raise ValidationError('Rows of reports in %s format can not be '
+                              'counted.' % download_format)
+      row_delimiter = ROW_DELIMITERS[download_format]
+
+    self.__ReloadAuthToken()
+    # Gzipped reports are not worth compressing again, and reports of unknown
+    # format might be gzipped already.
+    compress = bool(download_format) and not download_format.startswith(
+        'GZIPPED_')
+    headers = self.__GenerateHeaders(return_micros, url, compress)
+    if payload is not None:
+      headers['Content-Type'] = 'application/x-www-form-urlencoded'
+      headers['Content-Length'] = str(len(payload))
+
+    output = fileobj
+    if output is None and file_path:
+      output = open(file_path, 'wb')
+    elif output is None:
+      output = StringIO.StringIO()
+    try:
+      rows = self.__MakeRequest(url, headers, output, payload,
+                                progress_callback, keep_compressed=True,
+                                row_delimiter=row_delimiter)
+    finally:
+      if output is not fileobj and file_path:
+        output.close()
+
+    if fileobj is not None:
+      result = None
+    elif file_path:
+      result = file_path
+    else:
+      result = output.getvalue()
+    if count_rows:
+      return result, rows
+    return result
+
+  def __GetReportPayload(self, report_definition):
+    """Returns the request payload of a report definition.
+
+    Building the report XML is costly, so the payloads of recently used
+    definitions are kept in PAYLOAD_CACHE and reused for equal definitions.
+
+    Args:
+      report_definition: dict Report to download.
+
+    Returns:
+      str Urlencoded request payload.
+    """
+    key = (self._op_config['server'], self._op_config['version'],
+           _HashDefinition(report_definition))
+    payload = PAYLOAD_CACHE.Get(key)
+    if payload is None:
+      payload = urllib.urlencode(
+          {'__rdxml': self.__GetReportXml(report_definition)})
+      PAYLOAD_CACHE.Set(key, payload)
+    return payload
 
   def __GetReportXml(self, report):
     """Transforms the report object into xml.
@@ -230,13 +703,15 @@ class ReportDownloader(object):
     return re.sub(ATTRIBUTES_REGEX, '', report_xml).strip()
 
   def __DownloadReportById(self, report_definition_id, return_micros=False,
-                           fileobj=None):
+                           fileobj=None, progress_callback=None):
     """Download report and return raw data.
 
     Args:
       report_definition_id: str Id of the report definition to download.
       return_micros: bool Whether to return currency in micros.
       fileobj: str Path to download file to.
+      progress_callback: function Called with the bytes received and the bytes
+                         of report data so far.
 
     Returns:
       str Report data if no fileobj, otherwise None.
@@ -244,7 +719,8 @@ class ReportDownloader(object):
     self.__ReloadAuthToken()
     url = self.__GenerateUrl(report_definition_id)
     headers = self.__GenerateHeaders(return_micros, url)
-    return self.__MakeRequest(url, headers, fileobj)
+    return self.__MakeRequest(url, headers, fileobj,
+                              progress_callback=progress_callback)
 
   def __GenerateUrl(self, report_definition_id=None):
     """Generates the URL to get a report from.
@@ -261,13 +737,16 @@ class ReportDownloader(object):
       url.append(REPORT_ID % report_definition_id)
     return ''.join(url)
 
-  def __GenerateHeaders(self, return_micros, url):
+  def __GenerateHeaders(self, return_micros, url, compress=None):
     """Generates the headers to use for the report download.
 
     Args:
       return_micros: bool whether or not to use micros for money.
       url: str URL the report will be downloaded from, needed if OAuth is
            enabled.
+      compress: bool Whether to ask for a gzipped response, or None to follow
+                config['compress'] (optional). Whether the request body is
+                gzipped always follows config['compress'].
 
     Returns:
       dict Dictionary containing all the headers for the request
@@ -294,33 +773,55 @@ class ReportDownloader(object):
     headers['returnMoneyInMicros'] = str(return_micros).lower()
     headers['developerToken'] = self._headers['developerToken']
     headers['User-Agent'] = self._headers['userAgent']
-    if Utils.BoolTypeConvert(self._config['compress']):
+    compress_request = Utils.BoolTypeConvert(self._config['compress'])
+    if compress is None:
+      compress = compress_request
+    if compress:
       headers['Accept-Encoding'] = 'gzip'
       headers['User-Agent'] += ',gzip'
+    if compress_request:
+      # Tells __MakeRequest to gzip the payload.
       headers['Content-Encoding'] = 'gzip'
     return headers
 
-  def __MakeRequest(self, url, headers=None, fileobj=None, payload=None):
+  def __MakeRequest(self, url, headers=None, fileobj=None, payload=None,
+                    progress_callback=None, stream=False,
+                    keep_compressed=False, row_delimiter=None):
     """Performs an HTTPS request and slightly processes the response.
 
     If fileobj is provided, saves the body to file instead of including it
-    in the return value.
+    in the return value. The payload is gzipped if, and only if, the headers
+    have a gzip Content-Encoding. A gzipped body is decompressed as it is read
+    from the socket, so only one chunk of it is held in memory at a time.
 
     Args:
       url: str Resource for the request line.
       headers: dict Headers to send along with the request.
       fileobj: file File to save to (optional).
       payload: str Xml to POST (optional).
+      progress_callback: function Called with the bytes received and the bytes
+                         of report data so far (optional).
+      stream: bool Whether to return the response instead of reading it
+              (optional).
+      keep_compressed: bool Whether to save the body to fileobj gzipped
+                       (optional).
+      row_delimiter: str Field separator to count the rows of a body saved
+                     with keep_compressed by (optional).
 
     Returns:
-      str Report data as a string if fileobj=None, otherwise None
+      str Report data as a string if fileobj=None, otherwise None. If stream
+      is set, the _ResponseReader to read the report data from. With
+      keep_compressed, the number of rows if row_delimiter is set, otherwise
+      None.
     """
     headers = headers or {}
     request_url = self._op_config['server'] + url
 
     orig_payload = payload
 
-    if Utils.BoolTypeConvert(self._config['compress']):
+    if payload is None:
+      headers.pop('Content-Encoding', None)
+    elif headers.get('Content-Encoding') == 'gzip':
       buffer = StringIO.StringIO()
       gzip_file = gzip.GzipFile(mode='wb', fileobj=buffer)
       gzip_file.write(payload)
@@ -335,9 +836,15 @@ class ReportDownloader(object):
         response = urllib2.urlopen(request)
         response_code = response.code
         response_headers = response.info().headers
-        if response.info().get('Content-Encoding') == 'gzip':
-          response = gzip.GzipFile(fileobj=StringIO.StringIO(response.read()),
-                                   mode='rb')
+        if keep_compressed:
+          return _SaveCompressed(
+              response, response.info().get('Content-Encoding') == 'gzip',
+              fileobj, progress_callback, row_delimiter)
+        response = _ResponseReader(
+            response, response.info().get('Content-Encoding') == 'gzip',
+            progress_callback)
+        if stream:
+          return response
         if fileobj:
           self.__DumpToFile(response, fileobj)
           return None
@@ -347,9 +854,8 @@ class ReportDownloader(object):
         response = e
         response_code = response.code
         response_headers = response.info().headers
-        if response.info().get('Content-Encoding') == 'gzip':
-          response = gzip.GzipFile(fileobj=StringIO.StringIO(response.read()),
-                                   mode='rb')
+        response = _ResponseReader(
+            response, response.info().get('Content-Encoding') == 'gzip')
         error = response.read()
         match = re.search(OLD_ERROR_REGEX, error)
         if match:
@@ -502,3 +1008,536 @@ class ReportDownloader(object):
       str Serialized response headers.
     """
     return (''.join(response_headers)).strip()
+
+
+class _ResponseReader(object):
+
+  """Reads the body of a report download, decompressing it if gzipped.
+
+  The body is read from the socket one chunk at a time and each chunk is
+  decompressed as it arrives, so the memory used does not grow with the size
+  of the report. Once all of a gzipped body was read, the CRC and length in
+  its trailer are checked, so that a body cut short is not taken for a whole
+  report.
+  """
+
+  def __init__(self, response, compressed, progress_callback=None):
+    """Inits _ResponseReader.
+
+    Args:
+      response: file Response whose body to read.
+      compressed: bool Whether the body is gzipped.
+      [optional]
+      progress_callback: function Called with the number of bytes read from the
+                         response and the number of bytes of report data they
+                         held so far, after each chunk.
+    """
+    self.__response = response
+    self.__decompressor = None
+    if compressed:
+      self.__decompressor = zlib.decompressobj(GZIP_WBITS)
+    # CRC and length of the data of the current gzip member, and the last
+    # bytes read, which hold its trailer once the body is complete.
+    self.__crc = zlib.crc32('')
+    self.__size = 0
+    self.__tail = ''
+    self.__progress_callback = progress_callback
+    self.__buffer = ''
+    self.__done = False
+    self.bytes_in = 0
+    self.bytes_out = 0
+
+  def __ReadChunk(self):
+    """Reads and decompresses the next chunk of the body.
+
+    Returns:
+      str Report data held by the chunk, possibly empty.
+    """
+    chunk = self.__response.read(BUF_SIZE)
+    self.bytes_in += len(chunk)
+    if not chunk:
+      self.__done = True
+      data = ''
+      if self.__decompressor is not None:
+        data = self.__Track(self.__decompressor.flush())
+        self.__CheckTrailer()
+    elif self.__decompressor is None:
+      data = chunk
+    else:
+      self.__tail = (self.__tail + chunk)[-8:]
+      data = self.__Track(self.__decompressor.decompress(chunk))
+      # A gzip stream may consist of several members, one after the other.
+      while self.__decompressor.unused_data:
+        rest = self.__decompressor.unused_data
+        self.__decompressor = zlib.decompressobj(GZIP_WBITS)
+        self.__crc = zlib.crc32('')
+        self.__size = 0
+        data += self.__Track(self.__decompressor.decompress(rest))
+    self.bytes_out += len(data)
+    if self.__progress_callback is not None:
+      self.__progress_callback(self.bytes_in, self.bytes_out)
+    return data
+
+  def __Track(self, data):
+    """Adds decompressed data to the CRC and length of its gzip member.
+
+    Args:
+      data: str Decompressed data.
+
+    Returns:
+      str The same data.
+    """
+    self.__crc = zlib.crc32(data, self.__crc)
+    self.__size += len(data)
+    return data
+
+  def __CheckTrailer(self):
+    """Checks the trailer of the last gzip member against its data.
+
+    zlib checks the trailer of every member it reaches the end of, but does
+    not notice a body which ends before its last trailer.
+
+    Raises:
+      zlib.error: if the body is incomplete.
+    """
+    if (len(self.__tail) < 8 or struct.unpack('<II', self.__tail) !=
+        (self.__crc & 0xffffffff, self.__size & 0xffffffff)):
+      raise zlib.error('Report is incomplete, its gzip trailer is missing.')
+
+  def read(self, size=-1):
+    """Reads report data.
+
+    Args:
+      [optional]
+      size: int Maximum number of bytes to return. If negative, the rest of
+            the report is returned.
+
+    Returns:
+      str Report data, or an empty string once all of it was read.
+    """
+    if size < 0:
+      parts = [self.__buffer]
+      while not self.__done:
+        parts.append(self.__ReadChunk())
+      self.__buffer = ''
+      return ''.join(parts)
+    while len(self.__buffer) < size and not self.__done:
+      self.__buffer += self.__ReadChunk()
+    data = self.__buffer[:size]
+    self.__buffer = self.__buffer[size:]
+    return data
+
+  def IterLines(self):
+    """Yields the lines of report data, with their line endings.
+
+    Returns:
+      generator Lines of report data.
+    """
+    pending = ''
+    while True:
+      data = self.read(BUF_SIZE)
+      if not data:
+        break
+      pending += data
+      start = 0
+      end = pending.find('\n')
+      while end >= 0:
+        yield pending[start:end + 1]
+        start = end + 1
+        end = pending.find('\n', start)
+      pending = pending[start:]
+    if pending:
+      yield pending
+
+
+class _TeeReader(object):
+
+  """Reads from a response, and writes everything read to a file as well."""
+
+  def __init__(self, response, fileobj, head=''):
+    """Inits _TeeReader.
+
+    Args:
+      response: file Response to read from.
+      fileobj: file File-like object to write what is read to.
+      [optional]
+      head: str Data already read from the response, to return first.
+    """
+    self.__response = response
+    self.__fileobj = fileobj
+    self.__head = head
+
+  def read(self, size=-1):
+    """Reads from the response.
+
+    Args:
+      [optional]
+      size: int Maximum number of bytes to read.
+
+    Returns:
+      str Data read, or an empty string at the end of the response.
+    """
+    data = self.__head
+    self.__head = ''
+    if not data:
+      data = self.__response.read(size)
+    self.__fileobj.write(data)
+    return data
+
+
+class _RowCounter(object):
+
+  """Counts the rows of CSV or TSV report data as it is fed in.
+
+  Line breaks within quoted values do not end a row. The report title, column
+  header and totals rows are not counted.
+  """
+
+  # Length of the start of each row which is kept, to spot the totals row.
+  PREFIX_LENGTH = len(TOTALS_LABEL) + 1
+
+  def __init__(self, delimiter):
+    """Inits _RowCounter.
+
+    Args:
+      delimiter: str Field separator of the report.
+    """
+    self.__totals_prefix = TOTALS_LABEL + delimiter
+    self.__lines = 0
+    self.__in_quotes = False
+    # Start of the row being fed in, and of the last complete row.
+    self.__prefix = ''
+    self.__last_prefix = ''
+    self.__started = False
+
+  def Feed(self, data):
+    """Counts the rows which end in a chunk of report data.
+
+    Args:
+      data: str Next chunk of report data.
+    """
+    if not self.__in_quotes and '"' not in data:
+      # Shortcut for the common case of a chunk without any quoted values.
+      ends = data.count('\n')
+      if ends:
+        last_end = data.rindex('\n')
+        if ends == 1:
+          self.__Extend(data[:last_end])
+        else:
+          self.__prefix = data[data.rindex('\n', 0, last_end) + 1:last_end]
+        self.__EndRow(ends)
+        data = data[last_end + 1:]
+      self.__Extend(data)
+      return
+
+    position = 0
+    while position < len(data):
+      quote = data.find('"', position)
+      if self.__in_quotes:
+        if quote < 0:
+          quote = len(data)
+        else:
+          self.__in_quotes = False
+        self.__Extend(data[position:quote + 1])
+        position = quote + 1
+        continue
+      end = data.find('\n', position)
+      if quote >= 0 and (end < 0 or quote < end):
+        self.__in_quotes = True
+        self.__Extend(data[position:quote + 1])
+        position = quote + 1
+      elif end < 0:
+        self.__Extend(data[position:])
+        position = len(data)
+      else:
+        self.__Extend(data[position:end])
+        self.__EndRow(1)
+        position = end + 1
+
+  def GetRows(self):
+    """Returns the number of rows fed in so far.
+
+    Returns:
+      int Number of rows of the report.
+    """
+    lines = self.__lines
+    last_prefix = self.__last_prefix
+    if self.__started:
+      lines += 1
+      last_prefix = self.__prefix
+    # The title and column header rows come first.
+    rows = lines - 2
+    if last_prefix[:self.PREFIX_LENGTH] == self.__totals_prefix:
+      rows -= 1
+    return max(rows, 0)
+
+  def __Extend(self, data):
+    """Adds data to the row being fed in."""
+    if data:
+      self.__started = True
+      if len(self.__prefix) < self.PREFIX_LENGTH:
+        self.__prefix += data[:self.PREFIX_LENGTH]
+
+  def __EndRow(self, count):
+    """Ends the row being fed in, and count - 1 rows before it."""
+    self.__lines += count
+    self.__last_prefix = self.__prefix
+    self.__prefix = ''
+    self.__started = False
+
+
+def _SaveCompressed(response, compressed, fileobj, progress_callback=None,
+                    row_delimiter=None):
+  """Saves the body of a report download to a file, gzipped.
+
+  A gzipped body is written as it is; it is decompressed alongside only to
+  check its integrity and count its rows, and never compressed again. A body
+  which the server did not gzip is compressed on its way to the file.
+
+  Args:
+    response: file Response whose body to save.
+    compressed: bool Whether the body has a gzip Content-Encoding.
+    fileobj: file File-like object to save the body to.
+    [optional]
+    progress_callback: function Called with the bytes received and the bytes
+                       of report data so far.
+    row_delimiter: str Field separator of the report, to count its rows by.
+
+  Returns:
+    int Number of rows of the report if row_delimiter is set, otherwise None.
+
+  Raises:
+    zlib.error: if the gzipped body is corrupt or incomplete.
+  """
+  head = response.read(BUF_SIZE)
+  compressed = compressed or head.startswith(GZIP_MAGIC)
+  gzip_file = None
+  if not compressed:
+    gzip_file = gzip.GzipFile(mode='wb', fileobj=fileobj)
+    fileobj = gzip_file
+  reader = _ResponseReader(_TeeReader(response, fileobj, head), compressed,
+                           progress_callback)
+  counter = None
+  if row_delimiter is not None:
+    counter = _RowCounter(row_delimiter)
+  while True:
+    data = reader.read(BUF_SIZE)
+    if not data:
+      break
+    if counter is not None:
+      counter.Feed(data)
+  if gzip_file is not None:
+    gzip_file.close()
+  if counter is not None:
+    return counter.GetRows()
+
+
+def _ConvertNumber(value, number_type):
+  """Converts a report value to a number.
+
+  Args:
+    value: str Value to convert.
+    number_type: type Type of the number, i.e. long.
+
+  Returns:
+    object The number, or None if the value stands for a missing number.
+  """
+  if value in NULL_VALUES:
+    return None
+  return number_type(value.rstrip('%').replace(',', ''))
+
+
+def _GetConverters(column_types, return_micros):
+  """Returns the functions which convert the values of typed columns.
+
+  Args:
+    column_types: dict Column headers mapped to a field type or to a function.
+    return_micros: bool Whether currency is returned in micros.
+
+  Returns:
+    dict Column headers mapped to a function which converts a value.
+
+  Raises:
+    ValidationError: if a field type is not supported.
+  """
+  money_type = decimal.Decimal
+  if return_micros:
+    money_type = long
+  number_types = {
+      'Money': money_type,
+      'Bid': money_type,
+      'Integer': int,
+      'Long': long,
+      'Double': float
+  }
+  converters = {}
+  for header, column_type in column_types.iteritems():
+    if callable(column_type):
+      converters[header] = column_type
+    elif column_type in number_types:
+      converters[header] = (
+          lambda value, number_type=number_types[column_type]:
+          _ConvertNumber(value, number_type))
+    else:
+      raise ValidationError('Can not convert values of field type %s.'
+                            % column_type)
+  return converters
+
+
+def _IterRows(lines, delimiter, as_dict, converters, include_header=False):
+  """Yields the rows of a report, without its title and totals rows.
+
+  Args:
+    lines: iterator Lines of the report.
+    delimiter: str Field separator.
+    as_dict: bool Whether to yield each row as a dict keyed by column header.
+    converters: dict Column headers mapped to a function which converts a
+                value.
+    [optional]
+    include_header: bool Whether to yield the column headers first.
+
+  Returns:
+    generator Rows of the report.
+  """
+  rows = (row for row in csv.reader(lines, delimiter=delimiter) if row)
+  # The first row is the report title, the second one the column headers.
+  header = None
+  for index, row in enumerate(rows):
+    if index == 1:
+      header = row
+      break
+  if header is None:
+    return
+  if include_header:
+    yield tuple(header)
+  column_converters = [(index, converters[name])
+                       for index, name in enumerate(header)
+                       if name in converters]
+
+  # Hold back one row, as the last row holds the totals.
+  previous = None
+  for row in rows:
+    if previous is not None:
+      yield _MakeRow(previous, header, column_converters, as_dict)
+    previous = row
+  if previous is not None and previous[0] != TOTALS_LABEL:
+    yield _MakeRow(previous, header, column_converters, as_dict)
+
+
+def _GetFields(report_definition_or_query):
+  """Returns the fields of a report, in the order of its columns.
+
+  Args:
+    report_definition_or_query: dict or str Report, or AWQL for the report.
+
+  Returns:
+    list Fields of the report.
+
+  Raises:
+    ValidationError: if the report has no fields.
+  """
+  if isinstance(report_definition_or_query, dict):
+    fields = (report_definition_or_query.get('selector') or {}).get('fields')
+  else:
+    match = re.search(AWQL_FIELDS_REGEX, report_definition_or_query,
+                      re.IGNORECASE | re.DOTALL)
+    fields = match and [field.strip() for field in match.group(1).split(',')]
+  if not fields:
+    raise ValidationError('Report has no fields.')
+  return list(fields)
+
+
+def _IterAggregates(aggregator, as_dict):
+  """Yields the results of an aggregator, and then removes its spilled files.
+
+  Args:
+    aggregator: ReportAggregator Aggregator which read the report.
+    as_dict: bool Whether to yield each group as a dict.
+
+  Returns:
+    generator Results of the aggregator.
+  """
+  try:
+    for result in aggregator.IterResults(as_dict):
+      yield result
+  finally:
+    aggregator.Close()
+
+
+def _HashDefinition(report_definition):
+  """Returns a hash of a report definition which ignores dict ordering.
+
+  Args:
+    report_definition: dict Report definition.
+
+  Returns:
+    str Hex SHA-1 digest of the definition.
+  """
+  return sha1(repr(_Canonicalize(report_definition))).hexdigest()
+
+
+def _Canonicalize(value):
+  """Returns a value with its dicts replaced by sorted tuples of their items.
+
+  Args:
+    value: obj Report definition, or one of its values.
+
+  Returns:
+    obj Value whose repr is the same for all equal values.
+  """
+  if isinstance(value, dict):
+    items = [(key, _Canonicalize(item)) for key, item in value.iteritems()]
+    items.sort()
+    return ('dict', tuple(items))
+  elif isinstance(value, (list, tuple)):
+    return ('list', tuple([_Canonicalize(item) for item in value]))
+  return value
+
+
+def _MergeShard(report, fileobj, delimiter, include_header):
+  """Copies the rows of one shard's report to the merged report.
+
+  Args:
+    report: file File-like object holding the shard's report.
+    fileobj: file File-like object of the merged report.
+    delimiter: str Field separator of the report.
+    include_header: bool Whether to copy the column header row as well.
+  """
+  lines = iter(report)
+  # The first line is the report title, the second the column headers.
+  for line in lines:
+    break
+  for line in lines:
+    if include_header:
+      fileobj.write(line)
+    break
+  # The last line is held back, to drop it if it is the totals row.
+  previous = None
+  for line in lines:
+    if previous is not None:
+      fileobj.write(previous)
+    previous = line
+  if previous is not None and previous.split(delimiter, 1)[0] != TOTALS_LABEL:
+    fileobj.write(previous)
+    if not previous.endswith('\n'):
+      fileobj.write('\n')
+
+
+def _MakeRow(values, header, column_converters, as_dict):
+  """Converts the values of a row and packs them up.
+
+  Args:
+    values: list Values of the row, as read.
+    header: list Column headers.
+    column_converters: list Index of each typed column paired with the
+                       function which converts its values.
+    as_dict: bool Whether to return a dict keyed by column header.
+
+  Returns:
+    tuple or dict The row.
+  """
+  for index, converter in column_converters:
+    values[index] = converter(values[index])
+  if as_dict:
+    return dict(zip(header, values))
+  return tuple(values)
@@ -58,6 +58,9 @@ REQUIRED_SOAP_HEADERS = (('email', 'password', 'userAgent', 'developerToken'),
 AUTH_TOKEN_SERVICE = 'adwords'
 AUTH_TOKEN_EXPIRE = 60 * 60 * 23
 
+# Default number of requests a single client may have in flight at once.
+DEFAULT_MAX_IN_FLIGHT = 10
+
 ERROR_TYPES = []
 for item in Utils.GetDataFromCsvFile(os.path.join(LIB_HOME, 'data',
                                                   'error_types.csv')):
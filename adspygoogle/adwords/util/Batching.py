@@ -0,0 +1,218 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Splits long lists of mutate operations into chunks and merges the results.
+
+Operations are cut into chunks which stay under both a number of operations
+and an estimated request size. The chunks are sent by a pool of workers, and
+their results are merged back into one result, with the operation indexes in
+error field paths rewritten to index the whole list of operations.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import re
+import sys
+
+from adspygoogle.adwords.AdWordsErrors import BatchMutateError
+from adspygoogle.adwords.util.Paging import PageFetcher
+from adspygoogle.common.Errors import ValidationError
+
+
+# Most services refuse a mutate() call with more operations than this.
+DEFAULT_MAX_OPERATIONS = 5000
+# Estimated size, in bytes, of the operations of a single request.
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+# Matches the operation index at the start of an error's field path.
+OPERATION_INDEX_REGEX = r'^operations\[(\d+)\]'
+
+
+def SplitOperations(operations, max_operations=DEFAULT_MAX_OPERATIONS,
+                    max_bytes=None, get_size=None):
+  """Cuts a list of operations into chunks.
+
+  An operation larger than max_bytes on its own still gets a chunk of its own,
+  and is left for the server to refuse.
+
+  Args:
+    operations: list Operations to send.
+    [optional]
+    max_operations: int Number of operations per chunk.
+    max_bytes: int Estimated size of the operations of a chunk, in bytes. Only
+               used along with get_size.
+    get_size: function Takes an operation and returns its estimated size in
+              bytes.
+
+  Returns:
+    list Tuples of the index of the first operation of each chunk and the
+    chunk's operations.
+
+  Raises:
+    ValidationError: if max_operations or max_bytes is not positive.
+  """
+  if int(max_operations) < 1 or (max_bytes is not None and int(max_bytes) < 1):
+    raise ValidationError('Chunks must hold at least one operation and byte.')
+  chunks = []
+  start_index = 0
+  size = 0
+  for index, operation in enumerate(operations):
+    if get_size is not None and max_bytes is not None:
+      operation_size = get_size(operation)
+    else:
+      operation_size = 0
+    if index > start_index and (
+        index - start_index >= max_operations or
+        (operation_size and size + operation_size > max_bytes)):
+      chunks.append((start_index, operations[start_index:index]))
+      start_index = index
+      size = 0
+    size += operation_size
+  if start_index < len(operations):
+    chunks.append((start_index, operations[start_index:]))
+  return chunks
+
+
+def ShiftFieldPath(field_path, offset):
+  """Rewrites the operation index of a field path by an offset.
+
+  Args:
+    field_path: str Field path of an error, i.e. 'operations[2].operand.name'.
+    offset: int Index of the chunk's first operation in the whole list.
+
+  Returns:
+    str The field path, indexing the whole list of operations.
+  """
+  if not field_path or not offset:
+    return field_path
+  return re.sub(OPERATION_INDEX_REGEX,
+                lambda match: 'operations[%d]' % (int(match.group(1)) + offset),
+                field_path)
+
+
+def GetOperationIndex(field_path):
+  """Returns the operation index at the start of a field path.
+
+  Args:
+    field_path: str Field path of an error, i.e. 'operations[2].operand.name'.
+
+  Returns:
+    int The operation index, or None if the field path does not start with
+    one.
+  """
+  match = field_path and re.match(OPERATION_INDEX_REGEX, field_path)
+  if not match:
+    return None
+  return int(match.group(1))
+
+
+def MergeResults(results):
+  """Merges the results of the chunks of a list of operations.
+
+  The value lists are joined in chunk order, so that the value of an operation
+  keeps its index, and the fieldPath of each partial failure error is
+  rewritten to index the whole list of operations. The values of the
+  operations of a chunk which failed, or which has no value for them, are None.
+
+  Args:
+    results: list Tuples of the index of the first operation of a chunk, its
+             number of operations and the result of its mutate() call, or
+             None if the call failed, in chunk order.
+
+  Returns:
+    dict Merged result, or None if no chunk has a result.
+  """
+  merged = None
+  for _, _, result in results:
+    if result is not None:
+      merged = dict(result)
+      merged['value'] = []
+      merged['partialFailureErrors'] = []
+      break
+  if merged is None:
+    return None
+
+  for start_index, operation_count, result in results:
+    values = merged['value']
+    values.extend([None] * (start_index - len(values)))
+    if result is None:
+      values.extend([None] * operation_count)
+      continue
+    chunk_values = list(result.get('value') or [])[:operation_count]
+    values.extend(chunk_values)
+    values.extend([None] * (operation_count - len(chunk_values)))
+    for error in result.get('partialFailureErrors') or []:
+      error = dict(error)
+      if 'fieldPath' in error:
+        error['fieldPath'] = ShiftFieldPath(error['fieldPath'], start_index)
+      merged['partialFailureErrors'].append(error)
+  if not merged['partialFailureErrors']:
+    del merged['partialFailureErrors']
+  return merged
+
+
+def MutateInChunks(mutate, chunks, workers=1):
+  """Sends chunks of operations to a mutate() call and merges the results.
+
+  Every chunk is sent, even once one of them failed.
+
+  Args:
+    mutate: function Takes a list of operations and returns the result of a
+            mutate() call.
+    chunks: list Tuples of the index of the first operation of each chunk and
+            the chunk's operations, as returned by SplitOperations.
+    [optional]
+    workers: int Number of chunks sent at the same time.
+
+  Returns:
+    dict Merged result of all chunks.
+
+  Raises:
+    BatchMutateError: if any chunk failed. The error holds the merged result
+                      of the chunks which did not, with None as the value of
+                      each operation of the failed chunks.
+  """
+  if not chunks:
+    return None
+
+  def SendChunk(operations):
+    try:
+      return mutate(operations), None
+    except Exception:
+      return None, sys.exc_info()
+
+  if workers > 1 and len(chunks) > 1:
+    fetcher = PageFetcher(SendChunk, min(workers, len(chunks)))
+    try:
+      for start_index, operations in chunks:
+        fetcher.Fetch(start_index, operations)
+      outcomes = dict([fetcher.GetResult() for _ in chunks])
+    finally:
+      fetcher.Stop()
+  else:
+    outcomes = dict([(start_index, SendChunk(operations))
+                     for start_index, operations in chunks])
+
+  results = []
+  failures = []
+  for start_index, operations in chunks:
+    result, exc_info = outcomes[start_index]
+    results.append((start_index, len(operations), result))
+    if exc_info is not None:
+      failures.append((start_index, len(operations), exc_info[1]))
+  merged = MergeResults(results)
+  if failures:
+    raise BatchMutateError(merged, failures, len(chunks))
+  return merged
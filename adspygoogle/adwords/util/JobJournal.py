@@ -0,0 +1,267 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Append-only log of the mutate jobs submitted for a list of operations.
+
+Each line records the state of one job: its id, the range of operations it
+covers, a digest of those operations, its status and, for failed jobs, the
+reason. Lines are only ever appended, and each one is synced to disk before the
+call that wrote it returns, so a process which dies at any point leaves a
+journal from which its jobs can be picked up again. The last line of a job wins
+when the journal is read.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import threading
+
+from adspygoogle.common.Errors import Error
+
+try:
+  from hashlib import sha1
+except ImportError:
+  from sha import new as sha1
+
+
+# Marks the lines which record a job, so that other records can be added.
+JOB_RECORD = 'job'
+
+
+class JournalEntry(object):
+
+  """State of one job recorded in a journal.
+
+  Attributes:
+    job_id: str Id of the job.
+    start_index: int Index of the job's first operation.
+    operation_count: int Number of operations of the job.
+    digest: str Digest of the operations of the job.
+    status: str Last recorded status of the job.
+    reason: str Reason the job failed, if it did.
+  """
+
+  def __init__(self, job_id, start_index, operation_count, digest, status,
+               reason=''):
+    """Inits JournalEntry.
+
+    Args:
+      job_id: str Id of the job.
+      start_index: int Index of the job's first operation.
+      operation_count: int Number of operations of the job.
+      digest: str Digest of the operations of the job.
+      status: str Status of the job.
+      [optional]
+      reason: str Reason the job failed.
+    """
+    self.job_id = job_id
+    self.start_index = start_index
+    self.operation_count = operation_count
+    self.digest = digest
+    self.status = status
+    self.reason = reason
+
+
+class JobJournal(object):
+
+  """Implements JobJournal.
+
+  May be written to by many threads at once.
+  """
+
+  def __init__(self, path):
+    """Inits JobJournal, reading the jobs recorded in it so far.
+
+    A last line cut short by a crash is dropped from the file.
+
+    Args:
+      path: str Path of the journal file. It is created if it does not exist.
+
+    Raises:
+      Error: if a line other than the last one cannot be read.
+    """
+    self.__path = path
+    self.__lock = threading.Lock()
+    self.__entries = {}
+    self.__order = []
+    # Id of the latest job recorded for each range of operations.
+    self.__ranges = {}
+    size = None
+    if os.path.exists(path):
+      size = self.__Read()
+    self.__fh = open(path, 'a')
+    if size is not None and size != os.path.getsize(path):
+      self.__fh.truncate(size)
+
+  def __Read(self):
+    """Reads the jobs recorded in the journal file.
+
+    Returns:
+      int Size of the file up to the end of its last complete line.
+    """
+    fh = open(self.__path, 'r')
+    try:
+      lines = fh.readlines()
+    finally:
+      fh.close()
+    size = 0
+    for number, line in enumerate(lines):
+      fields = line.rstrip('\n').split('\t')
+      if (not line.endswith('\n') or len(fields) != 7 or
+          fields[0] != JOB_RECORD):
+        if number == len(lines) - 1:
+          break
+        raise Error('Line %d of job journal \'%s\' is not a job record.'
+                    % (number + 1, self.__path))
+      job_id, start_index, operation_count, digest, status, reason = fields[1:]
+      self.__Update(JournalEntry(job_id, int(start_index),
+                                 int(operation_count), digest, status, reason))
+      size += len(line)
+    return size
+
+  def __Update(self, entry):
+    """Records the latest state of a job in memory.
+
+    Args:
+      entry: JournalEntry State of the job.
+    """
+    if entry.job_id not in self.__entries:
+      self.__order.append(entry.job_id)
+    self.__entries[entry.job_id] = entry
+    self.__ranges[(entry.start_index, entry.operation_count)] = entry.job_id
+
+  def Record(self, job_id, start_index, operation_count, digest, status,
+             reason=''):
+    """Appends the state of a job and syncs it to disk.
+
+    Args:
+      job_id: str Id of the job.
+      start_index: int Index of the job's first operation.
+      operation_count: int Number of operations of the job.
+      digest: str Digest of the operations of the job, as returned by
+              GetDigest().
+      status: str Status of the job.
+      [optional]
+      reason: str Reason the job failed.
+    """
+    reason = ' '.join(str(reason or '').split())
+    self.__lock.acquire()
+    try:
+      self.__fh.write('%s\n' % '\t'.join(
+          [JOB_RECORD, str(job_id), str(start_index), str(operation_count),
+           str(digest), str(status), reason]))
+      self.__fh.flush()
+      os.fsync(self.__fh.fileno())
+      self.__Update(JournalEntry(str(job_id), start_index, operation_count,
+                                 str(digest), status, reason))
+    finally:
+      self.__lock.release()
+
+  def RecordStatus(self, job_id, status, reason=''):
+    """Appends a new status of a job which was already recorded.
+
+    Args:
+      job_id: str Id of the job.
+      status: str Status of the job.
+      [optional]
+      reason: str Reason the job failed.
+    """
+    entry = self.__entries.get(str(job_id))
+    if entry is not None and entry.status != status:
+      self.Record(job_id, entry.start_index, entry.operation_count,
+                  entry.digest, status, reason)
+
+  def GetEntries(self):
+    """Returns the latest state of every job, in the order they were recorded.
+
+    Returns:
+      list JournalEntry for each job.
+    """
+    self.__lock.acquire()
+    try:
+      return [self.__entries[job_id] for job_id in self.__order]
+    finally:
+      self.__lock.release()
+
+  def FindJob(self, start_index, operation_count, digest):
+    """Returns the job recorded for a range of operations.
+
+    Args:
+      start_index: int Index of the range's first operation.
+      operation_count: int Number of operations in the range.
+      digest: str Digest of the operations in the range, as returned by
+              GetDigest().
+
+    Returns:
+      JournalEntry The latest job recorded for the range, or None if there is
+      none.
+
+    Raises:
+      Error: if the job recorded for the range was submitted with other
+             operations.
+    """
+    self.__lock.acquire()
+    try:
+      job_id = self.__ranges.get((start_index, operation_count))
+      if job_id is None:
+        return None
+      entry = self.__entries[job_id]
+    finally:
+      self.__lock.release()
+    if entry.digest != digest:
+      raise Error('Job %s of journal \'%s\' was submitted for other operations '
+                  '%d to %d than the ones given. Use another journal for other '
+                  'operations.' % (job_id, self.__path, start_index,
+                                   start_index + operation_count - 1))
+    return entry
+
+  def Close(self):
+    """Closes the journal file."""
+    self.__lock.acquire()
+    try:
+      self.__fh.close()
+    finally:
+      self.__lock.release()
+
+
+def GetDigest(operations):
+  """Returns a digest of a list of operations, which ignores dict ordering.
+
+  Args:
+    operations: list Operations of a job.
+
+  Returns:
+    str Hex SHA-1 digest of the operations.
+  """
+  return sha1(repr(_Canonicalize(operations))).hexdigest()
+
+
+def _Canonicalize(value):
+  """Returns a value with its dicts replaced by sorted tuples of their items.
+
+  Args:
+    value: obj Operations, or one of their values.
+
+  Returns:
+    obj Value whose repr is the same for all equal values.
+  """
+  if isinstance(value, dict):
+    items = [(key, _Canonicalize(item)) for key, item in value.iteritems()]
+    items.sort()
+    return ('dict', tuple(items))
+  elif isinstance(value, (list, tuple)):
+    return ('list', tuple([_Canonicalize(item) for item in value]))
+  return value
@@ -0,0 +1,396 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Submits mutate jobs and collects their results once they complete.
+
+The status of all pending jobs is polled with a single get() call. The delay
+between polls starts short, grows while no job finishes and drops back once
+one does. The results of completed jobs are fetched by a pool of workers while
+the remaining jobs are still being polled.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import Queue
+import sys
+import threading
+import time
+
+from adspygoogle.adwords.AdWordsErrors import AdWordsError
+from adspygoogle.adwords.util import Batching
+from adspygoogle.adwords.util import JobJournal
+from adspygoogle.adwords.util.MutateResults import MutateResults
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.Future import Future
+
+
+# Number of seconds between polls while jobs are finishing.
+DEFAULT_MIN_DELAY = 5
+# Number of seconds the delay between polls grows up to.
+DEFAULT_MAX_DELAY = 300
+# Factor the delay grows by after each poll in which no job finished.
+DEFAULT_BACKOFF = 2
+DEFAULT_WORKERS = 4
+# Number of polls in a row which may fail before the pending jobs are failed.
+MAX_POLL_ERRORS = 3
+JOB_SELECTOR_TYPE = 'BulkMutateJobSelector'
+
+
+class JobFuture(Future):
+
+  """Future for the result of one mutate job.
+
+  Attributes:
+    job_id: str Id of the job.
+    status: str Last status of the job the server reported.
+    start_index: int Index of the job's first operation in the list the job
+                 was cut from.
+    operation_count: int Number of operations of the job.
+  """
+
+  def __init__(self, job_id, status=None, start_index=0, operation_count=None):
+    """Inits JobFuture.
+
+    Args:
+      job_id: str Id of the job.
+      [optional]
+      status: str Status of the job.
+      start_index: int Index of the job's first operation.
+      operation_count: int Number of operations of the job.
+    """
+    Future.__init__(self)
+    self.job_id = job_id
+    self.status = status
+    self.start_index = start_index
+    self.operation_count = operation_count
+
+  def GetMutateResults(self, timeout=None):
+    """Waits for the job to finish and returns its result, indexed.
+
+    Args:
+      [optional]
+      timeout: float Number of seconds to wait. Waits for as long as it takes
+               by default.
+
+    Returns:
+      MutateResults The job's result, with its errors indexed by operation.
+    """
+    return MutateResults(self.GetResult(timeout))
+
+
+class JobManager(object):
+
+  """Implements JobManager.
+
+  Works with services whose mutate() creates a job from a list of operations
+  and a policy, and whose get() and getResult() take a BulkMutateJobSelector,
+  such as MutateJobService.
+
+  With a journal, every submitted job and its outcome is recorded, and a
+  manager created with the same journal after a crash picks the recorded jobs
+  up again instead of submitting them anew.
+  """
+
+  def __init__(self, service, min_delay=DEFAULT_MIN_DELAY,
+               max_delay=DEFAULT_MAX_DELAY, backoff=DEFAULT_BACKOFF,
+               workers=DEFAULT_WORKERS, journal=None):
+    """Inits JobManager.
+
+    Args:
+      service: GenericAdWordsService Service the jobs are submitted to.
+      [optional]
+      min_delay: float Number of seconds between polls while jobs are
+                 finishing.
+      max_delay: float Number of seconds the delay between polls grows up to.
+      backoff: float Factor the delay grows by after each poll in which no job
+               finished.
+      workers: int Number of results fetched at the same time.
+      journal: JobJournal Journal the jobs are recorded in.
+    """
+    self.__service = service
+    self.__journal = journal
+    self.__min_delay = min_delay
+    self.__max_delay = max_delay
+    self.__backoff = backoff
+    self.__delay = min_delay
+    self.__next_poll = None
+    self.__condition = threading.Condition()
+    self.__pending = {}
+    self.__closed = False
+    self.__completed = Queue.Queue()
+    self.polls = 0
+
+    self.__threads = [threading.Thread(target=self.__PollJobs)]
+    for _ in xrange(max(int(workers), 1)):
+      self.__threads.append(threading.Thread(target=self.__FetchResults))
+    for thread in self.__threads:
+      thread.setDaemon(True)
+      thread.start()
+
+  def Submit(self, operations, policy=None, start_index=0):
+    """Submits a job and starts polling it.
+
+    Args:
+      operations: list Operations of the job.
+      [optional]
+      policy: dict Policy of the job, i.e. its prerequisiteJobIds.
+      start_index: int Index of the job's first operation, if the operations
+                   were cut from a longer list. Recorded in the journal.
+
+    Returns:
+      JobFuture Resolves to the job's result once it completes, or raises
+      AdWordsError if the job failed.
+
+    Raises:
+      Error: if the manager is closed.
+    """
+    if self.__closed:
+      raise Error('The job manager is closed.')
+    if policy is None:
+      policy = {'prerequisiteJobIds': []}
+    job = _Unwrap(self.__service.Mutate(operations, policy))
+    future = JobFuture(str(job['id']), job.get('status'), start_index,
+                       len(operations))
+    if self.__journal is not None:
+      self.__journal.Record(future.job_id, start_index, len(operations),
+                            JobJournal.GetDigest(operations), future.status)
+    self.__Track(future)
+    return future
+
+  def SubmitAll(self, operations,
+                max_operations=Batching.DEFAULT_MAX_OPERATIONS, policy=None):
+    """Submits a list of operations as jobs of at most max_operations each.
+
+    Ranges of operations for which the journal holds a job are not submitted
+    again; the recorded job is picked up instead, so that a program which died
+    can be run again with the same operations. All ranges are checked against
+    the journal before any job is submitted.
+
+    Args:
+      operations: list Operations to submit.
+      [optional]
+      max_operations: int Number of operations per job.
+      policy: dict Policy of each job.
+
+    Returns:
+      list JobFuture for each job, in the order of the operations.
+
+    Raises:
+      Error: if the journal holds a job for a range of operations which was
+             submitted with other operations.
+    """
+    chunks = Batching.SplitOperations(operations, max_operations)
+    entries = [None] * len(chunks)
+    if self.__journal is not None:
+      entries = [self.__journal.FindJob(start_index, len(chunk),
+                                        JobJournal.GetDigest(chunk))
+                 for start_index, chunk in chunks]
+    futures = []
+    for (start_index, chunk), entry in zip(chunks, entries):
+      if entry is not None:
+        futures.append(self.__Resume(entry))
+      else:
+        futures.append(self.Submit(chunk, policy, start_index))
+    return futures
+
+  def Resume(self):
+    """Picks up every job recorded in the journal.
+
+    Jobs which were still pending are polled, and the results of completed
+    jobs are fetched again, as the process which submitted them may have died
+    before using them.
+
+    Returns:
+      list JobFuture for each recorded job, in the order they were submitted.
+
+    Raises:
+      Error: if the manager has no journal.
+    """
+    if self.__journal is None:
+      raise Error('Only jobs recorded in a journal can be resumed.')
+    return [self.__Resume(entry) for entry in self.__journal.GetEntries()]
+
+  def __Resume(self, entry):
+    """Picks up a job recorded in the journal.
+
+    Args:
+      entry: JournalEntry The job's latest recorded state.
+
+    Returns:
+      JobFuture The job's future.
+    """
+    future = JobFuture(entry.job_id, entry.status, entry.start_index,
+                       entry.operation_count)
+    if entry.status == 'FAILED':
+      _Fail(future, AdWordsError('Job %s failed with reason \'%s\'.'
+                                 % (entry.job_id, entry.reason)))
+    elif entry.status == 'COMPLETED':
+      self.__completed.put(future)
+    else:
+      self.__Track(future)
+    return future
+
+  def Close(self):
+    """Stops polling, and fails the futures of the jobs still pending."""
+    self.__condition.acquire()
+    try:
+      self.__closed = True
+      pending = self.__pending.values()
+      self.__pending.clear()
+      self.__condition.notifyAll()
+    finally:
+      self.__condition.release()
+    for future in pending:
+      _Fail(future, Error('The job manager was closed before job %s finished.'
+                          % future.job_id))
+    for _ in self.__threads[1:]:
+      self.__completed.put(None)
+
+  def __Track(self, future):
+    """Adds a job to the ones being polled.
+
+    Args:
+      future: JobFuture The job's future.
+    """
+    self.__condition.acquire()
+    try:
+      self.__pending[future.job_id] = future
+      # A new job is polled soon, however long the others have taken.
+      self.__delay = self.__min_delay
+      next_poll = time.time() + self.__min_delay
+      if self.__next_poll is None or next_poll < self.__next_poll:
+        self.__next_poll = next_poll
+      self.__condition.notifyAll()
+    finally:
+      self.__condition.release()
+
+  def __PollJobs(self):
+    """Polls the pending jobs until the manager is closed."""
+    errors = 0
+    self.__condition.acquire()
+    try:
+      while True:
+        while not self.__closed and (not self.__pending or
+                                     time.time() < self.__next_poll):
+          if self.__pending:
+            self.__condition.wait(self.__next_poll - time.time())
+          else:
+            self.__condition.wait()
+        if self.__closed:
+          return
+
+        job_ids = self.__pending.keys()
+        self.__condition.release()
+        try:
+          try:
+            jobs = _Unwrap(self.__service.Get({'xsi_type': JOB_SELECTOR_TYPE,
+                                               'jobIds': job_ids}), False)
+            exc_info = None
+          except Exception:
+            jobs = []
+            exc_info = sys.exc_info()
+        finally:
+          self.__condition.acquire()
+        self.polls += 1
+
+        finished = 0
+        if exc_info is not None:
+          errors += 1
+          if errors >= MAX_POLL_ERRORS:
+            for job_id in job_ids:
+              if job_id in self.__pending:
+                self.__pending.pop(job_id).SetError(exc_info)
+        else:
+          errors = 0
+          for job in jobs or []:
+            finished += self.__Update(job)
+
+        if finished:
+          self.__delay = self.__min_delay
+        else:
+          self.__delay = min(self.__delay * self.__backoff, self.__max_delay)
+        self.__next_poll = time.time() + self.__delay
+    finally:
+      self.__condition.release()
+
+  def __Update(self, job):
+    """Records the status of a job. Must be called holding the lock.
+
+    Args:
+      job: dict Job returned by get().
+
+    Returns:
+      int 1 if the job finished, 0 otherwise.
+    """
+    future = self.__pending.get(str(job.get('id')))
+    if future is None:
+      return 0
+    future.status = job.get('status')
+    if future.status not in ('COMPLETED', 'FAILED'):
+      return 0
+    del self.__pending[future.job_id]
+    if self.__journal is not None:
+      self.__journal.RecordStatus(future.job_id, future.status,
+                                  job.get('failureReason'))
+    if future.status == 'COMPLETED':
+      self.__completed.put(future)
+    else:
+      _Fail(future, AdWordsError('Job %s failed with reason \'%s\'.'
+                                 % (future.job_id, job.get('failureReason'))))
+    return 1
+
+  def __FetchResults(self):
+    """Fetches the results of completed jobs until told to stop."""
+    while True:
+      future = self.__completed.get()
+      if future is None:
+        return
+      try:
+        result = _Unwrap(self.__service.GetResult(
+            {'xsi_type': JOB_SELECTOR_TYPE, 'jobIds': [future.job_id]}))
+      except Exception:
+        future.SetError(sys.exc_info())
+      else:
+        future.SetResult(result)
+
+
+def _Unwrap(response, single=True):
+  """Returns a response whether or not config['wrap_in_tuple'] is on.
+
+  Args:
+    response: object Response of a call.
+    [optional]
+    single: bool Whether the call returns a single object, as opposed to a
+            list.
+
+  Returns:
+    object The object, or list of objects, the call returned.
+  """
+  if isinstance(response, tuple):
+    response = list(response)
+    if single:
+      return response[0]
+  return response
+
+
+def _Fail(future, error):
+  """Sets an error on a future.
+
+  Args:
+    future: Future Future to fail.
+    error: Exception Error to raise to the future's callers.
+  """
+  future.SetError((error.__class__, error, None))
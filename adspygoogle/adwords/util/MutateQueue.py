@@ -0,0 +1,225 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Coalesces mutate operations added by many threads into fewer calls.
+
+Operations wait in a queue until it holds enough of them or the oldest one has
+waited long enough, and are then sent in a single mutate() call with
+partialFailure on. Each operation's future gets its own value from the result,
+or the partial failure errors naming the operation.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import sys
+import threading
+import time
+
+from adspygoogle.adwords.AdWordsErrors import AdWordsPartialFailureError
+from adspygoogle.adwords.util.MutateResults import MutateResults
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.Future import Future
+
+
+DEFAULT_MAX_OPERATIONS = 100
+# Number of milliseconds an operation waits for others to join its call.
+DEFAULT_MAX_DELAY = 50
+
+# Queues shared by the services of each URL and client customer id.
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def GetSharedQueue(key, mutate, max_operations=DEFAULT_MAX_OPERATIONS,
+                   max_delay=DEFAULT_MAX_DELAY):
+  """Returns the queue for a key, creating it if there is no open one.
+
+  Args:
+    key: tuple Identifies what the operations of the queue are sent to.
+    mutate: function Takes a list of operations and returns the result of a
+            mutate() call for them.
+    [optional]
+    max_operations: int Number of operations sent in one call.
+    max_delay: int Number of milliseconds an operation waits for others.
+
+  Returns:
+    MutateQueue The queue. A queue which already existed keeps the settings it
+    was created with.
+  """
+  _queues_lock.acquire()
+  try:
+    queue = _queues.get(key)
+    if queue is None or queue.IsClosed():
+      queue = MutateQueue(mutate, max_operations, max_delay)
+      _queues[key] = queue
+    return queue
+  finally:
+    _queues_lock.release()
+
+
+class MutateQueue(object):
+
+  """Implements MutateQueue.
+
+  Collects operations from any number of threads and sends them in batches.
+  A batch which fills up is sent by the thread that added its last operation;
+  otherwise it is sent by a background thread once its first operation has
+  waited max_delay milliseconds.
+  """
+
+  def __init__(self, mutate, max_operations=DEFAULT_MAX_OPERATIONS,
+               max_delay=DEFAULT_MAX_DELAY):
+    """Inits MutateQueue.
+
+    Args:
+      mutate: function Takes a list of operations and returns the result of a
+              mutate() call for them.
+      [optional]
+      max_operations: int Number of operations sent in one call.
+      max_delay: int Number of milliseconds an operation waits for others.
+    """
+    self.__mutate = mutate
+    self.__max_operations = max(int(max_operations), 1)
+    self.__max_delay = max_delay / 1000.0
+    self.__condition = threading.Condition()
+    self.__pending = []
+    self.__deadline = None
+    self.__closed = False
+    self.calls = 0
+    flusher = threading.Thread(target=self.__FlushWhenDue)
+    flusher.setDaemon(True)
+    flusher.start()
+
+  def Add(self, operation):
+    """Adds an operation to the next call.
+
+    Args:
+      operation: dict Operation for the mutate() call.
+
+    Returns:
+      Future Resolves to the operation's value from the result, or raises
+      AdWordsPartialFailureError with the errors of the operation, or the
+      error the whole call raised.
+
+    Raises:
+      Error: if the queue is closed.
+    """
+    future = Future()
+    batch = None
+    self.__condition.acquire()
+    try:
+      if self.__closed:
+        raise Error('The mutate queue is closed.')
+      self.__pending.append((operation, future))
+      if len(self.__pending) >= self.__max_operations:
+        batch = self.__TakeBatch()
+      elif len(self.__pending) == 1:
+        self.__deadline = time.time() + self.__max_delay
+        self.__condition.notify()
+    finally:
+      self.__condition.release()
+    if batch:
+      self.__Send(batch)
+    return future
+
+  def Flush(self):
+    """Sends the operations waiting in the queue right away."""
+    self.__condition.acquire()
+    try:
+      batch = self.__TakeBatch()
+    finally:
+      self.__condition.release()
+    if batch:
+      self.__Send(batch)
+
+  def Close(self):
+    """Sends the waiting operations and refuses any more."""
+    self.__condition.acquire()
+    try:
+      self.__closed = True
+      self.__condition.notify()
+    finally:
+      self.__condition.release()
+    self.Flush()
+
+  def IsClosed(self):
+    """Returns whether the queue was closed.
+
+    Returns:
+      bool True if the queue refuses operations, False otherwise.
+    """
+    return self.__closed
+
+  def __TakeBatch(self):
+    """Empties the queue. Must be called holding the condition's lock.
+
+    Returns:
+      list Tuples of each waiting operation and its future.
+    """
+    batch = self.__pending
+    self.__pending = []
+    self.__deadline = None
+    if batch:
+      self.calls += 1
+    return batch
+
+  def __FlushWhenDue(self):
+    """Sends each batch which did not fill up once it waited long enough."""
+    self.__condition.acquire()
+    try:
+      while True:
+        while not self.__pending and not self.__closed:
+          self.__condition.wait()
+        if not self.__pending:
+          return
+        delay = self.__deadline - time.time()
+        if delay > 0 and not self.__closed:
+          self.__condition.wait(delay)
+          continue
+        batch = self.__TakeBatch()
+        self.__condition.release()
+        try:
+          self.__Send(batch)
+        finally:
+          self.__condition.acquire()
+    finally:
+      self.__condition.release()
+
+  def __Send(self, batch):
+    """Sends a batch of operations and resolves their futures.
+
+    Partial failure errors which do not name an operation fail every operation
+    of the batch.
+
+    Args:
+      batch: list Tuples of each operation and its future.
+    """
+    try:
+      result = self.__mutate([operation for operation, _ in batch]) or {}
+    except Exception:
+      exc_info = sys.exc_info()
+      for _, future in batch:
+        future.SetError(exc_info)
+      return
+
+    results = MutateResults(result, len(batch))
+    for index, (_, future) in enumerate(batch):
+      errors = results.GetErrors(index) + results.unindexed_errors
+      if errors:
+        error = AdWordsPartialFailureError(errors)
+        future.SetError((AdWordsPartialFailureError, error, None))
+      else:
+        future.SetResult(results.GetValue(index))
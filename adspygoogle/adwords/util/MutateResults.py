@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Correlates the errors of a mutate result with the operations they name.
+
+Works on the result of a MutateJobService job, whose SimpleMutateResult holds
+results and errors, and on the result of a mutate() call made with
+partialFailure on, which holds value and partialFailureErrors. The fieldPath
+of each error is parsed once, and the errors are indexed by operation in flat
+arrays, so that looking up the errors of an operation does not go through the
+errors again.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import array
+import re
+
+from adspygoogle.adwords.util import Batching
+
+
+# Key of the results of job operations which were not applied.
+PLACEHOLDER = 'PlaceHolder'
+
+_OPERATION_INDEX = re.compile(Batching.OPERATION_INDEX_REGEX)
+
+
+class MutateResults(object):
+
+  """Implements MutateResults.
+
+  Attributes:
+    operation_count: int Number of operations of the mutate.
+    values: list Value returned for each operation.
+    errors: list All errors, in the order the server returned them.
+    unindexed_errors: list Errors whose fieldPath names no operation.
+    failed_indexes: list Indexes of the operations which have errors or, for
+                    jobs, a PlaceHolder result, in ascending order.
+    succeeded_indexes: list Indexes of the other operations, in ascending
+                       order.
+  """
+
+  def __init__(self, result, operation_count=None):
+    """Inits MutateResults.
+
+    Args:
+      result: dict Result of a job, as returned by MutateJobService's
+              getResult(), or of a mutate() call made with partialFailure on.
+      [optional]
+      operation_count: int Number of operations of the mutate. Defaults to the
+                       number of values in the result.
+    """
+    result = result or {}
+    if 'SimpleMutateResult' in result:
+      result = result['SimpleMutateResult'] or {}
+      self.values = result.get('results') or []
+      self.errors = result.get('errors') or []
+    else:
+      self.values = result.get('value') or []
+      self.errors = result.get('partialFailureErrors') or []
+
+    # The operation each error names, or -1.
+    error_indexes = array.array('l', [-1]) * len(self.errors)
+    self.unindexed_errors = []
+    if operation_count is None:
+      operation_count = len(self.values)
+    for position, error in enumerate(self.errors):
+      match = _OPERATION_INDEX.match(error.get('fieldPath') or '')
+      if match is None:
+        self.unindexed_errors.append(error)
+        continue
+      index = int(match.group(1))
+      error_indexes[position] = index
+      if index >= operation_count:
+        operation_count = index + 1
+    self.operation_count = operation_count
+
+    # The errors of operation i are at positions __offsets[i] up to
+    # __offsets[i + 1] of __positions.
+    offsets = array.array('l', [0]) * (operation_count + 1)
+    for index in error_indexes:
+      if index >= 0:
+        offsets[index + 1] += 1
+    for index in xrange(operation_count):
+      offsets[index + 1] += offsets[index]
+    positions = array.array('l', [0]) * offsets[operation_count]
+    cursors = offsets[:-1]
+    for position, index in enumerate(error_indexes):
+      if index >= 0:
+        positions[cursors[index]] = position
+        cursors[index] += 1
+    self.__offsets = offsets
+    self.__positions = positions
+
+    failed = array.array('b', [0]) * operation_count
+    for index in xrange(operation_count):
+      if offsets[index + 1] > offsets[index]:
+        failed[index] = 1
+    for index, value in enumerate(self.values):
+      if isinstance(value, dict) and PLACEHOLDER in value:
+        failed[index] = 1
+    self.__failed = failed
+    self.failed_indexes = [index for index in xrange(operation_count)
+                           if failed[index]]
+    self.succeeded_indexes = [index for index in xrange(operation_count)
+                              if not failed[index]]
+
+  def GetErrors(self, index):
+    """Returns the errors of an operation.
+
+    Args:
+      index: int Index of the operation.
+
+    Returns:
+      list Errors whose fieldPath names the operation, in the order the server
+      returned them.
+    """
+    if index < 0 or index >= self.operation_count:
+      return []
+    return [self.errors[position] for position in
+            self.__positions[self.__offsets[index]:self.__offsets[index + 1]]]
+
+  def GetValue(self, index):
+    """Returns the value returned for an operation.
+
+    Args:
+      index: int Index of the operation.
+
+    Returns:
+      object The value, or None if the result holds no value for it.
+    """
+    if 0 <= index < len(self.values):
+      return self.values[index]
+    return None
+
+  def IsFailed(self, index):
+    """Returns whether an operation failed.
+
+    Args:
+      index: int Index of the operation.
+
+    Returns:
+      bool True if the operation has errors or, for jobs, a PlaceHolder
+      result, False otherwise.
+    """
+    return 0 <= index < self.operation_count and bool(self.__failed[index])
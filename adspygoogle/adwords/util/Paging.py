@@ -0,0 +1,323 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Walks through the pages of entries matched by a selector.
+
+Pages are requested by offset, through the selector's startIndex and
+numberResults paging fields, until the offset passes the totalNumEntries the
+server reports.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import Queue
+import sys
+import threading
+
+
+DEFAULT_PAGE_SIZE = 500
+
+
+def GetPageSelector(selector, start_index, page_size):
+  """Returns a copy of a selector which asks for one page of entries.
+
+  Args:
+    selector: dict Selector to page through.
+    start_index: int Offset of the first entry of the page.
+    page_size: int Number of entries per page.
+
+  Returns:
+    dict Shallow copy of the selector with its paging set to the page.
+  """
+  page_selector = dict(selector)
+  page_selector['paging'] = {'startIndex': str(start_index),
+                             'numberResults': str(page_size)}
+  return page_selector
+
+
+def GetPaging(selector, page_size=None):
+  """Returns where paging through a selector starts and how far each page goes.
+
+  Args:
+    selector: dict Selector to page through.
+    [optional]
+    page_size: int Number of entries per page. Defaults to the selector's
+               numberResults, or DEFAULT_PAGE_SIZE if it has none.
+
+  Returns:
+    tuple The offset of the first entry and the number of entries per page.
+  """
+  paging = selector.get('paging') or {}
+  if page_size is None:
+    page_size = paging.get('numberResults') or DEFAULT_PAGE_SIZE
+  return int(paging.get('startIndex') or 0), int(page_size)
+
+
+def HasMoreEntries(page, next_index):
+  """Returns whether entries remain after a page.
+
+  Args:
+    page: dict Page returned by a get() call.
+    next_index: int Offset of the entry which follows the page.
+
+  Returns:
+    bool True if the next page should be requested, False otherwise.
+  """
+  return bool(page.get('entries')) and next_index < int(
+      page.get('totalNumEntries') or 0)
+
+
+class PageRequest(threading.Thread):
+
+  """Fetches one page from a daemon thread.
+
+  The page, or the error raised while fetching it, is handed to whichever
+  thread calls GetPage().
+  """
+
+  def __init__(self, get_page, selector):
+    """Inits PageRequest.
+
+    Args:
+      get_page: function Takes a selector and returns the page it matches.
+      selector: dict Selector for the page.
+    """
+    threading.Thread.__init__(self)
+    self.setDaemon(True)
+    self.__get_page = get_page
+    self.__selector = selector
+    self.__page = None
+    self.__exc_info = None
+
+  def run(self):
+    try:
+      self.__page = self.__get_page(self.__selector)
+    except Exception:
+      self.__exc_info = sys.exc_info()
+    # Drop the reference, so that only the caller holds on to the page.
+    self.__get_page = None
+
+  def GetPage(self):
+    """Waits for the page and returns it.
+
+    Returns:
+      dict The page.
+
+    Raises:
+      Exception: whichever error fetching the page raised.
+    """
+    self.join()
+    if self.__exc_info is not None:
+      raise self.__exc_info[0], self.__exc_info[1], self.__exc_info[2]
+    page = self.__page
+    self.__page = None
+    return page
+
+
+class PageFetcher(object):
+
+  """Pool of worker threads which fetch pages in the background.
+
+  Pages are queued by offset with Fetch() and handed back with GetResult() in
+  the order they arrive.
+  """
+
+  def __init__(self, get_page, workers):
+    """Inits PageFetcher.
+
+    Args:
+      get_page: function Takes a selector and returns the page it matches.
+      workers: int Number of pages fetched at the same time.
+    """
+    self.__get_page = get_page
+    self.__tasks = Queue.Queue()
+    self.__results = Queue.Queue()
+    self.__workers = []
+    for _ in xrange(workers):
+      worker = threading.Thread(target=self.__Work)
+      worker.setDaemon(True)
+      worker.start()
+      self.__workers.append(worker)
+
+  def __Work(self):
+    """Fetches queued pages until told to stop."""
+    while True:
+      task = self.__tasks.get()
+      if task is None:
+        return
+      start_index, selector = task
+      try:
+        result = (start_index, self.__get_page(selector), None)
+      except Exception:
+        result = (start_index, None, sys.exc_info())
+      self.__results.put(result)
+
+  def Fetch(self, start_index, selector):
+    """Queues a page to be fetched.
+
+    Args:
+      start_index: int Offset of the first entry of the page.
+      selector: dict Selector for the page.
+    """
+    self.__tasks.put((start_index, selector))
+
+  def GetResult(self):
+    """Waits for the next page to arrive and returns it.
+
+    Returns:
+      tuple The offset of the page and the page.
+
+    Raises:
+      Exception: whichever error fetching the page raised.
+    """
+    start_index, page, exc_info = self.__results.get()
+    if exc_info is not None:
+      raise exc_info[0], exc_info[1], exc_info[2]
+    return start_index, page
+
+  def Stop(self):
+    """Lets the workers end once the pages they are fetching arrive."""
+    for _ in self.__workers:
+      self.__tasks.put(None)
+
+
+def IterPages(get_page, selector, page_size=None, workers=1, ordered=True):
+  """Yields the pages of entries matched by a selector.
+
+  With a single worker, the next page is fetched in the background while the
+  caller works through the current one, so no more than two pages are held at
+  a time.
+
+  With more workers, the first page is fetched alone to learn totalNumEntries.
+  The remaining pages are then fetched by that many workers at once, with no
+  more than twice as many pages fetched or waiting to be yielded at a time.
+
+  Args:
+    get_page: function Takes a selector and returns the page it matches.
+    selector: dict Selector to page through. It is not modified.
+    [optional]
+    page_size: int Number of entries per page. Defaults to the selector's
+               numberResults, or DEFAULT_PAGE_SIZE if it has none.
+    workers: int Number of pages fetched at the same time.
+    ordered: bool Whether pages fetched by several workers are yielded in
+             offset order, as opposed to in the order they arrive.
+
+  Returns:
+    generator Pages, as returned by get_page.
+  """
+  if workers > 1:
+    return _IterPagesInParallel(get_page, selector, page_size, workers,
+                                ordered)
+  return _IterPagesAhead(get_page, selector, page_size)
+
+
+def _IterPagesAhead(get_page, selector, page_size):
+  """Yields pages in offset order, fetching one page ahead.
+
+  Args:
+    get_page: function Takes a selector and returns the page it matches.
+    selector: dict Selector to page through.
+    page_size: int Number of entries per page, or None.
+
+  Returns:
+    generator Pages, as returned by get_page.
+  """
+  start_index, page_size = GetPaging(selector, page_size)
+  request = PageRequest(get_page,
+                        GetPageSelector(selector, start_index, page_size))
+  request.start()
+  while request is not None:
+    page = request.GetPage()
+    start_index += page_size
+    request = None
+    if HasMoreEntries(page, start_index):
+      request = PageRequest(get_page,
+                            GetPageSelector(selector, start_index, page_size))
+      request.start()
+    yield page
+
+
+def _IterPagesInParallel(get_page, selector, page_size, workers, ordered):
+  """Yields pages fetched by a pool of workers once the first page arrived.
+
+  Args:
+    get_page: function Takes a selector and returns the page it matches.
+    selector: dict Selector to page through.
+    page_size: int Number of entries per page, or None.
+    workers: int Number of pages fetched at the same time.
+    ordered: bool Whether pages are yielded in offset order.
+
+  Returns:
+    generator Pages, as returned by get_page.
+  """
+  start_index, page_size = GetPaging(selector, page_size)
+  page = get_page(GetPageSelector(selector, start_index, page_size))
+  next_index = start_index + page_size
+  if not HasMoreEntries(page, next_index):
+    yield page
+    return
+
+  offsets = range(next_index, int(page['totalNumEntries']), page_size)
+  queued = 0
+  pending = 0
+  ready = {}
+  limit = workers * 2
+  fetcher = PageFetcher(get_page, workers)
+  try:
+    while True:
+      # Keep the workers busy without holding more than the limit of pages.
+      while queued < len(offsets) and pending + len(ready) < limit:
+        fetcher.Fetch(offsets[queued],
+                      GetPageSelector(selector, offsets[queued], page_size))
+        queued += 1
+        pending += 1
+      if ordered and next_index in ready:
+        page = ready.pop(next_index)
+        next_index += page_size
+      elif page is None:
+        if not pending:
+          break
+        start_index, page = fetcher.GetResult()
+        pending -= 1
+        if ordered:
+          ready[start_index] = page
+          page = None
+          continue
+      yield page
+      page = None
+  finally:
+    fetcher.Stop()
+
+
+def IterEntries(get_page, selector, page_size=None, workers=1, ordered=True):
+  """Yields the entries matched by a selector, one at a time.
+
+  Args:
+    get_page: function Takes a selector and returns the page it matches.
+    selector: dict Selector to page through. It is not modified.
+    [optional]
+    page_size: int Number of entries per page. Defaults to the selector's
+               numberResults, or DEFAULT_PAGE_SIZE if it has none.
+    workers: int Number of pages fetched at the same time.
+    ordered: bool Whether pages fetched by several workers are yielded in
+             offset order, as opposed to in the order they arrive.
+
+  Returns:
+    generator Entries of all pages.
+  """
+  for page in IterPages(get_page, selector, page_size, workers, ordered):
+    for entry in page.get('entries') or []:
+      yield entry
@@ -0,0 +1,189 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Precompiled service definitions shipped with the client library.
+
+The WSDLs of every service and API version the library supports are fixed, so
+their compiled ServiceDefinitions are built ahead of time by
+scripts/adspygoogle/adwords/schema_compiler.py, which setup.py runs when any of
+them is missing, and installed as package data.
+Services created against the live or sandbox servers load them from here and do
+not touch the network.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import cPickle
+import os
+
+from adspygoogle.adwords import LIB_HOME
+from adspygoogle.adwords.AdWordsSanityCheck import DEPRECATED_AFTER
+from adspygoogle.common.soappy import ServiceDefinition
+
+
+SCHEMA_DIR = os.path.join(LIB_HOME, 'schemas')
+
+# Servers whose WSDLs the shipped definitions were compiled from. Any other
+# server, i.e. a test server, always has its WSDL fetched.
+SERVERS = ('https://adwords.google.com', 'https://adwords-sandbox.google.com')
+
+# Group and name the definition of reportDefinition.xsd is stored under.
+REPORT_GROUP = 'reportdownload'
+REPORT_DEFINITION = 'reportDefinition'
+
+# Services behind the AdWordsClient.Get*Service methods, keyed by name, with the
+# group their WSDL is served from.
+SERVICES = {
+    'AdExtensionOverrideService': 'cm',
+    'AdGroupAdService': 'cm',
+    'AdGroupCriterionService': 'cm',
+    'AdGroupService': 'cm',
+    'AdParamService': 'cm',
+    'AlertService': 'mcm',
+    'BidLandscapeService': 'cm',
+    'BudgetOrderService': 'billing',
+    'BulkMutateJobService': 'job',
+    'CampaignAdExtensionService': 'cm',
+    'CampaignCriterionService': 'cm',
+    'CampaignService': 'cm',
+    'CampaignTargetService': 'cm',
+    'ConstantDataService': 'cm',
+    'ConversionTrackerService': 'cm',
+    'CreateAccountService': 'mcm',
+    'CustomerService': 'mcm',
+    'CustomerSyncService': 'ch',
+    'DataService': 'cm',
+    'ExperimentService': 'cm',
+    'GeoLocationService': 'cm',
+    'InfoService': 'info',
+    'LocationCriterionService': 'cm',
+    'ManagedCustomerService': 'mcm',
+    'MediaService': 'cm',
+    'MutateJobService': 'cm',
+    'ReportDefinitionService': 'cm',
+    'ServicedAccountService': 'mcm',
+    'TargetingIdeaService': 'o',
+    'TrafficEstimatorService': 'o',
+    'UserListService': 'cm'
+}
+
+
+def GetServices(version):
+  """Returns the services available in an API version.
+
+  Args:
+    version: str API version.
+
+  Returns:
+    list (group, service name) tuples, sorted by service name.
+  """
+  return [(SERVICES[name], name) for name in sorted(SERVICES)
+          if name not in DEPRECATED_AFTER or version <= DEPRECATED_AFTER[name]]
+
+
+def GetMissing(versions, schema_dir=None):
+  """Returns the paths of definitions which should be shipped but are missing.
+
+  Args:
+    versions: list API versions to check.
+    [optional]
+    schema_dir: str Directory holding the definitions. Defaults to the
+                directory shipped with the library.
+
+  Returns:
+    list Paths of the missing files.
+  """
+  missing = []
+  for version in versions:
+    for group, name in GetServices(version) + [(REPORT_GROUP,
+                                               REPORT_DEFINITION)]:
+      path = GetPath(version, group, name, schema_dir)
+      if not os.path.exists(path):
+        missing.append(path)
+  return missing
+
+
+def GetPath(version, group, name, schema_dir=None):
+  """Returns the path of the file holding a precompiled definition.
+
+  Args:
+    version: str API version.
+    group: str Group the WSDL is served from, i.e. 'cm'.
+    name: str Service name, or REPORT_DEFINITION.
+    [optional]
+    schema_dir: str Directory holding the definitions. Defaults to the
+                directory shipped with the library.
+
+  Returns:
+    str Path of the file.
+  """
+  if schema_dir is None:
+    schema_dir = SCHEMA_DIR
+  return os.path.join(schema_dir, '%s_%s_%s.pkl' % (version, group, name))
+
+
+def Load(server, version, group, name, schema_dir=None):
+  """Returns the precompiled definition of a service, if one is shipped.
+
+  Args:
+    server: str API server the service is accessed on.
+    version: str API version.
+    group: str Group the WSDL is served from, i.e. 'cm'.
+    name: str Service name, or REPORT_DEFINITION.
+    [optional]
+    schema_dir: str Directory holding the definitions. Defaults to the
+                directory shipped with the library.
+
+  Returns:
+    ServiceDefinition The definition, or None if there is no usable one for
+    this server.
+  """
+  if server not in SERVERS:
+    return None
+  try:
+    fh = open(GetPath(version, group, name, schema_dir), 'rb')
+  except IOError:
+    return None
+  try:
+    try:
+      format_version, definition = cPickle.load(fh)
+    finally:
+      fh.close()
+  except Exception:
+    return None
+  if format_version != ServiceDefinition.FORMAT_VERSION:
+    return None
+  return definition
+
+
+def Save(definition, version, group, name, schema_dir=None):
+  """Stores a compiled definition so that it can be shipped.
+
+  Args:
+    definition: ServiceDefinition Compiled definition to store.
+    version: str API version.
+    group: str Group the WSDL is served from, i.e. 'cm'.
+    name: str Service name, or REPORT_DEFINITION.
+    [optional]
+    schema_dir: str Directory holding the definitions. Defaults to the
+                directory shipped with the library.
+  """
+  fh = open(GetPath(version, group, name, schema_dir), 'wb')
+  try:
+    cPickle.dump((ServiceDefinition.FORMAT_VERSION, definition), fh,
+                 cPickle.HIGHEST_PROTOCOL)
+  finally:
+    fh.close()
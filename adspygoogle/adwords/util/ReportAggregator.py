@@ -0,0 +1,325 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Groups the rows of a report and aggregates their values as they stream in.
+
+Only one partial result per group is held in memory. Once there are more
+groups than a set limit, the partial results are sorted and spilled to a
+temporary file, and the spilled runs are merged when the results are read, so
+memory use stays bounded however many groups the report has.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import cPickle
+import heapq
+import re
+import tempfile
+
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.Errors import ValidationError
+
+
+DEFAULT_MAX_GROUPS = 100000
+# Aggregate functions which can be computed.
+FUNCTIONS = ('SUM', 'COUNT', 'MIN', 'MAX')
+# Parses an aggregate such as SUM(Cost) or COUNT(*).
+AGGREGATE_REGEX = r'^\s*(\w+)\s*\(\s*(\*|\w+)\s*\)\s*$'
+# Field type of fields whose values are compared as strings by MIN and MAX.
+STRING_TYPE = 'String'
+
+
+class ReportAggregator(object):
+
+  """Implements ReportAggregator.
+
+  Computes aggregates of the rows of a report per group of rows which share
+  the values of a set of fields, like an AWQL-style GROUP BY.
+  """
+
+  def __init__(self, fields, group_by, aggregates, column_types=None,
+               max_groups=DEFAULT_MAX_GROUPS):
+    """Inits ReportAggregator.
+
+    Args:
+      fields: list Fields of the report, in the order of its columns.
+      group_by: list Fields to group the rows by.
+      aggregates: list Aggregates to compute for each group, i.e.
+                  ['SUM(Cost)', 'MAX(Clicks)', 'COUNT(*)']. COUNT of a field
+                  counts the rows where it is not missing; the other functions
+                  skip missing values.
+      [optional]
+      column_types: dict Fields mapped to STRING_TYPE, to compare their
+                    values by MIN and MAX as strings instead of numbers.
+      max_groups: int Number of groups held in memory before spilling them to
+                  disk.
+
+    Raises:
+      ValidationError: if a field is not in the report, or an aggregate is not
+                       supported.
+    """
+    column_types = column_types or {}
+    self.__fields = list(fields)
+    self.__group_indexes = [self.__GetIndex(field) for field in group_by]
+    self.__aggregates = []
+    for aggregate in aggregates:
+      match = re.match(AGGREGATE_REGEX, aggregate)
+      function = match and match.group(1).upper()
+      if function not in FUNCTIONS:
+        raise ValidationError('Aggregate \'%s\' is not supported.' % aggregate)
+      field = match.group(2)
+      if field == '*':
+        if function != 'COUNT':
+          raise ValidationError('Only COUNT can be computed over *.')
+        index = None
+      else:
+        index = self.__GetIndex(field)
+      convert = _ParseNumber
+      if column_types.get(field) == STRING_TYPE:
+        convert = _ParseString
+      self.__aggregates.append((function, index, convert))
+    self.header = tuple(group_by) + tuple(aggregates)
+    self.rows = 0
+    self.spills = 0
+    self.__max_groups = max_groups
+    self.__groups = {}
+    self.__runs = []
+
+  def __GetIndex(self, field):
+    """Returns the column of a field.
+
+    Args:
+      field: str Field of the report.
+
+    Returns:
+      int Index of the field's column.
+
+    Raises:
+      ValidationError: if the field is not in the report.
+    """
+    if field not in self.__fields:
+      raise ValidationError('Field \'%s\' is not in the report.' % field)
+    return self.__fields.index(field)
+
+  def ReadRows(self, rows):
+    """Adds rows of the report to the aggregates of their groups.
+
+    Args:
+      rows: iterator Rows of the report, each a sequence of str values in the
+            order of the fields.
+
+    Raises:
+      Error: if a row does not have one value per field.
+    """
+    width = len(self.__fields)
+    group_indexes = self.__group_indexes
+    aggregates = self.__aggregates
+    groups = self.__groups
+    for row in rows:
+      if len(row) != width:
+        raise Error('Row %d has %d values, but the report has %d fields.'
+                    % (self.rows + 1, len(row), width))
+      key = tuple([row[index] for index in group_indexes])
+      state = groups.get(key)
+      if state is None:
+        if len(groups) >= self.__max_groups:
+          self.__Spill()
+        state = [_INITIAL[function] for function, _, _ in aggregates]
+        groups[key] = state
+      for position, (function, index, convert) in enumerate(aggregates):
+        if index is None:
+          state[position] += 1
+          continue
+        value = convert(row[index])
+        if value is not None:
+          state[position] = _UPDATE[function](state[position], value)
+      self.rows += 1
+
+  def IterResults(self, as_dict=False):
+    """Yields the aggregates of each group, in the order of the group values.
+
+    Args:
+      [optional]
+      as_dict: bool Whether to yield each group as a dict keyed by the fields
+               of group_by and the aggregates, as opposed to a tuple.
+
+    Returns:
+      generator Group values followed by the aggregates, per group.
+    """
+    items = self.__groups.items()
+    items.sort()
+    runs = [iter(items)] + [_IterRun(run) for run in self.__runs]
+    if len(runs) == 1:
+      merged = runs[0]
+    else:
+      merged = heapq.merge(*runs)
+    functions = [function for function, _, _ in self.__aggregates]
+
+    key = state = None
+    for next_key, next_state in merged:
+      if state is not None and next_key == key:
+        state = [_MERGE[function](value, next_value) for
+                 function, value, next_value in zip(functions, state,
+                                                    next_state)]
+        continue
+      if state is not None:
+        yield self.__MakeResult(key, state, as_dict)
+      key, state = next_key, next_state
+    if state is not None:
+      yield self.__MakeResult(key, state, as_dict)
+
+  def Close(self):
+    """Removes the files groups were spilled to."""
+    for run in self.__runs:
+      run.close()
+    self.__runs = []
+
+  def __Spill(self):
+    """Writes the groups held in memory to a temporary file, sorted."""
+    items = self.__groups.items()
+    items.sort()
+    run = tempfile.TemporaryFile()
+    pickler = cPickle.Pickler(run, cPickle.HIGHEST_PROTOCOL)
+    for item in items:
+      pickler.dump(item)
+      # The pickler would otherwise keep every item alive until it is done.
+      pickler.clear_memo()
+    self.__runs.append(run)
+    self.__groups.clear()
+    self.spills += 1
+
+  def __MakeResult(self, key, state, as_dict):
+    """Returns the result of one group.
+
+    Args:
+      key: tuple Values of the group_by fields.
+      state: list Aggregates of the group.
+      as_dict: bool Whether to return a dict.
+
+    Returns:
+      tuple or dict Result of the group.
+    """
+    result = key + tuple(state)
+    if as_dict:
+      return dict(zip(self.header, result))
+    return result
+
+
+def _IterRun(run):
+  """Yields the groups of a spilled run, in order.
+
+  Args:
+    run: file Temporary file the groups were spilled to.
+
+  Returns:
+    generator Tuples of group values and aggregates.
+  """
+  run.seek(0)
+  unpickler = cPickle.Unpickler(run)
+  while True:
+    try:
+      yield unpickler.load()
+    except EOFError:
+      return
+
+
+def _ParseNumber(value):
+  """Parses a report value to a number.
+
+  Args:
+    value: str Value to parse, i.e. '12', '1,234' or '0.50%'.
+
+  Returns:
+    object int, long or float, or None if the value stands for a missing
+    number.
+
+  Raises:
+    Error: if the value is not a number.
+  """
+  try:
+    return int(value)
+  except ValueError:
+    pass
+  value = value.rstrip('%').replace(',', '').strip()
+  if value in ('', '--'):
+    return None
+  try:
+    return int(value)
+  except ValueError:
+    try:
+      return float(value)
+    except ValueError:
+      raise Error('Value \'%s\' is not a number.' % value)
+
+
+def _ParseString(value):
+  """Returns a report value, or None if the value stands for a missing one.
+
+  Args:
+    value: str Value to parse.
+
+  Returns:
+    str The value, or None.
+  """
+  if value.strip() in ('', '--'):
+    return None
+  return value
+
+
+def _Sum(total, value):
+  """Adds a value to a sum which may not have any values yet."""
+  if total is None:
+    return value
+  return total + value
+
+
+def _MergeSums(total, other):
+  """Adds two sums, either of which may not have any values."""
+  if other is None:
+    return total
+  return _Sum(total, other)
+
+
+def _Min(minimum, value):
+  """Returns the smaller of two values, either of which may be missing."""
+  if minimum is None or (value is not None and value < minimum):
+    return value
+  return minimum
+
+
+def _Max(maximum, value):
+  """Returns the larger of two values, either of which may be missing."""
+  if maximum is None or (value is not None and value > maximum):
+    return value
+  return maximum
+
+
+# Value of each aggregate for a group without values.
+_INITIAL = {'SUM': None, 'COUNT': 0, 'MIN': None, 'MAX': None}
+# Adds a value to the aggregate of a group.
+_UPDATE = {
+    'SUM': _Sum,
+    'COUNT': lambda count, value: count + 1,
+    'MIN': _Min,
+    'MAX': _Max
+}
+# Combines the aggregates of two parts of a group.
+_MERGE = {
+    'SUM': _MergeSums,
+    'COUNT': lambda count, other: count + other,
+    'MIN': _Min,
+    'MAX': _Max
+}
@@ -0,0 +1,494 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reads the rows of a report into one typed buffer per column.
+
+Numbers are appended to arrays of 64-bit integers or doubles as each row is
+parsed, and strings are dictionary-encoded into 32-bit codes, so a report is
+held as a few flat buffers rather than as rows of Python objects. The columns
+can be copied into NumPy arrays in one go, or saved as .npy files which later
+jobs memory-map with numpy.load(path, mmap_mode='r'). Missing integers are
+masked, as no integer can stand for them; missing doubles are NaN.
+
+NumPy is only needed to turn the columns into arrays, not to read or save them.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import array
+import os
+import struct
+import sys
+
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.Errors import MissingPackageError
+from adspygoogle.common.Errors import ValidationError
+
+try:
+  import numpy
+  NUMPY_LIB = True
+except ImportError:
+  NUMPY_LIB = False
+
+
+# Field types stored as 64-bit integers. Money and Bid are in micros.
+INT64_TYPES = ('Money', 'Bid', 'Integer', 'Long')
+# Field types stored as doubles.
+FLOAT64_TYPES = ('Double',)
+# Field type of columns which are dictionary-encoded.
+STRING_TYPE = 'String'
+# File listing the fields of saved columns and their types, in report order.
+FIELDS_FILE = 'fields.txt'
+# Suffix of the file holding the distinct values of a string column.
+DICTIONARY_SUFFIX = '.dictionary'
+# Suffix of the file flagging the rows of an integer column which are missing a
+# value. Only written for columns which have such rows.
+MASK_SUFFIX = '.mask'
+NPY_MAGIC = '\x93NUMPY'
+BYTE_ORDER = {'little': '<', 'big': '>'}[sys.byteorder]
+# The array module has no typecode for 64-bit integers as such, so the C long
+# is used where it has 64 bits, and a list packed on demand elsewhere.
+if array.array('l').itemsize == 8:
+  INT64_TYPECODE = 'l'
+else:
+  INT64_TYPECODE = None
+
+
+class ReportColumns(object):
+
+  """Implements ReportColumns.
+
+  Holds the rows of a report as one typed buffer per field of its selector.
+  """
+
+  def __init__(self, fields, column_types=None):
+    """Inits ReportColumns.
+
+    Args:
+      fields: list Fields of the report, in the order of its columns, i.e.
+              the fields of its selector or AWQL SELECT clause.
+      [optional]
+      column_types: dict Fields mapped to their field type, one of Money, Bid,
+                    Integer, Long or Double. Other fields are read as strings.
+
+    Raises:
+      ValidationError: if a field type is not supported, or names a field the
+                       report does not have.
+    """
+    column_types = column_types or {}
+    for field, column_type in column_types.iteritems():
+      if field not in fields:
+        raise ValidationError('Field \'%s\' is not in the report.' % field)
+      if column_type not in INT64_TYPES + FLOAT64_TYPES + (STRING_TYPE,):
+        raise ValidationError('Can not store values of field type %s in a '
+                              'column.' % column_type)
+    self.fields = list(fields)
+    self.rows = 0
+    self.__columns = []
+    for field in self.fields:
+      column_type = column_types.get(field, STRING_TYPE)
+      if column_type in INT64_TYPES:
+        self.__columns.append(_Int64Column())
+      elif column_type in FLOAT64_TYPES:
+        self.__columns.append(_Float64Column())
+      else:
+        self.__columns.append(_StringColumn())
+
+  def ReadRows(self, rows):
+    """Appends rows of the report to the columns.
+
+    Args:
+      rows: iterator Rows of the report, each a sequence of str values in the
+            order of the fields.
+
+    Raises:
+      Error: if a row does not have one value per field.
+    """
+    appends = [column.Append for column in self.__columns]
+    width = len(appends)
+    for row in rows:
+      if len(row) != width:
+        raise Error('Row %d has %d values, but the report has %d fields.'
+                    % (self.rows + 1, len(row), width))
+      for append, value in zip(appends, row):
+        append(value)
+      self.rows += 1
+
+  def GetValues(self, field):
+    """Returns the values of one column, as Python objects.
+
+    Args:
+      field: str Field of the column.
+
+    Returns:
+      list Values of the column. Missing integers are None.
+    """
+    return self.__columns[self.fields.index(field)].GetValues()
+
+  def ToArrays(self):
+    """Returns the columns as NumPy arrays.
+
+    The arrays are copies, so rows read afterwards do not change them.
+
+    Returns:
+      dict Fields mapped to an int64 or float64 array of their values. An
+      int64 column missing some values is a numpy.ma.MaskedArray with those
+      values masked. String fields are mapped to a tuple of an int32 array of
+      codes and an array of the distinct values the codes index.
+
+    Raises:
+      MissingPackageError: if NumPy is not installed.
+    """
+    _CheckNumPy()
+    arrays = {}
+    for field, column in zip(self.fields, self.__columns):
+      arrays[field] = column.ToArray()
+    return arrays
+
+  def Save(self, output_dir):
+    """Saves each column to an .npy file in a directory.
+
+    Each field is saved to <field>.npy, the distinct values of a string field
+    to <field>.dictionary.npy as well, and which rows of an integer field are
+    missing a value to <field>.mask.npy, if any are. The fields and their types
+    are listed in fields.txt.
+
+    Args:
+      output_dir: str Directory to save the columns to. Created if missing.
+
+    Returns:
+      list Paths of the files written.
+    """
+    if not os.path.isdir(output_dir):
+      os.makedirs(output_dir)
+    paths = []
+    listing = []
+    for field, column in zip(self.fields, self.__columns):
+      paths.extend(column.Save(os.path.join(output_dir, field)))
+      listing.append('%s\t%s\n' % (field, column.TYPE))
+    path = os.path.join(output_dir, FIELDS_FILE)
+    fh = open(path, 'w')
+    try:
+      fh.writelines(listing)
+    finally:
+      fh.close()
+    paths.append(path)
+    return paths
+
+
+def LoadColumns(output_dir):
+  """Opens columns saved with ReportColumns.Save(), without reading them.
+
+  Args:
+    output_dir: str Directory the columns were saved to.
+
+  Returns:
+    dict Fields mapped to read-only memory-mapped arrays, shaped as by
+    ReportColumns.ToArrays().
+
+  Raises:
+    MissingPackageError: if NumPy is not installed.
+  """
+  _CheckNumPy()
+  arrays = {}
+  fh = open(os.path.join(output_dir, FIELDS_FILE))
+  try:
+    listing = [line.rstrip('\n').split('\t') for line in fh if line.strip()]
+  finally:
+    fh.close()
+  for field, column_type in listing:
+    path = os.path.join(output_dir, field)
+    values = numpy.load(path + '.npy', mmap_mode='r')
+    if column_type == STRING_TYPE:
+      values = (values, numpy.load(path + DICTIONARY_SUFFIX + '.npy',
+                                   mmap_mode='r'))
+    elif os.path.exists(path + MASK_SUFFIX + '.npy'):
+      values = numpy.ma.MaskedArray(
+          values, numpy.load(path + MASK_SUFFIX + '.npy', mmap_mode='r'))
+    arrays[field] = values
+  return arrays
+
+
+def _CheckNumPy():
+  """Checks that NumPy is installed.
+
+  Raises:
+    MissingPackageError: if NumPy is not installed.
+  """
+  if not NUMPY_LIB:
+    raise MissingPackageError('NumPy is required to use report columns as '
+                              'arrays.')
+
+
+def _ParseNumber(value, number_type, null):
+  """Parses a report value which is not a plain number.
+
+  Args:
+    value: str Value to parse, i.e. '1,234' or '0.50%'.
+    number_type: type Type of the number.
+    null: object Number which stands for a missing value.
+
+  Returns:
+    object The number.
+  """
+  value = value.rstrip('%').replace(',', '').strip()
+  if value in ('', '--'):
+    return null
+  return number_type(value)
+
+
+def _WriteNpy(path, descr, length, data):
+  """Writes a one-dimensional array to a file in the .npy format.
+
+  Args:
+    path: str Path of the file.
+    descr: str NumPy type description of the values, i.e. '<i8'.
+    length: int Number of values.
+    data: str Values, in their binary form.
+  """
+  header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (
+      descr, length)
+  # The header is padded with spaces, so the data starts 16-byte aligned.
+  prefix_length = len(NPY_MAGIC) + 4
+  padding = 16 - (prefix_length + len(header) + 1) % 16
+  header += ' ' * (padding % 16) + '\n'
+  fh = open(path, 'wb')
+  try:
+    fh.write(NPY_MAGIC + '\x01\x00' + struct.pack('<H', len(header)))
+    fh.write(header)
+    fh.write(data)
+  finally:
+    fh.close()
+
+
+class _Int64Column(object):
+
+  """Column of 64-bit integers.
+
+  Missing values are stored as 0, and the rows they are in are kept apart, so
+  that they can be told from real zeros.
+  """
+
+  TYPE = 'Long'
+
+  def __init__(self):
+    """Inits _Int64Column."""
+    if INT64_TYPECODE:
+      self.__values = array.array(INT64_TYPECODE)
+    else:
+      self.__values = []
+    self.__append = self.__values.append
+    # Rows missing a value, in ascending order. Most reports have few.
+    self.__missing = array.array('l')
+
+  def Append(self, value):
+    """Appends a report value to the column.
+
+    Args:
+      value: str Value to append.
+    """
+    try:
+      self.__append(int(value))
+    except ValueError:
+      number = _ParseNumber(value, long, None)
+      if number is None:
+        self.__missing.append(len(self.__values))
+        number = 0
+      self.__append(number)
+
+  def GetValues(self):
+    """Returns the values of the column.
+
+    Returns:
+      list Values of the column, with None for missing values.
+    """
+    values = list(self.__values)
+    for row in self.__missing:
+      values[row] = None
+    return values
+
+  def GetMask(self):
+    """Returns which rows of the column are missing a value.
+
+    Returns:
+      array.array 1 for each row missing a value, 0 for the others.
+    """
+    mask = array.array('b', [0]) * len(self.__values)
+    for row in self.__missing:
+      mask[row] = 1
+    return mask
+
+  def GetBytes(self):
+    """Returns the values of the column in their native binary form.
+
+    Returns:
+      str Values of the column.
+    """
+    if INT64_TYPECODE:
+      return self.__values.tostring()
+    return struct.pack('=%dq' % len(self.__values), *self.__values)
+
+  def ToArray(self):
+    """Returns a copy of the values of the column as a NumPy array.
+
+    Returns:
+      numpy.ndarray Values of the column. If some are missing, a
+      numpy.ma.MaskedArray with those values masked.
+    """
+    if INT64_TYPECODE:
+      values = numpy.frombuffer(self.__values, numpy.int64).copy()
+    else:
+      values = numpy.array(self.__values, numpy.int64)
+    if self.__missing:
+      return numpy.ma.MaskedArray(values,
+                                  numpy.array(self.GetMask(), numpy.bool_))
+    return values
+
+  def Save(self, path):
+    """Saves the column to path.npy, and its missing rows to path.mask.npy.
+
+    Args:
+      path: str Path of the files, without extension.
+
+    Returns:
+      list Paths of the files written.
+    """
+    _WriteNpy(path + '.npy', BYTE_ORDER + 'i8', len(self.__values),
+              self.GetBytes())
+    mask_path = path + MASK_SUFFIX + '.npy'
+    if not self.__missing:
+      # A mask left from an earlier save would mask values which are there.
+      if os.path.exists(mask_path):
+        os.remove(mask_path)
+      return [path + '.npy']
+    _WriteNpy(mask_path, '|b1', len(self.__values),
+              self.GetMask().tostring())
+    return [path + '.npy', mask_path]
+
+
+class _Float64Column(object):
+
+  """Column of doubles. Missing values are stored as NaN."""
+
+  TYPE = 'Double'
+
+  def __init__(self):
+    """Inits _Float64Column."""
+    self.__values = array.array('d')
+    self.__append = self.__values.append
+
+  def Append(self, value):
+    """Appends a report value to the column.
+
+    Args:
+      value: str Value to append.
+    """
+    try:
+      self.__append(float(value))
+    except ValueError:
+      self.__append(_ParseNumber(value, float, float('nan')))
+
+  def GetValues(self):
+    """Returns the values of the column.
+
+    Returns:
+      list Values of the column.
+    """
+    return list(self.__values)
+
+  def ToArray(self):
+    """Returns a copy of the values of the column as a NumPy array.
+
+    Returns:
+      numpy.ndarray Values of the column.
+    """
+    return numpy.frombuffer(self.__values, numpy.float64).copy()
+
+  def Save(self, path):
+    """Saves the column to path.npy.
+
+    Args:
+      path: str Path of the file, without extension.
+
+    Returns:
+      list Paths of the files written.
+    """
+    _WriteNpy(path + '.npy', BYTE_ORDER + 'f8', len(self.__values),
+              self.__values.tostring())
+    return [path + '.npy']
+
+
+class _StringColumn(object):
+
+  """Column of strings, stored as codes into a list of distinct values."""
+
+  TYPE = STRING_TYPE
+
+  def __init__(self):
+    """Inits _StringColumn."""
+    self.__codes = array.array('i')
+    self.__dictionary = {}
+    self.__values = []
+
+  def Append(self, value):
+    """Appends a report value to the column.
+
+    Args:
+      value: str Value to append.
+    """
+    code = self.__dictionary.get(value)
+    if code is None:
+      code = len(self.__values)
+      self.__dictionary[value] = code
+      self.__values.append(value)
+    self.__codes.append(code)
+
+  def GetValues(self):
+    """Returns the values of the column.
+
+    Returns:
+      list Values of the column.
+    """
+    values = self.__values
+    return [values[code] for code in self.__codes]
+
+  def ToArray(self):
+    """Returns a copy of the codes of the column and the values they index.
+
+    Returns:
+      tuple NumPy array of the codes, and NumPy array of the distinct values.
+    """
+    return (numpy.frombuffer(self.__codes, numpy.int32).copy(),
+            numpy.array(self.__values or [''], 'S')[:len(self.__values)])
+
+  def Save(self, path):
+    """Saves the codes to path.npy, and the values to path.dictionary.npy.
+
+    The values are saved as fixed-width byte strings, padded with null bytes.
+
+    Args:
+      path: str Path of the files, without extension.
+
+    Returns:
+      list Paths of the files written.
+    """
+    _WriteNpy(path + '.npy', BYTE_ORDER + 'i4', len(self.__codes),
+              self.__codes.tostring())
+    width = max([len(value) for value in self.__values] + [1])
+    data = ''.join([value.ljust(width, '\0') for value in self.__values])
+    dictionary_path = path + DICTIONARY_SUFFIX + '.npy'
+    _WriteNpy(dictionary_path, '|S%d' % width, len(self.__values), data)
+    return [path + '.npy', dictionary_path]
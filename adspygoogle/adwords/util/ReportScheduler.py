@@ -0,0 +1,452 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Downloads the same report for many client accounts, or date ranges, at once.
+
+Each account's report is downloaded by its own copy of a ReportDownloader, on
+a bounded pool of worker threads. A failed download is retried on its own and
+never affects the other accounts; the outcome for every account is returned as
+a manifest.
+
+A report over a long date range can likewise be split into shards of a few
+days, downloaded at the same time and handed on in date order.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import csv
+import datetime
+import os
+import Queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from adspygoogle.common.Errors import ValidationError
+
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_DELAY = 1.0
+# Extensions of the files reports are saved to, by download format.
+FILE_EXTENSIONS = {
+    'CSV': 'csv',
+    'CSVFOREXCEL': 'csv',
+    'TSV': 'tsv',
+    'XML': 'xml',
+    'GZIPPED_CSV': 'csv.gz',
+    'GZIPPED_TSV': 'tsv.gz',
+    'GZIPPED_XML': 'xml.gz'
+}
+# Delimiters of the download formats which can be merged into one stream.
+MERGE_DELIMITERS = {
+    'CSV': ',',
+    'TSV': '\t'
+}
+# Header of the column which merged reports are prefixed with.
+CUSTOMER_ID_HEADER = 'Customer ID'
+SUCCESS = 'SUCCESS'
+FAILED = 'FAILED'
+# Number of days in each shard of a date range, by shard name.
+SHARD_DAYS = {
+    'DAY': 1,
+    'WEEK': 7
+}
+# Format of the dates of a report definition's dateRange.
+DATE_FORMAT = '%Y%m%d'
+
+
+def DownloadReports(downloader, report_definition_or_query,
+                    client_customer_ids, download_format=None,
+                    output_dir=None, fileobj=None, return_micros=False,
+                    workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES,
+                    retry_delay=DEFAULT_RETRY_DELAY):
+  """Downloads a report for each of a list of client accounts.
+
+  Either saves each account's report to its own file in output_dir, named
+  after the account, or merges all of them into fileobj. Merged reports have
+  their column header written once, followed by the rows of every account in
+  the order the accounts finish, each prefixed with the account's id; report
+  titles and totals rows are left out.
+
+  Args:
+    downloader: ReportDownloader Downloader whose credentials and settings to
+                use.
+    report_definition_or_query: dict or str Report to download, or AWQL for
+                                the report.
+    client_customer_ids: list Ids of the accounts to download the report for.
+    [optional]
+    download_format: str Download format. Only needed with AWQL, as a report
+                     definition has its own downloadFormat.
+    output_dir: str Directory to save one file per account to.
+    fileobj: file File-like object which supports write(), to merge the
+             reports into. Only CSV and TSV reports can be merged.
+    return_micros: bool Whether to return currency in micros.
+    workers: int Number of reports downloaded at the same time.
+    retries: int Number of times a failed download is retried.
+    retry_delay: float Seconds to wait before the first retry of a download,
+                 doubled for each further retry.
+
+  Returns:
+    list Manifest with one dict per account, in the order of
+    client_customer_ids. Each holds the account's clientCustomerId, status
+    (SUCCESS or FAILED), attempts, seconds spent, error message if it failed,
+    and either the path and bytes of its file, or the rows it merged.
+
+  Raises:
+    ValidationError: if not exactly one of output_dir and fileobj is given, or
+                     if the reports can not be merged.
+  """
+  if (output_dir is None) == (fileobj is None):
+    raise ValidationError('Exactly one of output_dir and fileobj is required.')
+  if isinstance(report_definition_or_query, dict):
+    download_format = report_definition_or_query.get('downloadFormat')
+  download_format = str(download_format).upper()
+  if fileobj is not None and download_format not in MERGE_DELIMITERS:
+    raise ValidationError('Reports in %s format can not be merged.'
+                          % download_format)
+
+  if output_dir is not None:
+    extension = FILE_EXTENSIONS.get(download_format, 'report')
+
+    def Download(account_downloader, client_customer_id):
+      path = os.path.join(output_dir, '%s.%s' % (client_customer_id,
+                                                 extension))
+      return _DownloadToFile(account_downloader, report_definition_or_query,
+                             download_format, return_micros, path)
+  else:
+    merger = _ReportMerger(fileobj, MERGE_DELIMITERS[download_format])
+
+    def Download(account_downloader, client_customer_id):
+      return merger.Merge(account_downloader, client_customer_id,
+                          report_definition_or_query, download_format,
+                          return_micros)
+
+  tasks = Queue.Queue()
+  for index, client_customer_id in enumerate(client_customer_ids):
+    tasks.put((index, client_customer_id))
+  manifest = [None] * len(client_customer_ids)
+
+  def Work():
+    while True:
+      try:
+        index, client_customer_id = tasks.get_nowait()
+      except Queue.Empty:
+        return
+      manifest[index] = _DownloadWithRetries(
+          downloader, client_customer_id, Download, retries, retry_delay)
+
+  threads = [threading.Thread(target=Work)
+             for _ in xrange(min(workers, len(client_customer_ids)))]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return manifest
+
+
+def SplitDateRange(min_date, max_date, shard):
+  """Splits a date range into consecutive shards.
+
+  Shards start at min_date and each spans the same number of days, except the
+  last one, which ends at max_date. Week shards therefore do not follow
+  calendar weeks.
+
+  Args:
+    min_date: str First day of the range, as YYYYMMDD.
+    max_date: str Last day of the range, as YYYYMMDD.
+    shard: str or int Size of a shard, either DAY, WEEK or a number of days.
+
+  Returns:
+    list Tuples of the first and last day of each shard, as YYYYMMDD.
+
+  Raises:
+    ValidationError: if the dates or the shard size are not valid.
+  """
+  if isinstance(shard, (int, long)):
+    days = shard
+  else:
+    days = SHARD_DAYS.get(str(shard).upper())
+  if not days or days < 1:
+    raise ValidationError('Shard size \'%s\' is not valid.' % shard)
+  try:
+    start = datetime.date(*time.strptime(str(min_date), DATE_FORMAT)[:3])
+    end = datetime.date(*time.strptime(str(max_date), DATE_FORMAT)[:3])
+  except ValueError:
+    raise ValidationError('Date range %s-%s is not valid.'
+                          % (min_date, max_date))
+  if end < start:
+    raise ValidationError('Date range %s-%s ends before it starts.'
+                          % (min_date, max_date))
+
+  shards = []
+  while start <= end:
+    shard_end = min(start + datetime.timedelta(days - 1), end)
+    shards.append((start.strftime(DATE_FORMAT),
+                   shard_end.strftime(DATE_FORMAT)))
+    start = shard_end + datetime.timedelta(1)
+  return shards
+
+
+def DownloadShards(download_shard, shards, write_shard,
+                   workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES,
+                   retry_delay=DEFAULT_RETRY_DELAY):
+  """Downloads the shards of a report at once and hands them on in order.
+
+  Each shard is downloaded to a temporary file by one of a pool of workers,
+  and retried on its own if it fails. As soon as a shard and all shards before
+  it are complete, it is passed to write_shard, so the merged report is written
+  while later shards are still downloading.
+
+  Args:
+    download_shard: function Takes a shard and a file-like object, and
+                    downloads the shard's report into it.
+    shards: list Shards to download, in the order to hand them on.
+    write_shard: function Takes the index of a shard and a file-like object
+                 holding its report, positioned at its start. Called in the
+                 order of shards, from the calling thread.
+    [optional]
+    workers: int Number of shards downloaded at the same time.
+    retries: int Number of times a failed shard is retried.
+    retry_delay: float Seconds to wait before the first retry of a shard,
+                 doubled for each further retry.
+
+  Raises:
+    Exception: the error of the first shard, in order, which still failed
+               after its last retry. Shards not yet started are not
+               downloaded.
+  """
+  tasks = Queue.Queue()
+  for index, shard in enumerate(shards):
+    tasks.put((index, shard))
+  results = Queue.Queue()
+  stopped = threading.Event()
+
+  def Work():
+    while not stopped.isSet():
+      try:
+        index, shard = tasks.get_nowait()
+      except Queue.Empty:
+        return
+      spool = tempfile.TemporaryFile()
+
+      def Download():
+        spool.seek(0)
+        spool.truncate()
+        download_shard(shard, spool)
+
+      exc_info = _Retry(Download, retries, retry_delay)[2]
+      results.put((index, spool, exc_info))
+
+  threads = [threading.Thread(target=Work)
+             for _ in xrange(min(workers, len(shards)))]
+  for thread in threads:
+    thread.setDaemon(True)
+    thread.start()
+
+  ready = {}
+  next_index = 0
+  try:
+    while next_index < len(shards):
+      index, spool, exc_info = results.get()
+      ready[index] = (spool, exc_info)
+      while next_index in ready:
+        spool, exc_info = ready.pop(next_index)
+        try:
+          if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+          spool.seek(0)
+          write_shard(next_index, spool)
+        finally:
+          spool.close()
+        next_index += 1
+  finally:
+    stopped.set()
+    for spool, exc_info in ready.values():
+      spool.close()
+
+
+def _DownloadWithRetries(downloader, client_customer_id, download, retries,
+                         retry_delay):
+  """Downloads the report of one account, retrying if it fails.
+
+  Args:
+    downloader: ReportDownloader Downloader to copy for the account.
+    client_customer_id: str Id of the account.
+    download: function Takes the account's downloader and id, downloads the
+              report and returns the details to add to the manifest.
+    retries: int Number of times a failed download is retried.
+    retry_delay: float Seconds to wait before the first retry.
+
+  Returns:
+    dict Manifest entry of the account.
+  """
+  entry = {
+      'clientCustomerId': client_customer_id,
+      'status': FAILED,
+      'attempts': 0,
+      'error': None
+  }
+  start_time = time.time()
+  account_downloader = downloader.GetAccountDownloader(client_customer_id)
+  result, entry['attempts'], exc_info = _Retry(
+      lambda: download(account_downloader, client_customer_id), retries,
+      retry_delay)
+  if exc_info is None:
+    entry.update(result)
+    entry['status'] = SUCCESS
+  else:
+    entry['error'] = str(exc_info[1])
+  entry['seconds'] = time.time() - start_time
+  return entry
+
+
+def _Retry(function, retries, retry_delay):
+  """Calls a function until it succeeds or runs out of retries.
+
+  Args:
+    function: function Function to call, without arguments.
+    retries: int Number of times a failed call is retried.
+    retry_delay: float Seconds to wait before the first retry, doubled for each
+                 further retry.
+
+  Returns:
+    tuple Result of the function, or None if every call failed, the number of
+    calls made, and the sys.exc_info() of the last failed call, or None if it
+    succeeded.
+  """
+  attempts = 0
+  while True:
+    attempts += 1
+    try:
+      return function(), attempts, None
+    except ValidationError:
+      # The request itself is wrong, so trying again would not help.
+      return None, attempts, sys.exc_info()
+    except Exception:
+      if attempts > retries:
+        return None, attempts, sys.exc_info()
+      time.sleep(retry_delay * 2 ** (attempts - 1))
+
+
+def _DownloadToFile(downloader, report_definition_or_query, download_format,
+                    return_micros, path):
+  """Downloads a report to a file.
+
+  The report is written to a temporary file next to the target first, so that
+  a failed download never leaves a partial report behind.
+
+  Args:
+    downloader: ReportDownloader Downloader for the account.
+    report_definition_or_query: dict or str Report or AWQL.
+    download_format: str Download format.
+    return_micros: bool Whether to return currency in micros.
+    path: str Path of the file to save the report to.
+
+  Returns:
+    dict Path and size of the file.
+  """
+  fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                  suffix='.tmp')
+  try:
+    fh = os.fdopen(fd, 'wb')
+    try:
+      if isinstance(report_definition_or_query, dict):
+        downloader.DownloadReport(report_definition_or_query, return_micros,
+                                  fileobj=fh)
+      else:
+        downloader.DownloadReportWithAwql(report_definition_or_query,
+                                          download_format, return_micros,
+                                          fileobj=fh)
+      size = fh.tell()
+    finally:
+      fh.close()
+    if os.path.exists(path):
+      os.remove(path)
+    os.rename(tmp_path, path)
+  except Exception:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+    raise
+  return {'path': path, 'bytes': size}
+
+
+class _ReportMerger(object):
+
+  """Merges the rows of many accounts' reports into one file.
+
+  Each report is spooled to a temporary file while it downloads, and copied
+  to the merged file in one piece once complete, so that reports downloading
+  at the same time do not interleave and a failed download adds no rows.
+  """
+
+  def __init__(self, fileobj, delimiter):
+    """Inits _ReportMerger.
+
+    Args:
+      fileobj: file File-like object to merge the reports into.
+      delimiter: str Field separator of the reports.
+    """
+    self.__fileobj = fileobj
+    self.__delimiter = delimiter
+    self.__header_written = False
+    self.__lock = threading.Lock()
+
+  def Merge(self, downloader, client_customer_id, report_definition_or_query,
+            download_format, return_micros):
+    """Downloads the report of one account and adds its rows.
+
+    Args:
+      downloader: ReportDownloader Downloader for the account.
+      client_customer_id: str Id of the account.
+      report_definition_or_query: dict or str Report or AWQL.
+      download_format: str Download format.
+      return_micros: bool Whether to return currency in micros.
+
+    Returns:
+      dict Number of rows added.
+    """
+    spool = tempfile.TemporaryFile()
+    try:
+      writer = csv.writer(spool, delimiter=self.__delimiter,
+                          lineterminator='\n')
+      rows = downloader.IterReportRows(report_definition_or_query,
+                                       download_format, return_micros,
+                                       include_header=True)
+      header = None
+      count = 0
+      for row in rows:
+        if header is None:
+          header = (CUSTOMER_ID_HEADER,) + row
+          continue
+        writer.writerow((client_customer_id,) + row)
+        count += 1
+      spool.seek(0)
+
+      self.__lock.acquire()
+      try:
+        if not self.__header_written and header is not None:
+          csv.writer(self.__fileobj, delimiter=self.__delimiter,
+                     lineterminator='\n').writerow(header)
+          self.__header_written = True
+        shutil.copyfileobj(spool, self.__fileobj)
+      finally:
+        self.__lock.release()
+    finally:
+      spool.close()
+    return {'rows': count}
@@ -41,6 +41,7 @@ class FakeWsdlProxy(SOAPpy.WSDL.Proxy):
 
   def __init__(self, wsdl):
     self.wsdl = wsdl
+    self.methods = {}
 
 
 def ElementToComplexType(xsd):
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Holds what is known about an API call once it returned."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+
+class CallResult(object):
+
+  """Request metadata and response headers of one API call.
+
+  Everything is taken from the call's arguments and from the one parse of its
+  response, so that logging and accounting for the call do not have to parse
+  the SOAP messages in the buffer again.
+
+  Attributes:
+    method_name: str Name of the API method that was called.
+    args: tuple Arguments the method was called with.
+    headers: dict SOAP header entries of the response, keyed by element name,
+             or None if the response was not parsed.
+  """
+
+  def __init__(self, method_name, args, headers=None):
+    """Inits CallResult.
+
+    Args:
+      method_name: str Name of the API method that was called.
+      args: tuple Arguments the method was called with.
+      [optional]
+      headers: dict SOAP header entries of the response, keyed by element name.
+    """
+    self.method_name = method_name
+    self.args = args
+    self.headers = headers
+
+  def HasHeaders(self):
+    """Returns whether the SOAP headers of the response are known.
+
+    Returns:
+      bool True if the response was parsed, False otherwise.
+    """
+    return self.headers is not None
+
+  def GetHeaderValue(self, name):
+    """Returns the value of a field of the response's SOAP headers.
+
+    Fields are looked up among the header entries first, then among the fields
+    of each header entry, i.e. those of the ResponseHeader.
+
+    Args:
+      name: str Name of the field.
+
+    Returns:
+      str Value of the field, or None if the response has no such field.
+    """
+    if not self.headers:
+      return None
+    if name in self.headers:
+      return self.headers[name]
+    for entry in self.headers.itervalues():
+      if isinstance(entry, dict) and name in entry:
+        return entry[name]
+    return None
+
+  def GetOperators(self):
+    """Returns the operators of the operations sent with the call.
+
+    Returns:
+      dict Dictionary consisting of the name of each operator mapped to the
+      number of operations using it, i.e. {'ADD': 1, 'SET': 2}, or None if the
+      call did not send any operations.
+    """
+    if self.method_name == 'get':
+      return None
+    operators = {}
+    for arg in self.args:
+      if not isinstance(arg, (list, tuple)):
+        continue
+      for operation in arg:
+        if isinstance(operation, dict) and operation.get('operator'):
+          operator = str(operation['operator'])
+          operators[operator] = operators.get(operator, 0) + 1
+    return operators or None
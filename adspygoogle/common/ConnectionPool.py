@@ -0,0 +1,169 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pool of persistent HTTP/1.1 connections shared between service objects."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import httplib
+import select
+import socket
+import threading
+import time
+
+
+DEFAULT_MAX_SIZE = 10
+DEFAULT_IDLE_TIMEOUT = 60
+
+
+class ConnectionPool(object):
+
+  """Implements a ConnectionPool.
+
+  Keeps HTTP/1.1 keep-alive connections around so that consecutive SOAP calls
+  to the same host skip the TCP and TLS handshakes. Connections are keyed by
+  protocol and the address which is actually dialed, which is the HTTP proxy
+  whenever one is in use.
+
+  The pool never blocks. If every pooled connection for a host is busy, a new
+  one is opened; on release, at most max_size idle connections are kept per
+  host and the rest are closed.
+  """
+
+  def __init__(self, max_size=DEFAULT_MAX_SIZE,
+               idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Inits ConnectionPool.
+
+    Args:
+      [optional]
+      max_size: int Maximum number of idle connections to keep per host.
+      idle_timeout: int Number of seconds after which an idle connection is
+                    evicted instead of being reused.
+    """
+    self._max_size = int(max_size)
+    self._idle_timeout = int(idle_timeout)
+    self._lock = threading.Lock()
+    self._idle = {}
+    self._connections_opened = 0
+
+  def GetConnection(self, proto, address):
+    """Returns a connection to the given address, reusing an idle one if any.
+
+    Args:
+      proto: str Protocol of the connection, either 'http' or 'https'.
+      address: str Host (and optional port) to connect to.
+
+    Returns:
+      tuple A httplib.HTTPConnection (or httplib.HTTPSConnection) followed by a
+      bool which is True if the connection was taken from the pool.
+    """
+    key = (proto, address)
+    now = time.time()
+    self._lock.acquire()
+    try:
+      idle = self._idle.get(key, [])
+      while idle:
+        connection, last_used = idle.pop()
+        if (now - last_used < self._idle_timeout and
+            not _IsStale(connection)):
+          return connection, True
+        connection.close()
+      self._connections_opened += 1
+    finally:
+      self._lock.release()
+    return _NewConnection(proto, address), False
+
+  def ReleaseConnection(self, proto, address, connection):
+    """Returns a connection to the pool once its response was fully read.
+
+    Args:
+      proto: str Protocol of the connection, either 'http' or 'https'.
+      address: str Host (and optional port) the connection is attached to.
+      connection: httplib.HTTPConnection Connection to give back.
+    """
+    key = (proto, address)
+    self._lock.acquire()
+    try:
+      idle = self._idle.setdefault(key, [])
+      if len(idle) < self._max_size and connection.sock is not None:
+        idle.append((connection, time.time()))
+        return
+    finally:
+      self._lock.release()
+    connection.close()
+
+  def Clear(self):
+    """Closes all idle connections held by the pool."""
+    self._lock.acquire()
+    try:
+      idle, self._idle = self._idle, {}
+    finally:
+      self._lock.release()
+    for connections in idle.values():
+      for connection, _ in connections:
+        connection.close()
+
+  def GetConnectionsOpened(self):
+    """Returns the number of connections this pool had to open so far.
+
+    Returns:
+      int Number of connections opened.
+    """
+    return self._connections_opened
+
+
+def _NewConnection(proto, address):
+  """Creates a new, not yet connected, HTTP/1.1 connection.
+
+  Honors the SSL certificate verification set up through the Client's
+  "ca_certs" property.
+
+  Args:
+    proto: str Protocol of the connection, either 'http' or 'https'.
+    address: str Host (and optional port) to connect to.
+
+  Returns:
+    httplib.HTTPConnection New connection.
+  """
+  if proto == 'https':
+    try:
+      from adspygoogle.common.https import Https
+      return Https.GetHttpsConnectionClass()(address)
+    except ImportError:
+      return httplib.HTTPSConnection(address)
+  return httplib.HTTPConnection(address)
+
+
+def _IsStale(connection):
+  """Checks whether an idle connection was closed by the other side.
+
+  An idle keep-alive socket should have nothing to read. If it polls as
+  readable, the server has either closed it or sent something unexpected, and
+  in both cases it can not be used for another request.
+
+  Args:
+    connection: httplib.HTTPConnection Idle connection to check.
+
+  Returns:
+    bool True if the connection should not be reused, False otherwise.
+  """
+  if connection.sock is None:
+    return True
+  try:
+    readable, _, _ = select.select([connection.sock], [], [], 0)
+  except (select.error, socket.error, ValueError):
+    return True
+  return bool(readable)
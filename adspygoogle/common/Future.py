@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Result of work which finishes on another thread."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import threading
+
+from adspygoogle.common.Errors import Error
+
+
+class Future(object):
+
+  """Implements Future.
+
+  Set once, with either a result or the error the work raised, by the thread
+  doing the work. Any number of threads may wait for it.
+  """
+
+  def __init__(self):
+    """Inits Future."""
+    self.__done = threading.Event()
+    self.__result = None
+    self.__exc_info = None
+
+  def SetResult(self, result):
+    """Sets the result and wakes up the waiting threads.
+
+    Args:
+      result: object Result of the work.
+    """
+    self.__result = result
+    self.__done.set()
+
+  def SetError(self, exc_info):
+    """Sets the error the work raised and wakes up the waiting threads.
+
+    Args:
+      exc_info: tuple The error, as returned by sys.exc_info().
+    """
+    self.__exc_info = exc_info
+    self.__done.set()
+
+  def Done(self):
+    """Returns whether the work finished.
+
+    Returns:
+      bool True if a result or error was set, False otherwise.
+    """
+    return self.__done.isSet()
+
+  def GetResult(self, timeout=None):
+    """Waits for the work to finish and returns its result.
+
+    Args:
+      [optional]
+      timeout: float Number of seconds to wait. Waits for as long as it takes
+               by default.
+
+    Returns:
+      object The result.
+
+    Raises:
+      Error: if the work did not finish in time.
+      Exception: whichever error the work raised.
+    """
+    self.__done.wait(timeout)
+    if not self.__done.isSet():
+      raise Error('The result was not ready after %s seconds.' % timeout)
+    if self.__exc_info is not None:
+      raise self.__exc_info[0], self.__exc_info[1], self.__exc_info[2]
+    return self.__result
@@ -19,22 +19,26 @@
 __author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
 
 import httplib
-import sys
+import StringIO
 import time
-import threading
+import urllib
 
 from adspygoogle import SOAPpy
 from adspygoogle.common import MessageHandler
 from adspygoogle.common import SanityCheck
+from adspygoogle.common import ServiceRegistry
 from adspygoogle.common import Utils
+from adspygoogle.common import WsdlCache
+from adspygoogle.common.CallResult import CallResult
 from adspygoogle.common.Errors import AuthTokenError
 from adspygoogle.common.Errors import Error
 from adspygoogle.common.Errors import ValidationError
 from adspygoogle.common.Logger import Logger
+from adspygoogle.common.soappy import RequestSerializer
+from adspygoogle.common.soappy import ResponseParser
+from adspygoogle.common.soappy import ServiceDefinition
 from adspygoogle.SOAPpy.wstools.WSDLTools import WSDLError
 
-sys_stdout_monkey_lock = threading.Lock()
-
 class GenericApiService(object):
 
   """Generic wrapper around a SOAPpy proxy.
@@ -43,7 +47,7 @@ class GenericApiService(object):
   directly. Classes which implement this class are required to provide the
   following methods:
 
-  _SetHeaders
+  _GetSoapHeaders
   _GetMethodInfo
   _HandleLogsAndErrors
 
@@ -52,11 +56,16 @@ class GenericApiService(object):
 
   _TakeActionOnSoapCall
   _TakeActionOnPackedArgs
+
+  A single instance may be used by many threads at once. Everything that varies
+  between calls (SOAP and HTTP headers, SOAPpy config, the buffer) is built per
+  call rather than stored on the shared SOAPpy proxy.
   """
 
   def __init__(self, headers, config, op_config, lock, logger, service_name,
                service_url, wrap_lists, buffer_class, namespace,
-               namespace_extractor):
+               namespace_extractor, connection_pool=None, wsdl_cache=None,
+               registry_key=None):
     """Inits GenericApiService.
 
     Args:
@@ -65,8 +74,9 @@ class GenericApiService(object):
       config: dict Dictionary object with populated configuration values.
       op_config: dict Dictionary object with additional configuration values for
                  this operation.
-      lock: mixed Thread lock to use to synchronize requests. May be a
-            thread.lock or a threading.RLock
+      lock: mixed Lock or semaphore to hold for the duration of each request,
+            which bounds the number of requests in flight. May be a
+            thread.lock, a threading.RLock or a threading.BoundedSemaphore.
       logger: Logger Instance of Logger to use for logging.
       service_name: string The name of this service.
       service_url: string The URL pointing to this web service.
@@ -76,6 +86,17 @@ class GenericApiService(object):
       namespace: string The namespace this service uses by default.
       namespace_extractor: function A function which takes a URL and returns the
                            namespace prefix to use to represent it.
+      [optional]
+      connection_pool: ConnectionPool Pool of keep-alive connections to send
+                       requests through. If None, every request opens a new
+                       connection.
+      wsdl_cache: WsdlCache Cache of compiled service definitions to load this
+                  service's definition from. If None, the WSDL is parsed.
+      registry_key: tuple Key identifying this service in the process-wide
+                    ServiceRegistry. If given, the definition is shared with
+                    every other service object registered under the same key
+                    and only loaded by the first one. If None, every service
+                    object loads its own.
 
     Raises:
       Error: The WSDL for this service could not be found. Will also be raised
@@ -95,25 +116,75 @@ class GenericApiService(object):
     self._buffer_class = buffer_class
     self._namespace = namespace
     self._namespace_extractor = namespace_extractor
+    self._connection_pool = connection_pool
     self._method_proxies = {}
 
     wsdl_url = service_url + '?wsdl'
+    if registry_key is None:
+      definition = self._LoadServiceDefinition(wsdl_url, wsdl_cache)
+    else:
+      definition = ServiceRegistry.SHARED_REGISTRY.GetDefinition(
+          registry_key,
+          lambda: self._LoadServiceDefinition(wsdl_url, wsdl_cache))
+    self._soappyservice = ServiceDefinition.ServiceProxy(
+        definition,
+        SOAPpy.SOAPProxy(service_url, noroot=1,
+                         http_proxy=self._op_config['http_proxy']))
+    self._soappyservice.soapproxy.config.typed = 0
+    self._soappyservice.soapproxy.config.namespaceStyle = '2001'
+    self._soappyservice.soapproxy.config.returnFaultInfo = 1
+
+  def _LoadServiceDefinition(self, wsdl_url, wsdl_cache=None):
+    """Returns the compiled definition of this service.
+
+    Uses the definition shipped with the library if there is one, and fetches
+    and compiles the WSDL otherwise.
+
+    Args:
+      wsdl_url: string The URL of the WSDL.
+      [optional]
+      wsdl_cache: WsdlCache Cache to look the compiled definition up in, and to
+                  store it in once compiled.
+
+    Returns:
+      ServiceDefinition The compiled definition of this service.
+
+    Raises:
+      Error: The WSDL for this service could not be found.
+    """
+    definition = self._GetPrecompiledDefinition()
+    if definition is not None:
+      return definition
     try:
-      self._soappyservice = SOAPpy.WSDL.Proxy(
-          wsdl_url, noroot=1, http_proxy=self._op_config['http_proxy'])
-    except WSDLError:
+      wsdl_source = urllib.urlopen(wsdl_url).read()
+      content_hash = WsdlCache.GetContentHash(wsdl_source)
+      version = self._op_config.get('version')
+      if wsdl_cache is not None:
+        definition = wsdl_cache.Get(wsdl_url, version, content_hash)
+        if definition is not None:
+          return definition
+      wsdl_stream = StringIO.StringIO(wsdl_source)
+      wsdl_stream.name = wsdl_url
+      definition = ServiceDefinition.CompileWsdlProxy(
+          SOAPpy.WSDL.Proxy(wsdl_stream), content_hash)
+    except (IOError, WSDLError):
       raise Error('Unable to locate WSDL at path \'%s\'' % wsdl_url)
-    else:
-      for method_key in self._soappyservice.methods:
-        self._soappyservice.methods[method_key].location = service_url
+    if wsdl_cache is not None:
+      wsdl_cache.Put(wsdl_url, version, content_hash, definition)
+    return definition
+
+  def _GetPrecompiledDefinition(self):
+    """Returns a definition of this service shipped with the library.
 
-      self._soappyservice.soapproxy.config.typed = 0
-      self._soappyservice.soapproxy.config.namespaceStyle = '2001'
-      self._soappyservice.soapproxy.config.returnFaultInfo = 1
-      self._soappyservice.soapproxy.config.dumpHeadersIn = 1
-      self._soappyservice.soapproxy.config.dumpHeadersOut = 1
-      self._soappyservice.soapproxy.config.dumpSOAPIn = 1
-      self._soappyservice.soapproxy.config.dumpSOAPOut = 1
+    Intended to be overridden by extending classes which ship compiled
+    definitions. Called before fetching the WSDL, which is skipped if a
+    definition is returned.
+
+    Returns:
+      ServiceDefinition The shipped definition of this service, or None to fetch
+      and compile the WSDL.
+    """
+    return None
 
   def __getattr__(self, name):
     """Takes an attribute name and tries to create a SOAP call proxy around it.
@@ -141,10 +212,13 @@ class GenericApiService(object):
     dir_list.extend(self._soappyservice.methods.keys())
     return dir_list
 
-  def _SetHeaders(self):
-    """Sets the SOAP headers for this service's requests.
+  def _GetSoapHeaders(self):
+    """Builds the SOAP headers for a request made by this service.
 
     Must be overridden by an extending class.
+
+    Returns:
+      headerType The SOAP headers to send with the request.
     """
     raise NotImplementedError
 
@@ -166,7 +240,8 @@ class GenericApiService(object):
     """
     raise NotImplementedError
 
-  def _HandleLogsAndErrors(self, buf, start_time, stop_time, error=None):
+  def _HandleLogsAndErrors(self, buf, start_time, stop_time, error=None,
+                           call_result=None):
     """Manage SOAP XML message.
 
     Must be overridden by an extending class.
@@ -177,6 +252,9 @@ class GenericApiService(object):
       stop_time: str Time after service call was invoked.
       [optional]
       error: dict Error, if any.
+      call_result: CallResult Request metadata and response headers of the
+                   call. Not given for raw calls, whose details are only in
+                   the buffer.
     """
     raise NotImplementedError
 
@@ -211,59 +289,175 @@ class GenericApiService(object):
     """
     return ksoap_args
 
-  def _ReadyOAuth(self):
-    """If OAuth is on, sets the transport handler to add OAuth HTTP header."""
+  def _GetHttpHeaders(self):
+    """Builds the additional HTTP headers for a request made by this service.
+
+    Returns:
+      dict HTTP headers to send with the request, such as the OAuth
+      Authorization header if OAuth is on.
+    """
+    http_headers = {}
     if (self._config.get('oauth_handler') and
         self._headers.get('oauth_credentials')):
       signedrequestparams = self._config[
           'oauth_handler'].GetSignedRequestParameters(
               self._headers['oauth_credentials'], str(self._service_url))
-      self._soappyservice.soapproxy.transport.additional_headers[
-          'Authorization'] = (
-              'OAuth ' +
-              self._config['oauth_handler'].FormatParametersForHeader(
-                  signedrequestparams))
+      http_headers['Authorization'] = (
+          'OAuth ' +
+          self._config['oauth_handler'].FormatParametersForHeader(
+              signedrequestparams))
     elif self._headers.get('oauth2credentials'):
-      self._headers['oauth2credentials'].apply(
-          self._soappyservice.soapproxy.transport.additional_headers)
-    else:
-      if ('Authorization' in
-          self._soappyservice.soapproxy.transport.additional_headers):
-        del self._soappyservice.soapproxy.transport.additional_headers[
-            'Authorization']
+      self._headers['oauth2credentials'].apply(http_headers)
+    return http_headers
 
-  def _ReadyCompression(self):
-    """Sets whether the HTTP transport layer should use compression."""
+  def _GetSoapConfig(self):
+    """Builds the SOAPpy config for a request made by this service.
+
+    Returns:
+      SOAPConfig Copy of the service's SOAPpy config with the compression
+      settings of this client applied.
+    """
     compress = Utils.BoolTypeConvert(self._config['compress'])
-    self._soappyservice.soapproxy.config.send_compressed = compress
-    self._soappyservice.soapproxy.config.accept_compressed = compress
+    return SOAPpy.SOAPConfig(self._soappyservice.soapproxy.config,
+                             send_compressed=compress,
+                             accept_compressed=compress)
+
+  def _PackArg(self, obj, element_name, xmlns, type_name, soap_config):
+    """Packs an argument of a SOAP call for transport.
+
+    Arguments are serialized straight to XML by RequestSerializer where
+    possible, which is much faster than packing them into SOAPpy.Types objects
+    and produces the same request. Services wrapping lists or modifying the
+    packed arguments always get SOAPpy.Types objects.
+
+    Args:
+      obj: mixed The argument to pack.
+      element_name: string The name of the argument's XML element.
+      xmlns: string The namespace that the argument's type belongs to.
+      type_name: string The name of the SOAP type the argument represents.
+      soap_config: SOAPConfig The SOAPpy config to use for this call.
+
+    Returns:
+      mixed A RequestSerializer.SerializedArg, or the argument packed by
+      MessageHandler.PackForSoappy.
+    """
+    if (not self._wrap_lists and RequestSerializer.CanSerialize(soap_config)
+        and self._TakeActionOnPackedArgs.im_func is
+        GenericApiService._TakeActionOnPackedArgs.im_func):
+      serialized = RequestSerializer.SerializeArg(
+          obj, element_name, xmlns, type_name, self._soappyservice,
+          self._namespace_extractor, soap_config)
+      if serialized is not None:
+        return serialized
+    return MessageHandler.PackForSoappy(obj, xmlns, type_name,
+                                        self._soappyservice, self._wrap_lists,
+                                        self._namespace_extractor)
+
+  def _BuildSoapMessage(self, method_name, ksoap_args, soap_headers,
+                        methodattrs, soap_config):
+    """Builds the SOAP request for the given method.
+
+    Args:
+      method_name: string The name of the SOAP operation being called.
+      ksoap_args: dictionary The keyword arguments packed for the SOAP
+                  operation.
+      soap_headers: headerType The SOAP headers to send.
+      methodattrs: dict Attributes to put on the method's XML element.
+      soap_config: SOAPConfig The SOAPpy config to use for this call.
+
+    Returns:
+      str The SOAP request.
+    """
+    soapproxy = self._soappyservice.soapproxy
+    return RequestSerializer.BuildSOAP(
+        kw=ksoap_args, method=method_name,
+        namespace=self._soappyservice.methods[method_name].namespace,
+        header=soap_headers, methodattrs=methodattrs,
+        encoding=soapproxy.encoding, config=soap_config,
+        noroot=soapproxy.noroot)
+
+  def _InvokeSoapMethod(self, method_name, ksoap_args, soap_headers,
+                        methodattrs, soap_config, http_headers, recorder,
+                        output_types):
+    """Sends a SOAP request for the given method and parses its response.
+
+    Does what calling the method on the SOAPpy proxy would, except that all
+    per-call state is passed in rather than read from the shared proxy, and the
+    HTTP traffic is handed to the given recorder rather than printed.
+
+    Args:
+      method_name: string The name of the SOAP operation being called.
+      ksoap_args: dictionary The keyword arguments packed for the SOAP
+                  operation.
+      soap_headers: headerType The SOAP headers to send.
+      methodattrs: dict Attributes to put on the method's XML element.
+      soap_config: SOAPConfig The SOAPpy config to use for this call.
+      http_headers: dict Additional HTTP headers to send.
+      recorder: SoapBuffer Buffer which records the HTTP request and response.
+      output_types: list Tuples of (namespace, type name, maxOccurs) of the
+                    values the SOAP operation returns.
+
+    Returns:
+      ParsedResponse The contents of the response, including any SOAP fault.
+      Responses are parsed by ResponseParser where possible, and by SOAPpy
+      otherwise.
+    """
+    soapproxy = self._soappyservice.soapproxy
+    callinfo = self._soappyservice.methods[method_name]
+    message = self._BuildSoapMessage(method_name, ksoap_args, soap_headers,
+                                     methodattrs, soap_config)
+    transport = SOAPpy.HTTPTransport(additional_headers=http_headers,
+                                     connection_pool=self._connection_pool)
+    response, _ = transport.call(
+        SOAPpy.SOAPAddress(self._service_url), message, callinfo.namespace,
+        callinfo.soapAction or method_name, encoding=soapproxy.encoding,
+        http_proxy=soapproxy.http_proxy, config=soap_config,
+        recorder=recorder)
+    if (soapproxy.throw_faults and soapproxy.unwrap_results and
+        not soapproxy.simplify_objects):
+      parsed = ResponseParser.ParseResponse(response, self._soappyservice,
+                                            output_types)
+      if parsed is not None:
+        return parsed
+
+    result, header = SOAPpy.parseSOAPRPC(response, header=1)
+    if soapproxy.throw_faults and isinstance(result, SOAPpy.faultType):
+      return ResponseParser.ParsedResponse(
+          None, ResponseParser.UnpackHeaders(header), result)
+
+    # Bubble up the only piece of data in the response, like SOAPpy does.
+    if soapproxy.unwrap_results:
+      public = [key for key in result.__dict__.keys() if key[0] != '_']
+      if len(public) == 1:
+        result = getattr(result, public[0])
+    if soapproxy.simplify_objects:
+      result = SOAPpy.simplify(result)
+    return ResponseParser.ParsedResponse(
+        MessageHandler.UnpackResponseAsDict(result),
+        ResponseParser.UnpackHeaders(header), list_types_restored=False)
 
   def _CreateMethod(self, method_name):
     """Create a method wrapping an invocation to the SOAP service."""
-    try:
-      soap_service_method = getattr(self._soappyservice, method_name)
-    except AttributeError:
+    if method_name not in self._soappyservice.methods:
       method_name = method_name[0].lower() + method_name[1:]
-      soap_service_method = getattr(self._soappyservice, method_name)
+      if method_name not in self._soappyservice.methods:
+        raise AttributeError(method_name)
 
     def CallMethod(*args):
       """Perform a SOAP call."""
       try:
         self._lock.acquire()
-        self._SetHeaders()
-        self._ReadyOAuth()
-        self._ReadyCompression()
+        soap_headers = self._GetSoapHeaders()
+        http_headers = self._GetHttpHeaders()
+        soap_config = self._GetSoapConfig()
 
         args = self._TakeActionOnSoapCall(method_name, args)
         method_info = self._GetMethodInfo(method_name)
-        method_attrs_holder = None
+        methodattrs = self._soappyservice.soapproxy.methodattrs
         if not method_info[MethodInfoKeys.INPUTS]:
           # Don't put any namespaces other than this service's namespace on
           # calls with no input params.
-          method_attrs_holder = self._soappyservice.soapproxy.methodattrs
-          self._soappyservice.soapproxy.methodattrs = {
-              'xmlns': self._namespace
-          }
+          methodattrs = {'xmlns': self._namespace}
 
         if len(args) != len(method_info[MethodInfoKeys.INPUTS]):
           raise TypeError(''.join([
@@ -284,43 +478,45 @@ class GenericApiService(object):
           element_name = str(method_info[MethodInfoKeys.INPUTS][i][
               MethodInfoKeys.ELEMENT_NAME])
 
-          ksoap_args[element_name] = MessageHandler.PackForSoappy(
-              args[i],
+          ksoap_args[element_name] = self._PackArg(
+              args[i], element_name,
               method_info[MethodInfoKeys.INPUTS][i][MethodInfoKeys.NS],
               method_info[MethodInfoKeys.INPUTS][i][MethodInfoKeys.TYPE],
-              self._soappyservice,
-              self._wrap_lists,
-              self._namespace_extractor)
+              soap_config)
 
         ksoap_args = self._TakeActionOnPackedArgs(method_name, ksoap_args)
+        output_types = [(out_param[MethodInfoKeys.NS],
+                         out_param[MethodInfoKeys.TYPE],
+                         out_param[MethodInfoKeys.MAX_OCCURS]) for out_param
+                        in method_info[MethodInfoKeys.OUTPUTS]]
 
         buf = self._buffer_class(
             xml_parser=self._config['xml_parser'],
             pretty_xml=Utils.BoolTypeConvert(self._config['pretty_xml']))
-        sys_stdout_monkey_lock.acquire()
+        error = {}
+        response = None
+        parsed = None
+        start_time = time.strftime('%Y-%m-%d %H:%M:%S')
         try:
-            old_stdout = sys.stdout
-            sys.stdout = buf
-
-            error = {}
-            response = None
-            start_time = time.strftime('%Y-%m-%d %H:%M:%S')
-            try:
-              response = MessageHandler.UnpackResponseAsDict(
-                  soap_service_method(**ksoap_args))
-            except Exception, e:
-              error['data'] = e
-            stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
-            # Restore stdout
-            sys.stdout = old_stdout
-        finally:
-            sys_stdout_monkey_lock.release()
+          parsed = self._InvokeSoapMethod(method_name, ksoap_args,
+                                          soap_headers, methodattrs,
+                                          soap_config, http_headers, buf,
+                                          output_types)
+          if parsed.fault is not None:
+            raise parsed.fault
+          response = parsed.body
+        except Exception, e:
+          error['data'] = e
+        stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
 
         if isinstance(response, Error):
           error = response
 
         if not Utils.BoolTypeConvert(self._config['raw_debug']):
-          self._HandleLogsAndErrors(buf, start_time, stop_time, error)
+          call_result = CallResult(method_name, args,
+                                   parsed and parsed.headers)
+          self._HandleLogsAndErrors(buf, start_time, stop_time, error,
+                                    call_result)
 
         # When debugging mode is ON, fetch last traceback.
         if Utils.BoolTypeConvert(self._config['debug']):
@@ -359,21 +555,13 @@ class GenericApiService(object):
           response = buf.GetRawSoapIn()
         elif error:
           response = error
-        else:
-          output_types = [(out_param[MethodInfoKeys.NS],
-                           out_param[MethodInfoKeys.TYPE],
-                           out_param[MethodInfoKeys.MAX_OCCURS]) for out_param
-                          in method_info[MethodInfoKeys.OUTPUTS]]
+        elif not parsed.list_types_restored:
           response = MessageHandler.RestoreListTypeWithSoappy(
               response, self._soappyservice, output_types)
 
         if Utils.BoolTypeConvert(self._config['wrap_in_tuple']):
           response = MessageHandler.WrapInTuple(response)
 
-        # Restore method_attrs if they were over-ridden
-        if method_attrs_holder:
-          self._soappyservice.soapproxy.methodattrs = method_attrs_holder
-
         return response
       finally:
         self._lock.release()
@@ -511,7 +699,7 @@ class GenericApiService(object):
             'OAuth ' + self._config['oauth_handler'].FormatParametersForHeader(
                 signedrequestparams))
 
-      self._start_time = time.strftime('%Y-%m-%d %H:%M:%S')
+      start_time = time.strftime('%Y-%m-%d %H:%M:%S')
       buf.write('%s Outgoing HTTP headers %s\nPOST %s\nHost: %s\nUser-Agent: '
                 '%s\nContent-type: %s\nContent-length: %s\nSOAPAction: %s\n' %
                 ('*'*3, '*'*46, http_header['post'], http_header['host'],
@@ -553,7 +741,7 @@ class GenericApiService(object):
                  ' %s\n%s\n%s\n' % ('*'*3, '*'*46, status_code, status_message,
                                     header, '*'*72, '*'*3, '*'*54, response,
                                     '*'*72)))
-      self._stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
+      stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
 
       # Catch local errors prior to going down to the SOAP layer, which may not
       # exist for this error instance.
@@ -567,7 +755,7 @@ class GenericApiService(object):
           msg = 'Unknown error.'
         raise Error(msg)
 
-      self._HandleLogsAndErrors(buf, self._start_time, self._stop_time)
+      self._HandleLogsAndErrors(buf, start_time, stop_time)
     finally:
       self._lock.release()
     if self._config['wrap_in_tuple']:
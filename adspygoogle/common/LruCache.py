@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Thread-safe cache which evicts its least recently used entries."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import threading
+
+
+class LruCache(object):
+
+  """Implements a LruCache.
+
+  Holds up to a fixed number of values. Once full, adding a value evicts the
+  value which was least recently added or returned. The cache may be shared by
+  many threads.
+  """
+
+  def __init__(self, max_size):
+    """Inits LruCache.
+
+    Args:
+      max_size: int Maximum number of values to hold. A size of 0 disables the
+                cache.
+    """
+    self._max_size = max_size
+    self._lock = threading.Lock()
+    self._values = {}
+    # Keys mapped to the tick of their last use; a higher tick is more recent.
+    self._ticks = {}
+    self._tick = 0
+    self.hits = 0
+    self.misses = 0
+
+  def Get(self, key):
+    """Returns the value cached for a key.
+
+    Args:
+      key: obj Hashable key of the value.
+
+    Returns:
+      obj Cached value, or None if the key has no value.
+    """
+    self._lock.acquire()
+    try:
+      if key not in self._values:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self._tick += 1
+      self._ticks[key] = self._tick
+      return self._values[key]
+    finally:
+      self._lock.release()
+
+  def Set(self, key, value):
+    """Caches a value, evicting the least recently used one if full.
+
+    Args:
+      key: obj Hashable key of the value.
+      value: obj Value to cache.
+    """
+    if self._max_size <= 0:
+      return
+    self._lock.acquire()
+    try:
+      if key not in self._values and len(self._values) >= self._max_size:
+        oldest = min([(tick, cached_key) for cached_key, tick
+                      in self._ticks.items()])[1]
+        del self._values[oldest]
+        del self._ticks[oldest]
+      self._tick += 1
+      self._values[key] = value
+      self._ticks[key] = self._tick
+    finally:
+      self._lock.release()
+
+  def Clear(self):
+    """Removes all cached values."""
+    self._lock.acquire()
+    try:
+      self._values.clear()
+      self._ticks.clear()
+    finally:
+      self._lock.release()
+
+  def GetSize(self):
+    """Returns the number of cached values.
+
+    Returns:
+      int Number of cached values.
+    """
+    self._lock.acquire()
+    try:
+      return len(self._values)
+    finally:
+      self._lock.release()
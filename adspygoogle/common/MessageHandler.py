@@ -140,14 +140,13 @@ def _PackDictForSoappy(obj, xmlns, type_name, soappy_service, wrap_lists,
       obj, type_name, xmlns, soappy_service)
   if obj_contained_type:
     type_name = obj_contained_type
+  type_info = SoappyUtils.GetTypeInfo(type_name, xmlns, soappy_service)
 
   for key in obj:
     if key == type_key or not obj[key]:
       continue
-    ns_prefix = prefix_function(SoappyUtils.GetComplexFieldNamespaceByFieldName(
-        key, type_name, xmlns, soappy_service))
-    key_type = SoappyUtils.GetComplexFieldTypeByFieldName(
-        key, type_name, xmlns, soappy_service)
+    ns_prefix = prefix_function(type_info.GetFieldNamespace(key))
+    key_type = type_info.GetFieldType(key)
     packed_data[ns_prefix + key] = PackForSoappy(
         obj[key], key_type.getTargetNamespace(), key_type.getName(),
         soappy_service, wrap_lists, prefix_function)
@@ -156,8 +155,7 @@ def _PackDictForSoappy(obj, xmlns, type_name, soappy_service, wrap_lists,
   packed_object = SOAPpy.Types.structType(packed_data, typed=0, attrs=attrs)
   packed_object._typename = type_name
   packed_object._keyord = SoappyUtils.PruneKeyOrder(
-      [param['name'] for param in SoappyUtils.GenKeyOrderAttrs(
-          soappy_service, xmlns, type_name)], packed_object)
+      [param['name'] for param in type_info.GetFields()], packed_object)
   return packed_object
 
 
@@ -262,7 +260,7 @@ def _RestoreListTypesForResponse(response, type_name, ns, service):
     if not response: return response
     for key in response:
       if key.endswith("_Type"): type_name = response[key]
-    parameters = SoappyUtils.GenKeyOrderAttrs(service, ns, type_name)
+    parameters = SoappyUtils.GetTypeInfo(type_name, ns, service).GetFields()
     for param, param_type, param_max_occurs in [
         (param['name'], param['type'], param['maxOccurs'])
         for param in parameters]:
@@ -149,36 +149,30 @@ def _SoappySanityCheckComplexType(soappy_service, obj, ns, xsi_type):
                             '\'%s\'.' % (xsi_type, obj_contained_type))
     xsi_type = obj_contained_type
 
-  parameters = SoappyUtils.GenKeyOrderAttrs(soappy_service, ns, xsi_type)
+  fields = SoappyUtils.GetTypeInfo(xsi_type, ns,
+                                   soappy_service).GetFieldTable()
   for key in obj:
     if obj[key] is None or key == type_key:
       continue
-    found = False
-    for parameter, param_type, max_occurs in [
-        (param['name'], param['type'], param['maxOccurs']) for
-        param in parameters]:
-      if parameter == key:
-        found = True
-        if not max_occurs.isdigit() or int(max_occurs) > 1:
-          # This parameter should be a list.
-          if isinstance(obj[key], (list, tuple)):
-            for item in obj[key]:
-              SoappySanityCheck(soappy_service, item,
-                                param_type.getTargetNamespace(),
-                                param_type.getName())
-          else:
-            raise ValidationError('Field \'%s\' in complex type \'%s\' should '
-                                  'be a list but value \'%s\' is a \'%s\' '
-                                  'instead.'
-                                  % (key, xsi_type, obj[key], type(obj[key])))
-        else:
-          SoappySanityCheck(soappy_service, obj[key],
-                            param_type.getTargetNamespace(),
-                            param_type.getName())
-        break
-    if not found:
+    if key not in fields:
       raise ValidationError('Field \'%s\' is not in type \'%s\'.'
                             % (key, xsi_type))
+    param_type, max_occurs = fields[key]
+    if not max_occurs.isdigit() or int(max_occurs) > 1:
+      # This parameter should be a list.
+      if isinstance(obj[key], (list, tuple)):
+        for item in obj[key]:
+          SoappySanityCheck(soappy_service, item,
+                            param_type.getTargetNamespace(),
+                            param_type.getName())
+      else:
+        raise ValidationError('Field \'%s\' in complex type \'%s\' should '
+                              'be a list but value \'%s\' is a \'%s\' '
+                              'instead.'
+                              % (key, xsi_type, obj[key], type(obj[key])))
+    else:
+      SoappySanityCheck(soappy_service, obj[key],
+                        param_type.getTargetNamespace(), param_type.getName())
 
 
 def _SoappySanityCheckSimpleType(obj, xsi_type):
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process-wide registry of compiled service definitions."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import threading
+
+
+class ServiceRegistry(object):
+
+  """Implements a ServiceRegistry.
+
+  Maps keys identifying a service, i.e. (server, group, version, service), to
+  their compiled ServiceDefinition. Definitions are immutable, so every service
+  object and client in the process shares the one definition loaded first.
+
+  A definition is loaded at most once per key. Threads asking for a key which
+  is being loaded by another thread wait for that load instead of repeating it;
+  if it fails, one of the waiting threads tries again.
+  """
+
+  def __init__(self):
+    """Inits ServiceRegistry."""
+    self._lock = threading.Lock()
+    self._definitions = {}
+    self._loading = {}
+
+  def GetDefinition(self, key, loader):
+    """Returns the definition registered for a key, loading it if needed.
+
+    Args:
+      key: tuple Key identifying the service.
+      loader: function Function taking no arguments which returns the
+              ServiceDefinition of the service. Only called if the key has no
+              definition yet.
+
+    Returns:
+      ServiceDefinition The definition of the service.
+    """
+    while True:
+      self._lock.acquire()
+      try:
+        if key in self._definitions:
+          return self._definitions[key]
+        done = self._loading.get(key)
+        if done is None:
+          done = threading.Event()
+          self._loading[key] = done
+          is_loader = True
+        else:
+          is_loader = False
+      finally:
+        self._lock.release()
+
+      if not is_loader:
+        done.wait()
+        continue
+
+      definition = None
+      try:
+        definition = loader()
+      finally:
+        self._lock.acquire()
+        try:
+          if definition is not None:
+            self._definitions[key] = definition
+          del self._loading[key]
+        finally:
+          self._lock.release()
+        done.set()
+      return definition
+
+  def Invalidate(self, key=None):
+    """Removes registered definitions.
+
+    Service objects which already exist keep using their definition.
+
+    Args:
+      [optional]
+      key: tuple Key of the definition to remove. If None, all definitions are
+           removed.
+    """
+    self._lock.acquire()
+    try:
+      if key is None:
+        self._definitions.clear()
+      elif key in self._definitions:
+        del self._definitions[key]
+    finally:
+      self._lock.release()
+
+  def GetSize(self):
+    """Returns the number of registered definitions.
+
+    Returns:
+      int Number of registered definitions.
+    """
+    self._lock.acquire()
+    try:
+      return len(self._definitions)
+    finally:
+      self._lock.release()
+
+
+# The registry shared by all clients in this process.
+SHARED_REGISTRY = ServiceRegistry()
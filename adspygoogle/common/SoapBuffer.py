@@ -163,6 +163,47 @@ class SoapBuffer(Buffer):
   def flush(self):
     super(SoapBuffer, self).flush()
 
+  def recordRequest(self, request_line, headers, data):
+    """Record an outgoing HTTP request handed over by SOAPpy's HTTPTransport.
+
+    Args:
+      request_line: str HTTP request line, i.e. "POST /path HTTP/1.1".
+      headers: list HTTP headers that were sent, as (name, value) tuples.
+      data: str Outgoing SOAP XML message, before any compression.
+    """
+    lines = [request_line] + ['%s:%s' % header for header in headers]
+    self.__WriteDump('Outgoing HTTP headers', '\n'.join(lines) + '\n')
+    self.__WriteDump('Outgoing SOAP', data)
+
+  def recordResponse(self, code, msg, header_lines, data):
+    """Record an incoming HTTP response handed over by SOAPpy's HTTPTransport.
+
+    Args:
+      code: int HTTP status code.
+      msg: str HTTP reason phrase.
+      header_lines: list Raw HTTP header lines that were received.
+      data: str Incoming SOAP XML message, after any decompression.
+    """
+    if header_lines:
+      status = 'HTTP/1.? %d %s\n' % (code, msg)
+    else:
+      status = 'HTTP/0.9 %d %s\n' % (code, msg)
+    self.__WriteDump('Incoming HTTP headers', status + ''.join(header_lines))
+    self.__WriteDump('Incoming SOAP', data)
+
+  def __WriteDump(self, title, data):
+    """Append a section to the buffer, framed by banners like SOAPpy's dumps.
+
+    Args:
+      title: str Title of the section.
+      data: str Content of the section.
+    """
+    banner = '*** %s ' % title
+    if data and not data.endswith('\n'):
+      data += '\n'
+    self.write('%s%s\n%s%s\n' % (banner, '*' * (72 - len(banner)), data,
+                                 '*' * 72))
+
   def GetBufferAsStr(self):
     """Return buffer as string.
 
@@ -299,21 +340,7 @@ class SoapBuffer(Buffer):
     # Remove banners.
     xml_dump = self.GetSoapOut().lstrip('\n').rstrip('\n')
     xml_parts = xml_dump.split('\n')
-
-    # While multiple threads are used, SoapBuffer gets too greedy and tries to
-    # capture all traffic that goes to sys.stdout. The parts that we don't need
-    # should be redirected back to sys.stdout.
-    banner = '%s Outgoing SOAP %s' % ('*' * 3, '*' * 54)
-    begin = 1
-    for index in range(len(xml_parts)):
-      if xml_parts[index] == banner:
-        begin = index + 1
-        break
-    non_xml = '\n'.join(xml_parts[:begin-1])
-    # Send data we don't need back to sys.stdout.
-    if non_xml: print non_xml
-
-    xml_dump = '\n'.join(xml_parts[begin:len(xml_parts)-1])
+    xml_dump = '\n'.join(xml_parts[1:len(xml_parts)-1])
 
     try:
       if self.__xml_parser == PYXML:
@@ -423,19 +423,12 @@ def LastStackTrace():
   Returns:
     str Last stack traceback.
   """
-  # Temporarily redirect traceback from STDOUT into a buffer.
   trace_buf = Buffer()
-  old_stdout = sys.stdout
-  sys.stdout = trace_buf
-
   try:
-    traceback.print_exc(file=sys.stdout)
+    traceback.print_exc(file=trace_buf)
   except AttributeError:
     # No exception for traceback exist.
-    print ''
-
-  # Restore STDOUT.
-  sys.stdout = old_stdout
+    pass
   return trace_buf.GetBufferAsStr().strip()
 
 
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of compiled service definitions."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import cPickle
+import glob
+import os
+import tempfile
+
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.soappy import ServiceDefinition
+
+try:
+  from hashlib import sha1
+except ImportError:
+  from sha import new as sha1
+
+
+class WsdlCache(object):
+
+  """Implements a WsdlCache.
+
+  Stores compiled ServiceDefinition objects in a directory, one file per
+  service URL, API version and hash of the WSDL's content. Since the content
+  hash is part of the key, a WSDL which changes on the server is recompiled
+  rather than served stale. Files are written atomically, so one directory may
+  be shared by several processes.
+  """
+
+  def __init__(self, cache_dir):
+    """Inits WsdlCache.
+
+    Args:
+      cache_dir: str Path to the directory holding the cache. Created if it
+                 doesn't exist.
+
+    Raises:
+      Error: if the cache directory can not be created.
+    """
+    self._cache_dir = cache_dir
+    if not os.path.isdir(cache_dir):
+      try:
+        os.makedirs(cache_dir)
+      except OSError, e:
+        if not os.path.isdir(cache_dir):
+          raise Error('Unable to create WSDL cache directory \'%s\': %s'
+                      % (cache_dir, e))
+
+  def Get(self, wsdl_url, version, content_hash):
+    """Returns the cached definition of a service, if there is one.
+
+    Unreadable or outdated cache files are removed and count as a miss.
+
+    Args:
+      wsdl_url: str URL the WSDL was fetched from.
+      version: str API version of the service.
+      content_hash: str Hash of the WSDL's content, see GetContentHash.
+
+    Returns:
+      ServiceDefinition The cached definition, or None if there is none.
+    """
+    path = self.__GetPath(wsdl_url, version, content_hash)
+    try:
+      fh = open(path, 'rb')
+    except IOError:
+      return None
+    try:
+      try:
+        format_version, definition = cPickle.load(fh)
+      finally:
+        fh.close()
+    except Exception:
+      format_version, definition = None, None
+    if format_version != ServiceDefinition.FORMAT_VERSION:
+      self.__Remove(path)
+      return None
+    return definition
+
+  def Put(self, wsdl_url, version, content_hash, definition):
+    """Stores the definition of a service.
+
+    Args:
+      wsdl_url: str URL the WSDL was fetched from.
+      version: str API version of the service.
+      content_hash: str Hash of the WSDL's content, see GetContentHash.
+      definition: ServiceDefinition Compiled definition to store.
+    """
+    path = self.__GetPath(wsdl_url, version, content_hash)
+    fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+    try:
+      fh = os.fdopen(fd, 'wb')
+      try:
+        cPickle.dump((ServiceDefinition.FORMAT_VERSION, definition), fh,
+                     cPickle.HIGHEST_PROTOCOL)
+      finally:
+        fh.close()
+      # Replace any copy written concurrently by another process.
+      self.__Remove(path)
+      os.rename(tmp_path, path)
+    except (IOError, OSError):
+      self.__Remove(tmp_path)
+
+  def Invalidate(self, wsdl_url=None):
+    """Removes cached definitions.
+
+    Args:
+      [optional]
+      wsdl_url: str URL of the WSDL whose definitions to remove, for every API
+                version and content hash. If None, the whole cache is cleared.
+    """
+    if wsdl_url is None:
+      pattern = '*.pkl'
+    else:
+      pattern = '%s_*.pkl' % _Hash(wsdl_url)
+    for path in glob.glob(os.path.join(self._cache_dir, pattern)):
+      self.__Remove(path)
+
+  def __GetPath(self, wsdl_url, version, content_hash):
+    """Returns the path of the cache file for the given key.
+
+    Args:
+      wsdl_url: str URL the WSDL was fetched from.
+      version: str API version of the service.
+      content_hash: str Hash of the WSDL's content.
+
+    Returns:
+      str Path of the cache file.
+    """
+    return os.path.join(self._cache_dir, '%s_%s_%s.pkl' % (
+        _Hash(wsdl_url), _Hash(str(version))[:8], content_hash))
+
+  def __Remove(self, path):
+    """Removes a file, ignoring files which are already gone.
+
+    Args:
+      path: str Path of the file to remove.
+    """
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+
+
+def GetContentHash(content):
+  """Returns the hash identifying the given WSDL content in the cache.
+
+  Args:
+    content: str Content of a WSDL document.
+
+  Returns:
+    str Hex digest of the content.
+  """
+  return _Hash(content)
+
+
+def _Hash(value):
+  """Returns the hex SHA-1 digest of a string.
+
+  Args:
+    value: str String to hash.
+
+  Returns:
+    str Hex digest.
+  """
+  return sha1(value).hexdigest()
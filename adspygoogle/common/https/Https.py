@@ -55,6 +55,18 @@ def GetCurrentCertsFile():
   return _ca_certs_file
 
 
+def GetHttpsConnectionClass():
+  """Returns the HTTPS connection class matching the current certs setting.
+
+  Returns:
+    class The SSL-aware connection class if a trusted certificates file is set,
+    httplib.HTTPSConnection otherwise.
+  """
+  if _ca_certs_file is not None:
+    return _SslAwareHttpsConnection
+  return httplib.HTTPSConnection
+
+
 class _SslAwareHttps(httplib.HTTPS):
   """Overridden HTTPS class which can handle SSL certificate verification."""
 
@@ -0,0 +1,293 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serializes request arguments straight from Python objects to XML.
+
+MessageHandler.PackForSoappy turns every dict, list and string of a request into
+SOAPpy.Types objects, which SOAPpy.SOAPBuilder then walks to write the XML. For
+untyped requests the XML only depends on the WSDL types involved, so this module
+writes it directly from the dicts, lists and strings, skipping the intermediate
+objects. The output is byte for byte the one SOAPpy would have produced.
+
+Values this module does not handle, such as numbers, SOAPpy.Types objects or
+lists mixing dicts and strings, are left to MessageHandler.PackForSoappy.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import cgi
+
+from adspygoogle import SOAPpy
+from adspygoogle.common import Utils
+from adspygoogle.common.soappy import SoappyUtils
+from adspygoogle.SOAPpy.wstools.XMLname import toXMLname
+
+
+class _UnsupportedValue(Exception):
+
+  """Raised for a value whose XML has to be written by SOAPpy."""
+
+
+class SerializedArg(object):
+
+  """An argument of a SOAP call, already serialized to XML.
+
+  Attributes:
+    pieces: list Strings which, joined, make up the XML of the argument.
+    namespaces: list URIs of the envelope namespaces the XML uses, in the order
+                SOAPpy would have first used them.
+  """
+
+  def __init__(self):
+    """Inits SerializedArg."""
+    self.pieces = []
+    self.namespaces = []
+
+  def UseNamespace(self, uri):
+    """Records the use of an envelope namespace.
+
+    Args:
+      uri: str URI of the namespace.
+
+    Returns:
+      str Prefix of the namespace, including the colon.
+    """
+    if uri not in self.namespaces:
+      self.namespaces.append(uri)
+    return SOAPpy.SOAPBuilder._env_ns[uri] + ':'
+
+
+class RequestBuilder(SOAPpy.SOAPBuilder):
+
+  """SOAPBuilder which also writes out SerializedArg objects.
+
+  The envelope, headers and method element are built as usual.
+  """
+
+  def dump_SerializedArg(self, obj, tag, typed=1, ns_map={}):
+    """Writes out an argument serialized by SerializeArg.
+
+    Args:
+      obj: SerializedArg The serialized argument.
+      tag: str Name of the argument's element. Already part of the pieces.
+      typed: int Whether types are written out. Always off for SerializedArg.
+      ns_map: dict Namespaces in scope, mapped to their prefixes.
+    """
+    for uri in obj.namespaces:
+      self.genns(ns_map, uri)
+    self.out.extend(obj.pieces)
+
+
+def BuildSOAP(kw, method, namespace, header, methodattrs, encoding, config,
+              noroot):
+  """Builds a SOAP request, like SOAPpy.buildSOAP does.
+
+  Args:
+    kw: dict The arguments of the call, keyed by element name. Values may be
+        SerializedArg objects or anything SOAPpy can write out.
+    method: str Name of the SOAP operation.
+    namespace: str Namespace of the method's element, if any.
+    header: headerType The SOAP headers to send.
+    methodattrs: dict Attributes to put on the method's element.
+    encoding: str Encoding of the request.
+    config: SOAPConfig The SOAPpy config to build with.
+    noroot: int Whether to leave out the root attribute.
+
+  Returns:
+    str The SOAP request.
+  """
+  return RequestBuilder(kw=kw, method=method, namespace=namespace,
+                        header=header, methodattrs=methodattrs,
+                        encoding=encoding, config=config, noroot=noroot).build()
+
+
+def CanSerialize(config):
+  """Returns whether requests built with the given config can be serialized.
+
+  Args:
+    config: SOAPConfig The SOAPpy config requests are built with.
+
+  Returns:
+    bool True if arguments may be serialized by SerializeArg, False if they
+    have to be packed by MessageHandler.PackForSoappy.
+  """
+  return (not config.typed and
+          config.schemaNamespaceURI in SOAPpy.SOAPBuilder._env_ns and
+          config.typesNamespaceURI in SOAPpy.SOAPBuilder._env_ns)
+
+
+def SerializeArg(obj, element_name, xmlns, type_name, soappy_service,
+                 prefix_function, config):
+  """Serializes an argument of a SOAP call to XML.
+
+  Args:
+    obj: mixed The python object to serialize. May be a string, list, or
+         dictionary depending on what it represents.
+    element_name: str Name of the argument's element.
+    xmlns: str The namespace that the given object's type belongs to.
+    type_name: str The name of the SOAP type this object represents.
+    soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                    this service/WSDL.
+    prefix_function: callable Takes in an xml namespace and returns the prefix
+                     to use to represent it.
+    config: SOAPConfig The SOAPpy config the request is built with. Must pass
+            CanSerialize.
+
+  Returns:
+    SerializedArg The serialized argument, or None if it has to be packed by
+    MessageHandler.PackForSoappy instead.
+  """
+  serialized = SerializedArg()
+  try:
+    _Serialize(obj, element_name, xmlns, type_name, soappy_service,
+               prefix_function, config, serialized)
+  except _UnsupportedValue:
+    return None
+  return serialized
+
+
+def _Serialize(obj, tag, xmlns, type_name, soappy_service, prefix_function,
+               config, serialized):
+  """Serializes a value into the given SerializedArg.
+
+  Args:
+    obj: mixed The python object to serialize.
+    tag: str Name of the object's element, not yet converted to an XML name.
+    xmlns: str The namespace that the given object's type belongs to.
+    type_name: str The name of the SOAP type this object represents.
+    soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                    this service/WSDL.
+    prefix_function: callable Takes in an xml namespace and returns the prefix
+                     to use to represent it.
+    config: SOAPConfig The SOAPpy config the request is built with.
+    serialized: SerializedArg The argument being serialized.
+
+  Raises:
+    _UnsupportedValue: if the object has to be packed for SOAPpy instead.
+  """
+  if isinstance(obj, dict):
+    _SerializeDict(obj, tag, xmlns, type_name, soappy_service, prefix_function,
+                   config, serialized)
+  elif isinstance(obj, (list, tuple)):
+    _SerializeList(obj, tag, xmlns, type_name, soappy_service, prefix_function,
+                   config, serialized)
+  elif isinstance(obj, str):
+    tag = toXMLname(tag)
+    serialized.pieces.append('<%s>%s</%s>\n' % (
+        tag, Utils.HtmlEscape(obj).decode('utf-8'), tag))
+  elif isinstance(obj, unicode):
+    tag = toXMLname(tag)
+    serialized.pieces.append('<%s>%s</%s>\n' % (tag, Utils.HtmlEscape(obj),
+                                                tag))
+  elif obj is None:
+    serialized.pieces.append('<%s %snull="1"/>\n' % (
+        toXMLname(tag), serialized.UseNamespace(config.schemaNamespaceURI)))
+  else:
+    raise _UnsupportedValue()
+
+
+def _SerializeDict(obj, tag, xmlns, type_name, soappy_service, prefix_function,
+                   config, serialized):
+  """Serializes a dictionary representing a complex type.
+
+  Fields are written in the order the type declares them, like SOAPpy does for
+  objects packed by MessageHandler.PackForSoappy.
+
+  Args:
+    obj: dict The python object to serialize.
+    tag: str Name of the object's element, not yet converted to an XML name.
+    xmlns: str The namespace that the given object's type belongs to.
+    type_name: str The name of the SOAP type this object represents.
+    soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                    this service/WSDL.
+    prefix_function: callable Takes in an xml namespace and returns the prefix
+                     to use to represent it.
+    config: SOAPConfig The SOAPpy config the request is built with.
+    serialized: SerializedArg The argument being serialized.
+  """
+  obj_contained_type, type_key = SoappyUtils.GetExplicitType(
+      obj, type_name, xmlns, soappy_service)
+  if obj_contained_type:
+    type_name = obj_contained_type
+  type_info = SoappyUtils.GetTypeInfo(type_name, xmlns, soappy_service)
+
+  # Look every field up first, so that bad keys fail before anything is written.
+  fields = {}
+  for key in obj:
+    if key == type_key or not obj[key]:
+      continue
+    ns_prefix = prefix_function(type_info.GetFieldNamespace(key))
+    key_type = type_info.GetFieldType(key)
+    fields[key] = (ns_prefix + key, key_type.getTargetNamespace(),
+                   key_type.getName())
+
+  tag = toXMLname(tag)
+  serialized.pieces.append('<%s %stype="%s">\n' % (
+      tag, serialized.UseNamespace(SOAPpy.NS.XSI3),
+      cgi.escape(str(prefix_function(xmlns) + type_name), 1)))
+  for param in type_info.GetFields():
+    if param['name'] in fields:
+      field_tag, field_ns, field_type = fields[param['name']]
+      _Serialize(obj[param['name']], field_tag, field_ns, field_type,
+                 soappy_service, prefix_function, config, serialized)
+  serialized.pieces.append('</%s>\n' % tag)
+
+
+def _SerializeList(obj, tag, xmlns, type_name, soappy_service, prefix_function,
+                   config, serialized):
+  """Serializes a list, which is written out as a repeated element.
+
+  Args:
+    obj: list The python object to serialize.
+    tag: str Name of the items' elements, not yet converted to an XML name.
+    xmlns: str The namespace that the given object's type belongs to.
+    type_name: str The name of the SOAP type this object represents.
+    soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                    this service/WSDL.
+    prefix_function: callable Takes in an xml namespace and returns the prefix
+                     to use to represent it.
+    config: SOAPConfig The SOAPpy config the request is built with.
+    serialized: SerializedArg The argument being serialized.
+
+  Raises:
+    _UnsupportedValue: if the list mixes kinds of items or holds lists.
+  """
+  kinds = set()
+  for item in obj:
+    if isinstance(item, dict):
+      kinds.add(dict)
+    elif isinstance(item, basestring):
+      kinds.add(basestring)
+    elif item is None:
+      kinds.add(None)
+    else:
+      raise _UnsupportedValue()
+  if len(kinds) > 1:
+    raise _UnsupportedValue()
+
+  # SOAPpy declares these namespaces for the array type it does not write out.
+  if None in kinds:
+    serialized.UseNamespace(config.typesNamespaceURI)
+  serialized.UseNamespace(SOAPpy.NS.ENC)
+  serialized.UseNamespace(config.schemaNamespaceURI)
+
+  # SOAPpy converts the name once for the list and again for each item.
+  tag = toXMLname(tag)
+  for item in obj:
+    item_type = SoappyUtils.GetArrayItemTypeName(type_name, xmlns,
+                                                 soappy_service)
+    _Serialize(item, tag, xmlns, item_type, soappy_service, prefix_function,
+               config, serialized)
@@ -0,0 +1,683 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parses SOAP responses straight into Python dicts, lists and strings.
+
+A response used to be parsed by SOAPpy.parseSOAPRPC into SOAPpy.Types objects,
+unpacked into dicts by MessageHandler.UnpackResponseAsDict and walked once more
+by MessageHandler.RestoreListTypeWithSoappy to turn fields which may repeat into
+lists. This module does all three in a single expat pass, looking field types up
+in the WSDL as elements are opened, and also collects the SOAP headers and any
+SOAP fault along the way. The result is the one the three steps would have
+produced.
+
+Messages using SOAP encoding features SOAPpy handles but AdWords does not send,
+such as multi-references or encoded arrays, are not parsed here; ParseResponse
+returns None for them so that the caller can fall back to SOAPpy.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+from xml.parsers import expat
+
+from adspygoogle import SOAPpy
+from adspygoogle.common import MessageHandler
+from adspygoogle.common.soappy import SoappyUtils
+from adspygoogle.SOAPpy.wstools.XMLname import fromXMLname
+
+
+NS = SOAPpy.NS
+
+# Kinds of elements, by the role they play in the message.
+_ENVELOPE = 0
+_HEADER = 1
+_BODY = 2
+_RESULT = 3
+_FAULT = 4
+_DETAIL = 5
+_UNTYPED = 6
+_TYPED = 7
+
+# Stands in for the TypeInfo of a type which is not defined in the WSDL.
+_UNKNOWN_TYPE = object()
+
+# Converts values of XML schema types, the way SOAPpy does.
+_CONVERTER = SOAPpy.SOAPParser()
+
+
+class _UnsupportedResponse(Exception):
+
+  """Raised for a message which has to be parsed by SOAPpy."""
+
+
+class ParsedResponse(object):
+
+  """The contents of a SOAP response.
+
+  Attributes:
+    body: mixed The value the SOAP operation returned, as a dict, list or str.
+    headers: dict SOAP header entries, keyed by element name.
+    fault: faultType The SOAP fault of the response, if any.
+    list_types_restored: bool Whether list types in the body have already been
+                         restored, as done by
+                         MessageHandler.RestoreListTypeWithSoappy.
+  """
+
+  def __init__(self, body, headers, fault=None, list_types_restored=True):
+    """Inits ParsedResponse.
+
+    Args:
+      body: mixed The value the SOAP operation returned.
+      headers: dict SOAP header entries, keyed by element name.
+      [optional]
+      fault: faultType The SOAP fault of the response.
+      list_types_restored: bool Whether list types in the body have already
+                           been restored.
+    """
+    self.body = body
+    self.headers = headers
+    self.fault = fault
+    self.list_types_restored = list_types_restored
+
+
+class _Element(object):
+
+  """An element being parsed, along with what is known of its type."""
+
+  __slots__ = ('role', 'ns', 'name', 'key', 'depth', 'kind', 'null', 'attrs',
+               'text', 'children', 'values', 'counts', 'type_name', 'type_ns',
+               'type_info', 'fields', 'decisions', 'retyped')
+
+  def __init__(self, role, ns, name, key, depth, kind, null, attrs):
+    self.role = role
+    self.ns = ns
+    self.name = name
+    self.key = key
+    self.depth = depth
+    self.kind = kind
+    self.null = null
+    self.attrs = attrs
+    self.text = []
+    self.children = 0
+    self.values = {}
+    self.counts = {}
+    self.type_name = None
+    self.type_ns = None
+    self.type_info = None
+    self.fields = None
+    self.decisions = {}
+    self.retyped = False
+
+
+class ResponseParser(object):
+
+  """Incrementally parses a SOAP response.
+
+  Feed the response to the parser in as many pieces as convenient, then call
+  Close for the result.
+  """
+
+  def __init__(self, soappy_service, output_types):
+    """Inits ResponseParser.
+
+    Args:
+      soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                      the WSDL of the service which sent the response.
+      output_types: list Tuples of (namespace, type name, maxOccurs) of the
+                    values the SOAP operation returns.
+    """
+    self._service = soappy_service
+    self._failed = False
+    self._result_type = None
+    self._result_is_list = False
+    if len(output_types) > 1:
+      self._failed = True
+    elif output_types:
+      ns, type_name, max_occurs = output_types[0]
+      self._result_type = (type_name, ns)
+      self._result_is_list = not max_occurs.isdigit() or int(max_occurs) > 1
+      if SoappyUtils.IsAnArrayType(type_name, ns, soappy_service):
+        self._failed = True
+    self._has_output = bool(output_types)
+
+    self._stack = []
+    self._next = 'E'
+    self._prefixes = {NS.XML_T: NS.XML}
+    self._names = {}
+    self._headers = {}
+    self._body = None
+    self._fault = None
+    self._got_body = False
+
+    self._parser = expat.ParserCreate(namespace_separator=' ')
+    self._parser.buffer_text = True
+    self._parser.StartElementHandler = self._StartElement
+    self._parser.EndElementHandler = self._EndElement
+    self._parser.CharacterDataHandler = self._Characters
+    self._parser.StartNamespaceDeclHandler = self._StartNamespace
+    self._parser.EndNamespaceDeclHandler = self._EndNamespace
+
+  def Feed(self, data):
+    """Parses the next piece of the response.
+
+    Args:
+      data: str The next piece of the response.
+    """
+    if self._failed:
+      return
+    try:
+      self._parser.Parse(data, 0)
+    except (_UnsupportedResponse, expat.ExpatError):
+      self._failed = True
+
+  def Close(self):
+    """Finishes parsing the response.
+
+    Returns:
+      ParsedResponse The contents of the response, or None if the response has
+      to be parsed by SOAPpy instead.
+    """
+    if not self._failed:
+      try:
+        self._parser.Parse('', 1)
+      except (_UnsupportedResponse, expat.ExpatError):
+        self._failed = True
+    self._parser = None
+    if self._failed or not self._got_body:
+      return None
+    return ParsedResponse(self._body, self._headers, self._fault)
+
+  def _StartNamespace(self, prefix, uri):
+    self._prefixes[prefix] = uri
+
+  def _EndNamespace(self, prefix):
+    self._prefixes.pop(prefix, None)
+
+  def _Characters(self, data):
+    if self._stack:
+      text = self._stack[-1].text
+      if text is not None:
+        text.append(data)
+
+  def _SplitName(self, qualified_name):
+    """Splits an element's name into its namespace, name and dictionary key.
+
+    Args:
+      qualified_name: unicode The name as reported by expat.
+
+    Returns:
+      tuple The namespace, the name converted from an XML name, and the key
+      the element's value is stored under in dictionaries.
+
+    Raises:
+      _UnsupportedResponse: if the name can not be used as a key.
+    """
+    try:
+      return self._names[qualified_name]
+    except KeyError:
+      pass
+    ns, _, local_name = qualified_name.rpartition(' ')
+    name = fromXMLname(local_name)
+    if name.startswith('_'):
+      raise _UnsupportedResponse()
+    try:
+      key = str(name.replace('.', '_'))
+    except UnicodeError:
+      raise _UnsupportedResponse()
+    split = (ns or None, name, key)
+    self._names[qualified_name] = split
+    return split
+
+  def _ReadAttributes(self, attributes):
+    """Reads the xsi:type and xsi:nil attributes of an element.
+
+    Args:
+      attributes: dict The element's attributes, as reported by expat.
+
+    Returns:
+      tuple The element's xsi:type as a (namespace, name) tuple or None,
+      whether the element is nil and its remaining attributes, if any.
+
+    Raises:
+      _UnsupportedResponse: if the attributes call for SOAP encoding features
+                            this module does not handle.
+    """
+    kind = None
+    null = 0
+    remaining = None
+    for qualified_name, value in attributes.iteritems():
+      ns, _, name = qualified_name.rpartition(' ')
+      if name == 'type' and ns in NS.XSI_L:
+        if kind is not None:
+          raise _UnsupportedResponse()
+        prefix, colon, type_name = value.partition(':')
+        if colon:
+          try:
+            kind = (self._prefixes[prefix], type_name)
+          except KeyError:
+            raise _UnsupportedResponse()
+        else:
+          kind = (None, value)
+        if kind == (NS.ENC, 'Array'):
+          raise _UnsupportedResponse()
+      elif ((name == 'null' and ns in (NS.XSI, NS.XSI2)) or
+            (name == 'nil' and ns == NS.XSI3)):
+        if null:
+          raise _UnsupportedResponse()
+        if value.lower() == 'true':
+          null = 1
+        else:
+          try:
+            null = int(value)
+          except ValueError:
+            null = 0
+      elif ns == NS.ENC or (not ns and name in ('id', 'href')):
+        raise _UnsupportedResponse()
+      else:
+        if remaining is None:
+          remaining = {}
+        remaining[(ns or None, name)] = value
+    return kind, null, remaining
+
+  def _StartElement(self, qualified_name, attributes):
+    ns, name, key = self._SplitName(qualified_name)
+    if attributes:
+      kind, null, attrs = self._ReadAttributes(attributes)
+    else:
+      kind, null, attrs = None, 0, None
+    if ns == NS.URN:
+      raise _UnsupportedResponse()
+
+    stack = self._stack
+    if not stack:
+      if self._next != 'E' or (ns, name) != (NS.ENV, 'Envelope'):
+        raise _UnsupportedResponse()
+      self._next = 'HorB'
+      stack.append(_Element(_ENVELOPE, ns, name, key, 1, kind, null, attrs))
+      return
+
+    parent = stack[-1]
+    parent.children += 1
+    parent.text = None
+    role = parent.role
+    element = _Element(_UNTYPED, ns, name, key, parent.depth + 1, kind, null,
+                       attrs)
+
+    if role == _TYPED:
+      decisions = parent.decisions
+      if key in decisions:
+        field = decisions[key]
+      else:
+        fields = parent.fields
+        if fields is None:
+          fields = self._LookUpFields(parent)
+        field = fields and fields.get(key) or None
+        decisions[key] = field
+      if field:
+        element.role = _TYPED
+        element.type_name = field[3]
+        element.type_ns = field[1]
+    elif role == _UNTYPED or role == _HEADER:
+      pass
+    elif role == _RESULT:
+      if parent.counts and key not in parent.counts:
+        raise _UnsupportedResponse()
+      if self._result_type:
+        element.role = _TYPED
+        element.type_name, element.type_ns = self._result_type
+    elif role == _DETAIL:
+      element_type = self._LookUpElementType(ns, name)
+      if element_type:
+        element.role = _TYPED
+        element.type_ns, element.type_name = element_type
+    elif role == _FAULT:
+      if (ns, name) == (None, 'detail'):
+        element.role = _DETAIL
+    elif role == _BODY:
+      if parent.children > 1:
+        raise _UnsupportedResponse()
+      if (ns, name) == (NS.ENV, 'Fault'):
+        element.role = _FAULT
+      else:
+        element.role = _RESULT
+    elif role == _ENVELOPE:
+      if ns != NS.ENV:
+        raise _UnsupportedResponse()
+      if name == 'Header' and self._next == 'HorB':
+        element.role = _HEADER
+        self._next = 'B'
+      elif name == 'Body' and self._next in ('HorB', 'B'):
+        element.role = _BODY
+        self._next = None
+      else:
+        raise _UnsupportedResponse()
+    stack.append(element)
+
+  def _LookUpFields(self, element):
+    """Looks up the fields of a typed element, once its first child opens.
+
+    Args:
+      element: _Element The typed element.
+
+    Returns:
+      dict The element type's list field table, or None if the type is not
+      defined in the WSDL.
+    """
+    try:
+      type_info = SoappyUtils.GetTypeInfo(element.type_name, element.type_ns,
+                                          self._service)
+      fields = type_info.GetListFieldTable()
+      if len(fields) != len(type_info.GetFields()):
+        # Fields declared twice are restored twice, which is left to
+        # MessageHandler.RestoreListTypeWithSoappy.
+        raise KeyError(element.type_name)
+    except KeyError:
+      element.type_info = _UNKNOWN_TYPE
+      element.fields = {}
+      return None
+    element.type_info = type_info
+    element.fields = fields
+    return fields
+
+  def _LookUpElementType(self, ns, name):
+    """Returns the type of a global element declared in the WSDL.
+
+    Args:
+      ns: str The namespace of the element.
+      name: str The name of the element.
+
+    Returns:
+      tuple The (namespace, name) of the element's type, or None if the
+      element is not declared.
+    """
+    try:
+      element_type = self._service.wsdl.types[ns].elements[name].attributes[
+          'type']
+      return (element_type[0], element_type[1])
+    except (AttributeError, KeyError, TypeError, IndexError):
+      return None
+
+  def _EndElement(self, unused_qualified_name):
+    element = self._stack.pop()
+    role = element.role
+
+    if role == _ENVELOPE:
+      return
+    if role in (_HEADER, _BODY, _RESULT, _FAULT) and (element.null or
+                                                       element.kind):
+      raise _UnsupportedResponse()
+
+    if element.null:
+      if element.children or (element.text and
+                              ''.join(element.text).strip()):
+        raise _UnsupportedResponse()
+      value = None
+    elif role == _HEADER:
+      self._headers = self._FinishUntyped(element)
+      return
+    elif role == _BODY:
+      if not element.children:
+        raise _UnsupportedResponse()
+      self._next = ''
+      self._got_body = True
+      return
+    elif role == _RESULT:
+      self._FinishResult(element)
+      return
+    elif role == _FAULT:
+      self._FinishFault(element)
+      return
+    elif not element.children:
+      value = self._GetLeafValue(element)
+    elif role == _TYPED:
+      value = self._FinishTyped(element)
+    else:
+      value = self._FinishUntyped(element)
+
+    parent = self._stack[-1]
+    key = element.key
+    field = parent.decisions.get(key)
+    if field and field[2]:
+      # Falsy items of lists are dropped by RestoreListTypeWithSoappy.
+      items = parent.values.setdefault(key, [])
+      if value:
+        items.append(value)
+      parent.counts[key] = parent.counts.get(key, 0) + 1
+    else:
+      self._AddValue(parent, key, value)
+    if (parent.role == _TYPED and key.endswith('_Type') and
+        parent.type_info is not _UNKNOWN_TYPE):
+      self._Retype(parent, value)
+
+  def _AddValue(self, element, key, value):
+    """Adds the value of a child element the way SOAPpy structs do."""
+    count = element.counts.get(key, 0)
+    if not count:
+      element.values[key] = value
+    elif count == 1:
+      element.values[key] = [element.values[key], value]
+    else:
+      element.values[key].append(value)
+    element.counts[key] = count + 1
+
+  def _Retype(self, element, type_name):
+    """Switches a typed element to the type named by its xxx.Type field.
+
+    Args:
+      element: _Element The typed element.
+      type_name: mixed The value of the xxx.Type field.
+
+    Raises:
+      _UnsupportedResponse: if the type can not be looked up.
+    """
+    if not isinstance(type_name, basestring) or element.retyped:
+      raise _UnsupportedResponse()
+    element.retyped = True
+    if type_name == element.type_info.name:
+      return
+    try:
+      type_info = SoappyUtils.GetTypeInfo(type_name, element.type_ns,
+                                          self._service)
+      fields = type_info.GetListFieldTable()
+      if len(fields) != len(type_info.GetFields()):
+        raise KeyError(type_name)
+    except KeyError:
+      raise _UnsupportedResponse()
+    element.type_info = type_info
+    element.fields = fields
+
+  def _GetLeafValue(self, element):
+    """Returns the value of an element without children.
+
+    Args:
+      element: _Element The element.
+
+    Returns:
+      mixed The element's value, as SOAPpy would parse and
+      MessageHandler.UnpackResponseAsDict would unpack it.
+    """
+    text = ''.join(element.text)
+    kind = element.kind
+    if element.depth == 3 and kind is None and not text.strip():
+      return {}
+    if kind is None and element.ns is not None:
+      kind = (element.ns, element.name)
+    if kind is not None and (kind[0] is None or kind[0] in NS.EXSD_L):
+      try:
+        data = _CONVERTER.convertType(text, kind, element.attrs or {})
+      except SOAPpy.UnknownTypeError:
+        data = None
+      except Exception:
+        raise _UnsupportedResponse()
+      if data is not None:
+        return MessageHandler.UnpackResponseAsDict(data)
+    if not element.attrs:
+      try:
+        return str(text)
+      except UnicodeError:
+        pass
+    return text
+
+  def _FinishUntyped(self, element):
+    """Returns the dict of an element with children and no known type."""
+    values = element.values
+    for key, count in element.counts.iteritems():
+      if count > 1:
+        values[key] = [value for value in values[key] if value is not None]
+    return values
+
+  def _FinishTyped(self, element):
+    """Returns the dict of an element with children of a WSDL-defined type.
+
+    Args:
+      element: _Element The element.
+
+    Returns:
+      dict The element's value, with list types restored.
+
+    Raises:
+      _UnsupportedResponse: if fields were typed differently from how
+                            MessageHandler.RestoreListTypeWithSoappy would.
+    """
+    values = element.values
+    counts = element.counts
+    decisions = element.decisions
+    type_keys = 0
+    for key, count in counts.iteritems():
+      if key.endswith('_Type'):
+        type_keys += 1
+      if count > 1:
+        field = decisions.get(key)
+        if not field:
+          values[key] = [value for value in values[key] if value is not None]
+        elif not field[2]:
+          values[key] = [value for value in values[key] if value]
+    if type_keys > 1:
+      raise _UnsupportedResponse()
+
+    if element.type_info is _UNKNOWN_TYPE:
+      return self._Restore(values, element.type_name, element.type_ns, False)
+
+    if element.retyped:
+      fields = element.fields
+      for key, field in decisions.iteritems():
+        if field:
+          if fields.get(key) != field:
+            raise _UnsupportedResponse()
+        elif key in fields:
+          field = fields[key]
+          values[key] = self._Restore(values[key], field[0], field[1],
+                                      field[2])
+    return values
+
+  def _Restore(self, value, type_name, ns, is_list):
+    """Restores list types the way MessageHandler does.
+
+    Args:
+      value: mixed The unpacked value.
+      type_name: str The name of the value's type.
+      ns: str The namespace of the value's type.
+      is_list: bool Whether the value is of a field which holds a list.
+
+    Returns:
+      mixed The value with list types restored.
+
+    Raises:
+      _UnsupportedResponse: if the types can not be looked up.
+    """
+    max_occurs = '1'
+    if is_list:
+      max_occurs = 'unbounded'
+      if not isinstance(value, list):
+        value = [value]
+    try:
+      return MessageHandler.RestoreListTypeWithSoappy(
+          value, self._service, [(ns, type_name, max_occurs)])
+    except (KeyError, TypeError, AttributeError):
+      raise _UnsupportedResponse()
+
+  def _FinishResult(self, element):
+    """Stores the value returned by the SOAP operation.
+
+    Args:
+      element: _Element The operation's response element.
+
+    Raises:
+      _UnsupportedResponse: if the response is not a struct with one field.
+    """
+    if not element.children:
+      if ''.join(element.text).strip():
+        raise _UnsupportedResponse()
+      value = {}
+      count = 0
+    else:
+      key, count = element.counts.items()[0]
+      value = element.values[key]
+
+    if not self._has_output:
+      self._body = None
+    elif count > 1:
+      self._body = [item for item in value if item]
+    elif self._result_is_list:
+      if value:
+        self._body = [value]
+      else:
+        self._body = []
+    else:
+      self._body = value
+
+  def _FinishFault(self, element):
+    """Stores the SOAP fault of the response."""
+    fault = SOAPpy.faultType()
+    for key, value in self._FinishUntyped(element).iteritems():
+      fault._addItem(key, value)
+    self._fault = fault
+
+
+def ParseResponse(xml_str, soappy_service, output_types):
+  """Parses a SOAP response.
+
+  Args:
+    xml_str: str The SOAP response.
+    soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                    the WSDL of the service which sent the response.
+    output_types: list Tuples of (namespace, type name, maxOccurs) of the values
+                  the SOAP operation returns.
+
+  Returns:
+    ParsedResponse The contents of the response, or None if the response has to
+    be parsed by SOAPpy instead.
+  """
+  parser = ResponseParser(soappy_service, output_types)
+  parser.Feed(xml_str)
+  return parser.Close()
+
+
+def UnpackHeaders(header):
+  """Unpacks the SOAP headers SOAPpy parsed from a response.
+
+  Args:
+    header: headerType The headers, as returned by SOAPpy.parseSOAPRPC.
+
+  Returns:
+    dict SOAP header entries, keyed by element name.
+  """
+  headers = {}
+  if header is not None:
+    for key in header._keys():
+      headers[str(key.replace('.', '_'))] = MessageHandler.UnpackResponseAsDict(
+          getattr(header, key))
+  return headers
@@ -0,0 +1,278 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compiled, picklable description of a SOAP service parsed from its WSDL.
+
+Parsing a WSDL with SOAPpy's wstools builds a large graph of DOM backed schema
+objects, which is slow to build and can not be pickled. A ServiceDefinition
+keeps only the parts of that graph the client library reads (the methods and
+the schema types and elements, with their attributes, content, derivations and
+attribute content) as plain objects. Since these objects have the same
+attribute names as their wstools counterparts, a ServiceProxy built around a
+ServiceDefinition can be used wherever a SOAPpy.WSDL.Proxy is expected by
+MessageHandler, SanityCheck and SoappyUtils.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+
+# Bumped whenever the layout of the compiled objects changes, so that stale
+# serialized definitions are not loaded.
+FORMAT_VERSION = 1
+
+_COMPONENT_FIELDS = ('attributes', 'content', 'derivation', 'attr_content')
+_CALL_INFO_FIELDS = ('methodName', 'namespace', 'soapAction', 'location',
+                     'style', 'use', 'encodingStyle', 'transport')
+_PARAMETER_FIELDS = ('name', 'namespace', 'element_type')
+
+
+class QName(tuple):
+
+  """A (namespace, name) pair referring to a schema type or element."""
+
+  def getTargetNamespace(self):
+    return self[0]
+
+  def getName(self):
+    return self[1]
+
+
+class SchemaComponent(object):
+
+  """Plain stand-in for a wstools XMLSchema component.
+
+  Only has those of the attributes, content, derivation and attr_content fields
+  the original component had, so that hasattr() checks keep working.
+  """
+
+  def __init__(self, tag):
+    """Inits SchemaComponent.
+
+    Args:
+      tag: str The schema tag of the component, i.e. 'complexType'.
+    """
+    self.tag = tag
+
+
+class Schema(object):
+
+  """The types and elements defined in one target namespace."""
+
+  def __init__(self, types, elements):
+    """Inits Schema.
+
+    Args:
+      types: dict Type definitions, keyed by type name.
+      elements: dict Element declarations, keyed by element name.
+    """
+    self.types = types
+    self.elements = elements
+
+
+class Definitions(object):
+
+  """Stand-in for the wstools WSDL object, holding the schemas by namespace."""
+
+  def __init__(self, types):
+    """Inits Definitions.
+
+    Args:
+      types: dict Schemas, keyed by their target namespace.
+    """
+    self.types = types
+
+
+class CallInfo(object):
+
+  """Binding information about a SOAP operation, like SOAPCallInfo."""
+
+
+class ParameterInfo(object):
+
+  """An input or output parameter of a SOAP operation, like ParameterInfo."""
+
+
+class ServiceDefinition(object):
+
+  """Compiled description of a SOAP service.
+
+  Instances are treated as immutable once compiled, so one may be shared by any
+  number of services and threads.
+  """
+
+  def __init__(self, wsdl, methods, content_hash=None):
+    """Inits ServiceDefinition.
+
+    Args:
+      wsdl: Definitions The schemas of the service.
+      methods: dict CallInfo objects, keyed by method name.
+      [optional]
+      content_hash: str Hash of the WSDL document this was compiled from.
+    """
+    self.wsdl = wsdl
+    self.methods = methods
+    self.content_hash = content_hash
+
+
+class ServiceProxy(object):
+
+  """Pairs a shared ServiceDefinition with a service's own SOAPpy proxy.
+
+  Exposes the wsdl, methods and soapproxy attributes of a SOAPpy.WSDL.Proxy.
+  """
+
+  def __init__(self, definition, soapproxy):
+    """Inits ServiceProxy.
+
+    Args:
+      definition: ServiceDefinition Compiled description of the service.
+      soapproxy: SOAPpy.SOAPProxy Proxy holding this service's SOAPpy settings.
+    """
+    self.definition = definition
+    self.wsdl = definition.wsdl
+    self.methods = definition.methods
+    self.soapproxy = soapproxy
+
+
+def CompileWsdlProxy(wsdl_proxy, content_hash=None):
+  """Compiles a parsed SOAPpy.WSDL.Proxy into a ServiceDefinition.
+
+  Args:
+    wsdl_proxy: SOAPpy.WSDL.Proxy Proxy around the parsed WSDL.
+    [optional]
+    content_hash: str Hash of the WSDL document the proxy was parsed from.
+
+  Returns:
+    ServiceDefinition Compiled description of the service.
+  """
+  schemas = {}
+  for namespace in wsdl_proxy.wsdl.types.keys():
+    schema = wsdl_proxy.wsdl.types[namespace]
+    types = {}
+    for name in schema.types.keys():
+      types[name] = _CompileComponent(schema.types[name])
+    elements = {}
+    for name in schema.elements.keys():
+      elements[name] = _CompileComponent(schema.elements[name])
+    schemas[namespace] = Schema(types, elements)
+
+  methods = {}
+  for name in wsdl_proxy.methods:
+    methods[name] = _CompileCallInfo(wsdl_proxy.methods[name])
+  return ServiceDefinition(Definitions(schemas), methods, content_hash)
+
+
+def _CompileComponent(component):
+  """Compiles a wstools schema component and everything it contains.
+
+  Args:
+    component: mixed A wstools XMLSchema component, a tuple or list of them, or
+               None.
+
+  Returns:
+    mixed The matching SchemaComponent, list of them, or None.
+  """
+  if component is None:
+    return None
+  if isinstance(component, (tuple, list)):
+    return [_CompileComponent(item) for item in component]
+  compiled = SchemaComponent(getattr(component, 'tag', None))
+  for field in _COMPONENT_FIELDS:
+    if hasattr(component, field):
+      value = getattr(component, field)
+      if field == 'attributes':
+        value = _CompileValue(value)
+      else:
+        value = _CompileComponent(value)
+      setattr(compiled, field, value)
+  return compiled
+
+
+def _CompileValue(value):
+  """Compiles an attribute value of a schema component.
+
+  Qualified names become QName objects, strings are interned and dictionaries
+  are compiled recursively.
+
+  Args:
+    value: mixed The attribute value.
+
+  Returns:
+    mixed The compiled attribute value.
+  """
+  if isinstance(value, dict):
+    compiled = {}
+    for key in value:
+      compiled[_Intern(key)] = _CompileValue(value[key])
+    return compiled
+  elif isinstance(value, tuple) and len(value) == 2:
+    return QName((_Intern(value[0]), _Intern(value[1])))
+  elif isinstance(value, basestring):
+    return _Intern(value)
+  return value
+
+
+def _CompileCallInfo(callinfo):
+  """Compiles a wstools SOAPCallInfo.
+
+  Args:
+    callinfo: SOAPCallInfo Binding information about a SOAP operation.
+
+  Returns:
+    CallInfo The compiled binding information.
+  """
+  compiled = CallInfo()
+  for field in _CALL_INFO_FIELDS:
+    setattr(compiled, field, getattr(callinfo, field, None))
+  compiled.inparams = [_CompileParameter(param) for param in callinfo.inparams]
+  compiled.outparams = [_CompileParameter(param)
+                        for param in callinfo.outparams]
+  return compiled
+
+
+def _CompileParameter(param):
+  """Compiles a wstools ParameterInfo.
+
+  Args:
+    param: ParameterInfo A parameter of a SOAP operation.
+
+  Returns:
+    ParameterInfo The compiled parameter.
+  """
+  compiled = ParameterInfo()
+  for field in _PARAMETER_FIELDS:
+    setattr(compiled, field, getattr(param, field, None))
+  compiled.type = _CompileValue(param.type)
+  return compiled
+
+
+def _Intern(value):
+  """Interns a string so that repeated names share memory once loaded.
+
+  Args:
+    value: mixed The value to intern.
+
+  Returns:
+    mixed The interned string, or the value unchanged if it is not a string.
+  """
+  if isinstance(value, unicode):
+    try:
+      value = str(value)
+    except UnicodeEncodeError:
+      return value
+  if isinstance(value, str):
+    return intern(value)
+  return value
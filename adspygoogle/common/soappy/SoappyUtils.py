@@ -18,6 +18,298 @@
 
 __author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
 
+import threading
+import weakref
+
+
+# TypeIndex of each set of WSDL definitions, keyed by the definitions object so
+# that all services sharing one definition share one index.
+_type_indexes = weakref.WeakKeyDictionary()
+_type_indexes_lock = threading.Lock()
+
+
+class TypeInfo(object):
+
+  """Precomputed facts about one WSDL-defined type.
+
+  Everything otherwise found by walking the type's base types is computed once:
+  the names of the type and all its base types, whether it is a SOAP
+  encoded array, and the flattened, ordered table of its fields including
+  inherited ones. Field facts are only computed when first needed, since simple
+  types have no fields.
+  """
+
+  def __init__(self, index, type_name, ns):
+    """Inits TypeInfo.
+
+    Args:
+      index: TypeIndex The index this type belongs to.
+      type_name: string The name of the WSDL-defined type.
+      ns: string The namespace this WSDL-defined type belongs to.
+
+    Raises:
+      KeyError: if the type is not defined in the WSDL.
+    """
+    self._index = index
+    self.name = type_name
+    self.namespace = ns
+    self.type_def = index.types[ns].types[type_name]
+    self.is_subtype = hasattr(self.type_def.content, 'derivation')
+    self.base = None
+    self.supertypes = frozenset([type_name])
+    if self.is_subtype:
+      base = self.type_def.content.derivation.attributes['base']
+      self.base = (base.getTargetNamespace(), base.getName())
+      try:
+        self.supertypes = self.supertypes.union(
+            index.Get(self.base[1], self.base[0]).supertypes)
+      except KeyError:
+        # The base type is not defined in the WSDL, i.e. soapenc:Array.
+        self.supertypes = self.supertypes.union([self.base[1]])
+    self.is_array = 'Array' in self.supertypes
+    self._fields = None
+    self._field_types = None
+    self._field_namespaces = None
+    self._array_item_type_name = None
+    self._list_fields = None
+
+  def GetFields(self):
+    """Returns the attributes of the fields of this type, in order.
+
+    Inherited fields come first.
+
+    Returns:
+      list Dictionaries of field attributes. Must not be modified.
+
+    Raises:
+      KeyError: if a base type is not defined in the WSDL.
+    """
+    if self._fields is None:
+      if self.is_subtype:
+        fields = list(self._index.Get(self.base[1], self.base[0]).GetFields())
+        extension = self.type_def.content.derivation.content
+        if hasattr(extension, 'content'):
+          fields.extend([element.attributes for element in extension.content])
+      else:
+        fields = [element.attributes
+                  for element in self.type_def.content.content]
+      self._fields = fields
+    return self._fields
+
+  def GetFieldTable(self):
+    """Returns the type and maxOccurs of each field of this type.
+
+    Returns:
+      dict Tuples of (type, maxOccurs), keyed by field name. Where a field is
+      declared more than once, the first declaration wins. Must not be
+      modified.
+
+    Raises:
+      KeyError: if a base type is not defined in the WSDL.
+    """
+    if self._field_types is None:
+      field_types = {}
+      for field in self.GetFields():
+        if field['name'] not in field_types:
+          field_types[field['name']] = (field['type'], field['maxOccurs'])
+      self._field_types = field_types
+    return self._field_types
+
+  def GetFieldNamespaces(self):
+    """Returns the namespace of the type declaring each field of this type.
+
+    Returns:
+      dict Namespace URLs, keyed by field name. Where a field is redeclared by
+      an extending type, the extending type's namespace wins. Must not be
+      modified.
+
+    Raises:
+      KeyError: if a base type is not defined in the WSDL.
+    """
+    if self._field_namespaces is None:
+      if self.is_subtype:
+        namespaces = dict(
+            self._index.Get(self.base[1], self.base[0]).GetFieldNamespaces())
+        extension = self.type_def.content.derivation.content
+        if hasattr(extension, 'content'):
+          for element in extension.content:
+            namespaces[element.attributes['name']] = self.namespace
+      else:
+        namespaces = dict([(element.attributes['name'], self.namespace)
+                           for element in self.type_def.content.content])
+      self._field_namespaces = namespaces
+    return self._field_namespaces
+
+  def GetFieldNamespace(self, field):
+    """Returns the namespace of the type which declares a field.
+
+    Args:
+      field: string The name of the field.
+
+    Returns:
+      string The URL of the namespace this field was declared within.
+
+    Raises:
+      TypeError: if the given field is not within this type.
+    """
+    try:
+      return self.GetFieldNamespaces()[field]
+    except KeyError:
+      raise TypeError('There is no field with the name %s in complex type %s.'
+                      % (field, self.name))
+
+  def GetFieldType(self, field):
+    """Returns the type of a field of this type.
+
+    Args:
+      field: string The name of the field.
+
+    Returns:
+      TypeDescriptionComponent The type of object stored in the field.
+
+    Raises:
+      TypeError: if the given field is not within this type.
+    """
+    try:
+      return self.GetFieldTable()[field][0]
+    except KeyError:
+      raise TypeError('There is no field with the name %s in complex type %s.'
+                      % (field, self.name))
+
+  def GetArrayItemTypeName(self):
+    """Returns the name of the type of the items, if this is an encoded array.
+
+    Returns:
+      string The type name of the array's contents, or the name of this type if
+      it is not a SOAP encoded array.
+    """
+    if self._array_item_type_name is None:
+      item_type_name = self.name
+      try:
+        attr_contents = self.type_def.content.derivation.attr_content
+        if attr_contents:
+          raw_type_name = attr_contents[0].attributes[
+              'http://schemas.xmlsoap.org/wsdl/']['arrayType']
+          item_type_name = raw_type_name[raw_type_name.find(':') + 1:-2]
+      except (AttributeError, KeyError):
+        pass
+      self._array_item_type_name = item_type_name
+    return self._array_item_type_name
+
+  def GetListFieldTable(self):
+    """Returns how each field of this type is typed in a response.
+
+    Returns:
+      dict Tuples of (type name, namespace, is list, item type name), keyed by
+      field name, as MessageHandler.RestoreListTypeWithSoappy sees the fields.
+      A field is a list if its type is a SOAP encoded array or it may occur
+      more than once. The item type name is that of the list's items, or the
+      type name for fields which are not lists. Must not be modified.
+
+    Raises:
+      KeyError: if a base type is not defined in the WSDL.
+    """
+    if self._list_fields is None:
+      list_fields = {}
+      for name, (field_type, max_occurs) in self.GetFieldTable().iteritems():
+        type_name = field_type.getName()
+        ns = field_type.getTargetNamespace()
+        try:
+          field_info = self._index.Get(type_name, ns)
+        except KeyError:
+          field_info = None
+        is_array = type_name == 'Array' or bool(field_info and
+                                                field_info.is_array)
+        is_list = (is_array or not max_occurs.isdigit() or
+                   int(max_occurs) > 1)
+        item_type_name = type_name
+        if is_list and field_info:
+          item_type_name = field_info.GetArrayItemTypeName()
+        list_fields[name] = (type_name, ns, is_list, item_type_name)
+      self._list_fields = list_fields
+    return self._list_fields
+
+
+class TypeIndex(object):
+
+  """Index of TypeInfo objects for all types of a set of WSDL definitions.
+
+  Built lazily, one type at a time, and shared by all services using the same
+  definitions. Safe to use from many threads; a type looked up by two threads
+  at once may be indexed twice, but both results are the same.
+  """
+
+  def __init__(self, types):
+    """Inits TypeIndex.
+
+    Args:
+      types: dict The schemas of the WSDL, keyed by target namespace.
+    """
+    self.types = types
+    self._infos = {}
+
+  def Get(self, type_name, ns):
+    """Returns the TypeInfo of a type.
+
+    Args:
+      type_name: string The name of the WSDL-defined type.
+      ns: string The namespace this WSDL-defined type belongs to.
+
+    Returns:
+      TypeInfo Facts about the given type.
+
+    Raises:
+      KeyError: if the type is not defined in the WSDL.
+    """
+    key = (ns, type_name)
+    info = self._infos.get(key)
+    if info is None:
+      info = TypeInfo(self, type_name, ns)
+      self._infos[key] = info
+    return info
+
+
+def GetTypeIndex(soappy_service):
+  """Returns the TypeIndex of the definitions of a SOAPpy service.
+
+  Args:
+    soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                    the information stored in the WSDL.
+
+  Returns:
+    TypeIndex The index of the service's types.
+  """
+  wsdl = soappy_service.wsdl
+  index = _type_indexes.get(wsdl)
+  if index is None:
+    _type_indexes_lock.acquire()
+    try:
+      index = _type_indexes.get(wsdl)
+      if index is None:
+        index = TypeIndex(wsdl.types)
+        _type_indexes[wsdl] = index
+    finally:
+      _type_indexes_lock.release()
+  return index
+
+
+def GetTypeInfo(type_name, ns, soappy_service):
+  """Returns the TypeInfo of a WSDL-defined type.
+
+  Args:
+    type_name: string The name of the WSDL-defined type.
+    ns: string The namespace this WSDL-defined type belongs to.
+    soappy_service: SOAPpy.WSDL.Proxy The SOAPpy service object encapsulating
+                    the information stored in the WSDL.
+
+  Returns:
+    TypeInfo Facts about the given type.
+
+  Raises:
+    KeyError: if the type is not defined in the WSDL.
+  """
+  return GetTypeIndex(soappy_service).Get(type_name, ns)
+
 
 def GetArrayItemTypeName(type_name, ns, soappy_service):
   """Returns the name of the SOAP type which the items in an array represent.
@@ -39,18 +331,9 @@ def GetArrayItemTypeName(type_name, ns, soappy_service):
     string The type name of the array's contents.
   """
   try:
-    array_type = GetTypeFromSoappyService(type_name, ns, soappy_service)
-    attr_contents = array_type.content.derivation.attr_content
-    if attr_contents:
-      raw_type_name = attr_contents[0].attributes[
-          'http://schemas.xmlsoap.org/wsdl/']['arrayType']
-      return raw_type_name[raw_type_name.find(':') + 1:-2]
-    else:
-      return type_name
+    return GetTypeInfo(type_name, ns, soappy_service).GetArrayItemTypeName()
   except KeyError:
     return type_name
-  except AttributeError:
-    return type_name
 
 
 def IsASuperType(soappy_service, sub_type, ns, super_type):
@@ -72,14 +355,7 @@ def IsASuperType(soappy_service, sub_type, ns, super_type):
   if sub_type == super_type: return True
 
   try:
-    if IsASubType(sub_type, ns, soappy_service):
-      complex_type = GetTypeFromSoappyService(sub_type, ns, soappy_service)
-      return IsASuperType(
-          soappy_service,
-          complex_type.content.derivation.attributes['base'].getName(), ns,
-          super_type)
-    else:
-      return False
+    return super_type in GetTypeInfo(sub_type, ns, soappy_service).supertypes
   except KeyError:
     # The given sub_type does not exist in the WSDL definitions.
     return False
@@ -97,8 +373,7 @@ def IsASubType(type_name, ns, soappy_service):
   Returns:
     boolean Whether the given type is extending another type.
   """
-  return hasattr(GetTypeFromSoappyService(
-      type_name, ns, soappy_service).content, 'derivation')
+  return GetTypeInfo(type_name, ns, soappy_service).is_subtype
 
 
 def IsAnArrayType(type_name, ns, soappy_service):
@@ -116,15 +391,7 @@ def IsAnArrayType(type_name, ns, soappy_service):
   if type_name == 'Array':
     return True
   try:
-    wsdl_type_def = GetTypeFromSoappyService(type_name, ns, soappy_service)
-    if hasattr(wsdl_type_def.content, 'derivation'):
-      # This is an extension of another type.
-      return IsAnArrayType(
-          wsdl_type_def.content.derivation.attributes['base'].getName(),
-          wsdl_type_def.content.derivation.attributes[
-              'base'].getTargetNamespace(), soappy_service)
-    else:
-      return False
+    return GetTypeInfo(type_name, ns, soappy_service).is_array
   except KeyError:
     return False
 
@@ -159,21 +426,7 @@ def GenKeyOrderAttrs(soappy_service, ns, type_name):
     list A list of dictionaries containing the attributes of keys within a
     complex type, in order.
   """
-  complex_type = soappy_service.wsdl.types[ns].types[type_name]
-
-  if IsASubType(type_name, ns, soappy_service):
-    # This is an extension of another type.
-    key_order = GenKeyOrderAttrs(
-        soappy_service,
-        complex_type.content.derivation.attributes['base'].getTargetNamespace(),
-        complex_type.content.derivation.attributes['base'].getName())
-    if hasattr(complex_type.content.derivation.content, 'content'):
-      key_order.extend([element.attributes for element in
-                        complex_type.content.derivation.content.content])
-    return key_order
-  else:
-    # This is a base type.
-    return [element.attributes for element in complex_type.content.content]
+  return list(GetTypeInfo(type_name, ns, soappy_service).GetFields())
 
 
 def PruneKeyOrder(key_order, soappy_struct_object):
@@ -230,11 +483,7 @@ def GetComplexFieldTypeByFieldName(key, type_name, ns, soappy_service):
   Raises:
     TypeError: if the given key is not within the given complex type.
   """
-  for param in GenKeyOrderAttrs(soappy_service, ns, type_name):
-    if param['name'] == key:
-      return param['type']
-  raise TypeError('There is no field with the name %s in complex type %s.'
-                  % (key, type_name))
+  return GetTypeInfo(type_name, ns, soappy_service).GetFieldType(key)
 
 
 def GetComplexFieldNamespaceByFieldName(field, type_name, ns, soappy_service):
@@ -254,26 +503,7 @@ def GetComplexFieldNamespaceByFieldName(field, type_name, ns, soappy_service):
   Raises:
     TypeError: if the given field is not within the given complex type.
   """
-  type_obj = soappy_service.wsdl.types[ns].types[type_name]
-
-  if IsASubType(type_name, ns, soappy_service):
-    if hasattr(type_obj.content.derivation.content, 'content'):
-      for element in type_obj.content.derivation.content.content:
-        if element.attributes['name'] == field: return ns
-    try:
-      return GetComplexFieldNamespaceByFieldName(
-          field,
-          type_obj.content.derivation.attributes['base'].getName(),
-          type_obj.content.derivation.attributes['base'].getTargetNamespace(),
-          soappy_service)
-    except TypeError:
-      raise TypeError('There is no field with the name %s in complex type %s.'
-                      % (field, type_name))
-  else:
-    for element in type_obj.content.content:
-      if element.attributes['name'] == field: return ns
-    raise TypeError('There is no field with the name %s in complex type %s.'
-                    % (field, type_name))
+  return GetTypeInfo(type_name, ns, soappy_service).GetFieldNamespace(field)
 
 
 def GetExplicitType(obj, type_name, ns, soappy_service):
@@ -314,7 +544,4 @@ def _HasNativeType(type_name, ns, soappy_service):
   Returns:
     bool Whether or not the given type has a field named 'type'.
   """
-  params = GenKeyOrderAttrs(soappy_service, ns, type_name)
-  for param in params:
-    if param['name'] == 'type': return True
-  return False
+  return 'type' in GetTypeInfo(type_name, ns, soappy_service).GetFieldTable()
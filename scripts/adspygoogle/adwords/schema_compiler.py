@@ -0,0 +1,109 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Script to precompile the WSDLs and XSDs shipped with the client library.
+
+Fetches the WSDL of every service in every supported API version, along with
+the reportDefinition.xsd used by ReportDownloader, and stores their compiled
+definitions in adspygoogle/adwords/schemas. Run by setup.py when any of the
+definitions is missing.
+
+Usage: schema_compiler.py [server]
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import StringIO
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import urllib2
+
+from adspygoogle import SOAPpy
+from adspygoogle.adwords import API_VERSIONS
+from adspygoogle.adwords.util import PrecompiledSchemas
+from adspygoogle.adwords.util import XsdToWsdl
+from adspygoogle.common.soappy import ServiceDefinition
+
+
+DEFAULT_SERVER = PrecompiledSchemas.SERVERS[0]
+
+
+def CompileWsdl(url):
+  """Fetches and compiles the WSDL of a service.
+
+  Args:
+    url: str URL of the WSDL.
+
+  Returns:
+    ServiceDefinition Compiled definition of the service.
+  """
+  wsdl_stream = StringIO.StringIO(urllib2.urlopen(url).read())
+  wsdl_stream.name = url
+  return ServiceDefinition.CompileWsdlProxy(SOAPpy.WSDL.Proxy(wsdl_stream))
+
+
+def CompileAll(server=DEFAULT_SERVER, schema_dir=PrecompiledSchemas.SCHEMA_DIR,
+               versions=API_VERSIONS):
+  """Compiles the schemas of all services in the given API versions.
+
+  Services whose WSDL can not be fetched are skipped and reported.
+
+  Args:
+    [optional]
+    server: str API server to fetch the WSDLs and XSDs from.
+    schema_dir: str Directory to store the compiled definitions in.
+    versions: list API versions to compile.
+
+  Returns:
+    list URLs which could not be compiled.
+  """
+  if not os.path.isdir(schema_dir):
+    os.makedirs(schema_dir)
+  failed = []
+  for version in versions:
+    sources = [(group, name, '/'.join([server, 'api/adwords', group, version,
+                                       name]) + '?wsdl')
+               for group, name in PrecompiledSchemas.GetServices(version)]
+    sources.append((PrecompiledSchemas.REPORT_GROUP,
+                    PrecompiledSchemas.REPORT_DEFINITION,
+                    '/'.join([server, 'api/adwords',
+                              PrecompiledSchemas.REPORT_GROUP, version,
+                              'reportDefinition.xsd'])))
+    for group, name, url in sources:
+      print 'Compiling %s ...' % url
+      try:
+        if name == PrecompiledSchemas.REPORT_DEFINITION:
+          definition = ServiceDefinition.CompileWsdlProxy(
+              XsdToWsdl.CreateWsdlFromXsdUrl(url))
+        else:
+          definition = CompileWsdl(url)
+      except Exception, e:
+        print '  skipped: %s' % e
+        failed.append(url)
+        continue
+      PrecompiledSchemas.Save(definition, version, group, name, schema_dir)
+  return failed
+
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    failures = CompileAll(sys.argv[1])
+  else:
+    failures = CompileAll()
+  if failures:
+    print '%s schema(s) could not be compiled.' % len(failures)
+    sys.exit(1)
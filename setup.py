@@ -18,21 +18,50 @@
 
 __author__ = 'api.sgrinberg@gmail.com (Stan Grinberg)'
 
+import imp
 import os
+from distutils.command.build_py import build_py
 from distutils.core import setup
+from distutils.errors import DistutilsError
 
+from adspygoogle.adwords import API_VERSIONS
 from adspygoogle.adwords import LIB_AUTHOR
 from adspygoogle.adwords import LIB_AUTHOR_EMAIL
 from adspygoogle.adwords import LIB_NAME
 from adspygoogle.adwords import LIB_URL
 from adspygoogle.adwords import LIB_VERSION
+from adspygoogle.adwords.util import PrecompiledSchemas
 
 
 PACKAGES = ['adspygoogle', 'adspygoogle.common', 'adspygoogle.common.https',
             'adspygoogle.common.soappy', 'adspygoogle.common.oauth',
             'adspygoogle.adwords', 'adspygoogle.adwords.util',
             'adspygoogle.SOAPpy', 'adspygoogle.SOAPpy.wstools']
-PACKAGE_DATA = {'adspygoogle.adwords': [os.path.join('data', '*')]}
+PACKAGE_DATA = {'adspygoogle.adwords': [os.path.join('data', '*'),
+                                        os.path.join('schemas', '*')]}
+SCHEMA_COMPILER = os.path.join('scripts', 'adspygoogle', 'adwords',
+                               'schema_compiler.py')
+
+
+class BuildPy(build_py):
+
+  """Builds the packages along with their precompiled service definitions.
+
+  Missing definitions are compiled from the WSDLs on the live server first, and
+  the build fails if any of them can not be.
+  """
+
+  def run(self):
+    if PrecompiledSchemas.GetMissing(API_VERSIONS):
+      imp.load_source('schema_compiler', SCHEMA_COMPILER).CompileAll()
+      missing = PrecompiledSchemas.GetMissing(API_VERSIONS)
+      if missing:
+        raise DistutilsError('%s precompiled schema(s) could not be built, '
+                             'e.g. %s. Run %s with network access.'
+                             % (len(missing), missing[0], SCHEMA_COMPILER))
+      # The package data was listed before the definitions were compiled.
+      self.data_files = self.get_data_files()
+    build_py.run(self)
 
 
 setup(name='adspygoogle.adwords',
@@ -47,4 +76,5 @@ setup(name='adspygoogle.adwords',
       long_description='For additional information, please see %s' % LIB_URL,
       packages=PACKAGES,
       package_data=PACKAGE_DATA,
+      cmdclass={'build_py': BuildPy},
       platforms='any')
@@ -0,0 +1,201 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover mutating long lists of operations in chunks.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import re
+import sys
+import threading
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.adwords.AdWordsErrors import BatchMutateError
+from adspygoogle.adwords.util import Batching
+from adspygoogle.common import ETREE
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import Utils
+from adspygoogle.common.Errors import ValidationError
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+WSDL = Utils.ReadFile(os.path.join('data', 'campaign_service_v201206.wsdl'))
+MUTATE_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap='
+    '"http://schemas.xmlsoap.org/soap/envelope/"><soap:Header><ResponseHeader '
+    'xmlns="https://adwords.google.com/api/adwords/cm/v201206"><requestId>1'
+    '</requestId><operations>%s</operations><responseTime>10</responseTime>'
+    '<units>%s</units></ResponseHeader></soap:Header><soap:Body>'
+    '<mutateResponse xmlns="https://adwords.google.com/api/adwords/cm/v201206">'
+    '<rval><ListReturnValue.Type>CampaignReturnValue</ListReturnValue.Type>'
+    '%s</rval></mutateResponse></soap:Body></soap:Envelope>')
+VALUE = '<value><id>%s</id><name>%s</name></value>'
+PARTIAL_FAILURE_ERROR = (
+    '<partialFailureErrors xsi:type="CampaignError" xmlns:xsi='
+    '"http://www.w3.org/2001/XMLSchema-instance"><fieldPath>operations[%d]'
+    '.operand.name</fieldPath><trigger></trigger><errorString>'
+    'CampaignError.CAMPAIGN_NAME_IS_NULL</errorString><ApiError.Type>'
+    'CampaignError</ApiError.Type><reason>CAMPAIGN_NAME_IS_NULL</reason>'
+    '</partialFailureErrors>')
+FAULT_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap='
+    '"http://schemas.xmlsoap.org/soap/envelope/"><soap:Body><soap:Fault>'
+    '<faultcode>soap:Server</faultcode><faultstring>[RateExceededError]'
+    '</faultstring></soap:Fault></soap:Body></soap:Envelope>')
+
+
+class _Campaigns(object):
+
+  """Answers mutate() calls, failing operations on campaigns without a name."""
+
+  def __init__(self):
+    self.chunks = []
+    self.fail_chunk = None
+    self.__lock = threading.Lock()
+
+  def __call__(self, request):
+    names = re.findall('name>(.*?)</', request)
+    self.__lock.acquire()
+    try:
+      self.chunks.append(names)
+    finally:
+      self.__lock.release()
+    if self.fail_chunk is not None and self.fail_chunk in names:
+      return (500, FAULT_RESPONSE)
+    values = []
+    errors = []
+    for index, name in enumerate(names):
+      if name == 'unnamed':
+        errors.append(PARTIAL_FAILURE_ERROR % index)
+      values.append(VALUE % (index, name))
+    return MUTATE_RESPONSE % (len(names), len(names),
+                              ''.join(values + errors))
+
+
+def _Operations(count, unnamed=()):
+  """Returns operations adding campaigns c0, c1 and so on."""
+  operations = []
+  for index in xrange(count):
+    name = 'c%d' % index
+    if index in unnamed:
+      name = 'unnamed'
+    operations.append({'operator': 'ADD', 'operand': {'name': name}})
+  return operations
+
+
+class BatchingTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.Batching module."""
+
+  def setUp(self):
+    self.campaigns = _Campaigns()
+    self.server = StandInServer(self.campaigns, WSDL)
+    self.server.Start()
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890',
+               'partialFailure': 'true'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE}
+    self.client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    self.service = self.client.GetCampaignService(self.server.GetUrl(''),
+                                                  VERSION)
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+  def testBatchMutate(self):
+    """Tests that chunks are sent concurrently and merged in order."""
+    result = self.service.BatchMutate(_Operations(25, (3, 17)), 10,
+                                      workers=3)[0]
+    self.assertEqual(sorted([len(chunk) for chunk in self.campaigns.chunks]),
+                     [5, 10, 10])
+    self.assertEqual(len(result['value']), 25)
+    self.assertEqual(result['value'][17]['name'], 'unnamed')
+    self.assertEqual(result['value'][24]['name'], 'c24')
+    self.assertEqual([error['fieldPath'] for error in
+                      result['partialFailureErrors']],
+                     ['operations[3].operand.name',
+                      'operations[17].operand.name'])
+    self.assertEqual(self.client.GetOperations(), 25)
+
+  def testChunksBySize(self):
+    """Tests that chunks are cut by the size of their operations' XML."""
+    operations = _Operations(6)
+    operations[2]['operand']['name'] = 'c2' + 'x' * 200
+    self.service.BatchMutate(operations, max_bytes=400)
+    self.assertEqual([len(chunk) for chunk in self.campaigns.chunks],
+                     [2, 1, 2, 1])
+
+  def testFailedChunk(self):
+    """Tests that other chunks are applied when one of them fails."""
+    self.campaigns.fail_chunk = 'c12'
+    try:
+      self.service.BatchMutate(_Operations(25, (23,)), 10, workers=2)
+    except BatchMutateError, e:
+      self.assertEqual([failure[:2] for failure in e.failures], [(10, 10)])
+      # Values keep the index of their operation across the failed chunk.
+      self.assertEqual(len(e.result['value']), 25)
+      self.assertEqual(e.result['value'][10:20], [None] * 10)
+      self.assertEqual(e.result['value'][9]['name'], 'c9')
+      self.assertEqual(e.result['value'][20]['name'], 'c20')
+      self.assertEqual(e.result['partialFailureErrors'][0]['fieldPath'],
+                       'operations[23].operand.name')
+    else:
+      self.fail('BatchMutateError was not raised.')
+    self.assertEqual(len(self.campaigns.chunks), 3)
+
+  def testSplitOperations(self):
+    """Tests the chunks operations are split into."""
+    chunks = Batching.SplitOperations(range(7), 3)
+    self.assertEqual(chunks, [(0, [0, 1, 2]), (3, [3, 4, 5]), (6, [6])])
+    chunks = Batching.SplitOperations([1, 9, 2, 2, 2], 10, 5, lambda op: op)
+    self.assertEqual(chunks, [(0, [1]), (1, [9]), (2, [2, 2]), (4, [2])])
+    self.assertEqual(Batching.SplitOperations([], 3), [])
+    self.assertRaises(ValidationError, Batching.SplitOperations, [1], 0)
+
+  def testShiftFieldPath(self):
+    """Tests that only the leading operation index is rewritten."""
+    self.assertEqual(
+        Batching.ShiftFieldPath('operations[2].operand.operations[1]', 40),
+        'operations[42].operand.operations[1]')
+    self.assertEqual(Batching.ShiftFieldPath('operand.name', 40),
+                     'operand.name')
+    self.assertEqual(Batching.ShiftFieldPath(None, 40), None)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(BatchingTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
@@ -39,7 +39,7 @@ class Issue39(unittest.TestCase):
                             'userAgent': 'foo', 'clientCustomerId': 123})
     campaign_service = client.GetCampaignService(
         'https://adwords-sandbox.google.com', 'v201206')
-    campaign_service._SetHeaders()
+    campaign_service._GetSoapHeaders()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,335 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover GenericAdWordsService against a local stand-in server.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import glob
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.adwords.util import PrecompiledSchemas
+from adspygoogle.common import ETREE
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import SoapBuffer
+from adspygoogle.common import Utils
+from adspygoogle.common import WsdlCache
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+WSDL = Utils.ReadFile(os.path.join('data', 'campaign_service_v201206.wsdl'))
+GET_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap='
+    '"http://schemas.xmlsoap.org/soap/envelope/"><soap:Header><ResponseHeader '
+    'xmlns="https://adwords.google.com/api/adwords/cm/v201206"><requestId>%s'
+    '</requestId><operations>1</operations><responseTime>10</responseTime>'
+    '<units>1</units></ResponseHeader></soap:Header><soap:Body><getResponse '
+    'xmlns="https://adwords.google.com/api/adwords/cm/v201206"><rval>'
+    '<totalNumEntries>1</totalNumEntries><Page.Type>CampaignPage</Page.Type>'
+    '<entries><id>%s</id><name>Campaign #%s</name></entries></rval>'
+    '</getResponse></soap:Body></soap:Envelope>')
+
+
+def _AnswerGet(request):
+  """Answers a get() with one campaign whose id is the customer's id."""
+  customer_id = re.search('clientCustomerId>(.*?)<', request).group(1)
+  return GET_RESPONSE % (customer_id, customer_id, customer_id)
+
+
+class GenericAdWordsServiceTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.GenericAdWordsService module."""
+
+  def setUp(self):
+    self.server = StandInServer(_AnswerGet, WSDL, delay=0.05)
+    self.server.Start()
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+  def _GetClient(self, max_in_flight, customer_id='1234567890',
+                 wsdl_cache_dir=''):
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': customer_id}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE, 'max_in_flight': max_in_flight,
+              'wsdl_cache_dir': wsdl_cache_dir}
+    return AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+
+  def _GetService(self, client):
+    return client.GetCampaignService(self.server.GetUrl(''), VERSION)
+
+  def _RunThreads(self, targets):
+    errors = []
+
+    def Run(target):
+      try:
+        target()
+      except Exception, e:
+        errors.append(e)
+
+    threads = [threading.Thread(target=Run, args=(target,))
+               for target in targets]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(errors, [])
+
+  def testCallsOnDifferentServicesOverlap(self):
+    """Tests that one client runs calls on two services at the same time."""
+    client = self._GetClient(max_in_flight=2)
+    services = [self._GetService(client), self._GetService(client)]
+    self._RunThreads([lambda service=service: service.Get({})
+                      for service in services])
+    self.assertEqual(self.server.peak_in_flight, 2)
+
+  def testMaxInFlightIsEnforced(self):
+    """Tests that 32 threads never have more than max_in_flight calls open."""
+    client = self._GetClient(max_in_flight=8)
+    service = self._GetService(client)
+    results = []
+
+    def CallMany():
+      for _ in xrange(4):
+        results.append(service.Get({})[0])
+
+    self._RunThreads([CallMany] * 32)
+    self.assertEqual(len(results), 128)
+    self.assertEqual(self.server.peak_in_flight, 8)
+    self.assertEqual(client.GetUnits(), 128)
+
+  def testHeadersAreNotShared(self):
+    """Tests that concurrent calls of two clients keep their own headers."""
+    failures = []
+
+    def CallMany(customer_id):
+      service = self._GetService(self._GetClient(4, customer_id))
+      for _ in xrange(10):
+        page = service.Get({})[0]
+        if page['entries'][0]['id'] != customer_id:
+          failures.append(page)
+
+    self._RunThreads([lambda: CallMany('1111111111'),
+                      lambda: CallMany('2222222222')])
+    self.assertEqual(failures, [])
+
+  def testTokenRefreshDoesNotBlockOtherClients(self):
+    """Tests that one client fetching an auth token does not stall others."""
+    fetching = threading.Event()
+    release = threading.Event()
+    requests = []
+    self.server.response = lambda request: (requests.append(request) or
+                                            _AnswerGet(request))
+
+    def GetAuthToken(*args):
+      fetching.set()
+      release.wait(5)
+      return 'fresh'
+
+    refreshing = self._GetClient(4, '1111111111')
+    refreshing.GetAuthCredentials().update({'email': 'a@b.c',
+                                            'password': 'secret'})
+    refreshing.GetConfigValues()['auth_token_epoch'] = 0
+    refreshing_service = self._GetService(refreshing)
+    other_service = self._GetService(self._GetClient(4, '2222222222'))
+
+    get_auth_token = Utils.GetAuthToken
+    Utils.GetAuthToken = GetAuthToken
+    try:
+      refresh = threading.Thread(target=refreshing_service.Get, args=({},))
+      refresh.start()
+      fetching.wait(5)
+      other = threading.Thread(target=other_service.Get, args=({},))
+      other.start()
+      other.join(2)
+      self.assertFalse(other.isAlive())
+      release.set()
+      refresh.join()
+    finally:
+      release.set()
+      Utils.GetAuthToken = get_auth_token
+    self.assertEqual(len([request for request in requests
+                          if 'authToken>fresh<' in request]), 1)
+
+  def testServiceDefinitionsAreShared(self):
+    """Tests that services of many clients share one parsed WSDL."""
+    clients = [self._GetClient(1, str(customer_id))
+               for customer_id in xrange(1000000000, 1000000008)]
+    services = []
+    self._RunThreads([lambda client=client: services.append(
+        self._GetService(client)) for client in clients])
+    services.append(self._GetService(clients[0]))
+    self.assertEqual(self.server.wsdl_requests, 1)
+    definition = services[0]._soappyservice.definition
+    for service in services[1:]:
+      self.assertTrue(service._soappyservice.definition is definition)
+      self.assertFalse(service._soappyservice is
+                       services[0]._soappyservice)
+    self.assertEqual(services[-1].Get({})[0]['entries'][0]['id'], '1000000000')
+
+  def testFailedLoadIsRetried(self):
+    """Tests that a definition which failed to load is not registered."""
+    registry = ServiceRegistry.ServiceRegistry()
+
+    def Fail():
+      raise IOError('unreachable')
+
+    self.assertRaises(IOError, registry.GetDefinition, 'key', Fail)
+    self.assertEqual(registry.GetSize(), 0)
+    self.assertEqual(registry.GetDefinition('key', lambda: 'definition'),
+                     'definition')
+    self.assertEqual(registry.GetDefinition('key', Fail), 'definition')
+    registry.Invalidate('key')
+    self.assertEqual(registry.GetSize(), 0)
+
+  def testCallDetailsAreNotReparsed(self):
+    """Tests that units and log details come from the one parse of a call."""
+    parses = []
+    get_xml_in = SoapBuffer.SoapBuffer._GetXmlIn
+    get_xml_out = SoapBuffer.SoapBuffer._GetXmlOut
+
+    def CountParses(method):
+      def Parse(buf):
+        parses.append(method)
+        return method(buf)
+      return Parse
+
+    SoapBuffer.SoapBuffer._GetXmlIn = CountParses(get_xml_in)
+    SoapBuffer.SoapBuffer._GetXmlOut = CountParses(get_xml_out)
+    try:
+      client = self._GetClient(1)
+      service = self._GetService(client)
+      for _ in xrange(3):
+        service.Get({})
+    finally:
+      SoapBuffer.SoapBuffer._GetXmlIn = get_xml_in
+      SoapBuffer.SoapBuffer._GetXmlOut = get_xml_out
+    self.assertEqual(parses, [])
+    self.assertEqual(client.GetUnits(), 3)
+    self.assertEqual(client.GetOperations(), 3)
+    self.assertEqual(client.GetLastUnits(), 1)
+
+  def testWsdlCache(self):
+    """Tests that compiled WSDLs are reused from and removed from the cache."""
+    cache_dir = tempfile.mkdtemp()
+    try:
+      client = self._GetClient(1, wsdl_cache_dir=cache_dir)
+      service = self._GetService(client)
+      self.assertEqual(len(glob.glob(os.path.join(cache_dir, '*.pkl'))), 1)
+
+      # Mark the cached copy, so that a service built from it can be told apart
+      # from one built by parsing the WSDL again.
+      cache = WsdlCache.WsdlCache(cache_dir)
+      wsdl_url = service._service_url + '?wsdl'
+      content_hash = WsdlCache.GetContentHash(WSDL)
+      definition = cache.Get(wsdl_url, VERSION, content_hash)
+      definition.marker = 'cached'
+      cache.Put(wsdl_url, VERSION, content_hash, definition)
+      ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+      service = self._GetService(self._GetClient(1, wsdl_cache_dir=cache_dir))
+      self.assertEqual(getattr(service._soappyservice.definition, 'marker',
+                               None), 'cached')
+      self.assertEqual(service.Get({})[0]['entries'][0]['id'], '1234567890')
+
+      client.ClearWsdlCache(service._service_url)
+      self.assertEqual(glob.glob(os.path.join(cache_dir, '*.pkl')), [])
+      service = self._GetService(client)
+      self.assertFalse(hasattr(service._soappyservice.definition, 'marker'))
+    finally:
+      shutil.rmtree(cache_dir)
+
+  def testPrecompiledDefinitionSkipsWsdl(self):
+    """Tests that a shipped definition is used without fetching the WSDL."""
+    schema_dir = tempfile.mkdtemp()
+    old_schema_dir = PrecompiledSchemas.SCHEMA_DIR
+    old_servers = PrecompiledSchemas.SERVERS
+    try:
+      service = self._GetService(self._GetClient(1))
+      definition = service._soappyservice.definition
+      definition.marker = 'shipped'
+      PrecompiledSchemas.Save(definition, VERSION, 'cm', 'CampaignService',
+                              schema_dir)
+      ServiceRegistry.SHARED_REGISTRY.Invalidate()
+      self.assertEqual(self.server.wsdl_requests, 1)
+
+      PrecompiledSchemas.SCHEMA_DIR = schema_dir
+      PrecompiledSchemas.SERVERS = (self.server.GetUrl(''),)
+      service = self._GetService(self._GetClient(1))
+      self.assertEqual(self.server.wsdl_requests, 1)
+      self.assertEqual(getattr(service._soappyservice.definition, 'marker',
+                               None), 'shipped')
+      self.assertEqual(service.Get({})[0]['entries'][0]['id'], '1234567890')
+
+      # Definitions are only shipped for the live and sandbox servers.
+      PrecompiledSchemas.SERVERS = old_servers
+      self.assertEqual(PrecompiledSchemas.Load(
+          self.server.GetUrl(''), VERSION, 'cm', 'CampaignService'), None)
+    finally:
+      PrecompiledSchemas.SCHEMA_DIR = old_schema_dir
+      PrecompiledSchemas.SERVERS = old_servers
+      shutil.rmtree(schema_dir)
+
+  def testCorruptWsdlCacheFileIsAMiss(self):
+    """Tests that an unreadable cache file is discarded."""
+    cache_dir = tempfile.mkdtemp()
+    try:
+      self._GetService(self._GetClient(1, wsdl_cache_dir=cache_dir))
+      path = glob.glob(os.path.join(cache_dir, '*.pkl'))[0]
+      fh = open(path, 'wb')
+      fh.write('not a pickle')
+      fh.close()
+      ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+      service = self._GetService(self._GetClient(1, wsdl_cache_dir=cache_dir))
+      self.assertEqual(service.Get({})[0]['entries'][0]['id'], '1234567890')
+      self.assertEqual(glob.glob(os.path.join(cache_dir, '*.pkl')), [path])
+      cache = WsdlCache.WsdlCache(cache_dir)
+      self.assertTrue(cache.Get(service._service_url + '?wsdl', VERSION,
+                                WsdlCache.GetContentHash(WSDL)) is not None)
+    finally:
+      shutil.rmtree(cache_dir)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(GenericAdWordsServiceTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
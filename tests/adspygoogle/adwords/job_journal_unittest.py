@@ -0,0 +1,230 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover recording mutate jobs and picking them up again.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsErrors import AdWordsError
+from adspygoogle.adwords.util.JobJournal import GetDigest
+from adspygoogle.adwords.util.JobJournal import JobJournal
+from adspygoogle.adwords.util.JobManager import JobManager
+from adspygoogle.common.Errors import Error
+
+
+class _MutateJobService(object):
+
+  """Plays MutateJobService, finishing each job on its first poll.
+
+  Jobs whose operations hold None fail.
+  """
+
+  def __init__(self):
+    self.jobs = {}
+    self.mutates = 0
+    self.__lock = threading.Lock()
+
+  def Mutate(self, operations, policy):
+    self.__lock.acquire()
+    try:
+      self.mutates += 1
+      job_id = str(len(self.jobs) + 1)
+      self.jobs[job_id] = operations
+    finally:
+      self.__lock.release()
+    return {'id': job_id, 'status': 'PENDING'}
+
+  def Get(self, selector):
+    jobs = []
+    for job_id in selector['jobIds']:
+      status = 'COMPLETED'
+      if None in self.jobs[job_id]:
+        status = 'FAILED'
+      jobs.append({'id': job_id, 'status': status,
+                   'failureReason': 'UNKNOWN'})
+    return jobs
+
+  def GetResult(self, selector):
+    operations = self.jobs[selector['jobIds'][0]]
+    return {'SimpleMutateResult': {'results': operations, 'errors': []}}
+
+
+class JobJournalTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.JobJournal module."""
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'jobs.journal')
+    self.managers = []
+
+  def tearDown(self):
+    for manager in self.managers:
+      manager.Close()
+    shutil.rmtree(self.dir)
+
+  def _GetManager(self, service, journal):
+    manager = JobManager(service, min_delay=0.01, max_delay=0.05,
+                         journal=journal)
+    self.managers.append(manager)
+    return manager
+
+  def testRecordsAreReadBack(self):
+    """Tests that a reopened journal holds the latest state of each job."""
+    journal = JobJournal(self.path)
+    journal.Record('1', 0, 10, 'a', 'PENDING')
+    journal.Record('2', 10, 5, 'b', 'PENDING')
+    journal.RecordStatus('1', 'FAILED', 'TOO_MANY\tOPERATIONS')
+    journal.Close()
+
+    journal = JobJournal(self.path)
+    entries = journal.GetEntries()
+    self.assertEqual([entry.job_id for entry in entries], ['1', '2'])
+    self.assertEqual(entries[0].status, 'FAILED')
+    self.assertEqual(entries[0].reason, 'TOO_MANY OPERATIONS')
+    self.assertEqual(entries[0].digest, 'a')
+    self.assertEqual(journal.FindJob(10, 5, 'b').job_id, '2')
+    self.assertEqual(journal.FindJob(10, 4, 'b'), None)
+    self.assertRaises(Error, journal.FindJob, 10, 5, 'c')
+    journal.Close()
+
+  def testDigest(self):
+    """Tests that digests ignore dict ordering, but not operation order."""
+    first = {'operator': 'ADD', 'operand': {'name': 'a', 'status': 'PAUSED'}}
+    second = {'operator': 'ADD', 'operand': {'name': 'b'}}
+    reordered = dict(first.items()[::-1])
+    self.assertEqual(GetDigest([first, second]), GetDigest([reordered, second]))
+    self.assertNotEqual(GetDigest([first, second]), GetDigest([second, first]))
+
+  def testTornLastLineIsDropped(self):
+    """Tests that a line cut short by a crash is dropped from the file."""
+    journal = JobJournal(self.path)
+    journal.Record('1', 0, 10, 'a', 'PENDING')
+    journal.Close()
+    size = os.path.getsize(self.path)
+    fh = open(self.path, 'a')
+    fh.write('job\t2\t10\t5')
+    fh.close()
+
+    journal = JobJournal(self.path)
+    self.assertEqual([entry.job_id for entry in journal.GetEntries()], ['1'])
+    self.assertEqual(os.path.getsize(self.path), size)
+    journal.Record('3', 10, 5, 'b', 'PENDING')
+    journal.Close()
+    journal = JobJournal(self.path)
+    self.assertEqual([entry.job_id for entry in journal.GetEntries()],
+                     ['1', '3'])
+    journal.Close()
+
+  def testBadLineRaises(self):
+    """Tests that a bad line before the last one is not silently skipped."""
+    fh = open(self.path, 'w')
+    fh.write('garbage\njob\t1\t0\t10\ta\tPENDING\t\n')
+    fh.close()
+    self.assertRaises(Error, JobJournal, self.path)
+
+  def testSubmitAllResumesRecordedJobs(self):
+    """Tests that a rerun picks up recorded jobs instead of submitting them."""
+    service = _MutateJobService()
+    operations = range(10) + [None] + range(3)
+    manager = self._GetManager(service, JobJournal(self.path))
+    futures = manager.SubmitAll(operations, 5)
+    self.assertEqual(futures[0].GetResult(5)['SimpleMutateResult']['results'],
+                     range(5))
+    self.assertRaises(AdWordsError, futures[2].GetResult, 5)
+    futures[1].GetResult(5)
+    self.assertEqual(service.mutates, 3)
+    manager.Close()
+
+    # Only the first jobs are recorded when the process dies, so the last one
+    # is submitted by the rerun.
+    fh = open(self.path, 'r')
+    lines = fh.readlines()
+    fh.close()
+    fh = open(self.path, 'w')
+    fh.writelines([line for line in lines if not line.startswith('job\t3\t')])
+    fh.close()
+
+    manager = self._GetManager(service, JobJournal(self.path))
+    futures = manager.SubmitAll(operations, 5)
+    self.assertEqual([future.job_id for future in futures], ['1', '2', '4'])
+    self.assertEqual(futures[1].GetResult(5)['SimpleMutateResult']['results'],
+                     range(5, 10))
+    self.assertRaises(AdWordsError, futures[2].GetResult, 5)
+    self.assertEqual(service.mutates, 4)
+
+    futures = manager.Resume()
+    self.assertEqual([future.job_id for future in futures], ['1', '2', '4'])
+    self.assertEqual([future.status for future in futures],
+                     ['COMPLETED', 'COMPLETED', 'FAILED'])
+    self.assertRaises(AdWordsError, futures[2].GetResult, 5)
+
+  def testOtherOperationsAreRefused(self):
+    """Tests that a journal is not used for operations it was not kept for."""
+    service = _MutateJobService()
+    manager = self._GetManager(service, JobJournal(self.path))
+    manager.SubmitAll(range(10), 5)
+    manager.Close()
+
+    manager = self._GetManager(service, JobJournal(self.path))
+    self.assertRaises(Error, manager.SubmitAll, range(5) + range(9, 4, -1), 5)
+    # Nothing was submitted, not even the operations which did match.
+    self.assertEqual(service.mutates, 2)
+
+  def testResumePollsPendingJobs(self):
+    """Tests that jobs recorded as pending are polled after a restart."""
+    service = _MutateJobService()
+    service.Mutate(range(3), None)
+    journal = JobJournal(self.path)
+    journal.Record('1', 0, 3, GetDigest(range(3)), 'PENDING')
+    manager = self._GetManager(service, journal)
+    futures = manager.Resume()
+    self.assertEqual(futures[0].GetResult(5)['SimpleMutateResult']['results'],
+                     range(3))
+    self.assertEqual(journal.GetEntries()[0].status, 'COMPLETED')
+
+  def testResumeNeedsJournal(self):
+    """Tests that a manager without a journal cannot resume jobs."""
+    manager = self._GetManager(_MutateJobService(), None)
+    self.assertRaises(Error, manager.Resume)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(JobJournalTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
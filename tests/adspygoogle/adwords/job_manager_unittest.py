@@ -0,0 +1,172 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover submitting mutate jobs and collecting their results.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsErrors import AdWordsError
+from adspygoogle.adwords.util.JobManager import JobManager
+from adspygoogle.common.Errors import Error
+
+
+class _MutateJobService(object):
+
+  """Plays MutateJobService, finishing each job after a number of polls.
+
+  Responses are wrapped in tuples, like the services of a client with
+  config['wrap_in_tuple'] on.
+  """
+
+  def __init__(self, polls_per_job=2, failing_jobs=()):
+    self.polls_per_job = polls_per_job
+    self.failing_jobs = failing_jobs
+    self.jobs = {}
+    self.selectors = []
+    self.result_requests = []
+    self.poll_times = []
+    self.__lock = threading.Lock()
+
+  def Mutate(self, operations, policy):
+    self.__lock.acquire()
+    try:
+      job_id = str(len(self.jobs) + 1)
+      self.jobs[job_id] = [operations, 0]
+    finally:
+      self.__lock.release()
+    return ({'id': job_id, 'status': 'PENDING'},)
+
+  def Get(self, selector):
+    self.__lock.acquire()
+    try:
+      self.selectors.append(sorted(selector['jobIds']))
+      self.poll_times.append(time.time())
+      jobs = []
+      for job_id in selector['jobIds']:
+        job = self.jobs[job_id]
+        job[1] += 1
+        status = 'PROCESSING'
+        if job[1] >= self.polls_per_job:
+          status = 'COMPLETED'
+          if job_id in self.failing_jobs:
+            status = 'FAILED'
+        jobs.append({'id': job_id, 'status': status,
+                     'failureReason': 'UNKNOWN'})
+      return tuple(jobs)
+    finally:
+      self.__lock.release()
+
+  def GetResult(self, selector):
+    job_id = selector['jobIds'][0]
+    self.__lock.acquire()
+    try:
+      self.result_requests.append(job_id)
+      operations = self.jobs[job_id][0]
+    finally:
+      self.__lock.release()
+    return ({'SimpleMutateResult': {'results': operations, 'errors': []}},)
+
+
+class JobManagerTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.JobManager module."""
+
+  def setUp(self):
+    self.managers = []
+
+  def tearDown(self):
+    for manager in self.managers:
+      manager.Close()
+
+  def _GetManager(self, service, **kwargs):
+    manager = JobManager(service, **kwargs)
+    self.managers.append(manager)
+    return manager
+
+  def testJobsArePolledTogether(self):
+    """Tests that pending jobs share each poll and results are fetched."""
+    service = _MutateJobService(polls_per_job=3)
+    manager = self._GetManager(service, min_delay=0.05, max_delay=0.1)
+    futures = manager.SubmitAll(range(10), 4)
+    self.assertEqual([future.job_id for future in futures], ['1', '2', '3'])
+    self.assertEqual([future.GetResult(5)['SimpleMutateResult']['results']
+                      for future in futures],
+                     [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+    self.assertEqual(service.selectors[0], ['1', '2', '3'])
+    self.assertEqual(len(service.selectors), 3)
+    self.assertEqual(sorted(service.result_requests), ['1', '2', '3'])
+    self.assertEqual(futures[0].status, 'COMPLETED')
+
+  def testDelayBacksOff(self):
+    """Tests that the delay between polls grows while no job finishes."""
+    service = _MutateJobService(polls_per_job=5)
+    manager = self._GetManager(service, min_delay=0.02, max_delay=0.1,
+                               backoff=2)
+    manager.Submit(['a']).GetResult(5)
+    delays = [later - earlier for earlier, later in
+              zip(service.poll_times, service.poll_times[1:])]
+    self.assertEqual(len(delays), 4)
+    # Delays of about 0.04, 0.08, 0.1 and 0.1 seconds.
+    self.assertTrue(delays[1] > delays[0] * 1.5)
+    self.assertTrue(delays[2] > 0.07 and delays[3] < 0.5)
+
+  def testFailedJob(self):
+    """Tests that a failed job raises its failure reason."""
+    service = _MutateJobService(polls_per_job=1, failing_jobs=('2',))
+    manager = self._GetManager(service, min_delay=0.01)
+    futures = [manager.Submit([i]) for i in xrange(2)]
+    self.assertEqual(futures[0].GetResult(5)['SimpleMutateResult']['results'],
+                     [0])
+    self.assertEqual(futures[0].GetMutateResults().succeeded_indexes, [0])
+    self.assertRaises(AdWordsError, futures[1].GetResult, 5)
+    self.assertEqual(service.result_requests, ['1'])
+
+  def testClose(self):
+    """Tests that closing fails the pending jobs and refuses new ones."""
+    service = _MutateJobService()
+    manager = self._GetManager(service, min_delay=60)
+    future = manager.Submit(['a'])
+    manager.Close()
+    self.assertRaises(Error, future.GetResult, 5)
+    self.assertRaises(Error, manager.Submit, ['b'])
+    self.assertEqual(service.selectors, [])
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(JobManagerTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
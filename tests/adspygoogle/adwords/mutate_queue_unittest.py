@@ -0,0 +1,236 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover coalescing mutate operations from many threads.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import re
+import sys
+import threading
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.adwords.AdWordsErrors import AdWordsError
+from adspygoogle.adwords.AdWordsErrors import AdWordsPartialFailureError
+from adspygoogle.adwords.util.MutateQueue import MutateQueue
+from adspygoogle.common import ETREE
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import Utils
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.Errors import ValidationError
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+WSDL = Utils.ReadFile(os.path.join('data', 'campaign_service_v201206.wsdl'))
+MUTATE_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap='
+    '"http://schemas.xmlsoap.org/soap/envelope/"><soap:Header><ResponseHeader '
+    'xmlns="https://adwords.google.com/api/adwords/cm/v201206"><requestId>1'
+    '</requestId><operations>%s</operations><responseTime>10</responseTime>'
+    '<units>%s</units></ResponseHeader></soap:Header><soap:Body>'
+    '<mutateResponse xmlns="https://adwords.google.com/api/adwords/cm/v201206">'
+    '<rval><ListReturnValue.Type>CampaignReturnValue</ListReturnValue.Type>'
+    '%s</rval></mutateResponse></soap:Body></soap:Envelope>')
+VALUE = '<value><id>%s</id><name>%s</name></value>'
+PARTIAL_FAILURE_ERROR = (
+    '<partialFailureErrors xsi:type="CampaignError" xmlns:xsi='
+    '"http://www.w3.org/2001/XMLSchema-instance"><fieldPath>operations[%d]'
+    '.operand.name</fieldPath><trigger></trigger><errorString>'
+    'CampaignError.CAMPAIGN_NAME_IS_NULL</errorString><ApiError.Type>'
+    'CampaignError</ApiError.Type><reason>CAMPAIGN_NAME_IS_NULL</reason>'
+    '</partialFailureErrors>')
+FAULT_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap='
+    '"http://schemas.xmlsoap.org/soap/envelope/"><soap:Body><soap:Fault>'
+    '<faultcode>soap:Server</faultcode><faultstring>[RateExceededError]'
+    '</faultstring></soap:Fault></soap:Body></soap:Envelope>')
+
+
+class _Campaigns(object):
+
+  """Answers mutate() calls, failing operations on campaigns without a name."""
+
+  def __init__(self):
+    self.calls = []
+    self.fail = False
+    self.__lock = threading.Lock()
+
+  def __call__(self, request):
+    names = re.findall('name>(.*?)</', request)
+    self.__lock.acquire()
+    try:
+      self.calls.append((names, 'partialFailure>true<' in request))
+    finally:
+      self.__lock.release()
+    if self.fail:
+      return (500, FAULT_RESPONSE)
+    values = []
+    errors = []
+    for index, name in enumerate(names):
+      if name == 'unnamed':
+        errors.append(PARTIAL_FAILURE_ERROR % index)
+      values.append(VALUE % (index, name))
+    return MUTATE_RESPONSE % (len(names), len(names),
+                              ''.join(values + errors))
+
+
+def _Operation(name):
+  """Returns an operation adding a campaign."""
+  return {'operator': 'ADD', 'operand': {'name': name}}
+
+
+class MutateQueueTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.MutateQueue module."""
+
+  def setUp(self):
+    self.campaigns = _Campaigns()
+    self.server = StandInServer(self.campaigns, WSDL)
+    self.server.Start()
+    self.queues = []
+
+  def tearDown(self):
+    for queue in self.queues:
+      queue.Close()
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+  def _GetQueue(self, customer_id='1234567890', partial_failure=True,
+                headers=None, **kwargs):
+    headers = dict({'authToken': 'abc', 'developerToken': 'abc',
+                    'userAgent': 'unittest', 'clientCustomerId': customer_id},
+                   **(headers or {}))
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE}
+    client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    client.partial_failure = partial_failure
+    service = client.GetCampaignService(self.server.GetUrl(''), VERSION)
+    queue = service.GetMutateQueue(**kwargs)
+    self.queues.append(queue)
+    return queue
+
+  def testOperationsFromManyThreads(self):
+    """Tests that operations added at about the same time share one call."""
+    queue = self._GetQueue(max_delay=500)
+    names = ['c%d' % i for i in xrange(8)] + ['unnamed']
+    futures = {}
+
+    def Add(name):
+      futures[name] = queue.Add(_Operation(name))
+
+    threads = [threading.Thread(target=Add, args=(name,)) for name in names]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    for name in names[:-1]:
+      self.assertEqual(futures[name].GetResult(5)['name'], name)
+    self.assertRaises(AdWordsPartialFailureError,
+                      futures['unnamed'].GetResult, 5)
+    try:
+      futures['unnamed'].GetResult()
+    except AdWordsPartialFailureError, e:
+      self.assertEqual(e.errors[0]['reason'], 'CAMPAIGN_NAME_IS_NULL')
+    self.assertEqual(len(self.campaigns.calls), 1)
+    self.assertEqual(sorted(self.campaigns.calls[0][0]), sorted(names))
+    self.assertTrue(self.campaigns.calls[0][1])
+
+  def testFullBatchesAreSentRightAway(self):
+    """Tests that a batch is sent once it holds max_operations operations."""
+    queue = self._GetQueue(max_operations=4, max_delay=60000)
+    futures = [queue.Add(_Operation('c%d' % i)) for i in xrange(10)]
+    self.assertEqual([names for names, _ in self.campaigns.calls],
+                     [['c0', 'c1', 'c2', 'c3'], ['c4', 'c5', 'c6', 'c7']])
+    self.assertFalse(futures[9].Done())
+    queue.Flush()
+    self.assertEqual(futures[9].GetResult(0)['name'], 'c9')
+    self.assertEqual(queue.calls, 3)
+
+  def testDelayedBatch(self):
+    """Tests that a batch which does not fill up is sent after max_delay."""
+    queue = self._GetQueue(max_delay=50)
+    future = queue.Add(_Operation('c0'))
+    self.assertEqual(future.GetResult(5)['id'], '0')
+
+  def testFailedCall(self):
+    """Tests that an error of the whole call reaches every operation."""
+    self.campaigns.fail = True
+    queue = self._GetQueue(max_operations=2)
+    futures = [queue.Add(_Operation('c%d' % i)) for i in xrange(2)]
+    for future in futures:
+      self.assertRaises(AdWordsError, future.GetResult, 5)
+
+  def testSharedQueues(self):
+    """Tests that queues are shared per service URL, user and headers."""
+    queue = self._GetQueue()
+    self.assertTrue(self._GetQueue() is queue)
+    self.assertFalse(self._GetQueue('1112223333') is queue)
+    self.assertFalse(self._GetQueue(headers={'authToken': 'xyz'}) is queue)
+    self.assertFalse(self._GetQueue(headers={'developerToken': 'xyz'})
+                     is queue)
+    self.assertFalse(self._GetQueue(headers={'validateOnly': 'y'}) is queue)
+    # Without a customer id, only calls made as the same user share a queue.
+    other = self._GetQueue(None)
+    self.assertTrue(self._GetQueue(None) is other)
+    self.assertFalse(self._GetQueue(None, headers={'authToken': 'xyz'})
+                     is other)
+    queue.Close()
+    self.assertRaises(Error, queue.Add, _Operation('c0'))
+    self.assertFalse(self._GetQueue() is queue)
+
+  def testPartialFailureIsRequired(self):
+    """Tests that services without partialFailure get no queue."""
+    self.assertRaises(ValidationError, self._GetQueue, partial_failure=False)
+
+  def testQueueWithoutService(self):
+    """Tests a queue around any mutate function."""
+    calls = []
+
+    def Mutate(operations):
+      calls.append(operations)
+      return {'value': [operation * 2 for operation in operations],
+              'partialFailureErrors': [{'fieldPath': 'operations[1]'}]}
+
+    queue = MutateQueue(Mutate, 3, 60000)
+    futures = [queue.Add(i) for i in xrange(3)]
+    queue.Close()
+    self.assertEqual(calls, [[0, 1, 2]])
+    self.assertEqual((futures[0].GetResult(), futures[2].GetResult()), (0, 4))
+    self.assertRaises(AdWordsPartialFailureError, futures[1].GetResult)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(MutateQueueTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
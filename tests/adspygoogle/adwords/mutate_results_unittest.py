@@ -0,0 +1,120 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover correlating mutate errors with their operations.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.util.MutateResults import MutateResults
+
+
+def _Error(field_path, reason):
+  """Returns an error as the response parser returns it."""
+  return {'fieldPath': field_path, 'reason': reason,
+          'ApiError_Type': 'CriterionError'}
+
+
+JOB_RESULT = {
+    'SimpleMutateResult': {
+        'results': [{'AdGroupCriterion': {'id': '1'}}, {'PlaceHolder': {}},
+                    {'AdGroupCriterion': {'id': '3'}}, {'PlaceHolder': {}},
+                    {'AdGroupCriterion': {'id': '5'}}],
+        'errors': [
+            _Error('operations[3].operand.criterion.text', 'INVALID_CHARS'),
+            _Error('operations[1].operand.criterion.text', 'TOO_LONG'),
+            _Error('operations[3].operand.criterion.matchType', 'MISSING'),
+            _Error('', 'UNEXPECTED')
+        ]
+    }
+}
+PARTIAL_FAILURE_RESULT = {
+    'ListReturnValue_Type': 'AdGroupCriterionReturnValue',
+    'value': [{'criterion': {'id': '1'}}, {'criterion': {'id': '2'}}],
+    'partialFailureErrors': [_Error('operations[1].operand', 'DUPLICATE')]
+}
+
+
+class MutateResultsTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.MutateResults module."""
+
+  def testJobResult(self):
+    """Tests the errors of a job result, indexed by operation."""
+    results = MutateResults(JOB_RESULT)
+    self.assertEqual(results.operation_count, 5)
+    self.assertEqual(results.failed_indexes, [1, 3])
+    self.assertEqual(results.succeeded_indexes, [0, 2, 4])
+    self.assertEqual([error['reason'] for error in results.GetErrors(3)],
+                     ['INVALID_CHARS', 'MISSING'])
+    self.assertEqual(results.GetErrors(0), [])
+    self.assertEqual(results.GetErrors(7), [])
+    self.assertEqual([error['reason'] for error in results.unindexed_errors],
+                     ['UNEXPECTED'])
+    self.assertEqual(results.GetValue(2), {'AdGroupCriterion': {'id': '3'}})
+    self.assertTrue(results.IsFailed(1))
+    self.assertFalse(results.IsFailed(4))
+
+  def testPartialFailureResult(self):
+    """Tests the errors of a mutate() call made with partialFailure on."""
+    results = MutateResults(PARTIAL_FAILURE_RESULT, 3)
+    self.assertEqual(results.failed_indexes, [1])
+    self.assertEqual(results.succeeded_indexes, [0, 2])
+    self.assertEqual(results.GetErrors(1)[0]['reason'], 'DUPLICATE')
+    self.assertEqual(results.GetValue(2), None)
+
+  def testErrorsPastTheValues(self):
+    """Tests that errors naming operations without a value are counted."""
+    results = MutateResults({'partialFailureErrors': [
+        _Error('operations[4]', 'DUPLICATE')]})
+    self.assertEqual(results.operation_count, 5)
+    self.assertEqual(results.failed_indexes, [4])
+    self.assertEqual(MutateResults(None).failed_indexes, [])
+
+  def testManyErrors(self):
+    """Tests that many errors are grouped by operation in server order."""
+    errors = [_Error('operations[%d].operand' % (i % 1000), str(i))
+              for i in xrange(100000)]
+    results = MutateResults({'value': [{}] * 2000,
+                             'partialFailureErrors': errors})
+    self.assertEqual(len(results.failed_indexes), 1000)
+    self.assertEqual(results.succeeded_indexes[0], 1000)
+    self.assertEqual([error['reason'] for error in results.GetErrors(999)][:3],
+                     ['999', '1999', '2999'])
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(MutateResultsTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
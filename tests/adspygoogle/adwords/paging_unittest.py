@@ -0,0 +1,197 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover paging through get() calls against a stand-in server.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import re
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.adwords.util import Paging
+from adspygoogle.common import ETREE
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import Utils
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+WSDL = Utils.ReadFile(os.path.join('data', 'campaign_service_v201206.wsdl'))
+PAGE_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap='
+    '"http://schemas.xmlsoap.org/soap/envelope/"><soap:Header><ResponseHeader '
+    'xmlns="https://adwords.google.com/api/adwords/cm/v201206"><requestId>1'
+    '</requestId><operations>%s</operations><responseTime>10</responseTime>'
+    '<units>%s</units></ResponseHeader></soap:Header><soap:Body><getResponse '
+    'xmlns="https://adwords.google.com/api/adwords/cm/v201206"><rval>'
+    '<totalNumEntries>%s</totalNumEntries><Page.Type>CampaignPage</Page.Type>'
+    '%s</rval></getResponse></soap:Body></soap:Envelope>')
+ENTRY = '<entries><id>%s</id><name>Campaign #%s</name></entries>'
+
+
+class _PagedCampaigns(object):
+
+  """Answers get() calls with a page of a fixed number of campaigns."""
+
+  def __init__(self, total):
+    self.total = total
+    self.start_indexes = []
+    self.__lock = threading.Lock()
+
+  def __call__(self, request):
+    start_index = int(re.search('startIndex>(.*?)<', request).group(1))
+    page_size = int(re.search('numberResults>(.*?)<', request).group(1))
+    self.__lock.acquire()
+    try:
+      self.start_indexes.append(start_index)
+    finally:
+      self.__lock.release()
+    ids = range(start_index, min(start_index + page_size, self.total))
+    entries = ''.join([ENTRY % (i, i) for i in ids])
+    return PAGE_RESPONSE % (len(ids), len(ids), self.total, entries)
+
+
+class PagingTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.Paging module."""
+
+  def setUp(self):
+    self.campaigns = _PagedCampaigns(7)
+    self.server = StandInServer(self.campaigns, WSDL, delay=0.05)
+    self.server.Start()
+    self.client, self.service = self._GetService(10)
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+  def _GetService(self, max_in_flight):
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE, 'max_in_flight': max_in_flight}
+    client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    return client, client.GetCampaignService(self.server.GetUrl(''), VERSION)
+
+  def _GetIds(self, entries):
+    return [int(entry['id']) for entry in entries]
+
+  def testIterGet(self):
+    """Tests that all entries are yielded in order, one page after another."""
+    selector = {'fields': ['Id', 'Name']}
+    ids = [entry['id'] for entry in self.service.IterGet(selector, 3)]
+    self.assertEqual(ids, [str(i) for i in xrange(7)])
+    self.assertEqual(self.campaigns.start_indexes, [0, 3, 6])
+    self.assertEqual(selector, {'fields': ['Id', 'Name']})
+    self.assertEqual(self.client.GetUnits(), 7)
+
+  def testIterGetStartsAtSelectorPaging(self):
+    """Tests that the selector's paging sets the first offset and page size."""
+    selector = {'paging': {'startIndex': '2', 'numberResults': '4'}}
+    ids = [entry['id'] for entry in self.service.IterGet(selector)]
+    self.assertEqual(ids, [str(i) for i in xrange(2, 7)])
+    self.assertEqual(self.campaigns.start_indexes, [2, 6])
+
+  def testNextPageIsPrefetched(self):
+    """Tests that the next page is fetched while the caller is busy."""
+    entries = self.service.IterGet({}, 2)
+    entries.next()
+    time.sleep(0.5)
+    self.assertEqual(self.campaigns.start_indexes, [0, 2])
+    self.assertEqual(len(list(entries)), 6)
+    self.assertEqual(self.campaigns.start_indexes, [0, 2, 4, 6])
+
+  def testEmptyResult(self):
+    """Tests that a selector matching nothing takes one call."""
+    self.campaigns.total = 0
+    self.assertEqual(list(self.service.IterGet({})), [])
+    self.assertEqual(self.campaigns.start_indexes, [0])
+
+  def testErrorsReachTheCaller(self):
+    """Tests that an error fetching a page ahead is raised to the caller."""
+    def GetPage(selector):
+      if selector['paging']['startIndex'] != '0':
+        raise ValueError('page %s' % selector['paging']['startIndex'])
+      return {'totalNumEntries': '4', 'entries': ['a', 'b']}
+
+    entries = Paging.IterEntries(GetPage, {}, 2)
+    self.assertEqual([entries.next(), entries.next()], ['a', 'b'])
+    self.assertRaises(ValueError, entries.next)
+
+  def testParallelPages(self):
+    """Tests that 100 pages fetched by 10 workers take about 10 round trips."""
+    self.campaigns.total = 100
+    self.server.delay = 0.2
+    start_time = time.time()
+    ids = self._GetIds(self.service.IterGet({}, 1, workers=10))
+    elapsed = time.time() - start_time
+    self.assertEqual(ids, range(100))
+    self.assertEqual(sorted(self.campaigns.start_indexes), range(100))
+    self.assertEqual(self.server.peak_in_flight, 10)
+    # One page alone, then 99 pages 10 at a time; one by one would take 20s.
+    self.assertTrue(elapsed < 4, elapsed)
+
+  def testUnorderedParallelPages(self):
+    """Tests that unordered pages still yield every entry once."""
+    self.campaigns.total = 30
+    ids = self._GetIds(self.service.IterGet({}, 4, workers=3, ordered=False))
+    self.assertEqual(sorted(ids), range(30))
+    self.assertEqual(self.campaigns.start_indexes[0], 0)
+    self.assertEqual(len(self.campaigns.start_indexes), 8)
+
+  def testWorkersAreCappedByMaxInFlight(self):
+    """Tests that workers do not exceed the client's max_in_flight."""
+    self.campaigns.total = 30
+    service = self._GetService(3)[1]
+    ids = self._GetIds(service.IterGet({}, 2, workers=8))
+    self.assertEqual(ids, range(30))
+    self.assertEqual(self.server.peak_in_flight, 3)
+
+  def testParallelErrorsReachTheCaller(self):
+    """Tests that an error fetched by a worker is raised to the caller."""
+    def GetPage(selector):
+      if selector['paging']['startIndex'] == '4':
+        raise ValueError('page 4')
+      return {'totalNumEntries': '10', 'entries': ['a', 'b']}
+
+    pages = Paging.IterPages(GetPage, {}, 2, workers=3)
+    self.assertRaises(ValueError, list, pages)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(PagingTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
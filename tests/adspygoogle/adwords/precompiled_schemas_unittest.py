@@ -0,0 +1,146 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover the PrecompiledSchemas module and schema_compiler.py.
+
+Definitions are compiled the way setup.py builds them, from WSDLs served by a
+local stand-in server. These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import imp
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.adwords.util import PrecompiledSchemas
+from adspygoogle.common import ETREE
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import Utils
+from tests.adspygoogle.common import ReadServiceWsdls
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+WSDLS = ReadServiceWsdls('data', VERSION)
+WSDLS['reportDefinition.xsd'] = Utils.ReadFile(
+    os.path.join('data', 'report_definition_v201206.xsd'))
+SCHEMA_COMPILER = os.path.join('..', '..', '..', 'scripts', 'adspygoogle',
+                               'adwords', 'schema_compiler.py')
+
+
+class PrecompiledSchemasTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.PrecompiledSchemas module."""
+
+  def setUp(self):
+    self.server = StandInServer(wsdl=WSDLS)
+    self.server.Start()
+    self.schema_dir = tempfile.mkdtemp()
+    self.old_servers = PrecompiledSchemas.SERVERS
+    self.old_schema_dir = PrecompiledSchemas.SCHEMA_DIR
+    schema_compiler = imp.load_source('schema_compiler', SCHEMA_COMPILER)
+    # Keep the compiler's progress out of the test output.
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+      self.failed = schema_compiler.CompileAll(self.server.GetUrl(''),
+                                               self.schema_dir, [VERSION])
+    finally:
+      self.compiler_output = sys.stdout.getvalue()
+      sys.stdout = stdout
+
+  def tearDown(self):
+    self.server.Stop()
+    PrecompiledSchemas.SERVERS = self.old_servers
+    PrecompiledSchemas.SCHEMA_DIR = self.old_schema_dir
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+    shutil.rmtree(self.schema_dir)
+
+  def _GetClient(self):
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE}
+    return AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+
+  def testCompiledDefinitionsNeedNoNetwork(self):
+    """Tests that services are built from compiled definitions alone."""
+    compiled = [name for group, name in PrecompiledSchemas.GetServices(VERSION)
+                if name in WSDLS]
+    self.assertEqual(len(compiled), len(WSDLS) - 1)
+    self.assertEqual(len(self.failed),
+                     len(PrecompiledSchemas.GetServices(VERSION)) -
+                     len(compiled))
+    self.assertEqual(len(PrecompiledSchemas.GetMissing([VERSION],
+                                                       self.schema_dir)),
+                     len(self.failed))
+    self.assertTrue('skipped: HTTP Error 404' in self.compiler_output)
+
+    server = self.server.GetUrl('')
+    wsdl_requests = self.server.wsdl_requests
+    # Any attempt to fetch a WSDL from here on fails.
+    self.server.Stop()
+    PrecompiledSchemas.SERVERS = (server,)
+    PrecompiledSchemas.SCHEMA_DIR = self.schema_dir
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+    client = self._GetClient()
+    for name in compiled:
+      service = getattr(client, 'Get%s' % name)(server, VERSION)
+      self.assertTrue(service._soappyservice.methods)
+    downloader = client.GetReportDownloader(server, VERSION)
+    self.assertTrue(downloader._soappyservice.wsdl.types)
+    self.assertEqual(self.server.wsdl_requests, wsdl_requests)
+
+  def testMissingDefinitions(self):
+    """Tests that missing definitions are reported by path."""
+    path = PrecompiledSchemas.GetPath(VERSION, 'cm', 'CampaignService',
+                                      self.schema_dir)
+    self.assertFalse(path in PrecompiledSchemas.GetMissing([VERSION],
+                                                           self.schema_dir))
+    PrecompiledSchemas.SERVERS = (self.server.GetUrl(''),)
+    self.assertTrue(PrecompiledSchemas.Load(
+        self.server.GetUrl(''), VERSION, 'cm', 'CampaignService',
+        self.schema_dir) is not None)
+    os.remove(path)
+    self.assertTrue(path in PrecompiledSchemas.GetMissing([VERSION],
+                                                          self.schema_dir))
+    self.assertEqual(PrecompiledSchemas.Load(
+        self.server.GetUrl(''), VERSION, 'cm', 'CampaignService',
+        self.schema_dir), None)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(PrecompiledSchemasTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover aggregating report rows as they download.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.adwords.util.ReportAggregator import ReportAggregator
+from adspygoogle.common import ETREE
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import Utils
+from adspygoogle.common.Errors import ValidationError
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+XSD = Utils.ReadFile(os.path.join('data', 'report_definition_v201206.xsd'))
+AWQL = ('SELECT CampaignId, Date, Clicks, Cost '
+        'FROM CAMPAIGN_PERFORMANCE_REPORT DURING 20120101,20120131')
+ROWS = [(str(campaign), '2012-01-%02d' % day, str(campaign * day % 7),
+         str(campaign * day * 10000))
+        for day in xrange(1, 32) for campaign in xrange(1, 51)]
+REPORT = ''.join(['"CAMPAIGN_PERFORMANCE_REPORT (Jan 1, 2012-Jan 31, 2012)"\n',
+                  'Campaign ID,Day,Clicks,Cost\n'] +
+                 ['%s\n' % ','.join(row) for row in ROWS] +
+                 ['Total,--,0,0\n'])
+AGGREGATES = ['SUM(Cost)', 'SUM(Clicks)', 'COUNT(*)', 'MIN(Date)',
+              'MAX(Clicks)']
+
+
+def _Expected():
+  """Returns the aggregates of ROWS per campaign, computed the long way."""
+  results = []
+  for campaign in sorted(set([row[0] for row in ROWS])):
+    rows = [row for row in ROWS if row[0] == campaign]
+    results.append((campaign, sum([int(row[3]) for row in rows]),
+                    sum([int(row[2]) for row in rows]), len(rows),
+                    min([row[1] for row in rows]),
+                    max([int(row[2]) for row in rows])))
+  return results
+
+
+class ReportAggregatorTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.ReportAggregator module."""
+
+  def setUp(self):
+    self.requests = []
+    self.server = StandInServer(self._Answer, XSD)
+    self.server.Start()
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE}
+    self.client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    self.downloader = self.client.GetReportDownloader(self.server.GetUrl(''),
+                                                      VERSION)
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+  def _Answer(self, request):
+    self.requests.append(request)
+    return REPORT
+
+  def testAggregateReport(self):
+    """Tests group-by aggregates of a report downloaded with AWQL."""
+    results = list(self.downloader.AggregateReport(
+        AWQL, ['CampaignId'], AGGREGATES, 'CSV',
+        column_types={'Date': 'String'}))
+    self.assertEqual(results, _Expected())
+    self.assertEqual(len(self.requests), 1)
+
+  def testAggregatesAsDicts(self):
+    """Tests that results are keyed by field and aggregate."""
+    results = self.downloader.AggregateReport(
+        AWQL, ['CampaignId'], ['count(*)', 'MAX(Cost)'], 'CSV', as_dict=True)
+    self.assertEqual(results.next(),
+                     {'CampaignId': '1', 'count(*)': 31, 'MAX(Cost)': 310000})
+
+  def testGroupsAreSpilled(self):
+    """Tests that groups past max_groups are spilled and merged back."""
+    aggregator = ReportAggregator(['CampaignId', 'Date', 'Clicks', 'Cost'],
+                                  ['CampaignId'], AGGREGATES,
+                                  {'Date': 'String'}, max_groups=7)
+    aggregator.ReadRows(ROWS)
+    self.assertEqual(aggregator.rows, len(ROWS))
+    # Rows cycle through all 50 campaigns, so every 7th row spills.
+    self.assertEqual(aggregator.spills, (len(ROWS) - 1) / 7)
+    self.assertEqual(list(aggregator.IterResults()), _Expected())
+    aggregator.Close()
+
+  def testMissingValues(self):
+    """Tests that missing values are skipped, and counted by COUNT(*) only."""
+    aggregator = ReportAggregator(['Day', 'Clicks'], ['Day'],
+                                  ['SUM(Clicks)', 'COUNT(Clicks)', 'COUNT(*)',
+                                   'MIN(Clicks)'], max_groups=1)
+    aggregator.ReadRows([('1', '--'), ('2', '5'), ('1', ' --'), ('2', '1,000'),
+                         ('1', '3')])
+    self.assertEqual(list(aggregator.IterResults()),
+                     [('1', 3, 1, 3, 3), ('2', 1005, 2, 2, 5)])
+
+  def testAggregatesAreChecked(self):
+    """Tests that bad fields and aggregates are refused before downloading."""
+    aggregate = self.downloader.AggregateReport
+    self.assertRaises(ValidationError, aggregate, AWQL, ['AdGroupId'],
+                      ['COUNT(*)'], 'CSV')
+    self.assertRaises(ValidationError, aggregate, AWQL, ['CampaignId'],
+                      ['AVG(Cost)'], 'CSV')
+    self.assertRaises(ValidationError, aggregate, AWQL, ['CampaignId'],
+                      ['SUM(*)'], 'CSV')
+    self.assertEqual(self.requests, [])
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(ReportAggregatorTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
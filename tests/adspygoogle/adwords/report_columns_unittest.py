@@ -0,0 +1,231 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover reading reports into typed columns.
+
+These tests do not need credentials or network access. NumPy is only used if it
+is installed.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.adwords.util import ReportColumns
+from adspygoogle.common import ETREE
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import Utils
+from adspygoogle.common.Errors import MissingPackageError
+from adspygoogle.common.Errors import ValidationError
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+XSD = Utils.ReadFile(os.path.join('data', 'report_definition_v201206.xsd'))
+AWQL = ('SELECT Id, CampaignName, Impressions, Cost, Ctr '
+        'FROM CRITERIA_PERFORMANCE_REPORT DURING YESTERDAY')
+COLUMN_TYPES = {'Id': 'Long', 'Impressions': 'Long', 'Cost': 'Money',
+                'Ctr': 'Double'}
+REPORT = ('"CRITERIA_PERFORMANCE_REPORT (Jan 1, 2012)"\n'
+          'Keyword ID,Campaign,Impressions,Cost,CTR\n'
+          '30000000001,Mars,"1,200",1230000,0.50%\n'
+          '30000000002,Venus,0,0,--\n'
+          '30000000003,Mars,7,5000000000,1.00%\n'
+          'Total,--,"1,207",5001230000,0.58%\n')
+# Impressions and Cost are missing for the second row.
+SPARSE_REPORT = REPORT.replace('Venus,0,0,--', 'Venus,--,--,--')
+
+
+def _ReadNpy(path):
+  """Returns the type description, length and data of an .npy file."""
+  fh = open(path, 'rb')
+  try:
+    content = fh.read()
+  finally:
+    fh.close()
+  assert content.startswith('\x93NUMPY\x01\x00')
+  header_length = struct.unpack('<H', content[8:10])[0]
+  header = eval(content[10:10 + header_length])
+  assert (10 + header_length) % 16 == 0
+  return (header['descr'], header['shape'][0],
+          content[10 + header_length:])
+
+
+class ReportColumnsTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.ReportColumns module."""
+
+  def setUp(self):
+    self.requests = []
+    self.report = REPORT
+    self.server = StandInServer(self._Answer, XSD)
+    self.server.Start()
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE}
+    self.client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    self.downloader = self.client.GetReportDownloader(self.server.GetUrl(''),
+                                                      VERSION)
+    self.output_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+    shutil.rmtree(self.output_dir)
+
+  def _Answer(self, request):
+    self.requests.append(request)
+    return self.report
+
+  def testTypedColumns(self):
+    """Tests that columns are named after the fields and typed."""
+    columns = self.downloader.DownloadReportColumns(AWQL, 'CSV', COLUMN_TYPES)
+    self.assertEqual(columns.fields,
+                     ['Id', 'CampaignName', 'Impressions', 'Cost', 'Ctr'])
+    self.assertEqual(columns.rows, 3)
+    self.assertEqual(columns.GetValues('Id'),
+                     [30000000001, 30000000002, 30000000003])
+    self.assertEqual(columns.GetValues('CampaignName'),
+                     ['Mars', 'Venus', 'Mars'])
+    self.assertEqual(columns.GetValues('Impressions'), [1200, 0, 7])
+    self.assertEqual(columns.GetValues('Cost'), [1230000, 0, 5000000000])
+    ctr = columns.GetValues('Ctr')
+    self.assertEqual((ctr[0], ctr[2]), (0.5, 1.0))
+    # A missing double is NaN, which is not equal to itself.
+    self.assertNotEqual(ctr[1], ctr[1])
+
+  def testSavedColumns(self):
+    """Tests that columns are saved as .npy files."""
+    self.downloader.DownloadReportColumns(AWQL, 'CSV', COLUMN_TYPES,
+                                          self.output_dir)
+    descr, length, data = _ReadNpy(os.path.join(self.output_dir, 'Cost.npy'))
+    self.assertEqual((descr[1:], length), ('i8', 3))
+    self.assertEqual(struct.unpack(descr[0] + '3q', data),
+                     (1230000, 0, 5000000000))
+    descr, length, data = _ReadNpy(os.path.join(self.output_dir,
+                                                'CampaignName.npy'))
+    self.assertEqual(struct.unpack(descr[0] + '3i', data), (0, 1, 0))
+    self.assertEqual(_ReadNpy(os.path.join(self.output_dir,
+                                           'CampaignName.dictionary.npy')),
+                     ('|S5', 2, 'Mars\0Venus'))
+    fields = Utils.ReadFile(os.path.join(self.output_dir, 'fields.txt'))
+    self.assertEqual(fields.splitlines(),
+                     ['Id\tLong', 'CampaignName\tString', 'Impressions\tLong',
+                      'Cost\tLong', 'Ctr\tDouble'])
+
+  def testNumPyArrays(self):
+    """Tests the columns as arrays, or that NumPy is asked for."""
+    columns = self.downloader.DownloadReportColumns(AWQL, 'CSV', COLUMN_TYPES,
+                                                    self.output_dir)
+    if not ReportColumns.NUMPY_LIB:
+      self.assertRaises(MissingPackageError, columns.ToArrays)
+      self.assertRaises(MissingPackageError, ReportColumns.LoadColumns,
+                        self.output_dir)
+      return
+    for arrays in (columns.ToArrays(),
+                   ReportColumns.LoadColumns(self.output_dir)):
+      self.assertEqual(arrays['Cost'].dtype.name, 'int64')
+      self.assertEqual(list(arrays['Cost']), [1230000, 0, 5000000000])
+      codes, values = arrays['CampaignName']
+      self.assertEqual([values[code] for code in codes],
+                       ['Mars', 'Venus', 'Mars'])
+
+  def testMissingIntegers(self):
+    """Tests that missing integers are told apart from zeros."""
+    self.report = SPARSE_REPORT
+    columns = self.downloader.DownloadReportColumns(AWQL, 'CSV', COLUMN_TYPES,
+                                                    self.output_dir)
+    self.assertEqual(columns.GetValues('Impressions'), [1200, None, 7])
+    self.assertEqual(columns.GetValues('Cost'), [1230000, None, 5000000000])
+    descr, length, data = _ReadNpy(os.path.join(self.output_dir,
+                                                'Cost.mask.npy'))
+    self.assertEqual((descr, length, data), ('|b1', 3, '\0\1\0'))
+    self.assertFalse(os.path.exists(os.path.join(self.output_dir,
+                                                 'Id.mask.npy')))
+    if ReportColumns.NUMPY_LIB:
+      for arrays in (columns.ToArrays(),
+                     ReportColumns.LoadColumns(self.output_dir)):
+        self.assertEqual(list(arrays['Cost'].mask), [False, True, False])
+        self.assertEqual(arrays['Cost'].count(), 2)
+
+    # Saving columns without missing values drops the earlier masks.
+    self.report = REPORT
+    self.downloader.DownloadReportColumns(AWQL, 'CSV', COLUMN_TYPES,
+                                          self.output_dir)
+    self.assertFalse(os.path.exists(os.path.join(self.output_dir,
+                                                 'Cost.mask.npy')))
+
+  def testArraysAreCopies(self):
+    """Tests that arrays do not change as more rows are read."""
+    if not ReportColumns.NUMPY_LIB:
+      return
+    columns = ReportColumns.ReportColumns(['Clicks'], {'Clicks': 'Long'})
+    columns.ReadRows([('1',), ('2',)])
+    clicks = columns.ToArrays()['Clicks']
+    columns.ReadRows([(str(i),) for i in xrange(10000)])
+    self.assertEqual(list(clicks), [1, 2])
+
+  def testFieldsOfReportDefinition(self):
+    """Tests that a report definition's selector sets the columns."""
+    report_definition = {
+        'selector': {
+            'fields': ['Id', 'CampaignName', 'Impressions', 'Cost', 'Ctr']
+        },
+        'reportName': 'Criteria',
+        'reportType': 'CRITERIA_PERFORMANCE_REPORT',
+        'dateRangeType': 'YESTERDAY',
+        'downloadFormat': 'CSV'
+    }
+    columns = self.downloader.DownloadReportColumns(
+        report_definition, column_types={'Impressions': 'Integer'})
+    self.assertEqual(columns.GetValues('Impressions'), [1200, 0, 7])
+    self.assertEqual(columns.GetValues('Cost'),
+                     ['1230000', '0', '5000000000'])
+
+  def testColumnTypesAreChecked(self):
+    """Tests that bad column types are refused before downloading."""
+    download = self.downloader.DownloadReportColumns
+    self.assertRaises(ValidationError, download, AWQL, 'CSV',
+                      {'Clicks': 'Long'})
+    self.assertRaises(ValidationError, download, AWQL, 'CSV',
+                      {'Cost': 'Percent'})
+    self.assertRaises(ValidationError, download, 'SELECT FROM', 'CSV')
+    self.assertEqual(self.requests, [])
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(ReportColumnsTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
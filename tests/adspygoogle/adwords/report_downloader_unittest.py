@@ -0,0 +1,308 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover ReportDownloader against a local stand-in server.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import copy
+import decimal
+import gzip
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import zlib
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords import ReportDownloader
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.common import ETREE
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import Utils
+from adspygoogle.common.Errors import ValidationError
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+AWQL = 'SELECT CampaignId, Clicks FROM CAMPAIGN_PERFORMANCE_REPORT'
+REPORT = ''.join(['"Report (Jan 1, 2012-Jan 31, 2012)"\n',
+                  'Campaign ID,Clicks\n'] +
+                 ['%s,%s\n' % (i, i * 7 % 1000) for i in xrange(100000)] +
+                 ['Total,--\n'])
+TYPED_REPORT = (
+    '"CAMPAIGN_PERFORMANCE_REPORT (Jan 1, 2012-Jan 31, 2012)"\n'
+    'Campaign,Campaign ID,Clicks,Cost,CTR\n'
+    '"Cruise, ""Mars""",1,10,1.23,0.50%\n'
+    '"Two\nlines",2,0,0.00,0.00%\n'
+    'Total,--,10,1.23,0.45%\n')
+XSD = Utils.ReadFile(os.path.join('data', 'report_definition_v201206.xsd'))
+REPORT_DEFINITION = {
+    'selector': {
+        'fields': ['CampaignId', 'Clicks'],
+        'predicates': [{'field': 'Status', 'operator': 'IN',
+                        'values': ['ACTIVE', 'PAUSED']}]
+    },
+    'reportName': 'Campaign clicks',
+    'reportType': 'CAMPAIGN_PERFORMANCE_REPORT',
+    'dateRangeType': 'LAST_7_DAYS',
+    'downloadFormat': 'CSV'
+}
+
+
+def _Compress(data, members=1):
+  """Returns data gzipped in the given number of members."""
+  buf = StringIO.StringIO()
+  step = len(data) / members + 1
+  for start in xrange(0, len(data), step):
+    gzip_file = gzip.GzipFile(mode='wb', fileobj=buf)
+    gzip_file.write(data[start:start + step])
+    gzip_file.close()
+  return buf.getvalue()
+
+
+class ReportDownloaderTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.ReportDownloader module."""
+
+  def setUp(self):
+    self.requests = []
+    self.server = StandInServer(self._Answer, XSD)
+    self.server.Start()
+    self.report = REPORT
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE, 'compress': 'y'}
+    self.client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    self.downloader = self.client.GetReportDownloader(self.server.GetUrl(''),
+                                                      VERSION)
+    self.output_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+    shutil.rmtree(self.output_dir)
+
+  def _Answer(self, request):
+    self.requests.append(request)
+    return self.report
+
+  def testGzippedReportIsStreamed(self):
+    """Tests that a gzipped report is decompressed chunk by chunk."""
+    self.report = _Compress(REPORT)
+    self.server.response_headers['Content-Encoding'] = 'gzip'
+    progress = []
+    fileobj = StringIO.StringIO()
+    self.assertEqual(self.downloader.DownloadReportWithAwql(
+        AWQL, 'CSV', fileobj=fileobj,
+        progress_callback=lambda *args: progress.append(args)), None)
+    self.assertEqual(fileobj.getvalue(), REPORT)
+    self.assertTrue('__rdquery=SELECT' in self.requests[0])
+    self.assertTrue(len(progress) > len(self.report) / 4096)
+    self.assertEqual(progress[-1], (len(self.report), len(REPORT)))
+    # Report data is handed on as it arrives, not once all of it was read.
+    self.assertTrue(progress[len(progress) / 2][1] < len(REPORT) * 3 / 4)
+
+  def testGzipMembersAreJoined(self):
+    """Tests that a report gzipped in several members is read whole."""
+    self.report = _Compress(REPORT, members=3)
+    self.server.response_headers['Content-Encoding'] = 'gzip'
+    self.assertEqual(self.downloader.DownloadReportWithAwql(AWQL, 'CSV'),
+                     REPORT)
+
+  def testPlainReport(self):
+    """Tests a report which is not compressed."""
+    progress = []
+    self.assertEqual(self.downloader.DownloadReportWithAwql(
+        AWQL, 'CSV', progress_callback=lambda *args: progress.append(args)),
+                     REPORT)
+    self.assertEqual(progress[-1], (len(REPORT), len(REPORT)))
+
+  def testCorruptReport(self):
+    """Tests that a corrupt gzipped report is not passed on silently."""
+    self.report = _Compress(REPORT)[:-8] + 'xxxxxxxx'
+    self.server.response_headers['Content-Encoding'] = 'gzip'
+    self.assertRaises(zlib.error, self.downloader.DownloadReportWithAwql,
+                      AWQL, 'CSV')
+
+  def testIterReportRows(self):
+    """Tests that rows are parsed without the title and totals rows."""
+    rows = self.downloader.IterReportRows(AWQL, 'CSV')
+    self.assertEqual(rows.next(), ('0', '0'))
+    count = 1
+    for row in rows:
+      count += 1
+    self.assertEqual(row, ('99999', str(99999 * 7 % 1000)))
+    self.assertEqual(count, 100000)
+    self.assertTrue('__fmt=CSV' in self.requests[0])
+
+  def testIterReportRowsAsDicts(self):
+    """Tests typed columns, quoted values and dict rows."""
+    self.report = TYPED_REPORT
+    column_types = {'Clicks': 'Long', 'Cost': 'Money', 'CTR': 'Double',
+                    'Campaign': lambda value: value.upper()}
+    rows = list(self.downloader.IterReportRows(
+        AWQL, 'csv', as_dict=True, column_types=column_types))
+    self.assertEqual(rows, [
+        {'Campaign': 'CRUISE, "MARS"', 'Campaign ID': '1', 'Clicks': 10,
+         'Cost': decimal.Decimal('1.23'), 'CTR': 0.5},
+        {'Campaign': 'TWO\nLINES', 'Campaign ID': '2', 'Clicks': 0,
+         'Cost': decimal.Decimal('0.00'), 'CTR': 0.0}])
+    micros_report = TYPED_REPORT.replace('1.23,', '1230000,')
+    self.report = micros_report.replace('0.00,', '0,')
+    rows = list(self.downloader.IterReportRows(
+        AWQL, 'CSV', return_micros=True, column_types={'Cost': 'Money'}))
+    self.assertEqual(rows[0][3], 1230000)
+
+  def testIterGzippedTsvRows(self):
+    """Tests a gzipped TSV report, sent with its own gzip encoding."""
+    self.report = _Compress(_Compress(TYPED_REPORT.replace(',', '\t')))
+    self.server.response_headers['Content-Encoding'] = 'gzip'
+    rows = list(self.downloader.IterReportRows(AWQL, 'GZIPPED_TSV'))
+    self.assertEqual(rows[1], ('Two\nlines', '2', '0', '0.00', '0.00%'))
+    self.assertEqual(len(rows), 2)
+
+  def testIterReportRowsChecksFormat(self):
+    """Tests that formats which are not row-based are refused."""
+    self.assertRaises(ValidationError, self.downloader.IterReportRows, AWQL,
+                      'XML')
+    self.assertRaises(ValidationError, self.downloader.IterReportRows, AWQL,
+                      'CSV', column_types={'Cost': 'Percent'})
+    self.assertEqual(self.requests, [])
+
+  def testReportXmlIsCached(self):
+    """Tests that equal definitions reuse the payload built for the first."""
+    hits = ReportDownloader.PAYLOAD_CACHE.hits
+    self.report = TYPED_REPORT
+    self.downloader.DownloadReport(REPORT_DEFINITION)
+    downloader = self.client.GetReportDownloader(self.server.GetUrl(''),
+                                                 VERSION)
+    downloader.DownloadReport(copy.deepcopy(REPORT_DEFINITION))
+    self.assertEqual(ReportDownloader.PAYLOAD_CACHE.hits, hits + 1)
+    self.assertEqual(self.requests[0], self.requests[1])
+    self.assertTrue('%3CreportName%3ECampaign+clicks%3C%2FreportName%3E'
+                    in self.requests[0])
+    # The schema is fetched once, not by every downloader.
+    self.assertEqual(self.server.wsdl_requests, 1)
+
+    report_definition = dict(REPORT_DEFINITION, reportName='Other')
+    self.downloader.DownloadReport(report_definition)
+    self.assertEqual(ReportDownloader.PAYLOAD_CACHE.hits, hits + 1)
+    self.assertTrue('%3EOther%3C' in self.requests[2])
+
+  def testKeepCompressed(self):
+    """Tests that a gzipped response is saved as it is, and its rows counted."""
+    self.report = _Compress(TYPED_REPORT, members=2)
+    self.server.response_headers['Content-Encoding'] = 'gzip'
+    fileobj = StringIO.StringIO()
+    self.assertEqual(self.downloader.DownloadReportWithAwql(
+        AWQL, 'CSV', fileobj=fileobj, keep_compressed=True, count_rows=True),
+                     (None, 2))
+    self.assertEqual(fileobj.getvalue(), self.report)
+
+  def testKeepCompressedGzippedFormat(self):
+    """Tests that a report in a GZIPPED_* format is not gzipped twice."""
+    headers = []
+
+    def Answer(request, request_headers):
+      headers.append(request_headers)
+      return self.report
+
+    self.server.response = Answer
+    self.server.response_takes_headers = True
+    self.report = _Compress(REPORT)
+    self.assertEqual(self.downloader.DownloadReportWithAwql(
+        AWQL, 'GZIPPED_CSV', keep_compressed=True, count_rows=True),
+                     (self.report, 100000))
+    self.assertFalse('gzip' in headers[0].get('Accept-Encoding', ''))
+
+  def testGzippedFormatRequestBody(self):
+    """Tests that a gzipped request body is sent with its Content-Encoding."""
+    headers = []
+
+    def Answer(request, request_headers):
+      headers.append(request_headers)
+      return self.report
+
+    self.server.response = Answer
+    self.server.response_takes_headers = True
+    self.report = _Compress(REPORT)
+    self.downloader.DownloadReportWithAwql(AWQL, 'GZIPPED_CSV',
+                                           keep_compressed=True)
+    self.assertEqual(headers[0].get('Content-Encoding'), 'gzip')
+    body = self.server.raw_requests[0]
+    self.assertTrue(body.startswith(ReportDownloader.GZIP_MAGIC))
+    self.assertEqual(int(headers[0]['Content-Length']), len(body))
+    self.assertTrue('__fmt=GZIPPED_CSV' in zlib.decompress(
+        body, ReportDownloader.GZIP_WBITS))
+
+    self.client.compress = 'n'
+    downloader = self.client.GetReportDownloader(self.server.GetUrl(''),
+                                                 VERSION)
+    downloader.DownloadReportWithAwql(AWQL, 'GZIPPED_CSV',
+                                      keep_compressed=True)
+    self.assertEqual(headers[1].get('Content-Encoding'), None)
+    self.assertTrue(self.server.raw_requests[1].startswith('__'))
+
+  def testKeepCompressedPlainResponse(self):
+    """Tests that a response the server did not gzip is gzipped."""
+    path = os.path.join(self.output_dir, 'report.csv.gz')
+    self.assertEqual(self.downloader.DownloadReportWithAwql(
+        AWQL, 'CSV', file_path=path, keep_compressed=True), path)
+    gzip_file = gzip.open(path)
+    self.assertEqual(gzip_file.read(), REPORT)
+    gzip_file.close()
+
+  def testIncompleteReport(self):
+    """Tests that a gzipped report cut short is not taken for a whole one."""
+    self.report = _Compress(REPORT)[:-8]
+    self.server.response_headers['Content-Encoding'] = 'gzip'
+    self.assertRaises(zlib.error, self.downloader.DownloadReportWithAwql,
+                      AWQL, 'CSV')
+    self.assertRaises(zlib.error, self.downloader.DownloadReportWithAwql,
+                      AWQL, 'CSV', fileobj=StringIO.StringIO(),
+                      keep_compressed=True)
+
+  def testCountRowsChecksFormat(self):
+    """Tests that rows of reports which are not row-based are not counted."""
+    self.assertRaises(ValidationError, self.downloader.DownloadReportWithAwql,
+                      AWQL, 'XML', keep_compressed=True, count_rows=True)
+    self.assertRaises(ValidationError, self.downloader.DownloadReport, '123',
+                      count_rows=True)
+    self.assertEqual(self.requests, [])
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(ReportDownloaderTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
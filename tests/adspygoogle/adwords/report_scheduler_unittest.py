@@ -0,0 +1,286 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover downloading reports for many accounts or dates at once.
+
+These tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import re
+import shutil
+import StringIO
+import sys
+import tempfile
+import threading
+import time
+import urllib
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.adwords.AdWordsErrors import AdWordsError
+from adspygoogle.adwords.util import PrecompiledSchemas
+from adspygoogle.adwords.util import ReportScheduler
+from adspygoogle.common import ETREE
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import Utils
+from adspygoogle.common.Errors import ValidationError
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+AWQL = 'SELECT CampaignId, Clicks FROM CAMPAIGN_PERFORMANCE_REPORT'
+REPORT = ('"CAMPAIGN_PERFORMANCE_REPORT (Jan 1, 2012-Jan 31, 2012)"\n'
+          'Campaign ID,Clicks\n'
+          '%s1,10\n'
+          '%s2,20\n'
+          'Total,30\n')
+XSD = Utils.ReadFile(os.path.join('data', 'report_definition_v201206.xsd'))
+DAILY_REPORT = {
+    'selector': {
+        'fields': ['Date', 'Clicks'],
+        'dateRange': {'min': '20120101', 'max': '20120131'}
+    },
+    'reportName': 'Daily clicks',
+    'reportType': 'ACCOUNT_PERFORMANCE_REPORT',
+    'dateRangeType': 'CUSTOM_DATE',
+    'downloadFormat': 'CSV'
+}
+
+
+class ReportSchedulerTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.adwords.util.ReportScheduler module."""
+
+  def setUp(self):
+    self.failures = {}
+    self.attempts = {}
+    self.lock = threading.Lock()
+    self.server = StandInServer(self._Answer)
+    self.server.response_takes_headers = True
+    self.server.Start()
+    # AWQL downloads do not use the report definition schema, which is not
+    # available offline.
+    ServiceRegistry.SHARED_REGISTRY.GetDefinition(
+        (self.server.GetUrl(''), PrecompiledSchemas.REPORT_GROUP, VERSION,
+         PrecompiledSchemas.REPORT_DEFINITION), lambda: object())
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE}
+    self.client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    self.downloader = self.client.GetReportDownloader(self.server.GetUrl(''),
+                                                      VERSION)
+    self.output_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+    shutil.rmtree(self.output_dir)
+
+  def _Answer(self, request, headers):
+    """Answers with a report of the account, or fails as often as told to."""
+    customer_id = headers['clientCustomerId']
+    self.lock.acquire()
+    try:
+      self.attempts[customer_id] = self.attempts.get(customer_id, 0) + 1
+      if self.failures.get(customer_id):
+        self.failures[customer_id] -= 1
+        return 500, 'Internal error'
+    finally:
+      self.lock.release()
+    return REPORT % (customer_id, customer_id)
+
+  def _Download(self, customer_ids, **kwargs):
+    return self.downloader.DownloadReportForAccounts(
+        AWQL, customer_ids, 'CSV', retry_delay=0.01, **kwargs)
+
+  def testFilePerAccount(self):
+    """Tests that each account's report is saved to its own file."""
+    manifest = self._Download(['111', '222', '333'],
+                              output_dir=self.output_dir)
+    self.assertEqual([entry['clientCustomerId'] for entry in manifest],
+                     ['111', '222', '333'])
+    for entry in manifest:
+      self.assertEqual(entry['status'], ReportScheduler.SUCCESS)
+      self.assertEqual(entry['attempts'], 1)
+      path = os.path.join(self.output_dir, '%s.csv' % entry['clientCustomerId'])
+      self.assertEqual(entry['path'], path)
+      fh = open(path, 'rb')
+      self.assertEqual(fh.read(), REPORT % ((entry['clientCustomerId'],) * 2))
+      fh.close()
+      self.assertEqual(entry['bytes'], os.path.getsize(path))
+    self.assertEqual(self.downloader._headers['clientCustomerId'],
+                     '1234567890')
+
+  def testErrorsAreIsolatedAndRetried(self):
+    """Tests that a failing account is retried without affecting others."""
+    self.failures = {'222': 1, '333': 10}
+    manifest = self._Download(['111', '222', '333'],
+                              output_dir=self.output_dir, retries=2)
+    self.assertEqual([entry['status'] for entry in manifest],
+                     [ReportScheduler.SUCCESS, ReportScheduler.SUCCESS,
+                      ReportScheduler.FAILED])
+    self.assertEqual([entry['attempts'] for entry in manifest], [1, 2, 3])
+    self.assertTrue('Internal error' in manifest[2]['error'])
+    self.assertEqual(sorted(os.listdir(self.output_dir)),
+                     ['111.csv', '222.csv'])
+
+  def testMergedStream(self):
+    """Tests that rows of all accounts are merged under one header."""
+    fileobj = StringIO.StringIO()
+    self.failures = {'222': 1}
+    manifest = self._Download(['111', '222', '333'], fileobj=fileobj)
+    self.assertEqual([entry['rows'] for entry in manifest], [2, 2, 2])
+    lines = fileobj.getvalue().splitlines()
+    self.assertEqual(lines[0], 'Customer ID,Campaign ID,Clicks')
+    self.assertEqual(sorted(lines[1:]),
+                     ['111,1111,10', '111,1112,20', '222,2221,10',
+                      '222,2222,20', '333,3331,10', '333,3332,20'])
+    download = self.downloader.DownloadReportForAccounts
+    self.assertRaises(ValidationError, download, AWQL, ['111'], 'XML',
+                      fileobj=fileobj)
+    self.assertRaises(ValidationError, download, AWQL, ['111'], 'CSV')
+
+  def testDownloadsRunConcurrently(self):
+    """Tests that 20 accounts on 5 workers take about 4 round trips."""
+    self.server.delay = 0.2
+    start_time = time.time()
+    manifest = self._Download([str(i) for i in xrange(20)],
+                              output_dir=self.output_dir, workers=5)
+    elapsed = time.time() - start_time
+    self.assertEqual(len(os.listdir(self.output_dir)), 20)
+    self.assertEqual(self.server.peak_in_flight, 5)
+    self.assertEqual(set([entry['status'] for entry in manifest]),
+                     set([ReportScheduler.SUCCESS]))
+    # One at a time, the downloads would take 4s.
+    self.assertTrue(elapsed < 2, elapsed)
+
+
+class ShardedReportTest(unittest.TestCase):
+
+  """Tests for downloading a report in shards of its date range."""
+
+  def setUp(self):
+    self.failures = {}
+    self.shards = []
+    self.lock = threading.Lock()
+    self.server = StandInServer(self._Answer, XSD)
+    self.server.Start()
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE}
+    self.client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    self.downloader = self.client.GetReportDownloader(self.server.GetUrl(''),
+                                                      VERSION)
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+  def _Answer(self, request):
+    """Answers with one row per day of the requested date range."""
+    report_xml = urllib.unquote_plus(request)
+    min_date = re.search(r'<min>(\d+)</min>', report_xml).group(1)
+    max_date = re.search(r'<max>(\d+)</max>', report_xml).group(1)
+    self.lock.acquire()
+    try:
+      self.shards.append((min_date, max_date))
+      if self.failures.get(min_date):
+        self.failures[min_date] -= 1
+        return 500, 'Internal error'
+    finally:
+      self.lock.release()
+    # Earlier shards take longer, so that they complete out of order.
+    time.sleep((31 - int(min_date[-2:])) / 100.0)
+    days = range(int(min_date), int(max_date) + 1)
+    return ''.join(['"Daily clicks (%s-%s)"\n' % (min_date, max_date),
+                    'Day,Clicks\n'] +
+                   ['%s,%s\n' % (day, day % 100) for day in days] +
+                   ['Total,%s\n' % sum([day % 100 for day in days])])
+
+  def testShardsAreMergedInOrder(self):
+    """Tests that weekly shards are merged in date order under one header."""
+    report = self.downloader.DownloadShardedReport(DAILY_REPORT, retry_delay=0)
+    self.assertEqual(report.splitlines(),
+                     ['Day,Clicks'] +
+                     ['201201%02d,%s' % (day, day) for day in xrange(1, 32)])
+    self.assertEqual(sorted(self.shards),
+                     [('20120101', '20120107'), ('20120108', '20120114'),
+                      ('20120115', '20120121'), ('20120122', '20120128'),
+                      ('20120129', '20120131')])
+    self.assertEqual(DAILY_REPORT['selector']['dateRange'],
+                     {'min': '20120101', 'max': '20120131'})
+
+  def testFailedShardIsRetriedAlone(self):
+    """Tests that only the failed shard is downloaded again."""
+    self.failures = {'20120108': 1}
+    fileobj = StringIO.StringIO()
+    self.assertEqual(self.downloader.DownloadShardedReport(
+        DAILY_REPORT, 'DAY', fileobj=fileobj, workers=8, retry_delay=0), None)
+    self.assertEqual(len(fileobj.getvalue().splitlines()), 32)
+    self.assertEqual(len(self.shards), 32)
+    self.assertEqual(self.shards.count(('20120108', '20120108')), 2)
+
+  def testFailedShardReachesTheCaller(self):
+    """Tests that a shard failing on every retry fails the download."""
+    self.failures = {'20120115': 10}
+    self.assertRaises(AdWordsError, self.downloader.DownloadShardedReport,
+                      DAILY_REPORT, retries=1, retry_delay=0)
+    self.assertEqual(self.shards.count(('20120115', '20120121')), 2)
+
+  def testOnlyCustomDateReportsAreSharded(self):
+    """Tests that reports which can not be sharded are refused."""
+    report_definition = dict(DAILY_REPORT, dateRangeType='LAST_7_DAYS')
+    download = self.downloader.DownloadShardedReport
+    self.assertRaises(ValidationError, download, report_definition)
+    report_definition = dict(DAILY_REPORT, downloadFormat='XML')
+    self.assertRaises(ValidationError, download, report_definition)
+    self.assertRaises(ValidationError, download, DAILY_REPORT, 'MONTH')
+    self.assertEqual(self.shards, [])
+
+  def testSplitDateRange(self):
+    """Tests splitting date ranges across month and year ends."""
+    self.assertEqual(ReportScheduler.SplitDateRange('20111230', '20120102', 3),
+                     [('20111230', '20120101'), ('20120102', '20120102')])
+    self.assertEqual(ReportScheduler.SplitDateRange('20120228', '20120301',
+                                                    'day'),
+                     [('20120228', '20120228'), ('20120229', '20120229'),
+                      ('20120301', '20120301')])
+    self.assertRaises(ValidationError, ReportScheduler.SplitDateRange,
+                      '20120201', '20120101', 'WEEK')
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(ReportSchedulerTest))
+  suite.addTests(unittest.makeSuite(ShardedReportTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
@@ -0,0 +1,270 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover the RequestSerializer module.
+
+Requests built from serialized arguments are compared byte for byte with the
+ones SOAPpy builds from arguments packed by MessageHandler.PackForSoappy. These
+tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import glob
+import imp
+import inspect
+import os
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle import SOAPpy
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.common import ETREE
+from adspygoogle.common import MessageHandler
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common.GenericApiService import MethodInfoKeys
+from adspygoogle.common.soappy import RequestSerializer
+from tests.adspygoogle.common import ReadServiceWsdls
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+WSDLS = ReadServiceWsdls('data', VERSION)
+EXAMPLES_DIR = os.path.join('..', '..', '..', 'examples', 'adspygoogle',
+                            'adwords', VERSION)
+# Examples which make no call on a SOAP service of the client passed to them:
+# they authenticate on their own, or download reports.
+NO_SERVICE_CALLS = ('handle_two_factor_authorization_error.py',
+                    'use_oauth.py', 'use_oauth2.py',
+                    'download_criteria_report.py',
+                    'download_criteria_report_with_awql.py')
+# Arguments of examples which need more than ids.
+EXAMPLE_ARGS = {'upload_image.py': [os.path.join('data', 'image.jpg')]}
+
+
+class _StopExample(Exception):
+
+  """Raised to end an example once it made its first API call."""
+
+
+class _RecordingService(object):
+
+  """Stands in for a service, recording the first call made on it."""
+
+  def __init__(self, calls, service_name):
+    self.__calls = calls
+    self.__service_name = service_name
+
+  def __getattr__(self, name):
+    def Record(*args):
+      self.__calls.append((self.__service_name, name, args))
+      raise _StopExample()
+    return Record
+
+
+class _RecordingClient(object):
+
+  """Stands in for an AdWordsClient, handing out recording services."""
+
+  def __init__(self, calls):
+    self.__calls = calls
+
+  def __getattr__(self, name):
+    def GetService(*unused_args, **unused_kwargs):
+      if name.startswith('Get') and name.endswith('Service'):
+        return _RecordingService(self.__calls, name[3:])
+      raise _StopExample()
+    return GetService
+
+
+class RequestSerializerTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.soappy.RequestSerializer module."""
+
+  def setUp(self):
+    self.server = StandInServer(lambda request: '', WSDLS)
+    self.server.Start()
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE}
+    self.client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    self.service = self.client.GetCampaignService(self.server.GetUrl(''),
+                                                  VERSION)
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+  def _BuildRequest(self, service, method_name, args, pack):
+    """Builds the request for a call.
+
+    Args:
+      service: GenericAdWordsService Service to build the request for.
+      method_name: str Name of the SOAP operation.
+      args: tuple Arguments of the call.
+      pack: bool Whether to pack all arguments with
+            MessageHandler.PackForSoappy and build with SOAPpy.buildSOAP, as
+            opposed to building the way the service does.
+
+    Returns:
+      tuple The request and whether all of its arguments were serialized.
+    """
+    method_name = method_name[0].lower() + method_name[1:]
+    method_info = service._GetMethodInfo(method_name)
+    soap_headers = service._GetSoapHeaders()
+    soap_config = service._GetSoapConfig()
+    soapproxy = service._soappyservice.soapproxy
+    methodattrs = soapproxy.methodattrs
+    if not method_info[MethodInfoKeys.INPUTS]:
+      methodattrs = {'xmlns': service._namespace}
+    ksoap_args = {}
+    for arg, param in zip(args, method_info[MethodInfoKeys.INPUTS]):
+      element_name = str(param[MethodInfoKeys.ELEMENT_NAME])
+      if pack:
+        ksoap_args[element_name] = MessageHandler.PackForSoappy(
+            arg, param[MethodInfoKeys.NS], param[MethodInfoKeys.TYPE],
+            service._soappyservice, service._wrap_lists,
+            service._namespace_extractor)
+      else:
+        ksoap_args[element_name] = service._PackArg(
+            arg, element_name, param[MethodInfoKeys.NS],
+            param[MethodInfoKeys.TYPE], soap_config)
+    serialized = [isinstance(arg, RequestSerializer.SerializedArg)
+                  for arg in ksoap_args.values()]
+    if pack:
+      request = SOAPpy.buildSOAP(
+          kw=ksoap_args, method=method_name,
+          namespace=service._soappyservice.methods[method_name].namespace,
+          header=soap_headers, methodattrs=methodattrs,
+          encoding=soapproxy.encoding, config=soap_config,
+          noroot=soapproxy.noroot)
+    else:
+      request = service._BuildSoapMessage(method_name, ksoap_args,
+                                          soap_headers, methodattrs,
+                                          soap_config)
+    return request, all(serialized)
+
+  def _AssertSameRequest(self, method_name, *args):
+    expected = self._BuildRequest(self.service, method_name, args, True)[0]
+    actual, serialized = self._BuildRequest(self.service, method_name, args,
+                                            False)
+    self.assertTrue(serialized)
+    self.assertEqual(actual, expected)
+    return actual
+
+  def testGetRequests(self):
+    """Tests selectors with lists of strings and of complex types."""
+    self._AssertSameRequest('get', {})
+    request = self._AssertSameRequest('get', {
+        'fields': ['Id', 'Name', 'Status'],
+        'predicates': [{'field': 'Status', 'operator': 'IN',
+                        'values': ['ACTIVE', 'PAUSED']},
+                       {'field': 'Name', 'operator': 'EQUALS',
+                        'values': [u'Caf\xe9 <&> "quoted"']}],
+        'ordering': [{'field': 'Name', 'sortOrder': 'ASCENDING'}],
+        'paging': {'startIndex': '0', 'numberResults': '100'}})
+    self.assertTrue('<cm:values>Caf\xc3\xa9 &lt;&amp;&gt;' in request)
+    self._AssertSameRequest('get', {'fields': [], 'paging': {}})
+
+  def testMutateRequests(self):
+    """Tests operations with nested and explicitly typed complex types."""
+    self._AssertSameRequest('mutate', [{
+        'operator': 'ADD',
+        'xsi_type': 'CampaignOperation',
+        'operand': {
+            'name': 'Interplanetary Cruise \xc3\xa9 & more',
+            'status': 'PAUSED',
+            'startDate': '20120101',
+            'budget': {
+                'period': 'DAILY',
+                'amount': {'microAmount': '50000000'},
+                'deliveryMethod': 'STANDARD'
+            }
+        }
+    }, {
+        'operator': 'SET',
+        'operand': {'id': '123', 'name': None, 'status': ''}
+    }])
+    self._AssertSameRequest('mutate', [])
+    self._AssertSameRequest('mutate', ({'operator': 'REMOVE',
+                                        'operand': {'id': '1'}},))
+    self._AssertSameRequest('mutate', None)
+
+  def testUnsupportedValuesArePacked(self):
+    """Tests that values the serializer leaves alone get packed for SOAPpy."""
+    soap_config = self.service._GetSoapConfig()
+    packed = self.service._PackArg(
+        {'fields': ['Id', None]}, 'selector', self.service._namespace,
+        'Selector', soap_config)
+    self.assertTrue(isinstance(packed, SOAPpy.Types.structType))
+    self.assertRaises(AttributeError, self.service._PackArg,
+                      {'paging': {'startIndex': 0, 'numberResults': 100}},
+                      'selector', self.service._namespace, 'Selector',
+                      soap_config)
+    self.assertRaises(TypeError, self.service._PackArg,
+                      {'budget': {'period': 'DAILY'}}, 'selector',
+                      self.service._namespace, 'Selector', soap_config)
+    soap_config.typed = 1
+    self.assertTrue(isinstance(self.service._PackArg(
+        {'fields': ['Id']}, 'selector', self.service._namespace, 'Selector',
+        soap_config), SOAPpy.Types.structType))
+
+  def testExamples(self):
+    """Tests the first request made by each of the code examples."""
+    calls = []
+    examples = 0
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*', '*.py'))):
+      name = os.path.basename(path)
+      if name == '__init__.py' or name in NO_SERVICE_CALLS:
+        continue
+      module = imp.load_source('example_%s' % examples, path)
+      args = EXAMPLE_ARGS.get(
+          name, ['12345'] * (len(inspect.getargspec(module.main)[0]) - 1))
+      try:
+        module.main(_RecordingClient(calls), *args)
+      except _StopExample:
+        pass
+      examples += 1
+      self.assertEqual(len(calls), examples, 'No call recorded for %s' % name)
+
+    compared = 0
+    for service_name, method_name, args in calls:
+      service = getattr(self.client, 'Get%s' % service_name)(
+          self.server.GetUrl(''), VERSION)
+      expected = self._BuildRequest(service, method_name, args, True)[0]
+      actual = self._BuildRequest(service, method_name, args, False)[0]
+      self.assertEqual(actual, expected)
+      compared += 1
+    self.assertEqual(compared, len(calls))
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(RequestSerializerTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
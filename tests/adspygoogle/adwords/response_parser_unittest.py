@@ -0,0 +1,246 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover the ResponseParser module.
+
+Responses parsed by ResponseParser are compared with the result of parsing them
+with SOAPpy, unpacking them with MessageHandler.UnpackResponseAsDict and
+restoring their list types with MessageHandler.RestoreListTypeWithSoappy. These
+tests do not need credentials or network access.
+"""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle import SOAPpy
+from adspygoogle.adwords.AdWordsClient import AdWordsClient
+from adspygoogle.common import ETREE
+from adspygoogle.common import MessageHandler
+from adspygoogle.common import ServiceRegistry
+from adspygoogle.common import Utils
+from adspygoogle.common.GenericApiService import MethodInfoKeys
+from adspygoogle.common.soappy import ResponseParser
+from tests.adspygoogle.common import StandInServer
+
+
+VERSION = 'v201206'
+NS = 'https://adwords.google.com/api/adwords/cm/v201206'
+WSDL = Utils.ReadFile(os.path.join('data', 'campaign_service_v201206.wsdl'))
+ENVELOPE = (
+    '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap='
+    '"http://schemas.xmlsoap.org/soap/envelope/" xmlns:xsi='
+    '"http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd='
+    '"http://www.w3.org/2001/XMLSchema"><soap:Header><ResponseHeader '
+    'xmlns="%(ns)s"><requestId>abc123</requestId><operations>2</operations>'
+    '<responseTime>10</responseTime><units>3</units></ResponseHeader>'
+    '</soap:Header><soap:Body>%%s</soap:Body></soap:Envelope>' % {'ns': NS})
+GET = '<getResponse xmlns="%s"><rval>%%s</rval></getResponse>' % NS
+MUTATE = '<mutateResponse xmlns="%s"><rval>%%s</rval></mutateResponse>' % NS
+CAMPAIGN = ('<entries><id>%s</id><name>Campaign #%s</name><status>ACTIVE'
+            '</status><budget><period>DAILY</period><amount>'
+            '<ComparableValue.Type>Money</ComparableValue.Type><microAmount>'
+            '50000000</microAmount></amount></budget></entries>')
+
+
+class ResponseParserTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.soappy.ResponseParser module."""
+
+  def setUp(self):
+    self.server = StandInServer(lambda request: '', WSDL)
+    self.server.Start()
+    headers = {'authToken': 'abc', 'developerToken': 'abc',
+               'userAgent': 'unittest', 'clientCustomerId': '1234567890'}
+    config = {'strict': 'n', 'xml_log': 'n', 'request_log': 'n',
+              'xml_parser': ETREE}
+    client = AdWordsClient(headers, config, os.path.join('..', '..', '..'))
+    self.service = client.GetCampaignService(self.server.GetUrl(''), VERSION)
+
+  def tearDown(self):
+    self.server.Stop()
+    ServiceRegistry.SHARED_REGISTRY.Invalidate()
+
+  def _GetOutputTypes(self, method_name):
+    return [(param[MethodInfoKeys.NS], param[MethodInfoKeys.TYPE],
+             param[MethodInfoKeys.MAX_OCCURS]) for param in
+            self.service._GetMethodInfo(method_name)[MethodInfoKeys.OUTPUTS]]
+
+  def _ParseWithSoappy(self, response, output_types):
+    """Parses a response the way services did before ResponseParser.
+
+    Args:
+      response: str The SOAP response.
+      output_types: list Tuples of (namespace, type name, maxOccurs) of the
+                    values the SOAP operation returns.
+
+    Returns:
+      ParsedResponse The contents of the response.
+    """
+    result, header = SOAPpy.parseSOAPRPC(response, header=1)
+    headers = ResponseParser.UnpackHeaders(header)
+    if isinstance(result, SOAPpy.faultType):
+      return ResponseParser.ParsedResponse(None, headers, result)
+    public = [key for key in result.__dict__.keys() if key[0] != '_']
+    if len(public) == 1:
+      result = getattr(result, public[0])
+    return ResponseParser.ParsedResponse(
+        MessageHandler.RestoreListTypeWithSoappy(
+            MessageHandler.UnpackResponseAsDict(result),
+            self.service._soappyservice, output_types), headers)
+
+  def _AssertSameResponse(self, response, method_name='get'):
+    output_types = self._GetOutputTypes(method_name)
+    expected = self._ParseWithSoappy(response, output_types)
+    actual = ResponseParser.ParseResponse(response, self.service._soappyservice,
+                                          output_types)
+    self.assertTrue(actual is not None)
+    self.assertEqual(actual.body, expected.body)
+    self.assertEqual(actual.headers, expected.headers)
+    return actual
+
+  def testGetResponses(self):
+    """Tests pages with none, one and several entries."""
+    parsed = self._AssertSameResponse(ENVELOPE % (GET % (
+        '<totalNumEntries>1</totalNumEntries><Page.Type>CampaignPage'
+        '</Page.Type>' + CAMPAIGN % (1, 1))))
+    self.assertEqual(parsed.body['entries'][0]['budget']['amount'],
+                     {'ComparableValue_Type': 'Money',
+                      'microAmount': '50000000'})
+    self.assertEqual(parsed.headers['ResponseHeader'],
+                     {'requestId': 'abc123', 'operations': '2',
+                      'responseTime': '10', 'units': '3'})
+    self._AssertSameResponse(ENVELOPE % (GET % (
+        '<totalNumEntries>3</totalNumEntries><Page.Type>CampaignPage'
+        '</Page.Type>' + ''.join([CAMPAIGN % (i, i) for i in range(3)]))))
+    self._AssertSameResponse(ENVELOPE % (GET % (
+        '<totalNumEntries>0</totalNumEntries><Page.Type>CampaignPage'
+        '</Page.Type>')))
+    self._AssertSameResponse(ENVELOPE % (GET % ''))
+    self._AssertSameResponse(ENVELOPE % ('<getResponse xmlns="%s"/>' % NS))
+
+  def testValues(self):
+    """Tests nil, empty, typed and non-ASCII values."""
+    parsed = self._AssertSameResponse(ENVELOPE % (GET % (
+        '<totalNumEntries xsi:type="xsd:int">2</totalNumEntries>'
+        '<entries xsi:type="Campaign"><id xsi:type="xsd:long">7</id>'
+        '<name xsi:nil="true"/><status></status><startDate>  </startDate>'
+        '</entries><entries xsi:nil="true"/><entries><name>Caf\xc3\xa9 &amp;'
+        '</name><budget/></entries>')))
+    self.assertEqual(len(parsed.body['entries']), 2)
+    self.assertEqual(parsed.body['entries'][0]['id'], '7')
+    self.assertEqual(parsed.body['entries'][1]['name'], u'Caf\xe9 &')
+
+  def testExplicitTypes(self):
+    """Tests fields which are only known once the xxx.Type field is read."""
+    parsed = self._AssertSameResponse(ENVELOPE % (MUTATE % (
+        '<ListReturnValue.Type>CampaignReturnValue</ListReturnValue.Type>'
+        '<value><id>1</id></value><partialFailureErrors><fieldPath>'
+        'operations[0]</fieldPath><trigger/><errorString>CampaignError.'
+        'DUPLICATE_CAMPAIGN_NAME</errorString><ApiError.Type>CampaignError'
+        '</ApiError.Type><reason>DUPLICATE_CAMPAIGN_NAME</reason>'
+        '</partialFailureErrors>')), 'mutate')
+    self.assertEqual(parsed.body['value'], [{'id': '1'}])
+    self.assertEqual(parsed.body['partialFailureErrors'][0]['reason'],
+                     'DUPLICATE_CAMPAIGN_NAME')
+    # Fields read before the xxx.Type field are restored once it is read.
+    self._AssertSameResponse(ENVELOPE % (MUTATE % (
+        '<value><id>1</id></value><value><id>2</id></value>'
+        '<ListReturnValue.Type>CampaignReturnValue</ListReturnValue.Type>')),
+                             'mutate')
+
+  def testFaults(self):
+    """Tests that faults are returned with their detail."""
+    for name in ('response_fault.xml', 'response_fault_errors.xml',
+                 'response_fault_stacktrace.xml'):
+      response = Utils.ReadFile(os.path.join('data', name))
+      expected = self._ParseWithSoappy(response, self._GetOutputTypes('get'))
+      actual = ResponseParser.ParseResponse(
+          response, self.service._soappyservice, self._GetOutputTypes('get'))
+      self.assertEqual(actual.fault.faultcode, expected.fault.faultcode)
+      self.assertEqual(actual.fault.faultstring, expected.fault.faultstring)
+      self.assertEqual(getattr(actual.fault, 'detail', None),
+                       MessageHandler.UnpackResponseAsDict(
+                           getattr(expected.fault, 'detail', None)))
+      self.assertEqual(actual.headers, expected.headers)
+
+    parsed = ResponseParser.ParseResponse(ENVELOPE % (
+        '<soap:Fault><faultcode>soap:Server</faultcode><faultstring>'
+        '[CampaignError.DUPLICATE_CAMPAIGN_NAME @ operations[0]]</faultstring>'
+        '<detail><ApiExceptionFault xmlns="%s"><message>[CampaignError.'
+        'DUPLICATE_CAMPAIGN_NAME @ operations[0]]</message>'
+        '<ApplicationException.Type>ApiException</ApplicationException.Type>'
+        '<errors xsi:type="CampaignError"><fieldPath>operations[0]</fieldPath>'
+        '<trigger/><errorString>CampaignError.DUPLICATE_CAMPAIGN_NAME'
+        '</errorString><ApiError.Type>CampaignError</ApiError.Type><reason>'
+        'DUPLICATE_CAMPAIGN_NAME</reason></errors></ApiExceptionFault>'
+        '</detail></soap:Fault>' % NS), self.service._soappyservice,
+                                          self._GetOutputTypes('get'))
+    self.assertTrue(isinstance(parsed.fault, SOAPpy.faultType))
+    self.assertEqual(
+        parsed.fault.detail['ApiExceptionFault']['errors'][0]['reason'],
+        'DUPLICATE_CAMPAIGN_NAME')
+    self.assertEqual(parsed.body, None)
+
+  def testUnsupportedResponses(self):
+    """Tests responses which are left to SOAPpy."""
+    output_types = self._GetOutputTypes('get')
+    for body in (
+        GET % '<entries href="#id1"/>',
+        GET % '<totalNumEntries>1</totalNumEntries><Page.Type>UnknownPage'
+        '</Page.Type>',
+        '<getResponse xmlns="%s"><rval/><rval2/></getResponse>' % NS,
+        '<getResponse xmlns="%s">text</getResponse>' % NS):
+      self.assertEqual(ResponseParser.ParseResponse(
+          ENVELOPE % body, self.service._soappyservice, output_types), None)
+    self.assertEqual(ResponseParser.ParseResponse(
+        '<Envelope/>', self.service._soappyservice, output_types), None)
+    self.assertEqual(ResponseParser.ParseResponse(
+        (ENVELOPE % (GET % ''))[:-10], self.service._soappyservice,
+        output_types), None)
+
+  def testIncrementalParsing(self):
+    """Tests that a response may be fed in pieces."""
+    response = ENVELOPE % (GET % (
+        '<totalNumEntries>2</totalNumEntries><Page.Type>CampaignPage'
+        '</Page.Type>' + CAMPAIGN % (1, 1) + CAMPAIGN % (2, '\xc3\xa9')))
+    output_types = self._GetOutputTypes('get')
+    parser = ResponseParser.ResponseParser(self.service._soappyservice,
+                                           output_types)
+    for i in range(0, len(response), 7):
+      parser.Feed(response[i:i + 7])
+    self.assertEqual(parser.Close().body,
+                     self._ParseWithSoappy(response, output_types).body)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(ResponseParserTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
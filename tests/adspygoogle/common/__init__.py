@@ -19,12 +19,224 @@
 
 __author__ = 'api.sgrinberg@gmail.com (Stan Grinberg)'
 
+import BaseHTTPServer
+import glob
+import gzip
 import os
+import socket
+import SocketServer
+import StringIO
 import sys
+import threading
+import time
 sys.path.insert(0, os.path.join('..', '..', '..'))
 
+from adspygoogle.common import Utils
 from adspygoogle.common.Client import Client
 
 
 HTTP_PROXY = None
 client = Client(path=os.path.join('..', '..', '..'))
+
+STAND_IN_RESPONSE = (
+    '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap='
+    '"http://schemas.xmlsoap.org/soap/envelope/"><soap:Body/>'
+    '</soap:Envelope>')
+
+
+class _StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+  """Answers POSTs with the server's response, GETs with its WSDL."""
+
+  protocol_version = 'HTTP/1.1'
+  # Buffer the response so that it leaves in one segment.
+  wbufsize = -1
+
+  def setup(self):
+    BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+    self.server.connections += 1
+    self.server.sockets.append(self.connection)
+
+  def do_GET(self):
+    self.server.wsdl_requests += 1
+    wsdl = self.server.wsdl
+    if isinstance(wsdl, dict):
+      wsdl = wsdl.get(self.path.split('?')[0].split('/')[-1])
+      if wsdl is None:
+        self.send_error(404)
+        return
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/xml; charset=utf-8')
+    self.send_header('Content-Length', str(len(wsdl)))
+    self.end_headers()
+    self.wfile.write(wsdl)
+
+  def do_POST(self):
+    request = self.rfile.read(int(self.headers['Content-Length']))
+    self.server.raw_requests.append(request)
+    # Hang up without answering, as if the server went away mid-request.
+    if self.server.TakeDrop():
+      self.close_connection = 1
+      return
+    if self.headers.get('Content-Encoding') == 'gzip':
+      request = gzip.GzipFile(fileobj=StringIO.StringIO(request)).read()
+    self.server.Enter()
+    try:
+      time.sleep(self.server.delay)
+      response = self.server.response
+      if callable(response) and self.server.response_takes_headers:
+        response = response(request, self.headers)
+      elif callable(response):
+        response = response(request)
+    finally:
+      self.server.Exit()
+    status = 200
+    if isinstance(response, tuple):
+      status, response = response
+    self.send_response(status)
+    self.send_header('Content-Type', 'text/xml; charset=utf-8')
+    self.send_header('Content-Length', str(len(response)))
+    for name, value in self.server.response_headers.iteritems():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(response)
+    # Drop the socket without telling the client, like an idle timeout would.
+    if self.server.drop_after_response:
+      self.close_connection = 1
+
+  def log_message(self, *args):
+    pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+  """Local stand-in for the API server.
+
+  Counts accepted connections and the peak number of requests being handled at
+  once, and keeps the body of each POST as it was received. The response is
+  either a fixed string or a function which takes the request body, and the
+  request headers if response_takes_headers is set, and returns the response
+  body or a tuple of HTTP status and body. It is sent with any extra headers in
+  response_headers. The next drop_requests requests are read and then hung up
+  on without an answer. Each request may be delayed, to stand in for the time
+  the API server takes to answer. GETs are answered with the WSDL, which may
+  also be a dict of WSDLs keyed by the name of the service at the end of the
+  path.
+  """
+
+  daemon_threads = True
+
+  def __init__(self, response=STAND_IN_RESPONSE, wsdl='', delay=0):
+    BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _StandInHandler)
+    self.connections = 0
+    self.wsdl_requests = 0
+    self.raw_requests = []
+    self.drop_after_response = False
+    self.drop_requests = 0
+    self.response = response
+    self.response_headers = {}
+    self.response_takes_headers = False
+    self.wsdl = wsdl
+    self.delay = delay
+    self.in_flight = 0
+    self.peak_in_flight = 0
+    self.sockets = []
+    self.stopped = False
+    self.__handler_threads = []
+    self.__lock = threading.Lock()
+
+  def Enter(self):
+    """Marks the start of handling a request."""
+    self.__lock.acquire()
+    try:
+      self.in_flight += 1
+      self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+    finally:
+      self.__lock.release()
+
+  def TakeDrop(self):
+    """Tells whether to hang up on the request being handled.
+
+    Returns:
+      bool True for the next drop_requests requests, False afterwards.
+    """
+    self.__lock.acquire()
+    try:
+      if self.drop_requests > 0:
+        self.drop_requests -= 1
+        return True
+      return False
+    finally:
+      self.__lock.release()
+
+  def Exit(self):
+    """Marks the end of handling a request."""
+    self.__lock.acquire()
+    try:
+      self.in_flight -= 1
+    finally:
+      self.__lock.release()
+
+  def Start(self):
+    """Serves requests from a daemon thread."""
+    thread = threading.Thread(target=self.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+
+  def Stop(self):
+    """Stops serving requests, closes all sockets and waits for handlers."""
+    self.stopped = True
+    self.shutdown()
+    self.server_close()
+    # Hang up on kept-alive connections, so that their handler threads end.
+    for sock in self.sockets:
+      try:
+        sock.shutdown(socket.SHUT_RDWR)
+      except socket.error:
+        pass
+    # Handlers still running at interpreter shutdown print tracebacks.
+    for thread in self.__handler_threads:
+      thread.join(5)
+
+  def process_request(self, request, client_address):
+    """Handles a connection in a new thread, which Stop() waits for."""
+    thread = threading.Thread(target=self.process_request_thread,
+                              args=(request, client_address))
+    thread.setDaemon(True)
+    self.__handler_threads.append(thread)
+    thread.start()
+
+  def handle_error(self, request, client_address):
+    """Ignores errors of connections which Stop() hung up on."""
+    if not self.stopped:
+      BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+  def GetUrl(self, path):
+    """Returns the URL of the given path on this server.
+
+    Args:
+      path: str Absolute path on the server.
+
+    Returns:
+      str URL.
+    """
+    return 'http://127.0.0.1:%s%s' % (self.server_address[1], path)
+
+
+def ReadServiceWsdls(data_dir, version):
+  """Reads the service WSDLs in a directory of test data.
+
+  Args:
+    data_dir: str Directory holding the WSDLs.
+    version: str API version of the WSDLs.
+
+  Returns:
+    dict WSDLs keyed by service name, i.e. 'AdGroupAdService' for
+    ad_group_ad_service_<version>.wsdl.
+  """
+  wsdls = {}
+  for path in glob.glob(os.path.join(data_dir,
+                                     '*_service_%s.wsdl' % version)):
+    words = os.path.basename(path).split('_')[:-1]
+    wsdls[''.join([word.capitalize() for word in words])] = Utils.ReadFile(path)
+  return wsdls
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover CallResult."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.common.CallResult import CallResult
+
+
+class CallResultTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.CallResult module."""
+
+  def testHeaderValues(self):
+    """Tests header fields, both in a ResponseHeader and as header entries."""
+    call_result = CallResult('get', ({},), {'ResponseHeader': {
+        'requestId': 'abc', 'operations': '1', 'responseTime': '10',
+        'units': '2'}})
+    self.assertTrue(call_result.HasHeaders())
+    self.assertEqual(call_result.GetHeaderValue('units'), '2')
+    self.assertEqual(call_result.GetHeaderValue('requestId'), 'abc')
+    self.assertEqual(call_result.GetHeaderValue('missing'), None)
+    call_result = CallResult('get', ({},), {'units': '3'})
+    self.assertEqual(call_result.GetHeaderValue('units'), '3')
+    call_result = CallResult('get', ({},))
+    self.assertFalse(call_result.HasHeaders())
+    self.assertEqual(call_result.GetHeaderValue('units'), None)
+
+  def testOperators(self):
+    """Tests that the operators of all operations sent are counted."""
+    operations = [{'operator': 'ADD'}, {'operator': 'SET'},
+                  {'operator': 'ADD'}, {'operand': {}}]
+    self.assertEqual(CallResult('mutate', (operations,)).GetOperators(),
+                     {'ADD': 2, 'SET': 1})
+    self.assertEqual(CallResult('mutate', ([],)).GetOperators(), None)
+    self.assertEqual(CallResult('get', ([{'operator': 'ADD'}],)).GetOperators(),
+                     None)
+    self.assertEqual(CallResult('query', ('SELECT Id',)).GetOperators(), None)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(CallResultTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover ConnectionPool."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import httplib
+import os
+import socket
+import sys
+import threading
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.common.ConnectionPool import ConnectionPool
+from adspygoogle.SOAPpy.Client import HTTPTransport
+from adspygoogle.SOAPpy.Config import SOAPConfig
+from tests.adspygoogle.common import STAND_IN_RESPONSE
+from tests.adspygoogle.common import StandInServer
+
+
+class _FakeConnection(object):
+
+  """Connection which only records whether it was closed."""
+
+  def __init__(self):
+    self.sock = object()
+    self.closed = False
+
+  def close(self):
+    self.closed = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.ConnectionPool module."""
+
+  def setUp(self):
+    self.server = StandInServer()
+    self.server.Start()
+    self.url = self.server.GetUrl('/api/adwords/cm/v201206/CampaignService')
+    self.config = SOAPConfig(dumpHeadersIn=0, dumpHeadersOut=0, dumpSOAPIn=0,
+                             dumpSOAPOut=0)
+
+  def tearDown(self):
+    self.server.Stop()
+
+  def _Call(self, transport):
+    data, _ = transport.call(self.url, '<request/>', None, config=self.config)
+    self.assertEqual(data, STAND_IN_RESPONSE)
+
+  def testBurstReusesSingleConnection(self):
+    """Tests that sequential calls are all sent over one socket."""
+    pool = ConnectionPool()
+    transport = HTTPTransport(connection_pool=pool)
+    for _ in xrange(1000):
+      self._Call(transport)
+    self.assertEqual(self.server.connections, 1)
+    self.assertEqual(pool.GetConnectionsOpened(), 1)
+
+  def testConcurrentBurstOpensOneConnectionPerThread(self):
+    """Tests that N threads sharing a pool open at most N sockets."""
+    pool = ConnectionPool()
+    threads = [threading.Thread(target=self._CallMany, args=(pool, 100))
+               for _ in xrange(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertTrue(self.server.connections <= 4)
+
+  def _CallMany(self, pool, count):
+    transport = HTTPTransport(connection_pool=pool)
+    for _ in xrange(count):
+      self._Call(transport)
+
+  def testStaleConnectionIsReplaced(self):
+    """Tests that a socket closed by the server is transparently reopened."""
+    self.server.drop_after_response = True
+    transport = HTTPTransport(connection_pool=ConnectionPool())
+    for _ in xrange(3):
+      self._Call(transport)
+    self.assertEqual(self.server.connections, 3)
+
+  def testDroppedRequestIsResentOnce(self):
+    """Tests that a request hung up on over a reused socket is resent once."""
+    transport = HTTPTransport(connection_pool=ConnectionPool())
+    self._Call(transport)
+    self.server.drop_requests = 1
+    self._Call(transport)
+    self.assertEqual(len(self.server.raw_requests), 3)
+    self.assertEqual(self.server.connections, 2)
+
+    self.server.drop_requests = 2
+    self.assertRaises(httplib.BadStatusLine, self._Call, transport)
+    self.assertEqual(len(self.server.raw_requests), 5)
+    self.assertEqual(self.server.connections, 3)
+
+  def testDroppedRequestOnNewConnectionIsNotResent(self):
+    """Tests that only requests sent over reused sockets are resent."""
+    self.server.drop_requests = 1
+    transport = HTTPTransport(connection_pool=ConnectionPool())
+    self.assertRaises(httplib.BadStatusLine, self._Call, transport)
+    self.assertEqual(len(self.server.raw_requests), 1)
+
+  def testTimedOutRequestIsNotResent(self):
+    """Tests that a request whose answer timed out is not sent again."""
+    timeout = socket.getdefaulttimeout()
+    socket.setdefaulttimeout(0.2)
+    try:
+      transport = HTTPTransport(connection_pool=ConnectionPool())
+      self._Call(transport)
+      self.server.delay = 1
+      self.assertRaises(socket.timeout, self._Call, transport)
+    finally:
+      socket.setdefaulttimeout(timeout)
+    self.assertEqual(len(self.server.raw_requests), 2)
+    self.assertEqual(self.server.connections, 1)
+
+  def testIdleConnectionIsEvicted(self):
+    """Tests that connections idle for longer than the timeout are closed."""
+    transport = HTTPTransport(connection_pool=ConnectionPool(idle_timeout=0))
+    self._Call(transport)
+    self._Call(transport)
+    self.assertEqual(self.server.connections, 2)
+
+  def testPoolSizeIsBounded(self):
+    """Tests that no more than max_size idle connections are kept per host."""
+    pool = ConnectionPool(max_size=1)
+    first = _FakeConnection()
+    second = _FakeConnection()
+    pool.ReleaseConnection('http', 'example.com', first)
+    pool.ReleaseConnection('http', 'example.com', second)
+    self.assertFalse(first.closed)
+    self.assertTrue(second.closed)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(ConnectionPoolTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover Future."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+import threading
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.common.Errors import Error
+from adspygoogle.common.Future import Future
+
+
+class FutureTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.Future module."""
+
+  def testResultFromAnotherThread(self):
+    """Tests that waiting threads get the result once it is set."""
+    future = Future()
+    self.assertFalse(future.Done())
+    self.assertRaises(Error, future.GetResult, 0.01)
+    threading.Timer(0.05, future.SetResult, ('result',)).start()
+    self.assertEqual(future.GetResult(5), 'result')
+    self.assertTrue(future.Done())
+
+  def testError(self):
+    """Tests that the error of the work is raised to every caller."""
+    future = Future()
+    try:
+      raise ValueError('failed')
+    except ValueError:
+      future.SetError(sys.exc_info())
+    self.assertRaises(ValueError, future.GetResult)
+    self.assertRaises(ValueError, future.GetResult)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(FutureTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
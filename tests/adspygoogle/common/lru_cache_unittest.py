@@ -0,0 +1,77 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover LruCache."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.common.LruCache import LruCache
+
+
+class LruCacheTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.LruCache module."""
+
+  def testLeastRecentlyUsedIsEvicted(self):
+    """Tests that reading a value keeps it from being evicted."""
+    cache = LruCache(2)
+    cache.Set('a', 1)
+    cache.Set('b', 2)
+    self.assertEqual(cache.Get('a'), 1)
+    cache.Set('c', 3)
+    self.assertEqual(cache.Get('b'), None)
+    self.assertEqual(cache.Get('a'), 1)
+    self.assertEqual(cache.Get('c'), 3)
+    self.assertEqual(cache.GetSize(), 2)
+    self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+  def testReplacingDoesNotEvict(self):
+    """Tests that setting a cached key replaces its value in place."""
+    cache = LruCache(2)
+    cache.Set('a', 1)
+    cache.Set('b', 2)
+    cache.Set('a', 3)
+    self.assertEqual((cache.Get('a'), cache.Get('b')), (3, 2))
+    cache.Clear()
+    self.assertEqual(cache.GetSize(), 0)
+
+  def testDisabled(self):
+    """Tests that a cache of size 0 holds nothing."""
+    cache = LruCache(0)
+    cache.Set('a', 1)
+    self.assertEqual(cache.Get('a'), None)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(LruCacheTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover SoapBuffer as a recorder of SOAPpy's HTTPTransport."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+import threading
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.common.Buffer import Buffer
+from adspygoogle.common.SoapBuffer import SoapBuffer
+from adspygoogle.SOAPpy.Client import HTTPTransport
+from adspygoogle.SOAPpy.Config import SOAPConfig
+from tests.adspygoogle.common import STAND_IN_RESPONSE
+from tests.adspygoogle.common import StandInServer
+
+
+REQUEST = ('<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap='
+           '"http://schemas.xmlsoap.org/soap/envelope/"><soap:Body><get>%s'
+           '</get></soap:Body></soap:Envelope>')
+
+
+class SoapBufferTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.SoapBuffer module."""
+
+  def setUp(self):
+    self.server = StandInServer()
+    self.server.Start()
+    self.url = self.server.GetUrl('/api/adwords/cm/v201206/CampaignService')
+    self.config = SOAPConfig(dumpHeadersIn=0, dumpHeadersOut=0, dumpSOAPIn=0,
+                             dumpSOAPOut=0)
+
+  def tearDown(self):
+    self.server.Stop()
+
+  def testRecorderCapturesCall(self):
+    """Tests that a call is recorded without anything going to sys.stdout."""
+    buf = SoapBuffer()
+    stdout = Buffer()
+    old_stdout = sys.stdout
+    sys.stdout = stdout
+    try:
+      HTTPTransport().call(self.url, REQUEST % 'x', None, 'get',
+                           config=self.config, recorder=buf)
+    finally:
+      sys.stdout = old_stdout
+
+    self.assertEqual(stdout.GetBufferAsStr(), '')
+    self.assertTrue(buf.IsHandshakeComplete())
+    self.assertTrue('POST /api/adwords/cm/v201206/CampaignService' in
+                    buf.GetHeadersOut())
+    self.assertTrue('SOAPAction:"get"' in buf.GetHeadersOut())
+    self.assertTrue('<get>x' in buf.GetSoapOut())
+    self.assertTrue('HTTP/1.? 200 OK' in buf.GetHeadersIn())
+    self.assertTrue(STAND_IN_RESPONSE in buf.GetSoapIn())
+    self.assertTrue(buf._GetXmlOut() is not None)
+    self.assertTrue(buf._GetXmlIn() is not None)
+
+  def testConcurrentCallsKeepSeparateRecords(self):
+    """Tests that every thread's buffer only holds its own traffic."""
+    self.server.response = lambda request: request
+    buffers = [SoapBuffer() for _ in xrange(8)]
+    threads = [threading.Thread(target=self._CallMany, args=(buf, str(i)))
+               for i, buf in enumerate(buffers)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    for i, buf in enumerate(buffers):
+      dumps = buf.GetBufferAsStr()
+      self.assertEqual(dumps.count('*** Outgoing SOAP '), 20)
+      self.assertEqual(dumps.count('<get>%s</get>' % i), 40)
+
+  def _CallMany(self, buf, marker):
+    transport = HTTPTransport()
+    for _ in xrange(20):
+      transport.call(self.url, REQUEST % marker, None, 'get',
+                     config=self.config, recorder=buf)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(SoapBufferTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')
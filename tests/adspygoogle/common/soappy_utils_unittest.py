@@ -0,0 +1,170 @@
+#!/usr/bin/python
+#
+# Copyright 2012 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests to cover the type index of SoappyUtils."""
+
+__author__ = 'api.jdilallo@gmail.com (Joseph DiLallo)'
+
+import os
+import sys
+sys.path.insert(0, os.path.join('..', '..', '..'))
+import unittest
+
+from adspygoogle.common.soappy import ServiceDefinition
+from adspygoogle.common.soappy import SoappyUtils
+from adspygoogle.SOAPpy import wstools
+
+
+NS = 'https://example.com/api/v1'
+WSDL = """<?xml version="1.0" encoding="UTF-8"?>
+<wsdl:definitions xmlns:tns="%(ns)s"
+    xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/"
+    xmlns:soapenc="http://schemas.xmlsoap.org/soap/encoding/"
+    xmlns:xsd="http://www.w3.org/2001/XMLSchema" targetNamespace="%(ns)s">
+  <wsdl:types>
+    <schema xmlns="http://www.w3.org/2001/XMLSchema" targetNamespace="%(ns)s"
+        elementFormDefault="qualified">
+      <complexType name="Operation">
+        <sequence>
+          <element name="operator" type="xsd:string" minOccurs="0"/>
+          <element name="type" type="xsd:string" minOccurs="0"/>
+        </sequence>
+      </complexType>
+      <complexType name="CampaignOperation">
+        <complexContent>
+          <extension base="tns:Operation">
+            <sequence>
+              <element name="operand" type="tns:Campaign" minOccurs="0"/>
+            </sequence>
+          </extension>
+        </complexContent>
+      </complexType>
+      <complexType name="LabeledCampaignOperation">
+        <complexContent>
+          <extension base="tns:CampaignOperation">
+            <sequence>
+              <element name="labels" type="xsd:string" minOccurs="0"
+                  maxOccurs="unbounded"/>
+            </sequence>
+          </extension>
+        </complexContent>
+      </complexType>
+      <complexType name="Campaign">
+        <sequence>
+          <element name="id" type="xsd:long" minOccurs="0"/>
+          <element name="name" type="xsd:string" minOccurs="0"/>
+        </sequence>
+      </complexType>
+      <complexType name="CampaignArray">
+        <complexContent>
+          <restriction base="soapenc:Array"/>
+        </complexContent>
+      </complexType>
+    </schema>
+  </wsdl:types>
+</wsdl:definitions>
+""" % {'ns': NS}
+
+
+class _ParsedWsdl(object):
+
+  """Stands in for a SOAPpy.WSDL.Proxy around a WSDL without services."""
+
+  def __init__(self):
+    self.wsdl = wstools.WSDLTools.WSDLReader().loadFromString(WSDL)
+    self.methods = {}
+
+
+class SoappyUtilsTest(unittest.TestCase):
+
+  """Tests for the adspygoogle.common.soappy.SoappyUtils module."""
+
+  def setUp(self):
+    self.services = [_ParsedWsdl()]
+    self.services.append(ServiceDefinition.ServiceProxy(
+        ServiceDefinition.CompileWsdlProxy(self.services[0]), None))
+
+  def testFieldsAreFlattenedInOrder(self):
+    """Tests that inherited fields come first, in declaration order."""
+    for service in self.services:
+      self.assertEqual(
+          [param['name'] for param in SoappyUtils.GenKeyOrderAttrs(
+              service, NS, 'LabeledCampaignOperation')],
+          ['operator', 'type', 'operand', 'labels'])
+      self.assertEqual(SoappyUtils.GetComplexFieldTypeByFieldName(
+          'operand', 'LabeledCampaignOperation', NS, service).getName(),
+                       'Campaign')
+      self.assertEqual(SoappyUtils.GetComplexFieldNamespaceByFieldName(
+          'operator', 'LabeledCampaignOperation', NS, service), NS)
+      self.assertEqual(SoappyUtils.GetTypeInfo(
+          'LabeledCampaignOperation', NS, service).GetFieldTable()['labels'][1],
+                       'unbounded')
+      self.assertRaises(TypeError, SoappyUtils.GetComplexFieldTypeByFieldName,
+                        'budget', 'LabeledCampaignOperation', NS, service)
+      self.assertRaises(TypeError,
+                        SoappyUtils.GetComplexFieldNamespaceByFieldName,
+                        'budget', 'Campaign', NS, service)
+
+  def testTypeHierarchy(self):
+    """Tests the supertype closure and array flags."""
+    for service in self.services:
+      self.assertTrue(SoappyUtils.IsASuperType(
+          service, 'LabeledCampaignOperation', NS, 'Operation'))
+      self.assertTrue(SoappyUtils.IsASuperType(
+          service, 'LabeledCampaignOperation', NS, 'CampaignOperation'))
+      self.assertFalse(SoappyUtils.IsASuperType(
+          service, 'Operation', NS, 'CampaignOperation'))
+      self.assertFalse(SoappyUtils.IsASuperType(
+          service, 'Undefined', NS, 'Operation'))
+      self.assertTrue(SoappyUtils.IsASubType('CampaignOperation', NS, service))
+      self.assertFalse(SoappyUtils.IsASubType('Campaign', NS, service))
+      self.assertTrue(SoappyUtils.IsAnArrayType('CampaignArray', NS, service))
+      self.assertFalse(SoappyUtils.IsAnArrayType('Campaign', NS, service))
+      self.assertFalse(SoappyUtils.IsAnArrayType('Undefined', NS, service))
+
+  def testExplicitType(self):
+    """Tests that a native 'type' field is not taken for an explicit type."""
+    for service in self.services:
+      self.assertEqual(SoappyUtils.GetExplicitType(
+          {'type': 'x'}, 'Operation', NS, service), (None, None))
+      self.assertEqual(SoappyUtils.GetExplicitType(
+          {'type': 'x'}, 'Campaign', NS, service), ('x', 'type'))
+
+  def testIndexIsSharedByDefinition(self):
+    """Tests that services sharing a definition share one index."""
+    definition = self.services[1].definition
+    other = ServiceDefinition.ServiceProxy(definition, None)
+    info = SoappyUtils.GetTypeInfo('Campaign', NS, self.services[1])
+    self.assertTrue(SoappyUtils.GetTypeInfo('Campaign', NS, other) is info)
+    self.assertFalse(SoappyUtils.GetTypeInfo('Campaign', NS,
+                                             self.services[0]) is info)
+
+
+def makeTestSuite():
+  """Set up test suite.
+
+  Returns:
+    TestSuite test suite.
+  """
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(SoappyUtilsTest))
+  return suite
+
+
+if __name__ == '__main__':
+  suite = makeTestSuite()
+  alltests = unittest.TestSuite([suite])
+  unittest.main(defaultTest='alltests')